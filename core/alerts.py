@@ -0,0 +1,99 @@
+from typing import Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import os
+import logging
+from core.models import db, AlertState
+
+logger = logging.getLogger(__name__)
+
+# Lỗi kéo dài được nhắc lại sau mỗi khoảng này (giờ), giữa hai lần nhắc thì bị chặn
+ALERT_DIGEST_HOURS = int(os.getenv('ALERT_DIGEST_HOURS', '24'))
+
+# Các chuyển trạng thái sinh ra thông báo
+NEW = 'new'
+STILL_FAILING = 'still_failing'
+RECOVERED = 'recovered'
+
+_ERROR_PATTERNS = (
+    ('rate_limit', ('429', 'rate limit', 'too many requests')),
+    ('timeout', ('timeout', 'timed out', 'deadline')),
+    ('network', ('connection', 'ssl', 'name resolution', 'max retries', 'circuit open')),
+    ('auth', ('401', '403', 'unauthorized', 'forbidden', 'invalid token', 'token expired', 'invalid api',
+              'api key')),
+)
+
+def classify_error(error_message: str) -> str:
+    """Phân loại lỗi từ message để gom các lỗi giống nhau vào cùng một trạng thái"""
+    message = (error_message or '').lower()
+    for error_class, patterns in _ERROR_PATTERNS:
+        if any(p in message for p in patterns):
+            return error_class
+    return 'error'
+
+def record_failure(user_id: int, provider: str, account: str, error_message: str,
+                   error_class: Optional[str] = None, now: Optional[datetime] = None,
+                   commit: bool = True) -> Tuple[Optional[str], AlertState]:
+    """Ghi nhận một lần lỗi, trả về (chuyển trạng thái cần thông báo hoặc None, state).
+
+    NEW khi key mới lỗi (hoặc lỗi lại sau khi đã hồi phục), STILL_FAILING khi đã qua
+    ALERT_DIGEST_HOURS kể từ lần gửi trước, None nếu đang trong khoảng chặn.
+    """
+    now = now or datetime.utcnow()
+    error_class = error_class or classify_error(error_message)
+    state = AlertState.query.filter_by(user_id=user_id, provider=provider, account=account,
+                                       error_class=error_class).first()
+    if state is None:
+        state = AlertState(user_id=user_id, provider=provider, account=account, error_class=error_class,
+                           failure_count=0)
+        db.session.add(state)
+
+    if state.status != 'failing':
+        state.status = 'failing'
+        state.first_seen = now
+        state.failure_count = 0
+        state.last_sent = None
+
+    state.last_seen = now
+    state.failure_count += 1
+    state.last_error = (error_message or '')[:512]
+
+    transition = None
+    if state.last_sent is None:
+        transition = NEW
+    elif now - state.last_sent >= timedelta(hours=ALERT_DIGEST_HOURS):
+        transition = STILL_FAILING
+    if transition:
+        state.last_sent = now
+    else:
+        logger.info(f"[Alerts] Suppressed {provider} {error_class} alert for {account} "
+                    f"(failing since {state.first_seen}, {state.failure_count} failures)")
+
+    if commit:
+        db.session.commit()
+    return transition, state
+
+def record_successes(provider: str, keys: Iterable[Tuple[int, str]], error_class: Optional[str] = None,
+                     now: Optional[datetime] = None, commit: bool = True) -> List[AlertState]:
+    """Đánh dấu hồi phục cho các (user_id, account) vừa cập nhật thành công.
+
+    Trả về các state đã từng được thông báo lỗi, cần gửi thông báo RECOVERED.
+    Chỉ một query cho cả lô.
+    """
+    keys = set(keys)
+    if not keys:
+        return []
+    query = AlertState.query.filter_by(provider=provider, status='failing')
+    if error_class:
+        query = query.filter_by(error_class=error_class)
+
+    recovered = []
+    for state in query.all():
+        if (state.user_id, state.account) not in keys:
+            continue
+        state.status = 'recovered'
+        state.last_seen = now or datetime.utcnow()
+        if state.last_sent is not None:
+            recovered.append(state)
+    if commit:
+        db.session.commit()
+    return recovered
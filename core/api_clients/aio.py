@@ -0,0 +1,157 @@
+import os
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import requests
+
+try:
+    import httpx
+except ImportError:  # httpx là dependency tùy chọn
+    httpx = None
+
+from core.api_clients.resilience import (RETRY_STATUSES, DeadlineExceededError, budget_timeout, get_guard,
+                                        is_provider_failure, provider_name, remaining_time)
+from core.api_clients.transport import _origin
+
+logger = logging.getLogger(__name__)
+
+# Số connection tối đa của mỗi AsyncClient (mỗi host một client)
+AIO_MAX_CONNECTIONS = int(os.getenv('AIO_MAX_CONNECTIONS', '200'))
+# Số thread cho các thư viện chỉ có API blocking (pybitlaunch)
+AIO_OFFLOAD_THREADS = int(os.getenv('AIO_OFFLOAD_THREADS', '16'))
+
+def is_available() -> bool:
+    """Có dùng được client async không (cần cài httpx)"""
+    return httpx is not None
+
+class AsyncAPIError(Exception):
+    pass
+
+# Lỗi có thể gặp khi gọi aio.request(): lỗi httpx và lỗi của resilience (kế thừa từ requests)
+REQUEST_ERRORS = (requests.exceptions.RequestException, AsyncAPIError) + ((httpx.HTTPError,) if httpx else ())
+
+# ==================== SHARED EVENT LOOP ====================
+# Một event loop chạy trên thread nền, dùng chung cho mọi client async của process.
+# Code đồng bộ (Flask view, scheduler job) gửi coroutine vào qua run().
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+_clients: Dict[tuple, Any] = {}
+_offload_executor: Optional[ThreadPoolExecutor] = None
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Lấy event loop dùng chung (khởi động thread nền nếu chưa có)"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='aio-loop', daemon=True)
+            _loop_thread.start()
+            logger.debug("[AIO] Started shared event loop")
+        return _loop
+
+def run(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Chạy coroutine trên loop dùng chung và chờ kết quả (gọi từ code đồng bộ)"""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError('aio.run() cannot be called from the shared event loop, use await')
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+async def offload(func: Callable, *args, **kwargs) -> Any:
+    """Chạy hàm blocking trên thread pool riêng mà không chặn event loop"""
+    global _offload_executor
+    if _offload_executor is None:
+        _offload_executor = ThreadPoolExecutor(max_workers=AIO_OFFLOAD_THREADS, thread_name_prefix='aio-offload')
+    # Copy context để deadline của job vẫn áp dụng cho request trong thread offload
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_offload_executor,
+                                                            lambda: context.run(func, *args, **kwargs))
+
+def get_client(base_url: str, verify: bool = True):
+    """Lấy httpx.AsyncClient dùng chung cho một host (phải gọi trên loop dùng chung)"""
+    if httpx is None:
+        raise AsyncAPIError('httpx is not installed; async provider clients are unavailable')
+    key = (_origin(base_url), verify)
+    client = _clients.get(key)
+    if client is None:
+        limits = httpx.Limits(max_connections=AIO_MAX_CONNECTIONS, max_keepalive_connections=AIO_MAX_CONNECTIONS)
+        client = httpx.AsyncClient(limits=limits, verify=verify)
+        _clients[key] = client
+    return client
+
+def _timeout(value):
+    connect, read = value if isinstance(value, tuple) else (value, value)
+    return httpx.Timeout(read, connect=connect)
+
+async def request(method: str, url: str, timeout=None, verify: bool = True, **kwargs):
+    """Gửi request async qua rate limiter, circuit breaker và policy của provider.
+
+    Cùng hành vi với GuardedAdapter của transport đồng bộ: timeout mặc định theo
+    policy, rút ngắn theo deadline, retry request idempotent với backoff có jitter.
+    """
+    guard = get_guard(provider_name(_origin(url)))
+    policy = guard.policy
+    timeout = timeout or policy.timeout
+    retries = policy.retries_for(method)
+    client = get_client(url, verify)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            request_timeout = budget_timeout(timeout)
+        except DeadlineExceededError:
+            guard.count('deadline_exceeded')
+            raise
+        await guard.acquire_async()
+        try:
+            response = await client.request(method, url, timeout=_timeout(request_timeout), **kwargs)
+        except httpx.TransportError:
+            guard.record(ok=False)
+            if attempt <= retries and await _wait_before_retry(guard, attempt):
+                continue
+            raise
+        except Exception:
+            guard.record(ok=False)
+            raise
+        guard.record(ok=not is_provider_failure(response))
+        if response.status_code in RETRY_STATUSES and attempt <= retries and await _wait_before_retry(guard, attempt):
+            continue
+        return response
+
+async def _wait_before_retry(guard, attempt: int) -> bool:
+    delay = guard.policy.backoff(attempt)
+    remaining = remaining_time()
+    if remaining is not None and delay >= remaining:
+        return False
+    guard.count('retries')
+    await asyncio.sleep(delay)
+    return True
+
+async def _close_clients() -> None:
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
+
+def close_all() -> None:
+    """Đóng mọi AsyncClient và dừng loop dùng chung (khi tắt ứng dụng hoặc trong test)"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_thread = None
+    if loop is None:
+        return
+    if _clients:
+        asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(5)
+    loop.close()
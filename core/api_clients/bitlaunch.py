@@ -1,4 +1,7 @@
 import pybitlaunch
+from core.api_clients.transport import get_session
+
+BITLAUNCH_BASE_URL = 'https://app.bitlaunch.io'
 
 class BitLaunchAPIError(Exception):
     pass
@@ -6,6 +9,11 @@ class BitLaunchAPIError(Exception):
 class BitLaunchClient:
     def __init__(self, token: str):
         self.client = pybitlaunch.Client(token)
+        # pybitlaunch tạo một Session riêng cho mỗi service, thay bằng Session
+        # dùng chung để giữ connection keep-alive giữa các lần đồng bộ
+        session = get_session(BITLAUNCH_BASE_URL)
+        for service in ('Account', 'SSHKeys', 'Transactions', 'Servers', 'CreateOptions'):
+            getattr(self.client, service)._session = session
 
     def get_account_info(self):
         """
@@ -84,4 +92,22 @@ class BitLaunchClient:
         transaction, err = self.client.Transactions.Show(transaction_id)
         if err:
             raise BitLaunchAPIError(err)
-        return transaction 
\ No newline at end of file
+        return transaction
+
+class AsyncBitLaunchClient:
+    """Adapter async cho BitLaunchClient.
+
+    pybitlaunch chỉ có API blocking nên mỗi lời gọi chạy trên thread pool offload
+    của core.api_clients.aio; event loop dùng chung không bị chặn.
+    """
+
+    def __init__(self, token: str):
+        self.client = BitLaunchClient(token)
+
+    async def get_account_info(self):
+        from core.api_clients import aio
+        return await aio.offload(self.client.get_account_info)
+
+    async def list_servers(self):
+        from core.api_clients import aio
+        return await aio.offload(self.client.list_servers)
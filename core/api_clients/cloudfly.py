@@ -1,11 +1,22 @@
 import requests
 import json
+from core.api_clients.transport import get_session
 from typing import Dict, List, Optional, Any
 
 class CloudFlyAPIError(Exception):
     """Custom exception for CloudFly API errors"""
     pass
 
+def _instances_from_response(response) -> List[Dict]:
+    # CloudFly API trả về object với 'results' chứa danh sách instances
+    if isinstance(response, dict) and 'results' in response:
+        return response['results']
+    # Fallback cho trường hợp API trả về trực tiếp danh sách
+    if isinstance(response, list):
+        return response
+    # Hoặc có thể có wrapper object khác
+    return response.get('instances', [])
+
 class CloudFlyClient:
     """Client for interacting with CloudFly API"""
     
@@ -20,16 +31,17 @@ class CloudFlyClient:
     def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
         """Make HTTP request to CloudFly API"""
         url = f"{self.base_url}{endpoint}"
+        session = get_session(self.base_url)
         
         try:
             if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers)
+                response = session.get(url, headers=self.headers)
             elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
+                response = session.post(url, headers=self.headers, json=data)
             elif method.upper() == 'PUT':
-                response = requests.put(url, headers=self.headers, json=data)
+                response = session.put(url, headers=self.headers, json=data)
             elif method.upper() == 'DELETE':
-                response = requests.delete(url, headers=self.headers)
+                response = session.delete(url, headers=self.headers)
             else:
                 raise CloudFlyAPIError(f"Unsupported HTTP method: {method}")
             
@@ -47,15 +59,7 @@ class CloudFlyClient:
     
     def list_instances(self) -> List[Dict]:
         """List all VPS instances"""
-        response = self._make_request('GET', '/backend/api/instances')
-        # CloudFly API trả về object với 'results' chứa danh sách instances
-        if isinstance(response, dict) and 'results' in response:
-            return response['results']
-        # Fallback cho trường hợp API trả về trực tiếp danh sách
-        if isinstance(response, list):
-            return response
-        # Hoặc có thể có wrapper object khác
-        return response.get('instances', [])
+        return _instances_from_response(self._make_request('GET', '/backend/api/instances'))
     
     def get_instance(self, instance_id: str) -> Dict:
         """Get specific instance details"""
@@ -139,4 +143,31 @@ class CloudFlyClient:
     
     def get_usage_stats(self, period: str = "current") -> Dict:
         """Get usage statistics"""
-        return self._make_request('GET', f'/backend/api/usage?period={period}') 
\ No newline at end of file
+        return self._make_request('GET', f'/backend/api/usage?period={period}')
+
+class AsyncCloudFlyClient:
+    """Bản async của CloudFlyClient (chỉ các lời gọi đọc dùng khi đồng bộ), cần httpx"""
+
+    def __init__(self, token: str, base_url: str = "https://api.cloudfly.vn"):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {
+            'Authorization': f'Token {token}',
+            'Content-Type': 'application/json',
+        }
+
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
+        from core.api_clients import aio
+        try:
+            response = await aio.request(method, f"{self.base_url}{endpoint}", headers=self.headers, json=data)
+            response.raise_for_status()
+            return response.json()
+        except json.JSONDecodeError as e:
+            raise CloudFlyAPIError(f"Invalid JSON response: {str(e)}")
+        except aio.REQUEST_ERRORS as e:
+            raise CloudFlyAPIError(f"API request failed: {str(e)}")
+
+    async def get_user_info(self) -> Dict:
+        return await self._make_request('GET', '/backend/api/users')
+
+    async def list_instances(self) -> List[Dict]:
+        return _instances_from_response(await self._make_request('GET', '/backend/api/instances'))
@@ -0,0 +1,359 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Host của từng provider; host khác (Rocket Chat, ...) dùng chính origin làm tên
+PROVIDER_HOSTS = {
+    'app.bitlaunch.io': 'bitlaunch',
+    'api.zingproxy.com': 'zingproxy',
+    'api.cloudfly.vn': 'cloudfly',
+}
+
+# (request/giây, burst) mặc định; ghi đè bằng PROVIDER_RATE_<PROVIDER> và PROVIDER_BURST_<PROVIDER>
+DEFAULT_RATE_LIMITS = {
+    'bitlaunch': (5, 10),
+    'zingproxy': (5, 10),
+    'cloudfly': (3, 6),
+}
+
+# Số lỗi liên tiếp để mở circuit và thời gian (giây) circuit mở trước khi thử lại
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '60'))
+# Chờ token tối đa bao lâu (giây) trước khi báo lỗi, để không giữ request thread quá lâu
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '30'))
+
+# (connect timeout, read timeout, số lần retry) mặc định; ghi đè bằng
+# HTTP_CONNECT_TIMEOUT_<PROVIDER>, HTTP_READ_TIMEOUT_<PROVIDER>, HTTP_RETRIES_<PROVIDER>
+DEFAULT_POLICIES = {
+    'bitlaunch': (5, 20, 2),
+    'zingproxy': (5, 15, 2),
+    'cloudfly': (5, 30, 2),
+}
+DEFAULT_POLICY = (
+    float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+    float(os.getenv('HTTP_READ_TIMEOUT', '20')),
+    int(os.getenv('HTTP_RETRIES', '1')),
+)
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 8.0
+
+# Chỉ retry request idempotent; POST (tạo server, gửi message, ...) có thể đã được xử lý
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+class ProviderUnavailableError(requests.exceptions.ConnectionError):
+    """Provider đang bị circuit breaker chặn hoặc vượt rate limit quá lâu.
+
+    Kế thừa ConnectionError nên các client hiện có xử lý như lỗi mạng.
+    """
+
+class DeadlineExceededError(requests.exceptions.Timeout):
+    """Hết ngân sách thời gian của job trước khi request được gửi/hoàn tất"""
+
+class RequestPolicy:
+    """Timeout và chính sách retry của một provider"""
+
+    def __init__(self, connect_timeout: float, read_timeout: float, retries: int,
+                 backoff_base: float = RETRY_BACKOFF_BASE, backoff_max: float = RETRY_BACKOFF_MAX):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+    def retries_for(self, method: str) -> int:
+        return self.retries if (method or '').upper() in IDEMPOTENT_METHODS else 0
+
+    def backoff(self, attempt: int) -> float:
+        """Thời gian chờ trước lần retry thứ `attempt`: exponential backoff, full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    def to_dict(self) -> Dict:
+        return {'connect_timeout': self.connect_timeout, 'read_timeout': self.read_timeout, 'retries': self.retries}
+
+# ==================== DEADLINE ====================
+# Deadline gắn với context đang chạy (thread worker của refresh engine hoặc asyncio task
+# của một sync job): mọi request trong đó bị rút ngắn timeout cho vừa phần thời gian còn lại.
+
+_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+@contextmanager
+def deadline(at: Optional[float]):
+    """Đặt deadline (theo time.monotonic()) cho các request trong khối lệnh; lồng nhau thì lấy deadline sớm hơn"""
+    previous = _deadline.get()
+    if at is not None and previous is not None:
+        at = min(at, previous)
+    token = _deadline.set(at if at is not None else previous)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time() -> Optional[float]:
+    """Số giây còn lại tới deadline của context hiện tại, None nếu không có deadline"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+def budget_timeout(timeout: Union[float, Tuple[float, float]]) -> Union[float, Tuple[float, float]]:
+    """Rút ngắn timeout cho vừa deadline; raise DeadlineExceededError nếu đã hết giờ"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceededError('Sync job deadline exceeded before request was sent')
+    if isinstance(timeout, tuple):
+        return tuple(min(t, remaining) if t is not None else remaining for t in timeout)
+    return min(timeout, remaining) if timeout is not None else remaining
+
+class TokenBucket:
+    """Token bucket dùng chung giữa các thread: `rate` token/giây, tối đa `capacity` token"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Lấy một token, trả về số giây cần chờ trước khi được gửi request"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Token có thể âm: các thread đến sau xếp hàng chờ lượt của mình
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def cancel(self) -> None:
+        """Trả lại token đã reserve nhưng không dùng"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+class CircuitBreaker:
+    """Circuit breaker closed/open/half-open.
+
+    Sau `failure_threshold` lỗi liên tiếp circuit mở và mọi lời gọi bị từ chối ngay.
+    Hết `reset_timeout` giây thì sang half-open, cho đúng một lời gọi thử: thành công
+    thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Có được gọi provider không; ở half-open chỉ cho một lời gọi thử"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Ghi nhận một lỗi, trả về True nếu circuit vừa chuyển sang mở"""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                opened = self._state != self.OPEN
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+class ProviderGuard:
+    """Rate limiter + circuit breaker của một provider, dùng chung cho UI và scheduler"""
+
+    def __init__(self, name: str, rate: Optional[float] = None, burst: Optional[float] = None,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS, max_wait: float = RATE_LIMIT_MAX_WAIT,
+                 policy: Optional[RequestPolicy] = None):
+        self.name = name
+        self.policy = policy or RequestPolicy(*DEFAULT_POLICY)
+        self.bucket = TokenBucket(rate, burst or rate) if rate else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'failures': 0, 'rejected': 0, 'retries': 0, 'deadline_exceeded': 0,
+                          'throttled_seconds': 0.0}
+
+    def count(self, key: str, value=1) -> None:
+        with self._lock:
+            self._counters[key] += value
+
+    def _admit(self) -> float:
+        """Kiểm tra rate limit, deadline và circuit; trả về số giây phải chờ trước khi gửi"""
+        wait = self.bucket.reserve() if self.bucket is not None else 0.0
+        remaining = remaining_time()
+        if remaining is not None and wait >= remaining:
+            if self.bucket is not None:
+                self.bucket.cancel()
+            self.count('deadline_exceeded')
+            raise DeadlineExceededError(f"{self.name}: sync job deadline exceeded while waiting for rate limit")
+        if wait > self.max_wait:
+            self.bucket.cancel()
+            self.count('rejected')
+            raise ProviderUnavailableError(f"{self.name} rate limit: would wait {wait:.1f}s")
+        if not self.breaker.allow():
+            if self.bucket is not None:
+                self.bucket.cancel()
+            self.count('rejected')
+            raise ProviderUnavailableError(f"{self.name} unavailable: circuit open after repeated failures")
+        if wait > 0:
+            self.count('throttled_seconds', wait)
+        return wait
+
+    def max_queued(self) -> Optional[int]:
+        """Số lời gọi có thể cùng xếp hàng chờ token mà không bị từ chối vì quá max_wait.
+
+        Chỉ tính một nửa max_wait, phần còn lại dành cho lời gọi từ UI/thread khác và
+        các lần retry. None nếu provider không có rate limit.
+        """
+        if self.bucket is None:
+            return None
+        return max(1, int(self.bucket.capacity + self.bucket.rate * self.max_wait / 2))
+
+    def acquire(self) -> None:
+        """Chờ lượt gửi request; raise ProviderUnavailableError nếu circuit đang mở"""
+        wait = self._admit()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Như acquire() nhưng chờ bằng asyncio.sleep, không chặn event loop"""
+        wait = self._admit()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, ok: bool) -> None:
+        self.count('calls')
+        if ok:
+            self.breaker.record_success()
+            return
+        self.count('failures')
+        if self.breaker.record_failure():
+            logger.warning(f"[Resilience] Circuit for {self.name} opened after "
+                           f"{self.breaker.failures} consecutive failures")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters['throttled_seconds'] = round(counters['throttled_seconds'], 3)
+        counters['state'] = self.breaker.state
+        counters['consecutive_failures'] = self.breaker.failures
+        counters['policy'] = self.policy.to_dict()
+        if self.bucket is not None:
+            counters['rate'] = self.bucket.rate
+            counters['burst'] = self.bucket.capacity
+            counters['tokens'] = round(max(0.0, self.bucket.available), 2)
+        return counters
+
+def is_provider_failure(response: requests.Response) -> bool:
+    """5xx và 429 là lỗi phía provider; 4xx khác (token sai, ...) chỉ liên quan một tài khoản"""
+    return response.status_code >= 500 or response.status_code == 429
+
+def provider_name(origin: str) -> str:
+    host = origin.split('://', 1)[-1]
+    return PROVIDER_HOSTS.get(host, origin)
+
+def _policy(name: str) -> RequestPolicy:
+    connect, read, retries = DEFAULT_POLICIES.get(name, DEFAULT_POLICY)
+    suffix = name.upper()
+    return RequestPolicy(
+        float(os.getenv(f'HTTP_CONNECT_TIMEOUT_{suffix}', connect)),
+        float(os.getenv(f'HTTP_READ_TIMEOUT_{suffix}', read)),
+        int(os.getenv(f'HTTP_RETRIES_{suffix}', retries)),
+    )
+
+def _rate_limit(name: str):
+    rate, burst = DEFAULT_RATE_LIMITS.get(name, (None, None))
+    env_rate = os.getenv(f'PROVIDER_RATE_{name.upper()}')
+    env_burst = os.getenv(f'PROVIDER_BURST_{name.upper()}')
+    if env_rate:
+        rate = float(env_rate)
+    if env_burst:
+        burst = float(env_burst)
+    return rate, burst
+
+_guards: Dict[str, ProviderGuard] = {}
+_guards_lock = threading.Lock()
+
+def get_guard(name: str) -> ProviderGuard:
+    """Lấy ProviderGuard dùng chung của provider (tạo mới nếu chưa có)"""
+    with _guards_lock:
+        guard = _guards.get(name)
+        if guard is None:
+            rate, burst = _rate_limit(name)
+            guard = ProviderGuard(name, rate, burst, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                                  reset_timeout=CIRCUIT_RESET_SECONDS, max_wait=RATE_LIMIT_MAX_WAIT,
+                                  policy=_policy(name))
+            _guards[name] = guard
+        return guard
+
+def get_stats() -> Dict[str, Dict]:
+    with _guards_lock:
+        guards = dict(_guards)
+    return {name: guard.stats() for name, guard in sorted(guards.items())}
+
+def reset_all() -> None:
+    """Xóa mọi guard (dùng trong test)"""
+    with _guards_lock:
+        _guards.clear()
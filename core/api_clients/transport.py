@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.api_clients.resilience import (RETRY_STATUSES, DeadlineExceededError, ProviderGuard, budget_timeout,
+                                        get_guard, is_provider_failure, provider_name, remaining_time)
+
+logger = logging.getLogger(__name__)
+
+# Số connection keep-alive tối đa giữ lại cho mỗi host
+DEFAULT_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+class GuardedAdapter(HTTPAdapter):
+    """HTTPAdapter áp chính sách của provider cho mọi request.
+
+    Trước mỗi lần gửi: lấy lượt từ rate limiter, kiểm tra circuit breaker, dùng
+    timeout (connect, read) của policy nếu client không truyền và rút ngắn theo
+    deadline của job. Request idempotent lỗi mạng/timeout/429/502-504 được gửi lại
+    với backoff có jitter, miễn là còn trong deadline.
+    """
+
+    def __init__(self, guard: ProviderGuard, **kwargs):
+        self.guard = guard
+        super().__init__(**kwargs)
+
+    def _wait_before_retry(self, attempt: int) -> bool:
+        delay = self.guard.policy.backoff(attempt)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return False
+        self.guard.count('retries')
+        time.sleep(delay)
+        return True
+
+    def send(self, request, **kwargs):
+        policy = self.guard.policy
+        timeout = kwargs.get('timeout') or policy.timeout
+        retries = policy.retries_for(request.method)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                kwargs['timeout'] = budget_timeout(timeout)
+            except DeadlineExceededError:
+                self.guard.count('deadline_exceeded')
+                raise
+            self.guard.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.guard.record(ok=False)
+                if attempt <= retries and self._wait_before_retry(attempt):
+                    continue
+                raise
+            except Exception:
+                self.guard.record(ok=False)
+                raise
+            self.guard.record(ok=not is_provider_failure(response))
+            if response.status_code in RETRY_STATUSES and attempt <= retries and self._wait_before_retry(attempt):
+                response.close()
+                continue
+            return response
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+def _origin(url: str) -> str:
+    """Chuẩn hóa URL về scheme://host[:port] để làm key cho session"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+def get_session(base_url: str, pool_size: Optional[int] = None) -> requests.Session:
+    """Lấy Session dùng chung (keep-alive, connection pool) cho một base URL.
+
+    Mọi client gọi cùng một host đều nhận lại cùng một Session, nên các lần
+    đồng bộ liên tiếp dùng lại connection TCP/TLS thay vì bắt tay lại, và mọi
+    request (từ UI hay scheduler) dùng chung rate limiter/circuit breaker của host.
+    """
+    origin = _origin(base_url)
+    with _sessions_lock:
+        session = _sessions.get(origin)
+        if session is None:
+            size = pool_size or DEFAULT_POOL_SIZE
+            adapter = GuardedAdapter(get_guard(provider_name(origin)), pool_connections=1, pool_maxsize=size)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[origin] = session
+            logger.debug(f"[Transport] Created pooled session for {origin} (pool size {size})")
+        return session
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Gửi request qua Session dùng chung của host tương ứng"""
+    return get_session(url).request(method, url, **kwargs)
+
+def _pool_counters(session: requests.Session) -> Dict[str, int]:
+    connections = 0
+    requests_sent = 0
+    # Cùng một adapter được mount cho cả http:// và https://
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+    return {'connections': connections, 'requests': requests_sent}
+
+def get_stats() -> dict:
+    """Thống kê tái sử dụng connection theo từng host.
+
+    `handshakes` là số connection TCP (và TLS với https) đã mở, `reuse_ratio`
+    là tỉ lệ request đi trên connection có sẵn.
+    """
+    with _sessions_lock:
+        sessions = dict(_sessions)
+
+    hosts = {}
+    total_connections = 0
+    total_requests = 0
+    for origin, session in sessions.items():
+        counters = _pool_counters(session)
+        connections = counters['connections']
+        requests_sent = counters['requests']
+        total_connections += connections
+        total_requests += requests_sent
+        hosts[origin] = {
+            'requests': requests_sent,
+            'handshakes': connections,
+            'tls': origin.startswith('https://'),
+            'reuse_ratio': round(1 - connections / requests_sent, 4) if requests_sent else 0.0,
+        }
+
+    return {
+        'pool_size': DEFAULT_POOL_SIZE,
+        'requests': total_requests,
+        'handshakes': total_connections,
+        'reuse_ratio': round(1 - total_connections / total_requests, 4) if total_requests else 0.0,
+        'hosts': hosts,
+    }
+
+def close_all() -> None:
+    """Đóng mọi Session (dùng khi tắt ứng dụng hoặc trong test)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
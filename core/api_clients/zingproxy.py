@@ -1,9 +1,51 @@
 import requests
+from core.api_clients.transport import get_session
 from typing import Optional, Dict, Any, List
 
 class ZingProxyAPIError(Exception):
     pass
 
+def _normalize_proxy_data(proxy: Dict[str, Any], proxy_type: str) -> Dict[str, Any]:
+    """Chuẩn hóa dữ liệu proxy từ API về format thống nhất"""
+    return {
+        'proxy_id': proxy.get('uId') or proxy.get('resourceId'),
+        'ip': proxy.get('ip') or proxy.get('hostIp'),
+        'port': proxy.get('portHttp'),  # Sử dụng port HTTP làm port chính
+        'port_socks5': proxy.get('portSocks5'),
+        'status': proxy.get('state'),
+        'expire_at': proxy.get('dateEnd'),
+        'location': proxy.get('countryCode', 'vn'),
+        'type': proxy_type,
+        'username': proxy.get('username'),
+        'password': proxy.get('password'),
+        'note': proxy.get('note'),
+        'created_at': proxy.get('createdAt'),
+        'auto_renew': proxy.get('autoRenew'),
+        'prices': proxy.get('prices'),
+        'link_change_ip': proxy.get('linkChangeIp')
+    }
+
+# Các key trong response get-all-active-proxies và loại proxy tương ứng
+_PROXY_GROUPS = (
+    ('datacenterIPv4Proxies', 'datacenter_ipv4'),
+    ('datacenterIPv6Proxies', 'datacenter_ipv6'),
+    ('vietnamResidentialProxies', 'vietnam_residential'),
+)
+
+def _parse_active_proxies(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Gộp các nhóm proxy trong response về một danh sách đã chuẩn hóa"""
+    proxies = []
+    for key, proxy_type in _PROXY_GROUPS:
+        for proxy in data.get(key) or []:
+            proxies.append(_normalize_proxy_data(proxy, proxy_type))
+    return proxies
+
+def _parse_account_details(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Chuẩn hóa trả về user (bao gồm balance)
+    if data.get('status') == 'success' and 'user' in data:
+        return data['user']
+    return {}
+
 class ZingProxyClient:
     BASE_URL = 'https://api.zingproxy.com'
 
@@ -14,9 +56,14 @@ class ZingProxyClient:
         if not self.access_token and email and password:
             self.login()
 
+    @property
+    def session(self) -> requests.Session:
+        # Timeout và retry theo policy của provider (core/api_clients/resilience)
+        return get_session(self.BASE_URL)
+
     def login(self):
         url = f'{self.BASE_URL}/account/access-token'
-        resp = requests.post(url, json={"email": self.email, "password": self.password}, timeout=10)
+        resp = self.session.post(url, json={"email": self.email, "password": self.password})
         if resp.status_code != 200:
             raise ZingProxyAPIError(f"Login failed: {resp.status_code} {resp.text}")
         data = resp.json()
@@ -27,68 +74,53 @@ class ZingProxyClient:
     def get_account_details(self) -> Dict[str, Any]:
         url = f'{self.BASE_URL}/account/details'
         headers = {'Authorization': f'Bearer {self.access_token}'}
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = self.session.get(url, headers=headers)
         if resp.status_code != 200:
             raise ZingProxyAPIError(f"Get account details failed: {resp.status_code} {resp.text}")
-        data = resp.json()
-        # Chuẩn hóa trả về user (bao gồm balance)
-        if data.get('status') == 'success' and 'user' in data:
-            return data['user']
-        return {}
+        return _parse_account_details(resp.json())
 
     def get_all_active_proxies(self) -> List[Dict[str, Any]]:
         url = f'{self.BASE_URL}/proxy/get-all-active-proxies'
         headers = {'Authorization': f'Bearer {self.access_token}'}
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = self.session.get(url, headers=headers)
         if resp.status_code != 200:
             raise ZingProxyAPIError(f"Get proxies failed: {resp.status_code} {resp.text}")
         
-        data = resp.json()
-        # Xử lý format mới từ API
-        proxies = []
-        
-        # Thêm datacenter IPv4 proxies
-        if 'datacenterIPv4Proxies' in data:
-            for proxy in data['datacenterIPv4Proxies']:
-                proxies.append(self._normalize_proxy_data(proxy, 'datacenter_ipv4'))
-        
-        # Thêm datacenter IPv6 proxies  
-        if 'datacenterIPv6Proxies' in data:
-            for proxy in data['datacenterIPv6Proxies']:
-                proxies.append(self._normalize_proxy_data(proxy, 'datacenter_ipv6'))
-        
-        # Thêm Vietnam residential proxies
-        if 'vietnamResidentialProxies' in data:
-            for proxy in data['vietnamResidentialProxies']:
-                proxies.append(self._normalize_proxy_data(proxy, 'vietnam_residential'))
-        
-        return proxies
+        return _parse_active_proxies(resp.json())
 
     def _normalize_proxy_data(self, proxy: Dict[str, Any], proxy_type: str) -> Dict[str, Any]:
-        """Chuẩn hóa dữ liệu proxy từ API về format thống nhất"""
-        return {
-            'proxy_id': proxy.get('uId') or proxy.get('resourceId'),
-            'ip': proxy.get('ip') or proxy.get('hostIp'),
-            'port': proxy.get('portHttp'),  # Sử dụng port HTTP làm port chính
-            'port_socks5': proxy.get('portSocks5'),
-            'status': proxy.get('state'),
-            'expire_at': proxy.get('dateEnd'),
-            'location': proxy.get('countryCode', 'vn'),
-            'type': proxy_type,
-            'username': proxy.get('username'),
-            'password': proxy.get('password'),
-            'note': proxy.get('note'),
-            'created_at': proxy.get('createdAt'),
-            'auto_renew': proxy.get('autoRenew'),
-            'prices': proxy.get('prices'),
-            'link_change_ip': proxy.get('linkChangeIp')
-        }
+        return _normalize_proxy_data(proxy, proxy_type)
 
     def get_proxies_by_status(self, status: str) -> List[Dict[str, Any]]:
         # status: running, expiring, cancelled, all
         url = f'{self.BASE_URL}/proxy/dan-cu-viet-nam/{status}'
         headers = {'Authorization': f'Bearer {self.access_token}'}
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = self.session.get(url, headers=headers)
         if resp.status_code != 200:
             raise ZingProxyAPIError(f"Get proxies by status failed: {resp.status_code} {resp.text}")
-        return resp.json().get('data', []) 
\ No newline at end of file
+        return resp.json().get('data', [])
+
+class AsyncZingProxyClient:
+    """Bản async của ZingProxyClient cho các lần đồng bộ nhiều tài khoản (cần httpx).
+
+    Chạy trên event loop dùng chung của core.api_clients.aio, cùng rate limiter,
+    circuit breaker và timeout policy với client đồng bộ.
+    """
+    BASE_URL = ZingProxyClient.BASE_URL
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+
+    async def _get(self, path: str, action: str) -> Dict[str, Any]:
+        from core.api_clients import aio
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+        resp = await aio.request('GET', f'{self.BASE_URL}{path}', headers=headers)
+        if resp.status_code != 200:
+            raise ZingProxyAPIError(f"{action} failed: {resp.status_code} {resp.text}")
+        return resp.json()
+
+    async def get_account_details(self) -> Dict[str, Any]:
+        return _parse_account_details(await self._get('/account/details', 'Get account details'))
+
+    async def get_all_active_proxies(self) -> List[Dict[str, Any]]:
+        return _parse_active_proxies(await self._get('/proxy/get-all-active-proxies', 'Get proxies'))
@@ -0,0 +1,180 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from core.models import db, BalanceSample, BalanceRollup
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ('bitlaunch', 'zingproxy', 'cloudfly')
+RESOLUTIONS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+# Số ngày giữ sample thô (chỉ xóa phần đã được gộp theo giờ)
+BALANCE_RAW_RETENTION_DAYS = int(os.getenv('BALANCE_RAW_RETENTION_DAYS', '14'))
+# Số ngày giữ bản gộp theo giờ; bản gộp theo ngày được giữ vĩnh viễn
+BALANCE_HOURLY_RETENTION_DAYS = int(os.getenv('BALANCE_HOURLY_RETENTION_DAYS', '90'))
+# Số sample/bucket đọc mỗi lần khi gộp
+ROLLUP_CHUNK_ROWS = 1000
+# Khoảng thời gian tối đa của series trả về cho biểu đồ
+MAX_SERIES_DAYS = 366
+
+def record_sample(provider: str, account_id: int, user_id: int, balance: Optional[float],
+                  sampled_at: Optional[datetime] = None) -> None:
+    """Thêm một sample số dư vào session (commit cùng batch của job sync)"""
+    if balance is None:
+        return
+    try:
+        balance = float(balance)
+    except (TypeError, ValueError):
+        logger.warning(f"[BalanceHistory] Ignoring non-numeric {provider} balance for account {account_id}: {balance!r}")
+        return
+    db.session.add(BalanceSample(provider=provider, account_id=account_id, user_id=user_id,
+                                 balance=balance, sampled_at=sampled_at or datetime.utcnow()))
+
+def bucket_start(value: datetime, resolution: str) -> datetime:
+    if resolution == 'day':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def _watermark(resolution: str) -> Optional[datetime]:
+    """Đầu bucket kế tiếp sau bucket mới nhất đã gộp (mọi thứ trước mốc này đã gộp xong)"""
+    latest = db.session.execute(db.select(db.func.max(BalanceRollup.bucket_start))
+                                .where(BalanceRollup.resolution == resolution)).scalar()
+    return latest + RESOLUTIONS[resolution] if latest else None
+
+def _aggregate(points: Iterable[Tuple], resolution: str) -> List[dict]:
+    """Gộp các điểm (provider, account_id, user_id, thời điểm, samples, open, close, min, max, sum)
+    đã sắp xếp theo thời gian thành bucket của `resolution`"""
+    buckets: Dict[tuple, dict] = {}
+    for provider, account_id, user_id, at, samples, first, last, low, high, total in points:
+        key = (provider, account_id, bucket_start(at, resolution))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = {'resolution': resolution, 'provider': provider, 'account_id': account_id,
+                            'user_id': user_id, 'bucket_start': key[2], 'samples': samples,
+                            'balance_open': first, 'balance_close': last, 'balance_min': low,
+                            'balance_max': high, 'balance_sum': total}
+            continue
+        bucket['samples'] += samples
+        bucket['balance_close'] = last
+        bucket['balance_min'] = min(bucket['balance_min'], low)
+        bucket['balance_max'] = max(bucket['balance_max'], high)
+        bucket['balance_sum'] += total
+    return list(buckets.values())
+
+def _raw_points(start: Optional[datetime], end: datetime):
+    query = (db.select(BalanceSample.provider, BalanceSample.account_id, BalanceSample.user_id,
+                       BalanceSample.sampled_at, BalanceSample.balance)
+             .where(BalanceSample.sampled_at < end)
+             .order_by(BalanceSample.sampled_at, BalanceSample.id)
+             .execution_options(yield_per=ROLLUP_CHUNK_ROWS))
+    if start is not None:
+        query = query.where(BalanceSample.sampled_at >= start)
+    for provider, account_id, user_id, at, balance in db.session.execute(query):
+        yield provider, account_id, user_id, at, 1, balance, balance, balance, balance, balance
+
+def _hourly_points(start: Optional[datetime], end: datetime):
+    query = (db.select(BalanceRollup.provider, BalanceRollup.account_id, BalanceRollup.user_id,
+                       BalanceRollup.bucket_start, BalanceRollup.samples, BalanceRollup.balance_open,
+                       BalanceRollup.balance_close, BalanceRollup.balance_min, BalanceRollup.balance_max,
+                       BalanceRollup.balance_sum)
+             .where(BalanceRollup.resolution == 'hour', BalanceRollup.bucket_start < end)
+             .order_by(BalanceRollup.bucket_start)
+             .execution_options(yield_per=ROLLUP_CHUNK_ROWS))
+    if start is not None:
+        query = query.where(BalanceRollup.bucket_start >= start)
+    yield from db.session.execute(query)
+
+def _rollup(resolution: str, points, now: datetime) -> int:
+    end = bucket_start(now, resolution)  # Chỉ gộp bucket đã kết thúc
+    start = _watermark(resolution)
+    if start is not None and start >= end:
+        return 0
+    rows = _aggregate(points(start, end), resolution)
+    if rows:
+        db.session.execute(db.insert(BalanceRollup), rows)
+    return len(rows)
+
+def rollup_balances(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Gộp sample thô thành bucket giờ, rồi bucket giờ thành bucket ngày (chỉ bucket đã kết thúc).
+
+    Mỗi resolution có watermark là bucket mới nhất đã gộp nên mỗi lần chạy chỉ đọc
+    phần dữ liệu mới, không quét lại toàn bộ lịch sử.
+    """
+    now = now or datetime.utcnow()
+    hourly = _rollup('hour', _raw_points, now)
+    daily = _rollup('day', _hourly_points, now)
+    db.session.commit()
+    return {'hour': hourly, 'day': daily}
+
+def prune_balance_history(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Xóa sample thô và bucket giờ quá hạn giữ; sample chưa được gộp không bao giờ bị xóa"""
+    now = now or datetime.utcnow()
+    deleted = {'samples': 0, 'hour': 0}
+    raw_cutoff = now - timedelta(days=BALANCE_RAW_RETENTION_DAYS)
+    hourly_watermark = _watermark('hour')
+    if hourly_watermark is not None:
+        deleted['samples'] = db.session.execute(
+            db.delete(BalanceSample).where(BalanceSample.sampled_at < min(raw_cutoff, hourly_watermark))).rowcount
+    hourly_cutoff = now - timedelta(days=BALANCE_HOURLY_RETENTION_DAYS)
+    daily_watermark = _watermark('day')
+    if daily_watermark is not None:
+        deleted['hour'] = db.session.execute(
+            db.delete(BalanceRollup).where(BalanceRollup.resolution == 'hour',
+                                           BalanceRollup.bucket_start < min(hourly_cutoff, daily_watermark))).rowcount
+    db.session.commit()
+    return deleted
+
+def _burn_rate(points: List[dict]) -> Tuple[Optional[float], Optional[float]]:
+    """(số dư giảm mỗi ngày, số ngày đến khi hết tiền) tính từ điểm đầu và cuối của series"""
+    if len(points) < 2:
+        return None, None
+    first, last = points[0], points[-1]
+    days = (datetime.fromisoformat(last['t']) - datetime.fromisoformat(first['t'])).total_seconds() / 86400
+    if days <= 0:
+        return None, None
+    burn = (first['open'] - last['close']) / days
+    if burn <= 0:
+        return round(burn, 4), None
+    return round(burn, 4), round(max(last['close'], 0) / burn, 1)
+
+def get_balance_series(user_id: int, provider: Optional[str] = None, account_id: Optional[int] = None,
+                       days: int = 30, resolution: str = 'auto', now: Optional[datetime] = None) -> dict:
+    """Series số dư của các tài khoản của user cho biểu đồ, chỉ đọc từ bảng rollup.
+
+    resolution='auto' dùng bucket giờ khi xem <= 7 ngày, còn lại bucket ngày. Mỗi series
+    kèm tốc độ tiêu (burn_rate_per_day) và số ngày ước tính đến khi hết số dư.
+    """
+    if provider is not None and provider not in PROVIDERS:
+        raise ValueError(f"Provider không hợp lệ: {provider}")
+    if resolution == 'auto':
+        resolution = 'hour' if days <= 7 else 'day'
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Resolution không hợp lệ: {resolution}")
+    if not 1 <= days <= MAX_SERIES_DAYS:
+        raise ValueError(f"days phải từ 1 đến {MAX_SERIES_DAYS}")
+    since = bucket_start((now or datetime.utcnow()) - timedelta(days=days), resolution)
+
+    query = BalanceRollup.query.filter(BalanceRollup.user_id == user_id, BalanceRollup.resolution == resolution,
+                                       BalanceRollup.bucket_start >= since)
+    if provider is not None:
+        query = query.filter(BalanceRollup.provider == provider)
+    if account_id is not None:
+        query = query.filter(BalanceRollup.account_id == account_id)
+    series: Dict[tuple, List[dict]] = {}
+    for row in query.order_by(BalanceRollup.provider, BalanceRollup.account_id, BalanceRollup.bucket_start):
+        series.setdefault((row.provider, row.account_id), []).append({
+            't': row.bucket_start.isoformat(),
+            'open': row.balance_open,
+            'close': row.balance_close,
+            'min': row.balance_min,
+            'max': row.balance_max,
+            'avg': round(row.balance_sum / row.samples, 4),
+            'samples': row.samples,
+        })
+    result = []
+    for (series_provider, series_account), points in series.items():
+        burn, days_left = _burn_rate(points)
+        result.append({'provider': series_provider, 'account_id': series_account, 'points': points,
+                       'burn_rate_per_day': burn, 'days_until_empty': days_left})
+    return {'resolution': resolution, 'since': since.isoformat(), 'series': result}
@@ -0,0 +1,196 @@
+import os
+import copy
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    import redis
+except ImportError:  # redis là dependency tùy chọn
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = int(os.getenv('INVENTORY_CACHE_TTL', '300'))
+DEFAULT_MAX_ENTRIES = int(os.getenv('INVENTORY_CACHE_MAX_ENTRIES', '256'))
+
+# Key trong session.info chứa các user cần xóa cache khi transaction commit
+_DIRTY_KEY = 'inventory_cache_dirty'
+ALL_USERS = '*'
+
+class MemoryCache:
+    """Cache trong process với TTL và loại bỏ LRU khi đầy"""
+
+    backend = 'memory'
+
+    def __init__(self, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: 'OrderedDict[Any, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get((user_id, key))
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[(user_id, key)]
+                self.misses += 1
+                return None
+            self._data.move_to_end((user_id, key))
+            self.hits += 1
+            # Trả bản sao để caller có thể sửa dict mà không làm hỏng cache
+            return copy.deepcopy(entry[1])
+
+    def set(self, user_id: int, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[(user_id, key)] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._data.move_to_end((user_id, key))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """Xóa cache của một user, hoặc toàn bộ nếu user_id là None"""
+        with self._lock:
+            if user_id is None:
+                self._data.clear()
+                return
+            for cache_key in [k for k in self._data if k[0] == user_id]:
+                del self._data[cache_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class RedisCache:
+    """Cache dùng chung giữa các gunicorn worker qua Redis (hoặc server tương thích Redis).
+
+    Xóa toàn bộ cache bằng cách tăng số thế hệ (generation) thay vì quét key;
+    key cũ tự hết hạn theo TTL. Redis tự lo việc loại bỏ key khi đầy bộ nhớ.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, url: str, ttl: int = DEFAULT_TTL, prefix: str = 'vpsm:inventory'):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _generation(self) -> int:
+        return int(self.client.get(f'{self.prefix}:gen') or 0)
+
+    def _user_key(self, user_id: int) -> str:
+        return f'{self.prefix}:{self._generation()}:{user_id}'
+
+    def get(self, user_id: int, key: Any) -> Optional[Any]:
+        raw = self.client.hget(self._user_key(user_id), str(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, user_id: int, key: Any, value: Any) -> None:
+        user_key = self._user_key(user_id)
+        pipe = self.client.pipeline()
+        pipe.hset(user_key, str(key), json.dumps(value, default=str))
+        pipe.expire(user_key, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            self.client.incr(f'{self.prefix}:gen')
+        else:
+            self.client.delete(self._user_key(user_id))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_inventory_cache():
+    """Lấy cache inventory dùng chung (Redis nếu có INVENTORY_CACHE_URL, ngược lại trong process)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            url = os.getenv('INVENTORY_CACHE_URL')
+            if url and redis is None:
+                logger.warning("INVENTORY_CACHE_URL is set but the redis package is not installed, using in-process cache")
+            if url and redis is not None:
+                _cache = RedisCache(url)
+            else:
+                _cache = MemoryCache()
+        return _cache
+
+def warn_if_process_local(workers: int) -> bool:
+    """Cảnh báo khi nhiều worker dùng cache trong process: invalidate chỉ xóa cache của process
+    ghi, các worker khác vẫn trả snapshot cũ tới INVENTORY_CACHE_TTL giây. Trả về True nếu đã cảnh báo.
+    """
+    if workers <= 1 or (os.getenv('INVENTORY_CACHE_URL') and redis is not None):
+        return False
+    logger.warning(f"Inventory cache is in-process but {workers} workers are configured: writes only invalidate "
+                   f"the worker that made them, others may serve stale data for up to {DEFAULT_TTL}s. "
+                   f"Set INVENTORY_CACHE_URL (Redis) to share the cache.")
+    return True
+
+def mark_inventory_dirty(user_id: Optional[int] = None) -> None:
+    """Đánh dấu inventory của user (hoặc mọi user nếu None) cần làm mới.
+
+    Cache chỉ bị xóa khi transaction hiện tại commit, để request đọc song song
+    không kịp lưu lại dữ liệu cũ vào cache trước khi commit.
+    """
+    from core.models import db
+    dirty = db.session.info.setdefault(_DIRTY_KEY, set())
+    dirty.add(ALL_USERS if user_id is None else user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if not dirty:
+        return
+    cache = get_inventory_cache()
+    try:
+        if ALL_USERS in dirty:
+            cache.invalidate()
+        else:
+            for user_id in dirty:
+                cache.invalidate(user_id)
+    except Exception as e:
+        logger.error(f"Error invalidating inventory cache: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
@@ -1,66 +1,235 @@
 import os
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Ciphertext mới có dạng 'v2:<token Fernet>'; không có prefix là định dạng cũ (base64 của token)
+CIPHERTEXT_PREFIX = 'v2:'
+# Lệnh tạo key, in kèm lỗi khi ENCRYPTION_KEY thiếu hoặc sai định dạng
+KEYGEN_COMMAND = 'python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"'
+
+SECRET_CACHE_TTL = float(os.getenv('SECRET_CACHE_TTL', '300'))
+SECRET_CACHE_MAX_ENTRIES = int(os.getenv('SECRET_CACHE_MAX_ENTRIES', '4096'))
+
+class SecretCache:
+    """Cache giá trị đã giải mã theo ciphertext, có TTL và loại bỏ LRU khi đầy.
+
+    Ciphertext Fernet không đổi với cùng một giá trị đã lưu, nên đọc lại property
+    của model (hoặc list nhiều proxy dùng chung password) không phải giải mã lại.
+    """
+
+    def __init__(self, ttl: float = SECRET_CACHE_TTL, max_entries: int = SECRET_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clears = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, ciphertext: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(ciphertext)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[ciphertext]
+                self.misses += 1
+                return None
+            self._data.move_to_end(ciphertext)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, ciphertext: str, plaintext: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[ciphertext] = (time.monotonic() + self.ttl, plaintext)
+            self._data.move_to_end(ciphertext)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Xóa toàn bộ giá trị đã giải mã (khi đổi key)"""
+        with self._lock:
+            self._data.clear()
+            self.clears += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'clears': self.clears,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class EncryptionKeyError(RuntimeError):
+    """ENCRYPTION_KEY thiếu hoặc sai định dạng"""
+
+def _parse_key(value) -> bytes:
+    """Chuẩn hóa một key Fernet (chuỗi base64 urlsafe, có hoặc không có padding)"""
+    if isinstance(value, bytes):
+        value = value.decode()
+    value = value.strip()
+    key_bytes = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+    if len(key_bytes) != 32:
+        raise ValueError("Key must be 32 bytes when decoded")
+    return base64.urlsafe_b64encode(key_bytes)
+
+def key_fingerprint(key: bytes) -> str:
+    """Định danh ngắn của key để ghi log và checkpoint, không làm lộ key"""
+    return hashlib.sha256(key).hexdigest()[:16]
+
+def _ephemeral_key_allowed() -> bool:
+    flag = os.getenv('ALLOW_EPHEMERAL_ENCRYPTION_KEY', os.getenv('TESTING', 'false'))
+    return flag.strip().lower() in ('1', 'true', 'yes')
+
 class EncryptionManager:
-    def __init__(self):
-        self.key = self._get_or_create_key()
-        self.cipher_suite = Fernet(self.key)
-    
-    def _get_or_create_key(self):
-        """Lấy hoặc tạo encryption key từ environment variable"""
+    """Mã hóa secret bằng keyring: key chính (ENCRYPTION_KEY) để mã hóa, các key cũ
+    (ENCRYPTION_OLD_KEYS, phân tách bằng dấu phẩy) chỉ để giải mã dữ liệu chưa re-encrypt.
+    """
+
+    def __init__(self, keys: Optional[List] = None):
+        self.cache = SecretCache()
+        self._set_keys(keys if keys is not None else self._load_keys())
+
+    def _set_keys(self, keys: List[bytes]) -> None:
+        self.keys = [_parse_key(k) for k in keys]
+        self.key = self.keys[0]
+        self.primary_fingerprint = key_fingerprint(self.key)
+        self._primary = Fernet(self.key)
+        self.cipher_suite = MultiFernet([Fernet(k) for k in self.keys])
+        self.cache.clear()
+
+    def rotate_key(self, key) -> None:
+        """Đặt key chính mới, giữ key hiện tại trong keyring để vẫn đọc được dữ liệu cũ.
+
+        Cache giá trị đã giải mã bị xóa để không còn plaintext nào gắn với keyring cũ.
+        """
+        key = _parse_key(key)
+        self._set_keys([key] + [k for k in self.keys if k != key])
+        logger.info(f"[Encryption] Primary key rotated to {self.primary_fingerprint}")
+
+    def reload_keys(self) -> None:
+        """Đọc lại keyring từ environment (sau khi đổi ENCRYPTION_KEY/ENCRYPTION_OLD_KEYS)"""
+        self._set_keys(self._load_keys())
+
+    def _load_keys(self) -> List[bytes]:
+        """Đọc keyring từ environment; không tự tạo key mới ngoài môi trường test"""
         key = os.getenv('ENCRYPTION_KEY')
         if not key:
-            # Tạo key mới nếu chưa có
-            key = Fernet.generate_key()
-            logger.warning("ENCRYPTION_KEY not found in environment. Generated new key.")
-            logger.warning("Please set ENCRYPTION_KEY environment variable for production.")
-        else:
-            # Nếu key được cung cấp, đảm bảo nó đúng format
-            try:
-                # Thử decode để kiểm tra format
-                if isinstance(key, str):
-                    # Nếu là string, thử decode base64
-                    key_bytes = base64.urlsafe_b64decode(key + '=' * (4 - len(key) % 4))
-                    if len(key_bytes) != 32:
-                        raise ValueError("Key must be 32 bytes when decoded")
-                    key = base64.urlsafe_b64encode(key_bytes)
-                else:
-                    # Nếu đã là bytes, encode thành base64
-                    key = base64.urlsafe_b64encode(key)
-            except Exception as e:
-                logger.warning(f"Invalid ENCRYPTION_KEY format: {e}. Generating new key.")
-                key = Fernet.generate_key()
-        
-        return key
-    
+            if not _ephemeral_key_allowed():
+                raise EncryptionKeyError(
+                    "ENCRYPTION_KEY is not set. Refusing to generate a new key because stored secrets "
+                    "would become unreadable; set ALLOW_EPHEMERAL_ENCRYPTION_KEY=true for throwaway setups. "
+                    f"Generate a key with: {KEYGEN_COMMAND}")
+            logger.warning("ENCRYPTION_KEY not found, using an ephemeral key (secrets will not survive a restart)")
+            return [Fernet.generate_key()]
+        try:
+            keys = [_parse_key(key)]
+            keys += [_parse_key(k) for k in os.getenv('ENCRYPTION_OLD_KEYS', '').split(',') if k.strip()]
+        except Exception as e:
+            raise EncryptionKeyError(f"Invalid ENCRYPTION_KEY/ENCRYPTION_OLD_KEYS format: {e}. "
+                                     f"Generate a key with: {KEYGEN_COMMAND}") from e
+        return keys
+
+    def fingerprints(self) -> List[str]:
+        return [key_fingerprint(k) for k in self.keys]
+
     def encrypt(self, data: str) -> str:
-        """Mã hóa dữ liệu"""
+        """Mã hóa dữ liệu (định dạng v2: lưu thẳng token Fernet, vốn đã là base64)"""
         if not data:
             return data
         try:
-            encrypted_data = self.cipher_suite.encrypt(data.encode())
-            return base64.urlsafe_b64encode(encrypted_data).decode()
+            return CIPHERTEXT_PREFIX + self.cipher_suite.encrypt(data.encode()).decode()
         except Exception as e:
             logger.error(f"Encryption error: {e}")
             return data
-    
+
+    def encrypt_many(self, values: Iterable[Optional[str]]) -> List[Optional[str]]:
+        """Mã hóa nhiều giá trị một lần (import/export hàng loạt)"""
+        return [self.encrypt(value) for value in values]
+
+    def _decrypt_token(self, encrypted_data: str) -> str:
+        """Giải mã một ciphertext, raise nếu không đọc được"""
+        if encrypted_data.startswith(CIPHERTEXT_PREFIX):
+            token = encrypted_data[len(CIPHERTEXT_PREFIX):].encode()
+        else:
+            # Định dạng cũ: token Fernet bị base64 thêm một lần nữa
+            token = base64.urlsafe_b64decode(encrypted_data.encode())
+        return self.cipher_suite.decrypt(token).decode()
+
     def decrypt(self, encrypted_data: str) -> str:
-        """Giải mã dữ liệu"""
+        """Giải mã dữ liệu (đọc được cả định dạng v2 và định dạng cũ)"""
         if not encrypted_data:
             return encrypted_data
+        cached = self.cache.get(encrypted_data)
+        if cached is not None:
+            return cached
         try:
-            decoded_data = base64.urlsafe_b64decode(encrypted_data.encode())
-            decrypted_data = self.cipher_suite.decrypt(decoded_data)
-            return decrypted_data.decode()
+            decrypted_data = self._decrypt_token(encrypted_data)
         except Exception as e:
             logger.error(f"Decryption error: {e}")
             return encrypted_data
+        # Chỉ cache khi giải mã thành công; giá trị lỗi sẽ được thử lại lần sau
+        self.cache.set(encrypted_data, decrypted_data)
+        return decrypted_data
+
+    def decrypt_many(self, values: Iterable[Optional[str]]) -> List[Optional[str]]:
+        """Giải mã nhiều giá trị một lần; giá trị trùng nhau chỉ giải mã một lần"""
+        values = list(values)
+        decrypted = {value: self.decrypt(value) for value in set(values) if value}
+        return [decrypted.get(value, value) for value in values]
+
+    @staticmethod
+    def is_current_format(encrypted_data: Optional[str]) -> bool:
+        return bool(encrypted_data) and encrypted_data.startswith(CIPHERTEXT_PREFIX)
+
+    def upgrade(self, encrypted_data: str) -> Optional[str]:
+        """Chuyển ciphertext định dạng cũ sang v2; None nếu không giải mã được bằng keyring"""
+        if self.is_current_format(encrypted_data):
+            return encrypted_data
+        try:
+            plaintext = self._decrypt_token(encrypted_data)
+        except Exception:
+            return None
+        return CIPHERTEXT_PREFIX + self._primary.encrypt(plaintext.encode()).decode()
+
+    def reencrypt(self, encrypted_data: str) -> Optional[str]:
+        """Ciphertext mới (v2, key chính) nếu giá trị cần ghi lại, None nếu đã đúng.
+
+        Raise (InvalidToken, ValueError) nếu không key nào trong keyring giải mã được.
+        """
+        if self.is_current_format(encrypted_data):
+            token = encrypted_data[len(CIPHERTEXT_PREFIX):].encode()
+            try:
+                self._primary.decrypt(token)
+                return None
+            except InvalidToken:
+                return CIPHERTEXT_PREFIX + self.cipher_suite.rotate(token).decode()
+        token = base64.urlsafe_b64decode(encrypted_data.encode())
+        return CIPHERTEXT_PREFIX + self.cipher_suite.rotate(token).decode()
 
 # Global encryption manager instance
 encryption_manager = EncryptionManager()
@@ -71,4 +240,13 @@ def encrypt_sensitive_data(data: str) -> str:
 
 def decrypt_sensitive_data(encrypted_data: str) -> str:
     """Wrapper function để giải mã dữ liệu nhạy cảm"""
-    return encryption_manager.decrypt(encrypted_data) 
\ No newline at end of file
+    return encryption_manager.decrypt(encrypted_data)
+
+def get_keyring_info() -> dict:
+    """Fingerprint của key chính và các key cũ đang nạp"""
+    fingerprints = encryption_manager.fingerprints()
+    return {'primary': fingerprints[0], 'old': fingerprints[1:]}
+
+def get_secret_cache_stats() -> dict:
+    """Thống kê cache giá trị đã giải mã: hit, miss, eviction"""
+    return encryption_manager.cache.stats()
@@ -0,0 +1,95 @@
+import io
+import os
+import csv
+import json
+import zlib
+import logging
+from typing import Iterable, Iterator, List, Optional
+from core.encryption import encryption_manager
+from core.models import db, Proxy
+from core import manager
+
+logger = logging.getLogger(__name__)
+
+# Số dòng đọc từ DB mỗi lần (yield_per); mỗi lô được serialize thành một chunk HTTP
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '500'))
+
+# format -> (mimetype, đuôi file)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'txt': ('text/plain', 'txt'),  # ip:port:user:pass, mỗi dòng một proxy
+}
+
+PROXY_EXPORT_FIELDS = ('id', 'name', 'ip', 'port', 'port_socks5', 'username', 'password', 'type',
+                       'location', 'status', 'expire_at', 'source', 'source_id', 'note', 'auto_renew')
+
+# Chỉ đọc các cột cần export (không dựng ORM object cho từng dòng)
+_EXPORT_COLUMNS = [getattr(Proxy, f) for f in PROXY_EXPORT_FIELDS if f != 'password'] + [Proxy.password_encrypted]
+
+def iter_proxy_chunks(user_id: int, filters: Optional[dict] = None, include_secrets: bool = True,
+                      chunk_size: int = EXPORT_CHUNK_ROWS) -> Iterator[List[dict]]:
+    """Đọc proxy của user theo lô `chunk_size` dòng bằng yield_per, trả về từng lô dạng dict.
+
+    Password của cả lô được giải mã một lần bằng decrypt_many; bộ nhớ chỉ giữ một lô.
+    """
+    query = (manager.proxy_query(user_id, filters)
+             .with_only_columns(*_EXPORT_COLUMNS)
+             .order_by(Proxy.id)
+             .execution_options(yield_per=chunk_size))
+    result = db.session.execute(query)
+    for rows in result.partitions():
+        encrypted = [row.password_encrypted for row in rows]
+        passwords = encryption_manager.decrypt_many(encrypted) if include_secrets else [None] * len(rows)
+        chunk = []
+        for row, password in zip(rows, passwords):
+            item = {f: getattr(row, f) for f in PROXY_EXPORT_FIELDS if f != 'password'}
+            item['password'] = password
+            chunk.append(item)
+        yield chunk
+
+def _csv_chunks(chunks: Iterable[List[dict]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=PROXY_EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+def _ndjson_chunks(chunks: Iterable[List[dict]]) -> Iterator[str]:
+    for chunk in chunks:
+        yield ''.join(json.dumps(item, ensure_ascii=False, default=str) + '\n' for item in chunk)
+
+def proxy_line(item: dict) -> str:
+    """ip:port:user:pass (hoặc ip:port nếu proxy không có xác thực)"""
+    if item.get('username') or item.get('password'):
+        return f"{item['ip']}:{item['port']}:{item.get('username') or ''}:{item.get('password') or ''}"
+    return f"{item['ip']}:{item['port']}"
+
+def _txt_chunks(chunks: Iterable[List[dict]]) -> Iterator[str]:
+    for chunk in chunks:
+        yield ''.join(proxy_line(item) + '\n' for item in chunk)
+
+_SERIALIZERS = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks, 'txt': _txt_chunks}
+
+def stream_proxies(user_id: int, fmt: str, filters: Optional[dict] = None, include_secrets: bool = True,
+                   chunk_size: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Export proxy của user dạng stream: mỗi lô DB thành một chunk bytes đã serialize"""
+    if fmt not in _SERIALIZERS:
+        raise ValueError(f"Định dạng export không hỗ trợ: {fmt}")
+    chunks = iter_proxy_chunks(user_id, filters, include_secrets, chunk_size)
+    for text in _SERIALIZERS[fmt](chunks):
+        if text:
+            yield text.encode('utf-8')
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Nén gzip từng chunk khi stream (không giữ toàn bộ output trong bộ nhớ)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: định dạng gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,257 @@
+from typing import Dict, List, Optional
+from datetime import datetime, date, timedelta
+import logging
+from core.models import db, VPS, Account, ZingProxy, ZingProxyAccount, Proxy, parse_expiry_date
+from core import manager
+from core.cache import get_inventory_cache
+from core.pagination import DEFAULT_PAGE_SIZE, PaginationError, page_items, parse_sort
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('manual', 'bitlaunch', 'zingproxy', 'cloudfly')
+DEFAULT_WARNING_DAYS = 7
+
+def list_accounts(user_id: int) -> List[dict]:
+    """Danh sách tài khoản của user từ tất cả nguồn: manual, BitLaunch, ZingProxy, CloudFly"""
+    # 1. Tài khoản thủ công
+    accounts = manager.list_accounts()
+    for acc in accounts:
+        if 'service' not in acc:
+            acc['service'] = ''
+        acc['source'] = 'manual'  # Đánh dấu nguồn
+
+    # 2. Tài khoản từ BitLaunch
+    for api in manager.list_bitlaunch_apis(user_id):
+        accounts.append({
+            'id': f"bitlaunch_{api['id']}",
+            'username': api['email'],
+            'service': 'BitLaunch',
+            'expiry': None,  # BitLaunch không có expiry
+            'balance': api.get('balance', 0),
+            'source': 'bitlaunch'
+        })
+
+    # 3. Tài khoản từ ZingProxy
+    for acc in manager.list_zingproxy_accounts(user_id):
+        acc['source'] = 'zingproxy'  # Đánh dấu nguồn
+        # Map fields để phù hợp với UI
+        acc['username'] = acc.get('email', 'N/A')
+        acc['service'] = 'ZingProxy'
+        acc['expiry'] = None  # ZingProxy không có expiry
+        acc['balance'] = acc.get('balance', 0)
+        accounts.append(acc)
+
+    # 4. Tài khoản từ CloudFly
+    for api in manager.list_cloudfly_apis(user_id):
+        accounts.append({
+            'id': f"cloudfly_{api['id']}",
+            'username': api['email'],
+            'service': 'CloudFly',
+            'expiry': None,  # CloudFly không có expiry
+            'balance': api.get('balance', 0),
+            'source': 'cloudfly'
+        })
+
+    return accounts
+
+def list_vps(user_id: int) -> List[dict]:
+    """Danh sách VPS của user từ tất cả nguồn: manual, BitLaunch, CloudFly"""
+    vps_list = manager.list_vps()
+    for vps in vps_list:
+        if 'service' not in vps:
+            vps['service'] = ''
+        vps['source'] = 'manual'  # Đánh dấu nguồn
+
+    for source, service, items in (
+        ('bitlaunch', 'BitLaunch', manager.list_bitlaunch_vps(user_id)),
+        ('cloudfly', 'CloudFly', manager.list_cloudfly_vps(user_id)),
+    ):
+        for vps in items:
+            vps['source'] = source  # Đánh dấu nguồn
+            # Map fields để phù hợp với UI
+            vps['service'] = service
+            vps['ip'] = vps.get('ip_address', 'N/A')
+            vps['expiry'] = None  # BitLaunch/CloudFly không có expiry
+            vps_list.append(vps)
+
+    return vps_list
+
+def count_by_source(items: List[dict]) -> Dict[str, int]:
+    """Đếm số phần tử theo nguồn"""
+    counts = {source: 0 for source in SOURCES}
+    for item in items:
+        source = item.get('source', 'manual')
+        counts[source] = counts.get(source, 0) + 1
+    return counts
+
+def _warning(item_type: str, name: str, service: str, ip: str, expiry_date: date, today: date) -> dict:
+    return {
+        'item_type': item_type,
+        'name': name,
+        'service': service,
+        'ip': ip,
+        'expiry': expiry_date.strftime('%Y-%m-%d'),
+        'days_left': (expiry_date - today).days
+    }
+
+def collect_expiry_warnings(user_id: Optional[int], warning_days: int = DEFAULT_WARNING_DAYS) -> List[dict]:
+    """Danh sách cảnh báo hết hạn (bao gồm cả item đã hết hạn), sắp xếp theo số ngày còn lại.
+
+    Dùng range query trên các cột DATE có index nên chi phí tỉ lệ với số cảnh báo,
+    không phải tổng số VPS/proxy. Proxy chỉ được xét khi có `user_id`.
+    """
+    today = datetime.now().date()
+    cutoff = today + timedelta(days=warning_days)
+    warnings = []
+
+    for vps in db.session.execute(
+        db.select(VPS.id, VPS.name, VPS.service, VPS.ip, VPS.expiry_date).where(VPS.expiry_date <= cutoff)
+    ).all():
+        warnings.append(_warning('VPS', vps.name or f"VPS-{vps.id}", vps.service or 'N/A',
+                                 vps.ip or 'N/A', vps.expiry_date, today))
+
+    for acc in db.session.execute(
+        db.select(Account.id, Account.username, Account.service, Account.expiry_date)
+        .where(Account.expiry_date <= cutoff)
+    ).all():
+        warnings.append(_warning('Account', acc.username or f"Account-{acc.id}", acc.service or 'N/A',
+                                 'N/A', acc.expiry_date, today))
+
+    if user_id is not None:
+        # Proxy từ ZingProxy
+        for proxy in db.session.execute(
+            db.select(ZingProxy.proxy_id, ZingProxy.ip, ZingProxy.type, ZingProxy.expire_date)
+            .join(ZingProxyAccount, ZingProxy.account_id == ZingProxyAccount.id)
+            .where(ZingProxyAccount.user_id == user_id, ZingProxy.expire_date <= cutoff)
+        ).all():
+            warnings.append(_warning('Proxy', f"{proxy.proxy_id} ({proxy.type})", 'ZingProxy', proxy.ip,
+                                     proxy.expire_date, today))
+
+        # Proxy từ hệ thống quản lý proxy
+        for proxy in db.session.execute(
+            db.select(Proxy.name, Proxy.ip, Proxy.port, Proxy.expire_date, Proxy.source)
+            .where(Proxy.user_id == user_id, Proxy.expire_date <= cutoff)
+        ).all():
+            source_text = f"[{proxy.source}]" if proxy.source != 'manual' else ""
+            warnings.append(_warning('Proxy', f"{proxy.name} {source_text}", 'Proxy Management',
+                                     f"{proxy.ip}:{proxy.port}", proxy.expire_date, today))
+
+    # Sắp xếp theo số ngày còn lại (gần hết hạn trước)
+    warnings.sort(key=lambda x: x['days_left'])
+    return warnings
+
+def build_inventory(user_id: int, warning_days: int = DEFAULT_WARNING_DAYS) -> dict:
+    """Dựng toàn bộ inventory của user: VPS, tài khoản, số lượng, số dư và cảnh báo hết hạn"""
+    vps_list = list_vps(user_id)
+    accounts = list_accounts(user_id)
+    warnings = collect_expiry_warnings(user_id, warning_days)
+
+    balances = {}
+    for acc in accounts:
+        if acc['source'] != 'manual':
+            balances[acc['source']] = balances.get(acc['source'], 0) + (acc.get('balance') or 0)
+
+    return {
+        'vps': vps_list,
+        'accounts': accounts,
+        'warnings': warnings,
+        'counts': {
+            'vps': count_by_source(vps_list),
+            'accounts': count_by_source(accounts),
+            'warnings': len(warnings),
+            'expired': sum(1 for w in warnings if w['days_left'] < 0),
+        },
+        'balances': balances,
+        'warning_days': warning_days,
+    }
+
+def get_snapshot(user_id: int, warning_days: int = DEFAULT_WARNING_DAYS) -> dict:
+    """Inventory của user lấy từ cache, chỉ dựng lại khi cache hết hạn hoặc bị invalidate bởi thao tác ghi"""
+    cache = get_inventory_cache()
+    # Ngày hiện tại nằm trong key vì days_left của cảnh báo thay đổi theo ngày
+    key = f"{warning_days}:{datetime.now().date().isoformat()}"
+    try:
+        snapshot = cache.get(user_id, key)
+    except Exception as e:
+        logger.error(f"Error reading inventory cache: {e}")
+        snapshot = None
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = build_inventory(user_id, warning_days)
+    try:
+        cache.set(user_id, key, snapshot)
+    except Exception as e:
+        logger.error(f"Error writing inventory cache: {e}")
+    return snapshot
+
+# Danh sách gộp nhiều nguồn được phân trang trên snapshot đã cache (không có bảng chung để query)
+VPS_SORT_KEYS = ('name', 'expiry_date', 'status', 'source')
+ACCOUNT_SORT_KEYS = ('username', 'expiry_date', 'balance', 'source')
+VPS_FILTERS = ('source', 'status', 'location', 'q', 'expiring_within', 'expired', 'expires_after')
+ACCOUNT_FILTERS = ('source', 'service', 'q', 'expiring_within', 'expired')
+# Các trường được tìm theo filter q
+SEARCH_FIELDS = ('name', 'username', 'ip', 'service')
+
+def _contains(item: dict, fields, value: str) -> bool:
+    value = value.lower()
+    return any(value in str(item.get(field) or '').lower() for field in fields)
+
+def _matches(item: dict, filters: dict, today: date) -> bool:
+    for name, value in filters.items():
+        if name in ('expiring_within', 'expired', 'expires_after'):
+            expiry = parse_expiry_date(item.get('expiry'))
+            if expiry is None:
+                return False
+            if name == 'expiring_within' and not today <= expiry <= today + timedelta(days=value):
+                return False
+            if name == 'expired' and expiry >= today:
+                return False
+            if name == 'expires_after' and expiry <= today + timedelta(days=value):
+                return False
+        elif name == 'q':
+            if not _contains(item, SEARCH_FIELDS, value):
+                return False
+        elif name == 'service':
+            if not _contains(item, ('service',), value):
+                return False
+        elif name == 'location':
+            # BitLaunch có location, CloudFly có region
+            if (item.get('location') or item.get('region')) != value:
+                return False
+        elif item.get(name) != value:
+            return False
+    return True
+
+def filter_items(items: List[dict], filters: Optional[dict], allowed) -> List[dict]:
+    """Lọc list trong snapshot; thêm expiry_date (ISO) để sắp xếp đúng thứ tự ngày"""
+    filters = filters or {}
+    for name in filters:
+        if name not in allowed:
+            raise PaginationError(f"Không hỗ trợ lọc theo '{name}'")
+    today = date.today()
+    result = []
+    for item in items:
+        if _matches(item, filters, today):
+            expiry = parse_expiry_date(item.get('expiry'))
+            item['expiry_date'] = expiry.isoformat() if expiry else None
+            result.append(item)
+    return result
+
+def _page(items: List[dict], sort_keys, default_sort: str, cursor: Optional[str], limit: int,
+          sort: Optional[str]) -> dict:
+    key, descending = parse_sort(sort, sort_keys, default_sort)
+    page, next_cursor = page_items(items, key, descending, cursor, limit)
+    return {'items': page, 'next_cursor': next_cursor, 'has_more': next_cursor is not None}
+
+def page_vps(user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+             sort: Optional[str] = None, filters: Optional[dict] = None) -> dict:
+    """Một trang VPS (mọi nguồn) theo cursor, có lọc và sắp xếp"""
+    items = filter_items(get_snapshot(user_id)['vps'], filters, VPS_FILTERS)
+    return _page(items, VPS_SORT_KEYS, 'name', cursor, limit, sort)
+
+def page_accounts(user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                  sort: Optional[str] = None, filters: Optional[dict] = None) -> dict:
+    """Một trang tài khoản (mọi nguồn) theo cursor, có lọc và sắp xếp"""
+    items = filter_items(get_snapshot(user_id)['accounts'], filters, ACCOUNT_FILTERS)
+    return _page(items, ACCOUNT_SORT_KEYS, 'username', cursor, limit, sort)
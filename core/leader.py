@@ -0,0 +1,132 @@
+from typing import Callable, Optional
+from datetime import datetime, timedelta
+import os
+import uuid
+import socket
+import logging
+import threading
+from sqlalchemy.exc import IntegrityError
+from core.models import db, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Lease hết hạn sau khoảng này (giây) nếu leader không gia hạn; process khác sẽ tiếp quản.
+# Phải lớn hơn thời gian chạy của job dài nhất vì leader bị hạ chờ job đang chạy xong mới dừng
+LEASE_TTL = int(os.getenv('SCHEDULER_LEASE_TTL', '60'))
+
+def make_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def try_acquire(name: str, owner: str, ttl: int = LEASE_TTL, now: Optional[datetime] = None) -> bool:
+    """Giành hoặc gia hạn lease `name` cho `owner`.
+
+    Dùng một câu UPDATE có điều kiện (chỉ khi đang giữ lease hoặc lease đã hết hạn),
+    nên nguyên tử trên cả SQLite và PostgreSQL. Nếu chưa có dòng nào thì INSERT;
+    process nào INSERT sau sẽ gặp lỗi khóa chính và thua.
+    """
+    now = now or datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    table = SchedulerLease.__table__
+    with db.engine.begin() as conn:
+        acquired_at = db.case((table.c.owner == owner, table.c.acquired_at), else_=now)
+        result = conn.execute(
+            table.update()
+            .where(table.c.name == name, db.or_(table.c.owner == owner, table.c.expires_at < now))
+            .values(owner=owner, acquired_at=acquired_at, renewed_at=now, expires_at=expires_at)
+        )
+        if result.rowcount == 1:
+            return True
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert().values(name=name, owner=owner, acquired_at=now,
+                                               renewed_at=now, expires_at=expires_at))
+        return True
+    except IntegrityError:
+        return False
+
+def release(name: str, owner: str) -> None:
+    """Trả lease ngay (khi tắt process) để process khác không phải chờ hết TTL"""
+    table = SchedulerLease.__table__
+    with db.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.name == name, table.c.owner == owner)
+                     .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+
+def get_lease(name: str) -> Optional[dict]:
+    lease = db.session.get(SchedulerLease, name)
+    if lease is None:
+        return None
+    return {
+        'owner': lease.owner,
+        'acquired_at': lease.acquired_at.isoformat(),
+        'renewed_at': lease.renewed_at.isoformat(),
+        'expires_at': lease.expires_at.isoformat(),
+        'expired': lease.expires_at < datetime.utcnow(),
+    }
+
+class LeaderElector:
+    """Thread nền bầu leader qua lease trong database.
+
+    Gia hạn lease mỗi ttl/3 giây. Gọi `on_elected` khi giành được lease và `on_demoted`
+    ngay khi không gia hạn được (lỗi DB hoặc bị process khác chiếm), trước khi lease
+    hết hạn, nên tại mọi thời điểm chỉ có tối đa một leader.
+    """
+
+    def __init__(self, app, name: str, on_elected: Callable[[], None], on_demoted: Callable[[], None],
+                 ttl: int = LEASE_TTL, owner: Optional[str] = None):
+        self.app = app
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.ttl = ttl
+        self.owner = owner or make_owner_id()
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'leader-{self.name}', daemon=True)
+        self._thread.start()
+        logger.info(f"[Leader] Started election for '{self.name}' as {self.owner}")
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                with self.app.app_context():
+                    release(self.name, self.owner)
+            except Exception as e:
+                logger.error(f"[Leader] Error releasing lease '{self.name}': {e}")
+
+    def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        callback = self.on_elected if leader else self.on_demoted
+        logger.info(f"[Leader] {self.owner} {'acquired' if leader else 'lost'} lease '{self.name}'")
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"[Leader] Error in {'election' if leader else 'demotion'} callback: {e}")
+
+    def tick(self) -> bool:
+        """Một vòng bầu: giành/gia hạn lease và gọi callback khi trạng thái đổi"""
+        try:
+            with self.app.app_context():
+                acquired = try_acquire(self.name, self.owner, self.ttl)
+        except Exception as e:
+            logger.error(f"[Leader] Error renewing lease '{self.name}': {e}")
+            acquired = False
+        self._set_leader(acquired)
+        return acquired
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.tick()
+            self._stop.wait(max(1, self.ttl / 3))
@@ -1,14 +1,21 @@
 from typing import Dict, List, Optional, Any
-from core.models import db, VPS, Account, BitLaunchAPI, BitLaunchVPS, ZingProxyAccount, ZingProxy, User, Proxy, CloudFlyAPI, CloudFlyVPS, RocketChatConfig
+from core.models import db, VPS, Account, BitLaunchAPI, BitLaunchVPS, ZingProxyAccount, ZingProxy, User, Proxy, CloudFlyAPI, CloudFlyVPS, RocketChatConfig, parse_expiry_date
 from core.api_clients.bitlaunch import BitLaunchClient, BitLaunchAPIError
 from core.api_clients.zingproxy import ZingProxyClient, ZingProxyAPIError
 from core.api_clients.cloudfly import CloudFlyClient, CloudFlyAPIError
 from core.notifier import notify_expiry_telegram_per_user
+from core.cache import mark_inventory_dirty
+from core.pagination import DEFAULT_PAGE_SIZE, apply_filters, keyset_page, parse_sort
 import logging
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+def _mark_owner_dirty(model, parent_id: int) -> None:
+    """Đánh dấu cache inventory của user sở hữu API/tài khoản `parent_id` cần làm mới"""
+    parent = db.session.get(model, parent_id)
+    mark_inventory_dirty(parent.user_id if parent else None)
+
 def vps_to_dict(vps: VPS) -> dict:
     return {
         'id': vps.id,
@@ -51,12 +58,14 @@ def bitlaunch_vps_to_dict(vps: BitLaunchVPS) -> dict:
     }
 
 def clear_vps() -> None:
+    mark_inventory_dirty()
     VPS.query.delete()
     db.session.commit()
 
 def add_vps(vps: dict) -> None:
     vps_obj = VPS(**vps)
     db.session.merge(vps_obj)
+    mark_inventory_dirty()
     db.session.commit()
 
 def update_vps(vps_id: str, data: dict) -> None:
@@ -64,12 +73,14 @@ def update_vps(vps_id: str, data: dict) -> None:
     if vps:
         for k, v in data.items():
             setattr(vps, k, v)
+        mark_inventory_dirty()
         db.session.commit()
 
 def delete_vps(vps_id: str) -> None:
     vps = VPS.query.get(vps_id)
     if vps:
         db.session.delete(vps)
+        mark_inventory_dirty()
         db.session.commit()
 
 def list_vps() -> List[dict]:
@@ -80,6 +91,7 @@ def get_vps_expiry(vps_id: str) -> Optional[str]:
     return vps.expiry if vps else None
 
 def clear_accounts() -> None:
+    mark_inventory_dirty()
     Account.query.delete()
     db.session.commit()
 
@@ -88,6 +100,7 @@ def add_account(acc: dict) -> None:
     acc = {k: v for k, v in acc.items() if k in ['id', 'service', 'username', 'expiry']}
     acc_obj = Account(**acc)
     db.session.merge(acc_obj)
+    mark_inventory_dirty()
     db.session.commit()
 
 def update_account(acc_id: str, data: dict) -> None:
@@ -95,12 +108,14 @@ def update_account(acc_id: str, data: dict) -> None:
     if acc:
         for k, v in data.items():
             setattr(acc, k, v)
+        mark_inventory_dirty()
         db.session.commit()
 
 def delete_account(acc_id: str) -> None:
     acc = Account.query.get(acc_id)
     if acc:
         db.session.delete(acc)
+        mark_inventory_dirty()
         db.session.commit()
 
 def list_accounts() -> List[dict]:
@@ -114,6 +129,7 @@ def get_account_expiry(acc_id: str) -> Optional[str]:
 def add_bitlaunch_api(user_id: int, email: str, api_key: str, update_frequency: int = 1) -> BitLaunchAPI:
     # Kiểm tra xem email đã tồn tại cho user này chưa
     existing = BitLaunchAPI.query.filter_by(user_id=user_id, email=email).first()
+    mark_inventory_dirty(user_id)
     if existing:
         # Cập nhật API key và thông tin khác
         existing.api_key = api_key
@@ -133,13 +149,15 @@ def add_bitlaunch_api(user_id: int, email: str, api_key: str, update_frequency:
     db.session.commit()
     return api
 
-def update_bitlaunch_info(api_id: int, balance: float, limit: float) -> None:
+def update_bitlaunch_info(api_id: int, balance: float, limit: float, commit: bool = True) -> None:
     api = BitLaunchAPI.query.get(api_id)
     if api:
+        mark_inventory_dirty(api.user_id)
         api.balance = balance
         api.limit = limit
         api.last_updated = datetime.now()
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
 def list_bitlaunch_apis(user_id: int) -> List[dict]:
     apis = BitLaunchAPI.query.filter_by(user_id=user_id, is_active=True).all()
@@ -148,6 +166,7 @@ def list_bitlaunch_apis(user_id: int) -> List[dict]:
 def delete_bitlaunch_api(api_id: int) -> None:
     api = BitLaunchAPI.query.get(api_id)
     if api:
+        mark_inventory_dirty(api.user_id)
         api.is_active = False  # Soft delete
         db.session.commit()
 
@@ -172,71 +191,156 @@ def get_bitlaunch_apis_needing_update() -> List[BitLaunchAPI]:
     return need_update
 
 # BitLaunch VPS management
-def add_bitlaunch_vps(api_id: int, server_data: dict) -> BitLaunchVPS:
+def _bitlaunch_vps_fields(server_data: dict) -> dict:
+    """Lấy các cột cần lưu từ dữ liệu server BitLaunch"""
+    return {
+        'name': server_data.get('name'),
+        'status': server_data.get('status'),
+        'ip_address': server_data.get('ipv4'),  # BitLaunch API trả về ipv4
+        'location': server_data.get('region'),  # BitLaunch API trả về region
+        'plan': server_data.get('sizeDescription'),  # BitLaunch API trả về sizeDescription
+    }
+
+def add_bitlaunch_vps(api_id: int, server_data: dict, commit: bool = True) -> BitLaunchVPS:
     """Thêm hoặc cập nhật VPS từ BitLaunch"""
     server_id = server_data.get('id')
     if not server_id:
         return None
     
+    fields = _bitlaunch_vps_fields(server_data)
+    _mark_owner_dirty(BitLaunchAPI, api_id)
     # Kiểm tra xem VPS đã tồn tại chưa
     existing = BitLaunchVPS.query.filter_by(api_id=api_id, server_id=server_id).first()
     if existing:
         # Cập nhật thông tin
-        existing.name = server_data.get('name')
-        existing.status = server_data.get('status')
-        existing.ip_address = server_data.get('ipv4')  # BitLaunch API trả về ipv4
-        existing.location = server_data.get('region')  # BitLaunch API trả về region
-        existing.plan = server_data.get('sizeDescription')  # BitLaunch API trả về sizeDescription
+        for column, value in fields.items():
+            setattr(existing, column, value)
         existing.last_updated = datetime.now()
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return existing
     
     # Tạo mới
     vps = BitLaunchVPS(
         api_id=api_id,
         server_id=server_id,
-        name=server_data.get('name'),
-        status=server_data.get('status'),
-        ip_address=server_data.get('ipv4'),  # BitLaunch API trả về ipv4
-        location=server_data.get('region'),  # BitLaunch API trả về region
-        plan=server_data.get('sizeDescription'),  # BitLaunch API trả về sizeDescription
         created_at=datetime.now(),
-        last_updated=datetime.now()
+        last_updated=datetime.now(),
+        **fields
     )
     db.session.add(vps)
-    db.session.commit()
+    if commit:
+        db.session.commit()
     return vps
 
-def update_bitlaunch_vps_list(api_id: int, servers_list: List[dict]) -> None:
-    """Cập nhật toàn bộ danh sách VPS cho một API"""
-    # Xóa tất cả VPS cũ của API này
-    BitLaunchVPS.query.filter_by(api_id=api_id).delete()
-    
-    # Thêm VPS mới
-    for server in servers_list:
-        add_bitlaunch_vps(api_id, server)
-    
-    db.session.commit()
+def _value_changed(old: Any, new: Any) -> bool:
+    """So sánh giá trị cũ/mới, coi 8080 và '8080' là như nhau (cột String nhận số từ API)"""
+    if old == new:
+        return False
+    if old is None or new is None:
+        return True
+    return str(old) != str(new)
+
+def _sync_rows(model, parent_column: str, parent_id: int, key_column: str, incoming: Dict[str, tuple],
+               now: datetime, insert_defaults: Optional[dict] = None) -> Dict[str, int]:
+    """Đồng bộ các dòng con của một API/tài khoản với danh sách từ provider.
+
+    Đọc các dòng hiện có bằng một query, so sánh theo `key_column` rồi
+    insert/update/delete theo lô trong transaction hiện tại. Dòng không đổi
+    không bị ghi lại. `incoming` map str(key) -> (key gốc, dict các cột).
+    """
+    field_names = list(next(iter(incoming.values()))[1]) if incoming else []
+    existing = db.session.execute(
+        db.select(model.id, getattr(model, key_column), *[getattr(model, name) for name in field_names])
+        .where(getattr(model, parent_column) == parent_id)
+    ).all()
+
+    to_update = []
+    to_delete = []
+    seen = set()
+    for row in existing:
+        key = str(row[1])
+        if key not in incoming or key in seen:
+            to_delete.append(row.id)
+            continue
+        seen.add(key)
+        fields = incoming[key][1]
+        if any(_value_changed(getattr(row, name), value) for name, value in fields.items()):
+            to_update.append({'id': row.id, 'last_updated': now, **fields})
+
+    to_insert = [
+        {parent_column: parent_id, key_column: raw_key, 'last_updated': now, **(insert_defaults or {}), **fields}
+        for key, (raw_key, fields) in incoming.items()
+        if key not in seen
+    ]
+
+    if to_delete:
+        db.session.execute(db.delete(model).where(model.id.in_(to_delete)))
+    if to_update:
+        db.session.execute(db.update(model), to_update)
+    if to_insert:
+        db.session.execute(db.insert(model), to_insert)
 
-def list_bitlaunch_vps(user_id: int) -> List[dict]:
-    """Lấy danh sách VPS của user"""
-    # Lấy tất cả API của user
-    apis = BitLaunchAPI.query.filter_by(user_id=user_id, is_active=True).all()
-    all_vps = []
+    return {
+        'inserted': len(to_insert),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+        'unchanged': len(seen) - len(to_update),
+    }
+
+def update_bitlaunch_vps_list(api_id: int, servers_list: List[dict], commit: bool = True) -> Dict[str, int]:
+    """Đồng bộ danh sách VPS của một API, trả về số dòng inserted/updated/deleted/unchanged"""
+    incoming = {}
+    for server in servers_list:
+        server_id = server.get('id')
+        if server_id:
+            incoming[str(server_id)] = (server_id, _bitlaunch_vps_fields(server))
     
-    for api in apis:
-        vps_list = BitLaunchVPS.query.filter_by(api_id=api.id).all()
-        for vps in vps_list:
-            vps_dict = bitlaunch_vps_to_dict(vps)
-            vps_dict['email'] = api.email  # Thêm email để phân biệt
-            all_vps.append(vps_dict)
+    now = datetime.now()
+    counts = _sync_rows(BitLaunchVPS, 'api_id', api_id, 'server_id', incoming, now, {'created_at': now})
+    if counts['inserted'] or counts['updated'] or counts['deleted']:
+        _mark_owner_dirty(BitLaunchAPI, api_id)
     
-    return all_vps
+    if commit:
+        db.session.commit()
+    return counts
+
+BITLAUNCH_VPS_SORT_KEYS = ('id', 'name', 'status', 'location', 'created_at')
+BITLAUNCH_VPS_FILTERS = {'status': BitLaunchVPS.status, 'location': BitLaunchVPS.location}
+
+def _bitlaunch_vps_query(user_id: int, filters: Optional[dict] = None):
+    query = (db.select(BitLaunchVPS, BitLaunchAPI.email)
+             .join(BitLaunchAPI, BitLaunchVPS.api_id == BitLaunchAPI.id)
+             .where(BitLaunchAPI.user_id == user_id, BitLaunchAPI.is_active == True))
+    return apply_filters(query, filters or {}, BITLAUNCH_VPS_FILTERS)
+
+def _bitlaunch_vps_row_to_dict(vps: BitLaunchVPS, email: str) -> dict:
+    vps_dict = bitlaunch_vps_to_dict(vps)
+    vps_dict['email'] = email  # Thêm email để phân biệt
+    return vps_dict
+
+def list_bitlaunch_vps(user_id: int, filters: Optional[dict] = None) -> List[dict]:
+    """Lấy danh sách VPS của user (một query join với các API đang hoạt động)"""
+    rows = db.session.execute(
+        _bitlaunch_vps_query(user_id, filters).order_by(BitLaunchAPI.id, BitLaunchVPS.id)
+    ).all()
+    return [_bitlaunch_vps_row_to_dict(vps, email) for vps, email in rows]
+
+def page_bitlaunch_vps(user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                       sort: Optional[str] = None, filters: Optional[dict] = None) -> dict:
+    """Một trang VPS BitLaunch theo keyset (cursor), có lọc và sắp xếp"""
+    key, descending = parse_sort(sort, BITLAUNCH_VPS_SORT_KEYS, 'id')
+    rows, next_cursor = keyset_page(_bitlaunch_vps_query(user_id, filters), getattr(BitLaunchVPS, key),
+                                    BitLaunchVPS.id, lambda row: (getattr(row[0], key), row[0].id),
+                                    cursor, limit, descending)
+    return {'items': [_bitlaunch_vps_row_to_dict(vps, email) for vps, email in rows],
+            'next_cursor': next_cursor, 'has_more': next_cursor is not None}
 
 def delete_bitlaunch_vps(vps_id: int) -> None:
     """Xóa VPS"""
     vps = BitLaunchVPS.query.get(vps_id)
     if vps:
+        _mark_owner_dirty(BitLaunchAPI, vps.api_id)
         db.session.delete(vps)
         db.session.commit()
 
@@ -275,6 +379,7 @@ def zingproxy_to_dict(proxy: ZingProxy) -> dict:
 def add_zingproxy_account(user_id: int, email: str, access_token: str, balance: float, created_at: datetime, update_frequency: int = 1) -> ZingProxyAccount:
     existing = ZingProxyAccount.query.filter_by(user_id=user_id, email=email).first()
     now = datetime.now()
+    mark_inventory_dirty(user_id)
     if existing:
         existing.access_token = access_token
         existing.balance = balance
@@ -296,12 +401,14 @@ def add_zingproxy_account(user_id: int, email: str, access_token: str, balance:
     db.session.commit()
     return acc
 
-def update_zingproxy_account(acc_id: int, balance: float) -> None:
+def update_zingproxy_account(acc_id: int, balance: float, commit: bool = True) -> None:
     acc = ZingProxyAccount.query.get(acc_id)
     if acc:
+        mark_inventory_dirty(acc.user_id)
         acc.balance = balance
         acc.last_updated = datetime.now()
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
 def list_zingproxy_accounts(user_id: int) -> list:
     accs = ZingProxyAccount.query.filter_by(user_id=user_id).all()
@@ -310,64 +417,124 @@ def list_zingproxy_accounts(user_id: int) -> list:
 def delete_zingproxy_account(acc_id: int) -> None:
     acc = ZingProxyAccount.query.get(acc_id)
     if acc:
+        mark_inventory_dirty(acc.user_id)
         db.session.delete(acc)
         db.session.commit()
 
-def add_zingproxy(account_id: int, proxy_data: dict) -> ZingProxy:
+def _zingproxy_fields(proxy_data: dict) -> dict:
+    """Lấy các cột cần lưu từ dữ liệu proxy ZingProxy đã chuẩn hóa"""
+    return {
+        'ip': proxy_data.get('ip'),
+        'port': proxy_data.get('port'),
+        'port_socks5': proxy_data.get('port_socks5'),
+        'status': proxy_data.get('status'),
+        'expire_at': proxy_data.get('expire_at'),
+        'expire_date': parse_expiry_date(proxy_data.get('expire_at')),
+        'location': proxy_data.get('location'),
+        'type': proxy_data.get('type'),
+        'username': proxy_data.get('username'),
+        'password': proxy_data.get('password'),
+        'note': proxy_data.get('note'),
+        'created_at': proxy_data.get('created_at'),
+        'auto_renew': proxy_data.get('auto_renew'),
+        'link_change_ip': proxy_data.get('link_change_ip'),
+    }
+
+def add_zingproxy(account_id: int, proxy_data: dict, commit: bool = True) -> ZingProxy:
     proxy_id = proxy_data.get('proxy_id')
     if not proxy_id:
         return None
     existing = ZingProxy.query.filter_by(account_id=account_id, proxy_id=proxy_id).first()
     now = datetime.now()
+    fields = _zingproxy_fields(proxy_data)
+    _mark_owner_dirty(ZingProxyAccount, account_id)
     if existing:
-        existing.ip = proxy_data.get('ip')
-        existing.port = proxy_data.get('port')
-        existing.port_socks5 = proxy_data.get('port_socks5')
-        existing.status = proxy_data.get('status')
-        existing.expire_at = proxy_data.get('expire_at')
-        existing.location = proxy_data.get('location')
-        existing.type = proxy_data.get('type')
-        existing.username = proxy_data.get('username')
-        existing.password = proxy_data.get('password')
-        existing.note = proxy_data.get('note')
-        existing.created_at = proxy_data.get('created_at')
-        existing.auto_renew = proxy_data.get('auto_renew')
-        existing.link_change_ip = proxy_data.get('link_change_ip')
+        for column, value in fields.items():
+            setattr(existing, column, value)
         existing.last_updated = now
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return existing
     proxy = ZingProxy(
         account_id=account_id,
         proxy_id=proxy_id,
-        ip=proxy_data.get('ip'),
-        port=proxy_data.get('port'),
-        port_socks5=proxy_data.get('port_socks5'),
-        status=proxy_data.get('status'),
-        expire_at=proxy_data.get('expire_at'),
-        location=proxy_data.get('location'),
-        type=proxy_data.get('type'),
-        username=proxy_data.get('username'),
-        password=proxy_data.get('password'),
-        note=proxy_data.get('note'),
-        created_at=proxy_data.get('created_at'),
-        auto_renew=proxy_data.get('auto_renew'),
-        link_change_ip=proxy_data.get('link_change_ip'),
-        last_updated=now
+        last_updated=now,
+        **fields
     )
     db.session.add(proxy)
-    db.session.commit()
+    if commit:
+        db.session.commit()
     return proxy
 
-def update_zingproxy_list(account_id: int, proxies: list) -> None:
-    ZingProxy.query.filter_by(account_id=account_id).delete()
+def update_zingproxy_list(account_id: int, proxies: list, commit: bool = True) -> Dict[str, int]:
+    """Đồng bộ danh sách proxy của tài khoản ZingProxy, trả về số dòng inserted/updated/deleted/unchanged"""
+    incoming = {}
     for proxy in proxies:
-        add_zingproxy(account_id, proxy)
-    db.session.commit()
+        proxy_id = proxy.get('proxy_id')
+        if proxy_id:
+            incoming[str(proxy_id)] = (str(proxy_id), _zingproxy_fields(proxy))
+    counts = _sync_rows(ZingProxy, 'account_id', account_id, 'proxy_id', incoming, datetime.now())
+    if counts['inserted'] or counts['updated'] or counts['deleted']:
+        _mark_owner_dirty(ZingProxyAccount, account_id)
+    if commit:
+        db.session.commit()
+    return counts
+
+def sync_zingproxy_account(account_id: int, user_id: int, proxies: list, commit: bool = True) -> Dict[str, Dict[str, int]]:
+    """Đồng bộ proxy của một tài khoản ZingProxy vào cả bảng zingproxies và proxies trong một commit"""
+    counts = {
+        'zingproxies': update_zingproxy_list(account_id, proxies, commit=False),
+        'proxies': sync_zingproxy_proxies(user_id, proxies, commit=False),
+    }
+    if commit:
+        db.session.commit()
+    return counts
 
 def list_zingproxies(account_id: int) -> list:
     proxies = ZingProxy.query.filter_by(account_id=account_id).all()
     return [zingproxy_to_dict(p) for p in proxies] 
 
+def list_user_zingproxies(user_id: int) -> List[ZingProxy]:
+    """Lấy proxy của mọi tài khoản ZingProxy thuộc user trong một query"""
+    return (ZingProxy.query
+            .join(ZingProxyAccount, ZingProxy.account_id == ZingProxyAccount.id)
+            .filter(ZingProxyAccount.user_id == user_id)
+            .order_by(ZingProxyAccount.id, ZingProxy.id)
+            .all())
+
+def get_zingproxy_statistics(user_id: int, expiring_days: int = 7) -> dict:
+    """Thống kê tài khoản/proxy ZingProxy của user"""
+    total_accounts, total_balance = db.session.execute(
+        db.select(db.func.count(ZingProxyAccount.id), db.func.coalesce(db.func.sum(ZingProxyAccount.balance), 0))
+        .where(ZingProxyAccount.user_id == user_id)
+    ).one()
+    
+    expire_values = db.session.execute(
+        db.select(ZingProxy.expire_at)
+        .join(ZingProxyAccount, ZingProxy.account_id == ZingProxyAccount.id)
+        .where(ZingProxyAccount.user_id == user_id)
+    ).scalars().all()
+    
+    # Đếm proxy sắp hết hạn (trong vòng `expiring_days` ngày)
+    now = datetime.now()
+    expiring_proxies = 0
+    for expire_at in expire_values:
+        if not expire_at:
+            continue
+        try:
+            days_until_expiry = (datetime.strptime(expire_at, '%Y-%m-%d') - now).days
+        except ValueError:
+            continue
+        if 0 <= days_until_expiry <= expiring_days:
+            expiring_proxies += 1
+    
+    return {
+        'total_accounts': total_accounts,
+        'total_balance': round(total_balance or 0, 2),
+        'total_proxies': len(expire_values),
+        'expiring_proxies': expiring_proxies
+    }
+
 def get_zingproxy_accounts_needing_update() -> list:
     now = datetime.now()
     accs = ZingProxyAccount.query.all()
@@ -433,16 +600,19 @@ def add_cloudfly_api(user_id: int, email: str, api_token: str, update_frequency:
     )
     
     db.session.add(api)
+    mark_inventory_dirty(user_id)
     db.session.commit()
     return api
 
-def update_cloudfly_info(api_id: int, balance: float, limit: float) -> None:
+def update_cloudfly_info(api_id: int, balance: float, limit: float, commit: bool = True) -> None:
     api = CloudFlyAPI.query.get(api_id)
     if api:
+        mark_inventory_dirty(api.user_id)
         api.balance = balance
         api.account_limit = limit
         api.last_updated = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
 def list_cloudfly_apis(user_id: int) -> List[dict]:
     apis = CloudFlyAPI.query.filter_by(user_id=user_id).all()
@@ -451,6 +621,7 @@ def list_cloudfly_apis(user_id: int) -> List[dict]:
 def delete_cloudfly_api(api_id: int) -> None:
     api = CloudFlyAPI.query.get(api_id)
     if api:
+        mark_inventory_dirty(api.user_id)
         # Xóa tất cả VPS liên quan
         CloudFlyVPS.query.filter_by(api_id=api_id).delete()
         db.session.delete(api)
@@ -475,18 +646,8 @@ def get_cloudfly_apis_needing_update() -> List[CloudFlyAPI]:
     
     return apis_needing_update
 
-def add_cloudfly_vps(api_id: int, instance_data: dict) -> CloudFlyVPS:
-    """Thêm VPS mới từ CloudFly"""
-    # Kiểm tra xem instance đã tồn tại chưa
-    existing_vps = CloudFlyVPS.query.filter_by(
-        api_id=api_id, 
-        instance_id=instance_data.get('id')
-    ).first()
-    
-    # Extract dữ liệu từ CloudFly API response structure
-    display_name = instance_data.get('display_name', '')
-    ip_address = instance_data.get('accessIPv4', '')
-    
+def _cloudfly_vps_fields(instance_data: dict) -> dict:
+    """Lấy các cột cần lưu từ dữ liệu instance CloudFly"""
     # Convert status từ CloudFly format (ACTIVE) sang format thông thường (running)
     status = instance_data.get('status', '').lower()
     if status == 'active':
@@ -506,63 +667,104 @@ def add_cloudfly_vps(api_id: int, instance_data: dict) -> CloudFlyVPS:
     image_info = instance_data.get('image', {})
     image_name = image_info.get('name', '') if isinstance(image_info, dict) else str(image_info)
     
+    return {
+        'name': instance_data.get('display_name', ''),
+        'status': status,
+        'ip_address': instance_data.get('accessIPv4', ''),
+        'region': region,
+        'image_name': image_name,
+        'flavor_type': flavor_type,
+    }
+
+def add_cloudfly_vps(api_id: int, instance_data: dict, commit: bool = True) -> CloudFlyVPS:
+    """Thêm VPS mới từ CloudFly"""
+    # Kiểm tra xem instance đã tồn tại chưa
+    existing_vps = CloudFlyVPS.query.filter_by(
+        api_id=api_id, 
+        instance_id=instance_data.get('id')
+    ).first()
+    
+    # Extract dữ liệu từ CloudFly API response structure
+    fields = _cloudfly_vps_fields(instance_data)
+    _mark_owner_dirty(CloudFlyAPI, api_id)
+    
     if existing_vps:
         # Cập nhật thông tin nếu đã tồn tại
-        existing_vps.name = display_name
-        existing_vps.status = status
-        existing_vps.ip_address = ip_address
-        existing_vps.region = region
-        existing_vps.image_name = image_name
-        existing_vps.flavor_type = flavor_type
+        for column, value in fields.items():
+            setattr(existing_vps, column, value)
         existing_vps.last_updated = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return existing_vps
     
     # Tạo VPS mới
     vps = CloudFlyVPS(
         api_id=api_id,
         instance_id=instance_data.get('id'),
-        name=display_name,
-        status=status,
-        ip_address=ip_address,
-        region=region,
-        image_name=image_name,
-        flavor_type=flavor_type,
         created_at=datetime.utcnow(),
-        last_updated=datetime.utcnow()
+        last_updated=datetime.utcnow(),
+        **fields
     )
     
     db.session.add(vps)
-    db.session.commit()
+    if commit:
+        db.session.commit()
     return vps
 
-def update_cloudfly_vps_list(api_id: int, instances_list: List[dict]) -> None:
-    """Cập nhật danh sách VPS từ CloudFly"""
-    # Xóa tất cả VPS cũ
-    CloudFlyVPS.query.filter_by(api_id=api_id).delete()
-    
-    # Thêm VPS mới
+def update_cloudfly_vps_list(api_id: int, instances_list: List[dict], commit: bool = True) -> Dict[str, int]:
+    """Đồng bộ danh sách VPS từ CloudFly, trả về số dòng inserted/updated/deleted/unchanged"""
+    incoming = {}
     for instance_data in instances_list:
-        add_cloudfly_vps(api_id, instance_data)
-
-def list_cloudfly_vps(user_id: int) -> List[dict]:
-    """Lấy danh sách VPS CloudFly của user"""
-    vps_list = []
-    apis = CloudFlyAPI.query.filter_by(user_id=user_id).all()
+        instance_id = instance_data.get('id')
+        if instance_id:
+            incoming[str(instance_id)] = (str(instance_id), _cloudfly_vps_fields(instance_data))
     
-    for api in apis:
-        vps_instances = CloudFlyVPS.query.filter_by(api_id=api.id).all()
-        for vps in vps_instances:
-            vps_dict = cloudfly_vps_to_dict(vps)
-            vps_dict['api_email'] = api.email
-            vps_list.append(vps_dict)
+    now = datetime.utcnow()
+    counts = _sync_rows(CloudFlyVPS, 'api_id', api_id, 'instance_id', incoming, now, {'created_at': now})
+    if counts['inserted'] or counts['updated'] or counts['deleted']:
+        _mark_owner_dirty(CloudFlyAPI, api_id)
     
-    return vps_list
+    if commit:
+        db.session.commit()
+    return counts
+
+CLOUDFLY_VPS_SORT_KEYS = ('id', 'name', 'status', 'region', 'created_at')
+# CloudFly gọi vị trí là region; filter 'location' dùng chung tên với các endpoint khác
+CLOUDFLY_VPS_FILTERS = {'status': CloudFlyVPS.status, 'location': CloudFlyVPS.region}
+
+def _cloudfly_vps_query(user_id: int, filters: Optional[dict] = None):
+    query = (db.select(CloudFlyVPS, CloudFlyAPI.email)
+             .join(CloudFlyAPI, CloudFlyVPS.api_id == CloudFlyAPI.id)
+             .where(CloudFlyAPI.user_id == user_id))
+    return apply_filters(query, filters or {}, CLOUDFLY_VPS_FILTERS)
+
+def _cloudfly_vps_row_to_dict(vps: CloudFlyVPS, email: str) -> dict:
+    vps_dict = cloudfly_vps_to_dict(vps)
+    vps_dict['api_email'] = email
+    return vps_dict
+
+def list_cloudfly_vps(user_id: int, filters: Optional[dict] = None) -> List[dict]:
+    """Lấy danh sách VPS CloudFly của user (một query join với các API)"""
+    rows = db.session.execute(
+        _cloudfly_vps_query(user_id, filters).order_by(CloudFlyAPI.id, CloudFlyVPS.id)
+    ).all()
+    return [_cloudfly_vps_row_to_dict(vps, email) for vps, email in rows]
+
+def page_cloudfly_vps(user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                      sort: Optional[str] = None, filters: Optional[dict] = None) -> dict:
+    """Một trang VPS CloudFly theo keyset (cursor), có lọc và sắp xếp"""
+    key, descending = parse_sort(sort, CLOUDFLY_VPS_SORT_KEYS, 'id')
+    rows, next_cursor = keyset_page(_cloudfly_vps_query(user_id, filters), getattr(CloudFlyVPS, key),
+                                    CloudFlyVPS.id, lambda row: (getattr(row[0], key), row[0].id),
+                                    cursor, limit, descending)
+    return {'items': [_cloudfly_vps_row_to_dict(vps, email) for vps, email in rows],
+            'next_cursor': next_cursor, 'has_more': next_cursor is not None}
 
 def delete_cloudfly_vps(vps_id: int) -> None:
     """Xóa VPS CloudFly"""
     vps = CloudFlyVPS.query.get(vps_id)
     if vps:
+        _mark_owner_dirty(CloudFlyAPI, vps.api_id)
         db.session.delete(vps)
         db.session.commit()
 
@@ -593,8 +795,12 @@ def get_user_notify_hour(user_id: int) -> int:
 
 # ==================== PROXY MANAGEMENT ====================
 
-def proxy_to_dict(proxy: Proxy) -> dict:
-    """Convert Proxy object to dictionary"""
+def proxy_to_dict(proxy: Proxy, include_secrets: bool = True) -> dict:
+    """Convert Proxy object to dictionary.
+
+    include_secrets=False bỏ qua password (không giải mã) cho các màn hình list
+    không cần hiển thị bí mật.
+    """
     return {
         'id': proxy.id,
         'name': proxy.name,
@@ -602,7 +808,8 @@ def proxy_to_dict(proxy: Proxy) -> dict:
         'port': proxy.port,
         'port_socks5': proxy.port_socks5,
         'username': proxy.username,
-        'password': proxy.password,  # Sẽ được mã hóa
+        'password': proxy.password if include_secrets else None,
+        'has_password': bool(proxy.password_encrypted),
         'type': proxy.type,
         'location': proxy.location,
         'status': proxy.status,
@@ -611,6 +818,9 @@ def proxy_to_dict(proxy: Proxy) -> dict:
         'source_id': proxy.source_id,
         'note': proxy.note,
         'auto_renew': proxy.auto_renew,
+        'health': proxy.health,
+        'last_checked_at': proxy.last_checked_at.isoformat() if proxy.last_checked_at else None,
+        'last_latency_ms': proxy.last_latency_ms,
         'created_at': proxy.created_at.isoformat() if proxy.created_at else None,
         'updated_at': proxy.updated_at.isoformat() if proxy.updated_at else None
     }
@@ -656,6 +866,7 @@ def add_proxy(user_id: int, proxy_data: dict) -> Proxy:
     )
     
     db.session.add(proxy)
+    mark_inventory_dirty(user_id)
     db.session.commit()
     return proxy
 
@@ -692,6 +903,7 @@ def update_proxy(proxy_id: int, user_id: int, proxy_data: dict) -> Proxy:
         if hasattr(proxy, key):
             setattr(proxy, key, value)
     
+    mark_inventory_dirty(user_id)
     db.session.commit()
     return proxy
 
@@ -699,95 +911,138 @@ def delete_proxy(proxy_id: int, user_id: int) -> None:
     """Xóa proxy"""
     proxy = Proxy.query.filter_by(id=proxy_id, user_id=user_id).first()
     if proxy:
+        mark_inventory_dirty(user_id)
         db.session.delete(proxy)
         db.session.commit()
 
-def list_proxies(user_id: int) -> List[dict]:
+PROXY_SORT_KEYS = ('created_at', 'expire_date', 'name', 'ip', 'status', 'id')
+PROXY_FILTERS = {'source': Proxy.source, 'status': Proxy.status, 'location': Proxy.location,
+                 'type': Proxy.type, 'q': (Proxy.name, Proxy.ip), 'expiring_within': Proxy.expire_date,
+                 'expired': Proxy.expire_date}
+
+def proxy_query(user_id: int, filters: Optional[dict] = None):
+    return apply_filters(db.select(Proxy).where(Proxy.user_id == user_id), filters or {}, PROXY_FILTERS)
+
+def list_proxies(user_id: int, include_secrets: bool = True, filters: Optional[dict] = None) -> List[dict]:
     """Lấy danh sách proxy của user"""
-    proxies = Proxy.query.filter_by(user_id=user_id).order_by(Proxy.created_at.desc()).all()
-    return [proxy_to_dict(p) for p in proxies]
+    proxies = db.session.execute(proxy_query(user_id, filters).order_by(Proxy.created_at.desc())).scalars()
+    return [proxy_to_dict(p, include_secrets) for p in proxies]
+
+def page_proxies(user_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                 sort: Optional[str] = None, filters: Optional[dict] = None,
+                 include_secrets: bool = True) -> dict:
+    """Một trang proxy theo keyset (cursor), có lọc và sắp xếp; chỉ giải mã password của trang này"""
+    key, descending = parse_sort(sort, PROXY_SORT_KEYS, '-created_at')
+    rows, next_cursor = keyset_page(proxy_query(user_id, filters), getattr(Proxy, key), Proxy.id,
+                                    lambda row: (getattr(row[0], key), row[0].id),
+                                    cursor, limit, descending)
+    return {'items': [proxy_to_dict(row[0], include_secrets) for row in rows],
+            'next_cursor': next_cursor, 'has_more': next_cursor is not None}
 
 def get_proxy_by_id(proxy_id: int, user_id: int) -> Optional[Proxy]:
     """Lấy proxy theo ID"""
     return Proxy.query.filter_by(id=proxy_id, user_id=user_id).first()
 
-def import_proxies_from_zingproxy(user_id: int, zingproxy_data: List[dict]) -> int:
-    """Import proxy từ ZingProxy"""
-    imported_count = 0
-    updated_count = 0
-    error_count = 0
-    
-    logger.info(f"[Manager] Starting import of {len(zingproxy_data)} proxies from ZingProxy for user {user_id}")
+def _zingproxy_proxy_fields(proxy_data: dict) -> dict:
+    """Các cột của bảng proxies được cập nhật từ ZingProxy (password để dạng rõ, mã hóa khi ghi)"""
+    return {
+        'ip': proxy_data.get('ip', ''),
+        'port': proxy_data.get('port', ''),
+        'port_socks5': proxy_data.get('port_socks5'),
+        'username': proxy_data.get('username'),
+        'password': proxy_data.get('password'),
+        'status': proxy_data.get('status', 'active'),
+        'expire_at': proxy_data.get('expire_at'),
+        'expire_date': parse_expiry_date(proxy_data.get('expire_at')),
+        'location': proxy_data.get('location', 'vn'),
+        'type': proxy_data.get('type', 'HTTP'),
+        'note': proxy_data.get('note', ''),
+        'auto_renew': proxy_data.get('auto_renew', False),
+    }
+
+def sync_zingproxy_proxies(user_id: int, zingproxy_data: List[dict], commit: bool = True) -> Dict[str, int]:
+    """Đồng bộ proxy ZingProxy vào bảng proxies của user theo lô.
+
+    Đọc một lần toàn bộ proxy nguồn zingproxy của user (key theo source_id),
+    so sánh trong bộ nhớ rồi bulk insert/update. Password chỉ được mã hóa
+    lại khi thực sự thay đổi. Proxy không còn trên ZingProxy được giữ nguyên.
+    """
+    from core.encryption import encrypt_sensitive_data, decrypt_sensitive_data
     
+    incoming = {}
     for proxy_data in zingproxy_data:
-        try:
-            proxy_id = proxy_data.get('proxy_id', 'Unknown')
-            
+        proxy_id = proxy_data.get('proxy_id', 'Unknown')
+        incoming[str(proxy_id)] = (proxy_id, _zingproxy_proxy_fields(proxy_data))
+    
+    columns = [c for c in _zingproxy_proxy_fields({}) if c != 'password']
+    existing = {}
+    for row in db.session.execute(
+        db.select(Proxy.id, Proxy.source_id, Proxy.password_encrypted, *[getattr(Proxy, c) for c in columns])
+        .where(Proxy.user_id == user_id, Proxy.source == 'zingproxy')
+    ).all():
+        existing.setdefault(str(row.source_id), row)
+    
+    now = datetime.now()
+    to_insert = []
+    to_update = []
+    unchanged = 0
+    for key, (proxy_id, fields) in incoming.items():
+        password = fields.pop('password')
+        row = existing.get(key)
+        if row is None:
             # Tạo tên proxy từ thông tin có sẵn
             proxy_name = f"ZingProxy_{proxy_id}"
-            if proxy_data.get('type'):
-                proxy_name = f"ZingProxy_{proxy_data.get('type')}_{proxy_id}"
-            
-            # Kiểm tra xem proxy đã tồn tại chưa
-            existing = Proxy.query.filter_by(
-                user_id=user_id,
-                source='zingproxy',
-                source_id=proxy_id
-            ).first()
-            
-            if existing:
-                # Cập nhật proxy hiện có
-                logger.info(f"[Manager] Updating existing proxy {proxy_id}: {proxy_data.get('ip')}:{proxy_data.get('port')}")
-                existing.ip = proxy_data.get('ip', '')
-                existing.port = proxy_data.get('port', '')
-                existing.port_socks5 = proxy_data.get('port_socks5')
-                existing.username = proxy_data.get('username')
-                existing.password = proxy_data.get('password')
-                existing.status = proxy_data.get('status', 'active')
-                existing.expire_at = proxy_data.get('expire_at')
-                existing.location = proxy_data.get('location', 'vn')
-                existing.type = proxy_data.get('type', 'HTTP')
-                existing.note = proxy_data.get('note', '')
-                existing.auto_renew = proxy_data.get('auto_renew', False)
-                existing.updated_at = datetime.now()
-                updated_count += 1
-            else:
-                # Tạo proxy mới
-                logger.info(f"[Manager] Creating new proxy {proxy_id}: {proxy_data.get('ip')}:{proxy_data.get('port')}")
-                proxy = Proxy(
-                    user_id=user_id,
-                    name=proxy_name,
-                    ip=proxy_data.get('ip', ''),
-                    port=proxy_data.get('port', ''),
-                    port_socks5=proxy_data.get('port_socks5'),
-                    username=proxy_data.get('username'),
-                    password=proxy_data.get('password'),
-                    type=proxy_data.get('type', 'HTTP'),
-                    location=proxy_data.get('location', 'vn'),
-                    status=proxy_data.get('status', 'active'),
-                    expire_at=proxy_data.get('expire_at'),
-                    source='zingproxy',
-                    source_id=proxy_id,
-                    note=proxy_data.get('note', ''),
-                    auto_renew=proxy_data.get('auto_renew', False)
-                )
-                db.session.add(proxy)
-                imported_count += 1
-            
-        except Exception as e:
-            logger.error(f"[Manager] Error importing proxy {proxy_data.get('proxy_id')}: {e}")
-            error_count += 1
+            if fields.get('type'):
+                proxy_name = f"ZingProxy_{fields['type']}_{proxy_id}"
+            to_insert.append({
+                'user_id': user_id,
+                'name': proxy_name,
+                'source': 'zingproxy',
+                'source_id': proxy_id,
+                'password_encrypted': encrypt_sensitive_data(password) if password else None,
+                'created_at': now,
+                'updated_at': now,
+                **fields
+            })
             continue
+        
+        changes = {c: v for c, v in fields.items() if _value_changed(getattr(row, c), v)}
+        old_password = decrypt_sensitive_data(row.password_encrypted) if row.password_encrypted else None
+        if _value_changed(old_password, password or None):
+            changes['password_encrypted'] = encrypt_sensitive_data(password) if password else None
+        if changes:
+            to_update.append({'id': row.id, 'updated_at': now, **changes})
+        else:
+            unchanged += 1
     
-    try:
+    if to_update:
+        db.session.execute(db.update(Proxy), to_update)
+    if to_insert:
+        db.session.execute(db.insert(Proxy), to_insert)
+    if to_insert or to_update:
+        mark_inventory_dirty(user_id)
+    
+    counts = {'inserted': len(to_insert), 'updated': len(to_update), 'unchanged': unchanged}
+    logger.info(f"[Manager] ZingProxy sync for user {user_id}: {counts['inserted']} new, "
+                f"{counts['updated']} updated, {counts['unchanged']} unchanged")
+    if commit:
         db.session.commit()
-        logger.info(f"[Manager] Successfully imported {imported_count} new proxies, updated {updated_count} existing proxies, {error_count} errors")
+    return counts
+
+def import_proxies_from_zingproxy(user_id: int, zingproxy_data: List[dict], commit: bool = True) -> int:
+    """Import proxy từ ZingProxy, trả về số proxy đã đồng bộ"""
+    logger.info(f"[Manager] Starting import of {len(zingproxy_data)} proxies from ZingProxy for user {user_id}")
+    
+    try:
+        counts = sync_zingproxy_proxies(user_id, zingproxy_data, commit=commit)
     except Exception as e:
         logger.error(f"[Manager] Error committing to database: {e}")
+        if not commit:
+            raise
         db.session.rollback()
         return 0
     
-    return imported_count + updated_count 
+    return counts['inserted'] + counts['updated'] + counts['unchanged']
 
 def rocket_chat_config_to_dict(config: RocketChatConfig) -> dict:
     """Convert RocketChatConfig object to dictionary"""
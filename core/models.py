@@ -1,11 +1,32 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from core.encryption import encrypt_sensitive_data, decrypt_sensitive_data
-from datetime import datetime
+from datetime import datetime, date
+from typing import Optional
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 db = SQLAlchemy()
 
+def parse_expiry_date(date_str: Optional[str]) -> Optional[date]:
+    """Parse ngày hết hạn từ nhiều định dạng khác nhau"""
+    try:
+        if not date_str:
+            return None
+
+        # Xử lý ISO 8601 format: 2025-10-11T03:25:07.000Z
+        if 'T' in date_str:
+            return datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
+        # Xử lý YYYY-MM-DD format
+        else:
+            return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except Exception as e:
+        logger.warning(f"Error parsing expiry date {date_str}: {e}")
+        return None
+
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -67,6 +88,7 @@ class BitLaunchAPI(db.Model):
 
 class BitLaunchVPS(db.Model):
     __tablename__ = 'bitlaunch_vps'
+    __table_args__ = (db.Index('ix_bitlaunch_vps_api_status', 'api_id', 'status'),)
     id = db.Column(db.Integer, primary_key=True)
     api_id = db.Column(db.Integer, db.ForeignKey('bitlaunch_apis.id'), nullable=False)
     server_id = db.Column(db.Integer, nullable=False)  # ID server từ BitLaunch
@@ -85,9 +107,15 @@ class VPS(db.Model):
     name = db.Column(db.String)
     ip = db.Column(db.String)
     expiry = db.Column(db.String)
+    expiry_date = db.Column(db.Date, nullable=True, index=True)  # expiry đã parse, dùng cho range query
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    @validates('expiry')
+    def _sync_expiry_date(self, key, value):
+        self.expiry_date = parse_expiry_date(value)
+        return value
+
     @staticmethod
     def validate_expiry(expiry):
         """Validate expiry date format"""
@@ -104,9 +132,15 @@ class Account(db.Model):
     username = db.Column(db.String)
     password_encrypted = db.Column(db.String(512), nullable=True)  # Password đã mã hóa
     expiry = db.Column(db.String)
+    expiry_date = db.Column(db.Date, nullable=True, index=True)  # expiry đã parse, dùng cho range query
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    @validates('expiry')
+    def _sync_expiry_date(self, key, value):
+        self.expiry_date = parse_expiry_date(value)
+        return value
+
     @property
     def password(self):
         """Get decrypted password"""
@@ -148,6 +182,7 @@ class ZingProxy(db.Model):
     port_socks5 = db.Column(db.String(16), nullable=True)  # Port SOCKS5
     status = db.Column(db.String(32), nullable=True)
     expire_at = db.Column(db.String(32), nullable=True)
+    expire_date = db.Column(db.Date, nullable=True, index=True)  # expire_at đã parse, dùng cho range query
     location = db.Column(db.String(64), nullable=True)
     type = db.Column(db.String(32), nullable=True)
     username = db.Column(db.String(128), nullable=True)  # Username cho proxy
@@ -158,8 +193,24 @@ class ZingProxy(db.Model):
     link_change_ip = db.Column(db.String(512), nullable=True)  # Link đổi IP
     last_updated = db.Column(db.DateTime, nullable=True)
 
+    @validates('expire_at')
+    def _sync_expire_date(self, key, value):
+        self.expire_date = parse_expiry_date(value)
+        return value
+
 class Proxy(db.Model):
     __tablename__ = 'proxies'
+    # Index cho list phân trang: mọi filter/sort đều đi kèm user_id. Mỗi key trong
+    # manager.PROXY_SORT_KEYS có index (user_id, key, id) khớp ORDER BY của keyset_page;
+    # filter source/location/type được lọc trên các dòng đọc theo index sort, không có index riêng
+    __table_args__ = (
+        db.Index('ix_proxies_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_proxies_user_expire_id', 'user_id', 'expire_date', 'id'),
+        db.Index('ix_proxies_user_name_id', 'user_id', 'name', 'id'),
+        db.Index('ix_proxies_user_ip_id', 'user_id', 'ip', 'id'),
+        db.Index('ix_proxies_user_status_id', 'user_id', 'status', 'id'),
+        db.Index('ix_proxies_user_id', 'user_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(128), nullable=False)  # Tên proxy
@@ -172,10 +223,16 @@ class Proxy(db.Model):
     location = db.Column(db.String(64), nullable=True)  # Quốc gia/địa điểm
     status = db.Column(db.String(32), default='active')  # active, inactive, expired
     expire_at = db.Column(db.String(32), nullable=True)  # Ngày hết hạn
+    expire_date = db.Column(db.Date, nullable=True, index=True)  # expire_at đã parse, dùng cho range query
     source = db.Column(db.String(32), default='manual')  # manual, zingproxy, other
     source_id = db.Column(db.String(64), nullable=True)  # ID từ nguồn gốc (nếu có)
     note = db.Column(db.String(512), nullable=True)  # Ghi chú
     auto_renew = db.Column(db.Boolean, default=False)  # Tự động gia hạn
+    last_checked_at = db.Column(db.DateTime, nullable=True)  # Lần kiểm tra sống/chết gần nhất
+    last_latency_ms = db.Column(db.Integer, nullable=True)  # Thời gian mở tunnel qua proxy (ms)
+    check_failures = db.Column(db.Integer, nullable=True, default=0)  # Số lần kiểm tra lỗi liên tiếp
+    # alive/dead theo checker (None nếu chưa kiểm tra); tách khỏi status do user/provider quản lý
+    health = db.Column(db.String(16), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -189,6 +246,11 @@ class Proxy(db.Model):
         """Set encrypted password"""
         self.password_encrypted = encrypt_sensitive_data(value) if value else None
 
+    @validates('expire_at')
+    def _sync_expire_date(self, key, value):
+        self.expire_date = parse_expiry_date(value)
+        return value
+
     @staticmethod
     def validate_ip(ip):
         """Validate IP address format"""
@@ -237,6 +299,7 @@ class CloudFlyAPI(db.Model):
 
 class CloudFlyVPS(db.Model):
     __tablename__ = 'cloudfly_vps'
+    __table_args__ = (db.Index('ix_cloudfly_vps_api_status', 'api_id', 'status'),)
     id = db.Column(db.Integer, primary_key=True)
     api_id = db.Column(db.Integer, db.ForeignKey('cloudfly_apis.id'), nullable=False)
     instance_id = db.Column(db.String(64), nullable=False)  # ID instance từ CloudFly
@@ -281,4 +344,126 @@ class RocketChatConfig(db.Model):
         """Validate Rocket Chat user ID format"""
         if not user_id or len(user_id) < 5:
             return False
-        return True 
\ No newline at end of file
+        return True
+
+class SchedulerLease(db.Model):
+    """Lease bầu leader: chỉ process đang giữ lease (chưa hết hạn) được chạy scheduler"""
+    __tablename__ = 'scheduler_leases'
+    name = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)  # hostname:pid:token của process giữ lease
+    acquired_at = db.Column(db.DateTime, nullable=False)
+    renewed_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class SchedulerCursor(db.Model):
+    """Vị trí xoay vòng của job chạy theo lượt (vd. shard proxy kế tiếp), giữ qua restart và đổi leader"""
+    __tablename__ = 'scheduler_cursors'
+    name = db.Column(db.String(64), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class JobRun(db.Model):
+    """Lịch sử mỗi lần chạy job của scheduler"""
+    __tablename__ = 'job_runs'
+    __table_args__ = (db.Index('ix_job_runs_job_started', 'job_id', 'started_at'),
+                      db.Index('ix_job_runs_started', 'started_at'))
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(191), nullable=False)
+    status = db.Column(db.String(16), nullable=False)  # success, error, missed
+    scheduled_run_time = db.Column(db.DateTime, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    items_processed = db.Column(db.Integer, nullable=True)  # Giá trị job trả về (số item đã xử lý)
+    error = db.Column(db.String(512), nullable=True)
+
+class AlertState(db.Model):
+    """Trạng thái cảnh báo lỗi API theo (user, provider, tài khoản, loại lỗi) để chống gửi trùng"""
+    __tablename__ = 'alert_states'
+    __table_args__ = (db.UniqueConstraint('user_id', 'provider', 'account', 'error_class', name='uq_alert_state_key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    provider = db.Column(db.String(32), nullable=False)  # BitLaunch, ZingProxy, CloudFly
+    account = db.Column(db.String(128), nullable=False)  # Email tài khoản
+    error_class = db.Column(db.String(32), nullable=False)  # auth, rate_limit, timeout, network, stale, error
+    status = db.Column(db.String(16), nullable=False, default='failing', index=True)  # failing, recovered
+    first_seen = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_sent = db.Column(db.DateTime, nullable=True)
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(512), nullable=True)
+
+class RocketChatOutbox(db.Model):
+    """Hàng đợi thông báo Rocket Chat, được gửi bởi dispatcher chạy nền"""
+    __tablename__ = 'rocket_chat_outbox'
+    __table_args__ = (db.Index('ix_rocket_chat_outbox_status_next', 'status', 'next_attempt_at'),
+                      db.Index('ix_rocket_chat_outbox_status_created', 'status', 'created_at'))
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.String(128), nullable=False)
+    # Token không được sao chép vào outbox, dispatcher đọc từ config lúc gửi
+    config_id = db.Column(db.Integer, db.ForeignKey('rocket_chat_configs.id', ondelete='SET NULL'), nullable=True)
+    title = db.Column(db.String(256), nullable=True)
+    text = db.Column(db.Text, nullable=False)
+    color = db.Column(db.String(16), nullable=True, default='good')
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(512), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class ReencryptionCheckpoint(db.Model):
+    """Tiến độ re-encrypt secret của mỗi bảng theo key chính, để job chạy tiếp được sau khi dừng"""
+    __tablename__ = 'reencryption_checkpoints'
+    table_name = db.Column(db.String(64), primary_key=True)
+    key_fingerprint = db.Column(db.String(32), nullable=False)  # Key chính lúc bắt đầu lượt re-encrypt
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # Id lớn nhất đã xử lý (keyset)
+    rotated = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+class ProxyCheck(db.Model):
+    """Lịch sử kiểm tra proxy (mỗi giao thức một dòng)"""
+    __tablename__ = 'proxy_checks'
+    __table_args__ = (db.Index('ix_proxy_checks_proxy_checked', 'proxy_id', 'checked_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    proxy_id = db.Column(db.Integer, db.ForeignKey('proxies.id', ondelete='CASCADE'), nullable=False)
+    protocol = db.Column(db.String(16), nullable=False)  # http, socks5
+    port = db.Column(db.String(16), nullable=False)
+    success = db.Column(db.Boolean, nullable=False)
+    latency_ms = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    checked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class BalanceSample(db.Model):
+    """Số dư của tài khoản provider mỗi lần sync lấy được (chỉ thêm, không sửa)"""
+    __tablename__ = 'balance_samples'
+    __table_args__ = (db.Index('ix_balance_samples_account_time', 'provider', 'account_id', 'sampled_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(16), nullable=False)  # bitlaunch, zingproxy, cloudfly
+    account_id = db.Column(db.Integer, nullable=False)  # Id của BitLaunchAPI / ZingProxyAccount / CloudFlyAPI
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    balance = db.Column(db.Float, nullable=False)
+    sampled_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class BalanceRollup(db.Model):
+    """Số dư gộp theo giờ/ngày (open/close/min/max/sum) từ balance_samples, dùng cho biểu đồ"""
+    __tablename__ = 'balance_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'provider', 'account_id', 'bucket_start', name='uq_balance_rollup_bucket'),
+        db.Index('ix_balance_rollups_user_bucket', 'user_id', 'resolution', 'bucket_start'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(8), nullable=False)  # hour, day
+    provider = db.Column(db.String(16), nullable=False)
+    account_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)  # Đầu giờ/ngày (UTC)
+    samples = db.Column(db.Integer, nullable=False)
+    balance_open = db.Column(db.Float, nullable=False)
+    balance_close = db.Column(db.Float, nullable=False)
+    balance_min = db.Column(db.Float, nullable=False)
+    balance_max = db.Column(db.Float, nullable=False)
+    balance_sum = db.Column(db.Float, nullable=False)  # avg = balance_sum / samples
@@ -4,6 +4,7 @@ from core.models import User, RocketChatConfig
 from core.rocket_chat import send_account_expiry_notification, send_daily_account_summary
 import logging
 from core import manager
+from core import inventory
 
 logger = logging.getLogger(__name__)
 
@@ -59,7 +60,12 @@ def notify_expiry_rocketchat_per_user(items: List[Dict], item_type: str, user: U
         logger.debug(f"[Notifier] User {user.username} notify time: {user.notify_hour:02d}:{user.notify_minute:02d}, current: {current_hour:02d}:{current_minute:02d}")
         return
         
-    logger.info(f"[Notifier] Gửi thông báo RocketChat cho user {user.username} lúc {current_hour:02d}:{current_minute:02d}")
+    send_expiry_rocketchat(items, item_type, user, config)
+
+def send_expiry_rocketchat(items: List[Dict], item_type: str, user: User, config: RocketChatConfig) -> None:
+    """Gửi ngay thông báo hết hạn qua RocketChat cho user (job theo lịch của user gọi hàm này)"""
+    now = datetime.now()
+    logger.info(f"[Notifier] Gửi thông báo RocketChat cho user {user.username} lúc {now.hour:02d}:{now.minute:02d}")
     
     # Lọc items sắp hết hạn theo notify_days của user
     expiring_items = []
@@ -131,52 +137,7 @@ def send_daily_summary_rocketchat(user: User, config: RocketChatConfig) -> None:
     
     try:
         # Lấy danh sách tài khoản từ TẤT CẢ nguồn
-        # 1. Tài khoản thủ công
-        manual_acc_list = manager.list_accounts()
-        for acc in manual_acc_list:
-            if 'service' not in acc:
-                acc['service'] = ''
-            acc['source'] = 'manual'
-        
-        # 2. Tài khoản từ BitLaunch
-        bitlaunch_apis = manager.list_bitlaunch_apis(user.id)
-        bitlaunch_acc_list = []
-        for api in bitlaunch_apis:
-            acc = {
-                'id': f"bitlaunch_{api['id']}",
-                'username': api['email'],
-                'service': 'BitLaunch',
-                'expiry': None,
-                'balance': api.get('balance', 0),
-                'source': 'bitlaunch'
-            }
-            bitlaunch_acc_list.append(acc)
-        
-        # 3. Tài khoản từ ZingProxy
-        zingproxy_acc_list = manager.list_zingproxy_accounts(user.id)
-        for acc in zingproxy_acc_list:
-            acc['source'] = 'zingproxy'
-            acc['username'] = acc.get('email', 'N/A')
-            acc['service'] = 'ZingProxy'
-            acc['expiry'] = None
-            acc['balance'] = acc.get('balance', 0)
-        
-        # 4. Tài khoản từ CloudFly
-        cloudfly_apis = manager.list_cloudfly_apis(user.id)
-        cloudfly_acc_list = []
-        for api in cloudfly_apis:
-            acc = {
-                'id': f"cloudfly_{api['id']}",
-                'username': api['email'],
-                'service': 'CloudFly',
-                'expiry': None,
-                'balance': api.get('balance', 0),
-                'source': 'cloudfly'
-            }
-            cloudfly_acc_list.append(acc)
-        
-        # Kết hợp tất cả tài khoản
-        all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
+        all_accounts = inventory.list_accounts(user.id)
         
         logger.info(f"[Notifier] Retrieved {len(all_accounts)} total accounts for user {user.username}")
         
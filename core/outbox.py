@@ -0,0 +1,260 @@
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import time
+import random
+import logging
+import threading
+from core.models import db, RocketChatOutbox, RocketChatConfig
+from core import rocket_chat
+
+logger = logging.getLogger(__name__)
+
+# Số message gửi song song tối đa
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '4'))
+# Thông báo cùng room trong khoảng này (giây) được gộp thành một message
+OUTBOX_MERGE_WINDOW = int(os.getenv('OUTBOX_MERGE_WINDOW', '10'))
+# Khoảng nghỉ giữa các lần quét outbox khi không có thông báo mới
+OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+# Message đã gửi/thất bại được giữ bấy nhiêu ngày rồi xóa (message pending không bao giờ bị xóa)
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+OUTBOX_BATCH_SIZE = 200
+# Message đã được một dispatcher nhận gửi bị khóa trong khoảng này (giây); nếu process đó chết
+# giữa chừng thì message được gửi lại sau khi hết hạn
+OUTBOX_CLAIM_SECONDS = 120
+# Khoảng cách (giây) giữa các lần dọn outbox trong vòng lặp dispatcher
+OUTBOX_PRUNE_INTERVAL = 3600
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+_wakeup = threading.Event()
+
+def enqueue(room_id: str, title: str, text: str, config_id: int, color: str = 'good',
+            commit: bool = False) -> RocketChatOutbox:
+    """Thêm thông báo vào outbox và trả về ngay, không gọi Rocket Chat.
+
+    Outbox chỉ lưu id của Rocket Chat config, token được đọc lúc gửi. Mặc định message
+    được thêm vào session của caller và chỉ được gửi khi caller commit. `commit=True` ghi
+    ngay trong transaction riêng, không commit các thay đổi đang chờ trong session của caller.
+    """
+    now = datetime.utcnow()
+    values = dict(room_id=room_id, config_id=config_id, title=title, text=text, color=color,
+                  status='pending', attempts=0, next_attempt_at=now, created_at=now)
+    if commit:
+        with db.engine.begin() as conn:
+            message_id = conn.execute(db.insert(RocketChatOutbox).values(**values)).inserted_primary_key[0]
+        message = db.session.get(RocketChatOutbox, message_id)
+    else:
+        message = RocketChatOutbox(**values)
+        db.session.add(message)
+    _wakeup.set()
+    return message
+
+def backoff_delay(attempts: int) -> float:
+    """Thời gian chờ (giây) trước lần gửi lại thứ `attempts`: exponential backoff có jitter"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+def _attachments(messages: List[RocketChatOutbox]) -> List[Dict]:
+    return [{
+        'title': m.title,
+        'text': m.text,
+        'color': m.color or 'good',
+        'ts': m.created_at.isoformat()
+    } for m in messages]
+
+def _due_groups(now: datetime) -> List[List[RocketChatOutbox]]:
+    """Các nhóm thông báo (theo room + Rocket Chat config) đã đến lúc gửi"""
+    rows = RocketChatOutbox.query.filter(
+        RocketChatOutbox.status == 'pending',
+        RocketChatOutbox.next_attempt_at <= now
+    ).order_by(RocketChatOutbox.id).limit(OUTBOX_BATCH_SIZE).all()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.room_id, row.config_id), []).append(row)
+
+    merge_after = now - timedelta(seconds=OUTBOX_MERGE_WINDOW)
+    due = []
+    for messages in groups.values():
+        # Chờ hết cửa sổ gộp để các cảnh báo tới sau đi chung một message
+        if all(m.attempts == 0 for m in messages) and min(m.created_at for m in messages) > merge_after:
+            continue
+        due.append(messages)
+    return due
+
+def _send(request: tuple) -> tuple:
+    room_id, auth_token, user_id, attachments = request
+    return rocket_chat.post_attachments(room_id, auth_token, user_id, attachments)
+
+def _claim(groups: List[List[RocketChatOutbox]], now: datetime) -> List[List[RocketChatOutbox]]:
+    """Nhận gửi các nhóm bằng cách đẩy next_attempt_at ra sau OUTBOX_CLAIM_SECONDS.
+
+    UPDATE có điều kiện nên khi nhiều process cùng chạy dispatcher, mỗi nhóm chỉ được
+    một process gửi; nhóm bị process khác nhận mất một phần thì bỏ qua lượt này.
+    """
+    claimed = []
+    until = now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+    for messages in groups:
+        ids = [m.id for m in messages]
+        result = db.session.execute(
+            db.update(RocketChatOutbox)
+            .where(RocketChatOutbox.id.in_(ids), RocketChatOutbox.status == 'pending',
+                   RocketChatOutbox.next_attempt_at <= now)
+            .values(next_attempt_at=until)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == len(ids):
+            claimed.append(messages)
+    db.session.commit()
+    return claimed
+
+def dispatch_once(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Gửi các thông báo đến hạn một lần, trả về số message đã gửi/thất bại"""
+    now = now or datetime.utcnow()
+    groups = _claim(_due_groups(now), now)
+    counts = {'sent': 0, 'retry': 0, 'failed': 0, 'messages': len(groups)}
+    if not groups:
+        return counts
+
+    config_ids = {messages[0].config_id for messages in groups}
+    configs = {c.id: c for c in RocketChatConfig.query.filter(RocketChatConfig.id.in_(config_ids))}
+    sendable, requests = [], []
+    for messages in groups:
+        config = configs.get(messages[0].config_id)
+        if config is None or not config.is_active:
+            # Config đã bị xóa/tắt sau khi thông báo được đưa vào outbox
+            for message in messages:
+                message.status = 'failed'
+                message.last_error = 'Rocket Chat config không còn hoạt động'
+                counts['failed'] += 1
+            continue
+        sendable.append(messages)
+        requests.append((messages[0].room_id, config.auth_token, config.user_id_rocket, _attachments(messages)))
+
+    # Mỗi nhóm gộp thành một message nhiều attachment; chỉ phần gọi HTTP chạy song song,
+    # đọc/ghi DB ở thread hiện tại
+    results = []
+    if requests:
+        with ThreadPoolExecutor(max_workers=min(OUTBOX_CONCURRENCY, len(requests))) as executor:
+            results = list(executor.map(_send, requests))
+
+    sent_at = datetime.utcnow()
+    for messages, (ok, error) in zip(sendable, results):
+        for message in messages:
+            if ok:
+                message.status = 'sent'
+                message.sent_at = sent_at
+                counts['sent'] += 1
+                continue
+            message.attempts += 1
+            message.last_error = (error or '')[:512]
+            if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                message.status = 'failed'
+                counts['failed'] += 1
+            else:
+                message.next_attempt_at = sent_at + timedelta(seconds=backoff_delay(message.attempts))
+                counts['retry'] += 1
+    db.session.commit()
+
+    logger.info(f"[Outbox] Dispatched {counts['messages']} messages: {counts['sent']} sent, "
+                f"{counts['retry']} to retry, {counts['failed']} failed")
+    return counts
+
+def prune_outbox(days: int = OUTBOX_RETENTION_DAYS, now: Optional[datetime] = None) -> int:
+    """Xóa message đã gửi/thất bại cũ hơn `days` ngày"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    deleted = db.session.execute(
+        db.delete(RocketChatOutbox).where(RocketChatOutbox.status.in_(('sent', 'failed')),
+                                          RocketChatOutbox.created_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    if deleted:
+        logger.info(f"[Outbox] Pruned {deleted} messages older than {days} days")
+    return deleted
+
+def get_queue_stats() -> Dict:
+    """Độ sâu hàng đợi outbox theo trạng thái"""
+    rows = db.session.execute(
+        db.select(RocketChatOutbox.status, db.func.count(RocketChatOutbox.id), db.func.min(RocketChatOutbox.created_at))
+        .group_by(RocketChatOutbox.status)
+    ).all()
+    stats = {'pending': 0, 'sent': 0, 'failed': 0, 'oldest_pending_seconds': None}
+    for status, count, oldest in rows:
+        stats[status] = count
+        if status == 'pending' and oldest:
+            stats['oldest_pending_seconds'] = int((datetime.utcnow() - oldest).total_seconds())
+    return stats
+
+class OutboxDispatcher:
+    """Thread nền gửi outbox: thức dậy khi có thông báo mới hoặc sau mỗi OUTBOX_POLL_INTERVAL giây.
+
+    Chạy ở mọi process server, độc lập với scheduler (kể cả khi ENABLE_SCHEDULER=false);
+    nhiều dispatcher chạy cùng lúc không gửi trùng nhờ `_claim`. Dọn message cũ mỗi
+    OUTBOX_PRUNE_INTERVAL giây.
+    """
+
+    def __init__(self, app, poll_interval: int = OUTBOX_POLL_INTERVAL):
+        self.app = app
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='rocket-chat-outbox', daemon=True)
+        self._thread.start()
+        logger.info("[Outbox] Dispatcher started")
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            _wakeup.clear()
+            with self.app.app_context():
+                try:
+                    dispatch_once()
+                    if self._last_prune is None or time.monotonic() - self._last_prune >= OUTBOX_PRUNE_INTERVAL:
+                        self._last_prune = time.monotonic()
+                        prune_outbox()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"[Outbox] Error dispatching outbox: {e}")
+                finally:
+                    db.session.remove()
+            # Vẫn quét lại định kỳ vì cửa sổ gộp và backoff cần thời gian trôi qua
+            _wakeup.wait(self.poll_interval)
+
+_dispatcher = None
+
+def start_dispatcher(app) -> OutboxDispatcher:
+    """Khởi động dispatcher dùng chung của process (thay thế dispatcher cũ nếu có)"""
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.stop()
+    _dispatcher = OutboxDispatcher(app)
+    _dispatcher.start()
+    return _dispatcher
+
+def stop_dispatcher() -> None:
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.stop()
+        _dispatcher = None
+
+def get_dispatcher() -> Optional[OutboxDispatcher]:
+    return _dispatcher
@@ -0,0 +1,195 @@
+import json
+import base64
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import or_, tuple_
+from core.models import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Filter chung cho các endpoint list; mỗi endpoint chỉ nhận một phần trong số này.
+# q: tìm chuỗi con không phân biệt hoa thường; expired: đã hết hạn; expires_after: còn hạn hơn N ngày
+FILTER_PARAMS = ('source', 'status', 'location', 'type', 'service', 'q', 'expiring_within', 'expired',
+                 'expires_after')
+_DAY_FILTERS = ('expiring_within', 'expires_after')
+_TRUE_VALUES = ('1', 'true', 'yes')
+
+class PaginationError(ValueError):
+    """Tham số phân trang/lọc/sắp xếp không hợp lệ"""
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Cursor là (giá trị sort, id) của phần tử cuối trang, mã hóa base64 để client coi là opaque"""
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise PaginationError('Cursor không hợp lệ')
+    if not isinstance(values, list) or len(values) != 2:
+        raise PaginationError('Cursor không hợp lệ')
+    return values
+
+def parse_sort(sort: Optional[str], allowed: Iterable[str], default: str) -> Tuple[str, bool]:
+    """'-created_at' -> ('created_at', True); chỉ chấp nhận key có trong `allowed`"""
+    sort = (sort or default).strip()
+    descending = sort.startswith('-')
+    key = sort.lstrip('-')
+    if key not in allowed:
+        raise PaginationError(f"Không hỗ trợ sắp xếp theo '{key}'")
+    return key, descending
+
+def parse_limit(value: Optional[str]) -> int:
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError('limit phải là số nguyên')
+    if limit < 1:
+        raise PaginationError('limit phải lớn hơn 0')
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_filters(args, allowed: Iterable[str] = FILTER_PARAMS) -> Dict[str, Any]:
+    """Đọc filter từ query string; expiring_within là số ngày"""
+    filters = {}
+    for name in allowed:
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        if name in _DAY_FILTERS:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise PaginationError(f'{name} phải là số ngày')
+            if value < 0:
+                raise PaginationError(f'{name} phải >= 0')
+        elif name == 'expired':
+            if value.strip().lower() not in _TRUE_VALUES:
+                continue
+            value = True
+        filters[name] = value
+    return filters
+
+def wants_page(args) -> bool:
+    """Chỉ trả về dạng phân trang khi client truyền limit/cursor (giữ tương thích response cũ)"""
+    return 'limit' in args or 'cursor' in args
+
+def expiring_range(days: int, today: Optional[date] = None) -> Tuple[date, date]:
+    today = today or date.today()
+    return today, today + timedelta(days=days)
+
+def apply_filters(query, filters: Dict[str, Any], columns: Dict[str, Any]):
+    """Thêm điều kiện WHERE cho các filter; `columns` map tên filter -> cột (cột DATE cho các
+    filter hết hạn, tuple cột được tìm cho q)"""
+    today = date.today()
+    for name, value in filters.items():
+        column = columns.get(name)
+        if column is None:
+            raise PaginationError(f"Không hỗ trợ lọc theo '{name}'")
+        if name == 'expiring_within':
+            start, end = expiring_range(value)
+            query = query.where(column.between(start, end))
+        elif name == 'expired':
+            query = query.where(column < today)
+        elif name == 'expires_after':
+            query = query.where(column > today + timedelta(days=value))
+        elif name == 'q':
+            query = query.where(or_(*(c.icontains(value, autoescape=True) for c in column)))
+        else:
+            query = query.where(column == value)
+    return query
+
+def _cursor_value(column, value):
+    """Đưa giá trị trong cursor về đúng kiểu của cột để so sánh trong SQL"""
+    if value is None:
+        return None
+    try:
+        if isinstance(column.type, db.DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(column.type, db.Date):
+            return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise PaginationError('Cursor không hợp lệ')
+    return value
+
+def _is_nullable(column) -> bool:
+    return any(c.nullable and not c.primary_key for c in column.property.columns)
+
+def keyset_page(query, sort_column, id_column, row_key: Callable[[Any], Tuple[Any, Any]],
+                cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                descending: bool = False) -> Tuple[list, Optional[str]]:
+    """Lấy một trang của `query` theo keyset (sort_column, id), NULL xếp cuối.
+
+    Mỗi query chỉ ORDER BY (sort_column, id) nên đọc thẳng theo index (user_id, sort_column, id),
+    không sort tạm và chi phí mỗi trang không tăng theo số dòng đã bỏ qua như OFFSET. Cột sort
+    nullable được đọc thành hai đoạn: các giá trị khác NULL, rồi phần IS NULL theo id (chỉ khi
+    trang còn chỗ). `row_key(row)` trả về (giá trị sort, id) của một dòng.
+    Trả về (các dòng, cursor trang sau hoặc None).
+    """
+    nullable = _is_nullable(sort_column)
+    direction = (lambda c: c.desc()) if descending else (lambda c: c.asc())
+    value = last_id = None
+    in_null_tail = False
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        value = _cursor_value(sort_column, value)
+        in_null_tail = value is None
+        if in_null_tail and not nullable:
+            raise PaginationError('Cursor không hợp lệ')
+
+    rows = []
+    if not in_null_tail:
+        head = query.where(sort_column.is_not(None)) if nullable else query
+        if cursor:
+            key, last = tuple_(sort_column, id_column), tuple_(value, last_id)
+            head = head.where(key < last if descending else key > last)
+        head = head.order_by(direction(sort_column), direction(id_column)).limit(limit + 1)
+        rows = db.session.execute(head).all()
+    if nullable and len(rows) <= limit:
+        tail = query.where(sort_column.is_(None))
+        if in_null_tail:
+            tail = tail.where(id_column < last_id if descending else id_column > last_id)
+        tail = tail.order_by(direction(id_column)).limit(limit + 1 - len(rows))
+        rows += db.session.execute(tail).all()
+    next_cursor = encode_cursor(row_key(rows[limit - 1])) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _item_sort_key(value, source, item_id):
+    # Id có thể là số (provider) hoặc chuỗi (nhập tay) nên so sánh dạng chuỗi
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    return (value is None, '' if value is None else value, source or '', str(item_id))
+
+def _is_after(key, last, descending: bool) -> bool:
+    if key[0] != last[0]:
+        return key[0]  # NULL luôn xếp cuối
+    return key[1:] < last[1:] if descending else key[1:] > last[1:]
+
+def page_items(items: List[dict], sort_key: str, descending: bool = False,
+               cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """Keyset cho list đã có sẵn trong bộ nhớ (inventory gộp nhiều nguồn, đã được cache).
+
+    Cùng thứ tự với keyset_page (NULL xếp cuối); cursor mang (giá trị sort, 'source:id').
+    """
+    def key(item):
+        return _item_sort_key(item.get(sort_key), item.get('source'), item.get('id'))
+
+    if descending:
+        ordered = sorted(items, key=lambda i: key(i)[1:], reverse=True)
+        ordered = [i for i in ordered if not key(i)[0]] + [i for i in ordered if key(i)[0]]
+    else:
+        ordered = sorted(items, key=key)
+    if cursor:
+        value, marker = decode_cursor(cursor)
+        source, _, item_id = str(marker).partition(':')
+        last = _item_sort_key(value, source, item_id)
+        ordered = [i for i in ordered if _is_after(key(i), last, descending)]
+    page = ordered[:limit]
+    next_cursor = None
+    if len(ordered) > limit:
+        last_item = page[-1]
+        next_cursor = encode_cursor([last_item.get(sort_key), f"{last_item.get('source') or ''}:{last_item.get('id')}"])
+    return page, next_cursor
@@ -0,0 +1,338 @@
+import os
+import time
+import socket
+import base64
+import asyncio
+import ipaddress
+import logging
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import or_
+from core.encryption import encryption_manager
+from core.models import db, Proxy, ProxyCheck, SchedulerCursor
+from core.api_clients import aio
+
+logger = logging.getLogger(__name__)
+
+# Số kết nối kiểm tra đồng thời tối đa của cả process (mọi lượt kiểm tra dùng chung)
+PROXY_CHECK_CONCURRENCY = int(os.getenv('PROXY_CHECK_CONCURRENCY', '200'))
+# Thời gian tối đa (giây) để mở được tunnel qua một proxy
+PROXY_CHECK_TIMEOUT = float(os.getenv('PROXY_CHECK_TIMEOUT', '10'))
+# Host:port đích yêu cầu proxy mở tunnel tới (chỉ mở kết nối, không gửi dữ liệu)
+PROXY_CHECK_TARGET = os.getenv('PROXY_CHECK_TARGET', 'www.google.com:443')
+# Proxy được chia thành N shard theo id, mỗi lần job chạy kiểm tra một shard
+PROXY_CHECK_SHARDS = int(os.getenv('PROXY_CHECK_SHARDS', '12'))
+PROXY_CHECK_INTERVAL_MINUTES = int(os.getenv('PROXY_CHECK_INTERVAL_MINUTES', '5'))
+# Số proxy đọc từ DB và ghi kết quả trong một transaction
+PROXY_CHECK_BATCH_SIZE = int(os.getenv('PROXY_CHECK_BATCH_SIZE', '1000'))
+# Lỗi liên tiếp bao nhiêu lần thì đánh dấu proxy là dead
+PROXY_CHECK_FAIL_THRESHOLD = int(os.getenv('PROXY_CHECK_FAIL_THRESHOLD', '3'))
+PROXY_CHECK_HISTORY_DAYS = int(os.getenv('PROXY_CHECK_HISTORY_DAYS', '7'))
+# Cho phép kiểm tra proxy trỏ tới địa chỉ loopback/private/link-local (chỉ bật khi test/benchmark
+# với proxy giả chạy local), mặc định tắt để user không dùng checker quét port mạng nội bộ
+PROXY_CHECK_ALLOW_PRIVATE = os.getenv('PROXY_CHECK_ALLOW_PRIVATE', 'false').lower() == 'true'
+# Số proxy tối đa cho một lần kiểm tra thủ công (request HTTP chờ kết quả)
+MANUAL_CHECK_LIMIT = 500
+
+# Proxy hết hạn không được kiểm tra
+SKIPPED_STATUSES = ('expired',)
+
+class ProxyCheckError(Exception):
+    """Proxy trả lời nhưng không mở được tunnel (sai auth, bị từ chối, sai giao thức)"""
+
+class ProxyTarget:
+    """Thông tin cần để kiểm tra một proxy (password đã giải mã), không giữ ORM object"""
+
+    __slots__ = ('proxy_id', 'user_id', 'ip', 'port', 'port_socks5', 'type', 'username', 'password',
+                 'health', 'check_failures')
+
+    def __init__(self, proxy_id: int, ip: str, port: str, port_socks5: Optional[str] = None,
+                 type: Optional[str] = None, username: Optional[str] = None, password: Optional[str] = None,
+                 user_id: Optional[int] = None, health: Optional[str] = None, check_failures: int = 0):
+        self.proxy_id = proxy_id
+        self.user_id = user_id
+        self.ip = ip
+        self.port = port
+        self.port_socks5 = port_socks5
+        self.type = type
+        self.username = username
+        self.password = password
+        self.health = health
+        self.check_failures = check_failures or 0
+
+    def checks(self) -> List[Tuple[str, str]]:
+        """Các (giao thức, port) cần kiểm tra: `port` theo type (mặc định HTTP CONNECT), thêm `port_socks5` nếu có"""
+        protocol = 'socks5' if (self.type or '').upper() == 'SOCKS5' else 'http'
+        checks = [(protocol, self.port)]
+        if self.port_socks5 and ('socks5', self.port_socks5) not in checks:
+            checks.append(('socks5', self.port_socks5))
+        return checks
+
+def parse_target(value: str = PROXY_CHECK_TARGET) -> Tuple[str, int]:
+    host, _, port = value.rpartition(':')
+    return host, int(port)
+
+# ==================== PROTOCOLS ====================
+
+async def _http_connect(reader, writer, target: Tuple[str, int], username: Optional[str],
+                        password: Optional[str]) -> None:
+    host, port = target
+    lines = [f'CONNECT {host}:{port} HTTP/1.1', f'Host: {host}:{port}']
+    if username or password:
+        token = base64.b64encode(f"{username or ''}:{password or ''}".encode()).decode()
+        lines.append(f'Proxy-Authorization: Basic {token}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    status = (await reader.readline()).split()
+    if len(status) < 2 or not status[0].startswith(b'HTTP/'):
+        raise ProxyCheckError('Phản hồi không phải HTTP')
+    if status[1] != b'200':
+        raise ProxyCheckError(f'HTTP {status[1].decode(errors="replace")}')
+
+async def _socks5_connect(reader, writer, target: Tuple[str, int], username: Optional[str],
+                          password: Optional[str]) -> None:
+    host, port = target
+    methods = b'\x00\x02' if username or password else b'\x00'
+    writer.write(b'\x05' + bytes([len(methods)]) + methods)
+    await writer.drain()
+    version, method = await reader.readexactly(2)
+    if version != 5:
+        raise ProxyCheckError('Phản hồi không phải SOCKS5')
+    if method == 0x02:
+        # Xác thực username/password (RFC 1929)
+        user, pwd = (username or '').encode(), (password or '').encode()
+        writer.write(b'\x01' + bytes([len(user)]) + user + bytes([len(pwd)]) + pwd)
+        await writer.drain()
+        if (await reader.readexactly(2))[1] != 0:
+            raise ProxyCheckError('SOCKS5 sai username/password')
+    elif method != 0x00:
+        raise ProxyCheckError('SOCKS5 không chấp nhận phương thức xác thực')
+    address = host.encode('idna')
+    writer.write(b'\x05\x01\x00\x03' + bytes([len(address)]) + address + port.to_bytes(2, 'big'))
+    await writer.drain()
+    reply = await reader.readexactly(4)
+    if reply[1] != 0:
+        raise ProxyCheckError(f'SOCKS5 lỗi {reply[1]}')
+
+_HANDSHAKES = {'http': _http_connect, 'socks5': _socks5_connect}
+
+def _is_internal(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split('%')[0])
+    ip = getattr(ip, 'ipv4_mapped', None) or ip
+    return ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_multicast or ip.is_reserved \
+        or ip.is_unspecified
+
+async def _resolve(host: str, port: int) -> str:
+    """Địa chỉ IP để kết nối tới proxy; từ chối địa chỉ nội bộ nếu không bật PROXY_CHECK_ALLOW_PRIVATE.
+
+    Kết nối thẳng tới địa chỉ đã kiểm tra nên hostname không thể đổi sang IP nội bộ giữa chừng.
+    """
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    addresses = [info[4][0] for info in infos]
+    if not PROXY_CHECK_ALLOW_PRIVATE and any(_is_internal(address) for address in addresses):
+        raise ProxyCheckError('Địa chỉ nội bộ, không được kiểm tra')
+    return addresses[0]
+
+async def _open_tunnel(ip: str, port: int, protocol: str, target: Tuple[str, int], username, password) -> None:
+    reader, writer = await asyncio.open_connection(await _resolve(ip, port), port)
+    try:
+        await _HANDSHAKES[protocol](reader, writer, target, username, password)
+    finally:
+        writer.close()
+
+def _error_message(error: BaseException) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return 'Timeout'
+    if isinstance(error, asyncio.IncompleteReadError):
+        return 'Proxy đóng kết nối'
+    if isinstance(error, ConnectionRefusedError):
+        return 'Kết nối bị từ chối'
+    return str(error)[:255] or type(error).__name__
+
+async def check_proxy(proxy: ProxyTarget, timeout: float = PROXY_CHECK_TIMEOUT,
+                      target: Optional[Tuple[str, int]] = None) -> List[dict]:
+    """Kiểm tra một proxy với từng giao thức, trả về mỗi giao thức một kết quả"""
+    target = target or parse_target()
+    results = []
+    for protocol, port in proxy.checks():
+        started = time.perf_counter()
+        result = {'proxy_id': proxy.proxy_id, 'protocol': protocol, 'port': str(port),
+                  'success': False, 'latency_ms': None, 'error': None}
+        try:
+            await asyncio.wait_for(_open_tunnel(proxy.ip, int(port), protocol, target,
+                                                proxy.username, proxy.password), timeout)
+            result['success'] = True
+            result['latency_ms'] = int((time.perf_counter() - started) * 1000)
+        except (OSError, ValueError, OverflowError, ProxyCheckError, asyncio.TimeoutError,
+                asyncio.IncompleteReadError) as e:
+            result['error'] = _error_message(e)
+        results.append(result)
+    return results
+
+# Semaphore giới hạn tổng số kiểm tra đồng thời, một cái cho mỗi event loop
+_semaphores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = weakref.WeakKeyDictionary()
+
+def _global_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(PROXY_CHECK_CONCURRENCY)
+    return semaphore
+
+async def check_proxies(proxies: Iterable[ProxyTarget], concurrency: int = PROXY_CHECK_CONCURRENCY,
+                        timeout: float = PROXY_CHECK_TIMEOUT,
+                        target: Optional[Tuple[str, int]] = None) -> List[dict]:
+    """Kiểm tra nhiều proxy bằng pool `concurrency` worker lấy việc từ một queue.
+
+    Mọi lượt kiểm tra chạy cùng lúc trên một loop dùng chung semaphore
+    PROXY_CHECK_CONCURRENCY nên tổng số kết nối mở không vượt quá giới hạn này.
+    """
+    target = target or parse_target()
+    queue: asyncio.Queue = asyncio.Queue()
+    for proxy in proxies:
+        queue.put_nowait(proxy)
+    semaphore = _global_semaphore()
+    results: List[dict] = []
+
+    async def worker():
+        while True:
+            try:
+                proxy = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with semaphore:
+                results.extend(await check_proxy(proxy, timeout, target))
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, queue.qsize()))))
+    return results
+
+# ==================== DATABASE ====================
+
+_TARGET_COLUMNS = (Proxy.id, Proxy.user_id, Proxy.ip, Proxy.port, Proxy.port_socks5, Proxy.type, Proxy.username,
+                   Proxy.password_encrypted, Proxy.health, Proxy.check_failures)
+
+def _checkable_query():
+    return db.select(*_TARGET_COLUMNS).where(or_(Proxy.status.is_(None), Proxy.status.notin_(SKIPPED_STATUSES)))
+
+def _load_targets(query) -> List[ProxyTarget]:
+    rows = db.session.execute(query).all()
+    passwords = encryption_manager.decrypt_many([row.password_encrypted for row in rows])
+    return [ProxyTarget(row.id, row.ip, row.port, row.port_socks5, row.type, row.username, password,
+                        user_id=row.user_id, health=row.health, check_failures=row.check_failures)
+            for row, password in zip(rows, passwords)]
+
+def record_results(targets: List[ProxyTarget], results: List[dict],
+                   now: Optional[datetime] = None) -> Dict[str, int]:
+    """Ghi lịch sử kiểm tra và cập nhật health/latency của proxy (chưa commit).
+
+    Proxy alive nếu mở được tunnel bằng ít nhất một giao thức; lỗi liên tiếp
+    PROXY_CHECK_FAIL_THRESHOLD lần thì dead. Checker không đụng tới status (do user
+    hoặc sync provider quản lý) nên không làm mất hiệu lực cache inventory.
+    """
+    now = now or datetime.utcnow()
+    if results:
+        db.session.execute(db.insert(ProxyCheck), [dict(r, checked_at=now) for r in results])
+    by_proxy: Dict[int, List[dict]] = {}
+    for result in results:
+        by_proxy.setdefault(result['proxy_id'], []).append(result)
+
+    summary = {'checked': 0, 'alive': 0, 'dead': 0, 'health_changed': 0}
+    updates = []
+    for proxy in targets:
+        checks = by_proxy.get(proxy.proxy_id)
+        if not checks:
+            continue
+        latencies = [c['latency_ms'] for c in checks if c['success']]
+        failures = 0 if latencies else proxy.check_failures + 1
+        health = proxy.health
+        if latencies:
+            health = 'alive'
+        elif failures >= PROXY_CHECK_FAIL_THRESHOLD:
+            health = 'dead'
+        if health != proxy.health:
+            summary['health_changed'] += 1
+        summary['checked'] += 1
+        summary['alive' if latencies else 'dead'] += 1
+        updates.append({'id': proxy.proxy_id, 'health': health, 'check_failures': failures,
+                        'last_checked_at': now, 'last_latency_ms': min(latencies) if latencies else None})
+    if updates:
+        db.session.execute(db.update(Proxy), updates)
+    return summary
+
+def _merge(total: Dict[str, int], part: Dict[str, int]) -> None:
+    for key, value in part.items():
+        total[key] = total.get(key, 0) + value
+
+def _check_in_batches(query, batch_size: int, concurrency: int, timeout: float) -> Dict[str, int]:
+    """Kiểm tra proxy của `query` theo lô id tăng dần, mỗi lô một transaction"""
+    total = {'checked': 0, 'alive': 0, 'dead': 0, 'health_changed': 0}
+    last_id = 0
+    while True:
+        targets = _load_targets(query.where(Proxy.id > last_id).order_by(Proxy.id).limit(batch_size))
+        if not targets:
+            return total
+        last_id = targets[-1].proxy_id
+        results = aio.run(check_proxies(targets, concurrency, timeout))
+        _merge(total, record_results(targets, results))
+        db.session.commit()
+
+# Tên cursor trong bảng scheduler_cursors lưu shard kế tiếp
+SHARD_CURSOR = 'proxy_check_shard'
+
+def next_shard(shards: int = PROXY_CHECK_SHARDS) -> int:
+    """Lấy shard đến lượt và đẩy cursor trong DB sang shard sau.
+
+    Cursor được lưu lại nên các shard được kiểm tra lần lượt, không lặp hay bỏ sót shard
+    nào khi job bị trễ/lỡ lượt, scheduler restart hoặc leader chuyển sang process khác.
+    Mỗi proxy được kiểm tra một lần mỗi shards lần job chạy.
+    """
+    shards = max(shards, 1)
+    cursor = db.session.get(SchedulerCursor, SHARD_CURSOR)
+    if cursor is None:
+        cursor = SchedulerCursor(name=SHARD_CURSOR, position=0)
+        db.session.add(cursor)
+    shard = (cursor.position or 0) % shards
+    cursor.position = (shard + 1) % shards
+    cursor.updated_at = datetime.utcnow()
+    db.session.commit()
+    return shard
+
+def check_shard(shard: int, shards: int = PROXY_CHECK_SHARDS, batch_size: int = PROXY_CHECK_BATCH_SIZE,
+                concurrency: int = PROXY_CHECK_CONCURRENCY, timeout: float = PROXY_CHECK_TIMEOUT) -> Dict[str, int]:
+    """Kiểm tra các proxy có id % shards == shard"""
+    summary = _check_in_batches(_checkable_query().where(Proxy.id % shards == shard), batch_size,
+                                concurrency, timeout)
+    logger.info(f"[ProxyCheck] Shard {shard}/{shards}: {summary['checked']} checked, {summary['alive']} alive, "
+                f"{summary['dead']} dead, {summary['health_changed']} health changes")
+    return summary
+
+def check_user_proxies(user_id: int, proxy_ids: Optional[List[int]] = None,
+                       batch_size: int = PROXY_CHECK_BATCH_SIZE) -> Dict[str, int]:
+    """Kiểm tra ngay proxy của một user (tất cả hoặc theo danh sách id), tối đa MANUAL_CHECK_LIMIT proxy"""
+    query = _checkable_query().where(Proxy.user_id == user_id)
+    if proxy_ids is not None:
+        query = query.where(Proxy.id.in_(proxy_ids))
+    count = db.session.execute(query.with_only_columns(db.func.count(Proxy.id))).scalar()
+    if count > MANUAL_CHECK_LIMIT:
+        raise ValueError(f"Chỉ kiểm tra được tối đa {MANUAL_CHECK_LIMIT} proxy mỗi lần, hãy chọn bớt proxy")
+    return _check_in_batches(query, batch_size, PROXY_CHECK_CONCURRENCY, PROXY_CHECK_TIMEOUT)
+
+def get_check_history(proxy_id: int, limit: int = 50) -> dict:
+    """Các lần kiểm tra gần nhất của proxy kèm tỉ lệ sống và latency trung bình"""
+    checks = (ProxyCheck.query.filter_by(proxy_id=proxy_id)
+              .order_by(ProxyCheck.checked_at.desc(), ProxyCheck.id.desc()).limit(limit).all())
+    latencies = [c.latency_ms for c in checks if c.success]
+    return {
+        'checks': [{'protocol': c.protocol, 'port': c.port, 'success': c.success, 'latency_ms': c.latency_ms,
+                    'error': c.error, 'checked_at': c.checked_at.isoformat()} for c in checks],
+        'success_rate': round(len(latencies) / len(checks), 3) if checks else None,
+        'avg_latency_ms': int(sum(latencies) / len(latencies)) if latencies else None,
+    }
+
+def prune_check_history(days: int = PROXY_CHECK_HISTORY_DAYS) -> int:
+    """Xóa lịch sử kiểm tra cũ hơn `days` ngày"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = db.session.execute(db.delete(ProxyCheck).where(ProxyCheck.checked_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
@@ -0,0 +1,188 @@
+import io
+import os
+import re
+import csv
+import logging
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+from core.encryption import encryption_manager
+from core.models import db, Proxy, parse_expiry_date
+from core.cache import mark_inventory_dirty
+
+logger = logging.getLogger(__name__)
+
+# Số proxy hợp lệ được insert trong một transaction
+IMPORT_BATCH_SIZE = int(os.getenv('PROXY_IMPORT_BATCH_SIZE', '2000'))
+# Số lỗi tối đa trả về trong báo cáo (vẫn đếm đủ tất cả)
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = ('auto', 'csv', 'txt')
+CSV_FIELDS = ('name', 'ip', 'port', 'port_socks5', 'username', 'password', 'type', 'location',
+              'status', 'expire_at', 'source_id', 'note', 'auto_renew')
+PROXY_TYPES = ('HTTP', 'HTTPS', 'SOCKS4', 'SOCKS5')
+# Độ dài tối đa theo cột của bảng proxies; bulk insert không qua validate của model
+FIELD_MAX_LENGTHS = {'name': 128, 'username': 128, 'type': 32, 'location': 64, 'status': 32,
+                     'expire_at': 32, 'source_id': 64, 'note': 512}
+
+# Cùng pattern với Proxy.validate_ip, compile một lần cho cả file
+_IP_RE = re.compile(r'^(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$')
+_TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+def _text_lines(stream: IO[bytes]) -> io.TextIOWrapper:
+    # utf-8-sig bỏ BOM của file CSV lưu từ Excel; đọc từng dòng, không nạp cả file
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+def _parse_txt(lines: Iterator[str], default_type: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """ip:port hoặc ip:port:user:pass, mỗi dòng một proxy; bỏ qua dòng trống và dòng bắt đầu bằng #"""
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(':', 3)
+        if len(parts) not in (2, 4):
+            yield line_no, None, 'Sai định dạng, cần ip:port hoặc ip:port:user:pass'
+            continue
+        record = {'ip': parts[0].strip(), 'port': parts[1].strip(), 'type': default_type}
+        if len(parts) == 4:
+            record['username'], record['password'] = parts[2], parts[3]
+        yield line_no, record, None
+
+def _parse_csv(lines: Iterator[str], default_type: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """CSV có header (cùng cột với file export); cột không biết bị bỏ qua"""
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or 'ip' not in reader.fieldnames or 'port' not in reader.fieldnames:
+        yield 1, None, 'File CSV cần header có cột ip và port'
+        return
+    for row in reader:
+        record = {f: (row.get(f) or '').strip() or None for f in CSV_FIELDS}
+        record['type'] = record['type'] or default_type
+        yield reader.line_num, record, None
+
+def parse_proxy_lines(stream: IO[bytes], fmt: str = 'auto',
+                      default_type: str = 'HTTP') -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Đọc file upload dạng stream, trả về (số dòng, record hoặc None, lỗi hoặc None)"""
+    lines = _text_lines(stream)
+    if fmt == 'auto':
+        first = lines.readline()
+        # Header CSV luôn có dấu phẩy, dòng ip:port:user:pass thì không
+        fmt = 'csv' if ',' in first else 'txt'
+        lines = _chain(first, lines)
+    parser = _parse_csv if fmt == 'csv' else _parse_txt
+    return parser(lines, default_type)
+
+def _chain(first: str, rest: Iterator[str]) -> Iterator[str]:
+    if first:
+        yield first
+    yield from rest
+
+def validate_batch(records: List[Tuple[int, dict]]) -> Tuple[List[Tuple[int, dict]], List[dict]]:
+    """Validate một lô record, trả về (record hợp lệ đã chuẩn hóa, lỗi theo dòng)"""
+    valid, errors = [], []
+    for line_no, record in records:
+        ip, port = record.get('ip') or '', record.get('port') or ''
+        if not _IP_RE.match(ip):
+            errors.append({'line': line_no, 'error': f'IP không hợp lệ: {ip[:64]}'})
+            continue
+        if not port.isdigit() or not 1 <= int(port) <= 65535:
+            errors.append({'line': line_no, 'error': f'Port không hợp lệ: {port[:16]}'})
+            continue
+        socks = record.get('port_socks5')
+        if socks and (not socks.isdigit() or not 1 <= int(socks) <= 65535):
+            errors.append({'line': line_no, 'error': f'Port SOCKS5 không hợp lệ: {socks[:16]}'})
+            continue
+        too_long = next((f for f, limit in FIELD_MAX_LENGTHS.items() if len(record.get(f) or '') > limit), None)
+        if too_long:
+            errors.append({'line': line_no,
+                           'error': f'Cột {too_long} dài quá {FIELD_MAX_LENGTHS[too_long]} ký tự'})
+            continue
+        proxy_type = (record.get('type') or 'HTTP').strip().upper()
+        if proxy_type not in PROXY_TYPES:
+            errors.append({'line': line_no, 'error': f'Loại proxy không hợp lệ: {proxy_type[:16]}'})
+            continue
+        record['port'] = str(int(port))
+        record['type'] = proxy_type
+        valid.append((line_no, record))
+    return valid, errors
+
+def _insert_batch(user_id: int, batch: List[dict]) -> None:
+    now = datetime.utcnow()
+    passwords = encryption_manager.encrypt_many([r.get('password') or None for r in batch])
+    rows = []
+    for record, password_encrypted in zip(batch, passwords):
+        rows.append({
+            'user_id': user_id,
+            'name': record.get('name') or f"{record['ip']}:{record['port']}",
+            'ip': record['ip'],
+            'port': record['port'],
+            'port_socks5': record.get('port_socks5'),
+            'username': record.get('username') or None,
+            'password_encrypted': password_encrypted,
+            'type': record.get('type') or 'HTTP',
+            'location': record.get('location'),
+            'status': record.get('status') or 'active',
+            # Bulk insert không chạy @validates nên tự parse expire_date
+            'expire_at': record.get('expire_at'),
+            'expire_date': parse_expiry_date(record.get('expire_at')),
+            'source': 'manual',
+            'source_id': record.get('source_id'),
+            'note': record.get('note'),
+            'auto_renew': str(record.get('auto_renew') or '').lower() in _TRUE_VALUES,
+            'created_at': now,
+            'updated_at': now,
+        })
+    db.session.execute(db.insert(Proxy), rows)
+    mark_inventory_dirty(user_id)
+    db.session.commit()
+
+def import_proxies(user_id: int, stream: IO[bytes], fmt: str = 'auto', default_type: str = 'HTTP',
+                   batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """Import proxy hàng loạt từ file (CSV hoặc ip:port:user:pass) đọc dạng stream.
+
+    Proxy đã có của user được nạp một lần vào set (ip, port) để loại trùng, kể cả
+    trùng trong chính file. Record hợp lệ được insert theo lô `batch_size` dòng,
+    mỗi lô một transaction; lỗi được báo theo số dòng trong file.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Định dạng import không hỗ trợ: {fmt}")
+    seen: Set[Tuple[str, str]] = set(
+        (ip, str(port)) for ip, port in db.session.execute(
+            db.select(Proxy.ip, Proxy.port).where(Proxy.user_id == user_id)).all())
+    summary = {'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': [], 'errors_truncated': False}
+
+    def report(errors: List[dict]) -> None:
+        summary['invalid'] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(summary['errors'])
+        summary['errors'].extend(errors[:max(room, 0)])
+        if len(errors) > room:
+            summary['errors_truncated'] = True
+
+    def flush(pending: List[Tuple[int, dict]]) -> None:
+        valid, errors = validate_batch(pending)
+        report(errors)
+        batch = []
+        for line_no, record in valid:
+            key = (record['ip'], record['port'])
+            if key in seen:
+                summary['duplicates'] += 1
+                continue
+            seen.add(key)
+            batch.append(record)
+        if batch:
+            _insert_batch(user_id, batch)
+            summary['imported'] += len(batch)
+
+    pending: List[Tuple[int, dict]] = []
+    for line_no, record, error in parse_proxy_lines(stream, fmt, default_type):
+        if error:
+            report([{'line': line_no, 'error': error}])
+            continue
+        pending.append((line_no, record))
+        if len(pending) >= batch_size:
+            flush(pending)
+            pending = []
+    if pending:
+        flush(pending)
+
+    logger.info(f"[Import] User {user_id}: {summary['imported']} proxies imported, "
+                f"{summary['duplicates']} duplicates, {summary['invalid']} invalid")
+    return summary
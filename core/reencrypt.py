@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+import os
+import logging
+from sqlalchemy import bindparam
+from core.encryption import CIPHERTEXT_PREFIX, encryption_manager
+from core.models import db, BitLaunchAPI, ZingProxyAccount, CloudFlyAPI, Account, Proxy, ReencryptionCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# (model, cột chứa ciphertext)
+ENCRYPTED_COLUMNS = (
+    (BitLaunchAPI, 'api_key_encrypted'),
+    (ZingProxyAccount, 'access_token_encrypted'),
+    (CloudFlyAPI, 'api_token_encrypted'),
+    (Account, 'password_encrypted'),
+    (Proxy, 'password_encrypted'),
+)
+
+MIGRATION_BATCH_SIZE = 500
+# Re-encrypt theo key chính mới: số dòng mỗi lô và số lô tối đa mỗi lần job chạy
+REENCRYPT_BATCH_SIZE = int(os.getenv('REENCRYPT_BATCH_SIZE', '200'))
+REENCRYPT_MAX_BATCHES = int(os.getenv('REENCRYPT_MAX_BATCHES', '50'))
+
+def _update_statement(model, column_name: str):
+    """UPDATE theo id và giá trị cũ: dòng bị sửa đồng thời (user đổi key) sẽ không bị ghi đè"""
+    table = model.__table__
+    column = table.c[column_name]
+    return (table.update()
+            .where(table.c.id == bindparam('_id'), column == bindparam('_old'))
+            .values({column_name: bindparam('_new')}))
+
+def migrate_ciphertexts(batch_size: int = MIGRATION_BATCH_SIZE,
+                        tables: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+    """Ghi lại ciphertext định dạng cũ sang định dạng v2, theo lô keyset (id tăng dần).
+
+    Mỗi lô chỉ đọc (id, ciphertext) của tối đa `batch_size` dòng và commit ngay,
+    nên bộ nhớ không phụ thuộc kích thước bảng và có thể dừng/chạy lại bất cứ lúc nào.
+    Giá trị không giải mã được bằng key hiện tại được giữ nguyên và đếm vào `failed`.
+    """
+    results = {}
+    for model, column_name in ENCRYPTED_COLUMNS:
+        if tables and model.__tablename__ not in tables:
+            continue
+        column = getattr(model, column_name)
+        statement = _update_statement(model, column_name)
+        migrated = failed = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(model.id, column)
+                .where(model.id > last_id, column.isnot(None), column != '',
+                       ~column.startswith(CIPHERTEXT_PREFIX))
+                .order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = []
+            for row_id, ciphertext in rows:
+                upgraded = encryption_manager.upgrade(ciphertext)
+                if upgraded is None:
+                    failed += 1
+                else:
+                    updates.append({'_id': row_id, '_old': ciphertext, '_new': upgraded})
+            if updates:
+                db.session.execute(statement, updates)
+            db.session.commit()
+            migrated += len(updates)
+        results[model.__tablename__] = {'migrated': migrated, 'failed': failed}
+        if migrated or failed:
+            logger.info(f"[Encryption] {model.__tablename__}: migrated {migrated} ciphertexts, {failed} unreadable")
+    return results
+
+def _checkpoint(table_name: str, fingerprint: str) -> ReencryptionCheckpoint:
+    """Checkpoint của bảng cho key chính hiện tại; đổi key chính thì bắt đầu lại từ đầu"""
+    checkpoint = db.session.get(ReencryptionCheckpoint, table_name)
+    if checkpoint is None:
+        checkpoint = ReencryptionCheckpoint(table_name=table_name, key_fingerprint=fingerprint)
+        db.session.add(checkpoint)
+    elif checkpoint.key_fingerprint != fingerprint:
+        checkpoint.key_fingerprint = fingerprint
+        checkpoint.last_id = checkpoint.rotated = checkpoint.failed = 0
+        checkpoint.started_at = datetime.utcnow()
+        checkpoint.completed_at = None
+    # Cột có default chỉ được điền khi flush
+    checkpoint.last_id = checkpoint.last_id or 0
+    checkpoint.rotated = checkpoint.rotated or 0
+    checkpoint.failed = checkpoint.failed or 0
+    return checkpoint
+
+def reencrypt_secrets(batch_size: int = REENCRYPT_BATCH_SIZE,
+                      max_batches: Optional[int] = REENCRYPT_MAX_BATCHES) -> int:
+    """Ghi lại mọi secret chưa mã hóa bằng key chính (key cũ hoặc định dạng cũ), theo lô keyset.
+
+    Checkpoint (id cuối đã xử lý) được commit cùng transaction với dữ liệu của lô,
+    nên job có thể dừng bất cứ lúc nào và lần chạy sau tiếp tục đúng chỗ. Mỗi lần
+    chạy xử lý tối đa `max_batches` lô (None = chạy đến hết). Trả về số dòng đã ghi lại.
+    """
+    fingerprint = encryption_manager.primary_fingerprint
+    rotated_total = 0
+    batches = 0
+    for model, column_name in ENCRYPTED_COLUMNS:
+        checkpoint = _checkpoint(model.__tablename__, fingerprint)
+        if checkpoint.completed_at is not None:
+            continue
+        column = getattr(model, column_name)
+        statement = _update_statement(model, column_name)
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                db.session.commit()
+                return rotated_total
+            rows = db.session.execute(
+                db.select(model.id, column)
+                .where(model.id > checkpoint.last_id, column.isnot(None), column != '')
+                .order_by(model.id).limit(batch_size)
+            ).all()
+            batches += 1
+            if not rows:
+                checkpoint.completed_at = checkpoint.updated_at = datetime.utcnow()
+                db.session.commit()
+                logger.info(f"[Encryption] Re-encrypted {model.__tablename__} with key {fingerprint}: "
+                            f"{checkpoint.rotated} rotated, {checkpoint.failed} unreadable")
+                break
+            updates = []
+            for row_id, ciphertext in rows:
+                try:
+                    rotated = encryption_manager.reencrypt(ciphertext)
+                except Exception:
+                    checkpoint.failed += 1
+                    continue
+                if rotated is not None:
+                    updates.append({'_id': row_id, '_old': ciphertext, '_new': rotated})
+            if updates:
+                db.session.execute(statement, updates)
+            checkpoint.last_id = rows[-1].id
+            checkpoint.rotated += len(updates)
+            checkpoint.updated_at = datetime.utcnow()
+            db.session.commit()
+            rotated_total += len(updates)
+    return rotated_total
+
+def get_reencryption_status() -> dict:
+    """Tiến độ re-encrypt của từng bảng so với key chính hiện tại"""
+    fingerprint = encryption_manager.primary_fingerprint
+    checkpoints = {c.table_name: c for c in ReencryptionCheckpoint.query.all()}
+    tables = {}
+    for model, _ in ENCRYPTED_COLUMNS:
+        checkpoint = checkpoints.get(model.__tablename__)
+        current = checkpoint is not None and checkpoint.key_fingerprint == fingerprint
+        tables[model.__tablename__] = {
+            'last_id': checkpoint.last_id if current else 0,
+            'rotated': checkpoint.rotated if current else 0,
+            'failed': checkpoint.failed if current else 0,
+            'completed_at': checkpoint.completed_at.isoformat() if current and checkpoint.completed_at else None,
+        }
+    return {
+        'key_fingerprint': fingerprint,
+        'complete': all(t['completed_at'] for t in tables.values()),
+        'tables': tables,
+    }
@@ -0,0 +1,260 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+from core.api_clients.resilience import DeadlineExceededError, deadline as request_deadline, get_guard
+
+logger = logging.getLogger(__name__)
+
+# Số request đồng thời tối đa cho từng provider (có thể ghi đè bằng REFRESH_LIMIT_<PROVIDER>)
+DEFAULT_PROVIDER_LIMITS = {
+    'bitlaunch': 8,
+    'zingproxy': 8,
+    'cloudfly': 4,
+}
+DEFAULT_PROVIDER_LIMIT = 4
+# Số lời gọi async đồng thời tối đa cho mỗi provider trong run_async() (ghi đè bằng ASYNC_LIMIT_<PROVIDER>)
+DEFAULT_ASYNC_LIMIT = int(os.getenv('ASYNC_PROVIDER_LIMIT', '200'))
+
+class RefreshTask:
+    """Một lời gọi tới provider cần chạy song song.
+
+    `func` chỉ được gọi API bên ngoài, KHÔNG truy cập database: các worker
+    chạy ngoài app context, việc ghi DB do thread gọi `run()` đảm nhận.
+    """
+
+    def __init__(self, key: Any, provider: str, func: Callable, *args, **kwargs):
+        self.key = key
+        self.provider = provider
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+class RefreshResult:
+    """Kết quả của một RefreshTask"""
+
+    def __init__(self, key: Any, provider: str, value: Any = None, error: Optional[BaseException] = None, duration: float = 0.0):
+        self.key = key
+        self.provider = provider
+        self.value = value
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class RefreshEngine:
+    """Chạy các lời gọi provider trên một worker pool có giới hạn.
+
+    Mỗi provider có một semaphore riêng dùng chung cho mọi lần `run()`, nên
+    hai job chạy cùng lúc vẫn không vượt quá giới hạn của provider. Semaphore
+    được lấy ở thread điều phối trước khi submit, worker không bao giờ phải
+    đứng chờ slot của provider.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, provider_limits: Optional[Dict[str, int]] = None):
+        self.max_workers = max_workers or int(os.getenv('REFRESH_MAX_WORKERS', '16'))
+        self.provider_limits = dict(DEFAULT_PROVIDER_LIMITS)
+        for provider in list(self.provider_limits):
+            env_value = os.getenv(f'REFRESH_LIMIT_{provider.upper()}')
+            if env_value:
+                self.provider_limits[provider] = int(env_value)
+        self.provider_limits.update(provider_limits or {})
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._semaphores_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='refresh')
+
+    def _semaphore(self, provider: str) -> threading.BoundedSemaphore:
+        with self._semaphores_lock:
+            if provider not in self._semaphores:
+                limit = self.provider_limits.get(provider, DEFAULT_PROVIDER_LIMIT)
+                self._semaphores[provider] = threading.BoundedSemaphore(max(1, limit))
+            return self._semaphores[provider]
+
+    @staticmethod
+    def _call(task: RefreshTask, deadline: Optional[float] = None) -> RefreshResult:
+        started = time.monotonic()
+        try:
+            # Request HTTP trong worker bị rút ngắn timeout theo deadline của cả lần chạy
+            with request_deadline(deadline):
+                value = task.func(*task.args, **task.kwargs)
+            return RefreshResult(task.key, task.provider, value=value, duration=time.monotonic() - started)
+        except Exception as e:
+            return RefreshResult(task.key, task.provider, error=e, duration=time.monotonic() - started)
+
+    def run(self, tasks: List[RefreshTask], timeout: Optional[float] = None) -> List[RefreshResult]:
+        """Chạy tất cả tasks và trả về kết quả theo đúng thứ tự đầu vào.
+
+        `timeout` là ngân sách (giây) cho cả lần chạy: task chưa kịp bắt đầu khi hết
+        giờ bị hủy, task đang chạy bị cắt timeout HTTP; cả hai trả về kết quả lỗi
+        DeadlineExceededError.
+        """
+        if not tasks:
+            return []
+
+        started = time.monotonic()
+        deadline = started + timeout if timeout else None
+        queues: Dict[str, deque] = {}
+        for index, task in enumerate(tasks):
+            queues.setdefault(task.provider, deque()).append((index, task))
+
+        results: List[Optional[RefreshResult]] = [None] * len(tasks)
+        pending = {}
+
+        def _release(provider):
+            return lambda _future: self._semaphore(provider).release()
+
+        while queues or pending:
+            if deadline is not None and queues and time.monotonic() >= deadline:
+                for provider, queue in queues.items():
+                    for index, task in queue:
+                        results[index] = RefreshResult(task.key, provider, error=DeadlineExceededError(
+                            f'Cancelled: refresh deadline of {timeout:.0f}s exceeded before the call started'))
+                logger.warning(f"[Refresh] Deadline exceeded, cancelled {sum(len(q) for q in queues.values())} queued calls")
+                queues = {}
+                if not pending:
+                    break
+
+            # Submit mọi task còn slot trống của provider tương ứng
+            for provider in list(queues):
+                queue = queues[provider]
+                semaphore = self._semaphore(provider)
+                while queue and semaphore.acquire(blocking=False):
+                    index, task = queue.popleft()
+                    future = self._executor.submit(self._call, task, deadline)
+                    future.add_done_callback(_release(provider))
+                    pending[future] = index
+                if not queue:
+                    del queues[provider]
+
+            if not pending:
+                # Slot đang bị job khác giữ, chờ một chút rồi thử lại
+                time.sleep(0.05)
+                continue
+
+            done, _ = wait(list(pending), timeout=0.05 if queues else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+        elapsed = time.monotonic() - started
+        slowest = max(r.duration for r in results)
+        logger.info(f"[Refresh] Ran {len(tasks)} provider calls in {elapsed:.2f}s (slowest call {slowest:.2f}s)")
+        return results
+
+    @staticmethod
+    def _async_limit(provider: str) -> int:
+        limit = max(1, int(os.getenv(f'ASYNC_LIMIT_{provider.upper()}', DEFAULT_ASYNC_LIMIT)))
+        # Không cho nhiều lời gọi hơn số token rate limiter cấp được trong max_wait,
+        # nếu không các lời gọi xếp hàng cuối bị ProviderGuard từ chối
+        queued = get_guard(provider).max_queued()
+        return limit if queued is None else min(limit, queued)
+
+    def run_async(self, tasks: List[RefreshTask], timeout: Optional[float] = None) -> List[RefreshResult]:
+        """Như run() nhưng `func` của task là coroutine function.
+
+        Mọi task chạy trên event loop dùng chung của core.api_clients.aio, mỗi provider
+        tối đa ASYNC_LIMIT lời gọi cùng lúc (không quá số token rate limit cấp được
+        trong RATE_LIMIT_MAX_WAIT), nên hàng trăm request có thể chờ I/O song
+        song mà không cần thêm thread.
+        """
+        if not tasks:
+            return []
+        from core.api_clients import aio
+
+        started = time.monotonic()
+        deadline = started + timeout if timeout else None
+        results = aio.run(self._gather_async(tasks, deadline, timeout))
+        elapsed = time.monotonic() - started
+        slowest = max(r.duration for r in results)
+        logger.info(f"[Refresh] Ran {len(tasks)} async provider calls in {elapsed:.2f}s (slowest call {slowest:.2f}s)")
+        return results
+
+    async def _gather_async(self, tasks: List[RefreshTask], deadline: Optional[float],
+                            timeout: Optional[float]) -> List[RefreshResult]:
+        semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        async def _call(task: RefreshTask) -> RefreshResult:
+            semaphore = semaphores.setdefault(task.provider, asyncio.Semaphore(self._async_limit(task.provider)))
+            async with semaphore:
+                started = time.monotonic()
+                if deadline is not None and started >= deadline:
+                    return RefreshResult(task.key, task.provider, error=DeadlineExceededError(
+                        f'Cancelled: refresh deadline of {timeout:.0f}s exceeded before the call started'))
+                try:
+                    with request_deadline(deadline):
+                        call = task.func(*task.args, **task.kwargs)
+                        value = await (asyncio.wait_for(call, deadline - started) if deadline is not None else call)
+                    return RefreshResult(task.key, task.provider, value=value, duration=time.monotonic() - started)
+                except asyncio.TimeoutError:
+                    error = DeadlineExceededError(f'Cancelled: refresh deadline of {timeout:.0f}s exceeded')
+                    return RefreshResult(task.key, task.provider, error=error, duration=time.monotonic() - started)
+                except Exception as e:
+                    return RefreshResult(task.key, task.provider, error=e, duration=time.monotonic() - started)
+
+        return list(await asyncio.gather(*(_call(task) for task in tasks)))
+
+    def shutdown(self, wait_for_tasks: bool = True) -> None:
+        self._executor.shutdown(wait=wait_for_tasks)
+
+# Pipeline đồng bộ của provider vừa chạy xong trong khoảng này (giây) thì trigger mới bị bỏ qua
+SYNC_MIN_INTERVAL = int(os.getenv('SYNC_MIN_INTERVAL', '900'))
+
+class SyncGuard:
+    """Gộp các trigger chồng nhau của cùng một pipeline đồng bộ.
+
+    Mỗi pipeline chỉ chạy một lần tại một thời điểm; trigger tới khi pipeline đang
+    chạy, hoặc vừa chạy thành công chưa quá `min_interval` giây, bị bỏ qua vì kết
+    quả đang có đã đủ mới. Lần chạy thất bại không chặn lần sau.
+    """
+
+    IN_FLIGHT = 'in_flight'
+    RECENT = 'recent'
+
+    def __init__(self, min_interval: int = SYNC_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._running = set()
+        self._last_success: Dict[str, float] = {}
+
+    def begin(self, name: str, force: bool = False) -> Optional[str]:
+        """Đánh dấu pipeline bắt đầu; trả về None nếu được chạy, ngược lại là lý do bỏ qua"""
+        with self._lock:
+            if name in self._running:
+                return self.IN_FLIGHT
+            last = self._last_success.get(name)
+            if not force and last is not None and time.monotonic() - last < self.min_interval:
+                return self.RECENT
+            self._running.add(name)
+            return None
+
+    def finish(self, name: str, ok: bool = True) -> None:
+        with self._lock:
+            self._running.discard(name)
+            if ok:
+                self._last_success[name] = time.monotonic()
+
+    def status(self) -> Dict[str, Dict]:
+        with self._lock:
+            now = time.monotonic()
+            names = self._running | set(self._last_success)
+            return {name: {
+                'running': name in self._running,
+                'seconds_since_success': int(now - self._last_success[name]) if name in self._last_success else None,
+            } for name in sorted(names)}
+
+# Global engine dùng chung cho scheduler
+_engine: Optional[RefreshEngine] = None
+_engine_lock = threading.Lock()
+
+def get_refresh_engine() -> RefreshEngine:
+    """Lấy refresh engine dùng chung"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RefreshEngine()
+        return _engine
@@ -1,5 +1,6 @@
 import requests
 import logging
+from core.api_clients.transport import get_session
 from typing import Dict, List, Optional
 from datetime import datetime
 
@@ -25,12 +26,13 @@ class RocketChatClient:
     def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
         """Make HTTP request to Rocket Chat API"""
         url = f"{self.base_url}{endpoint}"
+        session = get_session(self.base_url)
         
         try:
             if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers, verify=False)
+                response = session.get(url, headers=self.headers, verify=False)
             elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data, verify=False)
+                response = session.post(url, headers=self.headers, json=data, verify=False)
             else:
                 raise RocketChatError(f"Unsupported HTTP method: {method}")
             
@@ -78,54 +80,111 @@ class RocketChatClient:
         
         return self._make_request('POST', '/api/v1/chat.postMessage', payload)
 
+class AsyncRocketChatClient:
+    """Bản async của RocketChatClient trên event loop dùng chung (cần httpx)"""
+
+    def __init__(self, auth_token: str, user_id: str, base_url: str = "https://rocket.int.team"):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {
+            "X-Auth-Token": auth_token,
+            "X-User-Id": user_id,
+            "Content-Type": "application/json"
+        }
+
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
+        from core.api_clients import aio
+        try:
+            response = await aio.request(method, f"{self.base_url}{endpoint}", headers=self.headers,
+                                         json=data, verify=False)
+            response.raise_for_status()
+            return response.json()
+        except aio.REQUEST_ERRORS as e:
+            raise RocketChatError(f"API request failed: {str(e)}")
+        except Exception as e:
+            raise RocketChatError(f"Unexpected error: {str(e)}")
+
+    async def get_channels(self) -> List[Dict]:
+        response = await self._make_request('GET', '/api/v1/channels.list')
+        return response.get('channels', [])
+
+    async def get_groups(self) -> List[Dict]:
+        response = await self._make_request('GET', '/api/v1/groups.list')
+        return response.get('groups', [])
+
+    async def send_message(self, room_id: str, message: str, alias: Optional[str] = None) -> Dict:
+        payload = {"roomId": room_id, "text": message}
+        if alias:
+            payload["alias"] = alias
+        return await self._make_request('POST', '/api/v1/chat.postMessage', payload)
+
+    async def post_attachments(self, room_id: str, attachments: List[Dict]) -> Dict:
+        payload = {"roomId": room_id, "attachments": attachments}
+        return await self._make_request('POST', '/api/v1/chat.postMessage', payload)
+
 # ==================== SIMPLE FUNCTIONS ====================
 
-def send_formatted_notification_simple(
-    room_id: str,
-    title: str,
-    text: str,
-    auth_token: str,
-    user_id: str,
-    color: str = "good"
-) -> bool:
-    """Send formatted notification to Rocket Chat (simplified version)"""
+ROCKET_CHAT_BASE_URL = "https://rocket.int.team"
+
+def post_attachments(room_id: str, auth_token: str, user_id: str, attachments: List[Dict]) -> tuple:
+    """Gửi đồng bộ một message gồm nhiều attachment, trả về (thành công, lỗi)"""
     try:
-        base_url = "https://rocket.int.team"
         headers = {
             "X-Auth-Token": auth_token,
             "X-User-Id": user_id,
             "Content-Type": "application/json"
         }
+        payload = {"roomId": room_id, "attachments": attachments}
         
-        payload = {
-            "roomId": room_id,
-            "attachments": [{
-                "title": title,
-                "text": text,
-                "color": color,
-                "ts": datetime.now().isoformat()
-            }]
-        }
-        
-        response = requests.post(f"{base_url}/api/v1/chat.postMessage", 
-                               headers=headers, 
-                               json=payload, 
-                               verify=False)
+        response = get_session(ROCKET_CHAT_BASE_URL).post(f"{ROCKET_CHAT_BASE_URL}/api/v1/chat.postMessage",
+                                                          headers=headers,
+                                                          json=payload,
+                                                          verify=False)
         
         if response.status_code == 200:
             result = response.json()
             if result.get('success'):
-                logger.info(f"Rocket Chat notification sent successfully to room {room_id}")
-                return True
-            else:
-                logger.error(f"Rocket Chat API returned error: {result}")
-                return False
-        else:
-            logger.error(f"Rocket Chat API request failed: {response.status_code} - {response.text}")
-            return False
+                logger.info(f"Rocket Chat message with {len(attachments)} attachments sent to room {room_id}")
+                return True, None
+            logger.error(f"Rocket Chat API returned error: {result}")
+            return False, f"API error: {result}"
+        logger.error(f"Rocket Chat API request failed: {response.status_code} - {response.text}")
+        return False, f"HTTP {response.status_code}: {response.text[:200]}"
             
     except Exception as e:
         logger.error(f"Unexpected error sending Rocket Chat notification: {e}")
+        return False, str(e)
+
+def send_formatted_notification_simple(
+    room_id: str,
+    title: str,
+    text: str,
+    auth_token: str,
+    user_id: str,
+    color: str = "good",
+    immediate: bool = False
+) -> bool:
+    """Gửi thông báo có định dạng tới Rocket Chat.
+
+    Mặc định đưa vào outbox trong transaction riêng (không commit session của caller) để
+    dispatcher chạy nền gửi, có retry và gộp theo room. `immediate=True` (gửi thủ công từ UI)
+    gửi ngay và trả về kết quả thật. Outbox chỉ lưu id của config nên thông tin đăng nhập
+    không khớp config nào đã lưu cũng được gửi ngay.
+    """
+    from core import outbox
+    from core.models import db, RocketChatConfig
+    try:
+        if not immediate:
+            with db.session.no_autoflush:
+                config = RocketChatConfig.query.filter_by(room_id=room_id, auth_token=auth_token,
+                                                          user_id_rocket=user_id).first()
+            if config is not None:
+                outbox.enqueue(room_id, title, text, config.id, color, commit=True)
+                return True
+        attachment = {"title": title, "text": text, "color": color, "ts": datetime.utcnow().isoformat()}
+        ok, _ = post_attachments(room_id, auth_token, user_id, [attachment])
+        return ok
+    except Exception as e:
+        logger.error(f"Error sending Rocket Chat notification: {e}")
         return False
 
 def send_account_expiry_notification(
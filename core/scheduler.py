@@ -1,11 +1,31 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+from apscheduler.util import obj_to_ref
 from core import manager, notifier
-from core.models import User
-from datetime import datetime
+from core.models import db, User, SchedulerLease, JobRun
+from core.leader import LeaderElector, get_lease
+from core.api_clients.bitlaunch import BitLaunchClient, AsyncBitLaunchClient
+from core.api_clients.zingproxy import ZingProxyClient, AsyncZingProxyClient
+from core.api_clients.cloudfly import CloudFlyClient, AsyncCloudFlyClient
+from core.api_clients import aio
+from core.refresh import RefreshTask, SyncGuard, get_refresh_engine
+from core.api_clients.resilience import DeadlineExceededError
+from core import inventory
+from core import alerts
+from core import reencrypt
+from core import proxy_check
+from core import balance_history
+from datetime import datetime, timezone
 from datetime import timedelta
+from typing import Optional
 from core.rocket_chat import send_formatted_notification_simple
 import os
+import math
+import time
+import atexit
 import logging
+import threading
 import urllib3
 
 # Suppress SSL warnings
@@ -13,726 +33,910 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 logger = logging.getLogger(__name__)
 
-def start_scheduler():
-    from ui.app import create_app
-    app = create_app()
-    
-    scheduler = BackgroundScheduler()
+# ==================== PROVIDER FETCHERS ====================
+# Các hàm dưới đây chạy trong worker của refresh engine: chỉ gọi API, không chạm DB.
+# Mỗi tài khoản chỉ được fetch một lần cho cả pipeline: balance (khi đến hạn) và
+# danh sách VPS/proxy dùng chung một client. Bản async chạy trên event loop dùng
+# chung khi có httpx (xem ASYNC_SYNC).
+
+def _bitlaunch_balance(account_info: dict) -> tuple:
+    """(balance, limit) theo dollars; BitLaunch API trả về milli-dollars (1/1000)"""
+    return account_info.get('balance', 0) / 1000, account_info.get('limit', 0) / 1000
+
+def _cloudfly_main_balance(user_info: dict) -> float:
+    # CloudFly API có structure phức tạp: clients[0].wallet.main_balance
+    if 'clients' in user_info and len(user_info['clients']) > 0:
+        return user_info['clients'][0].get('wallet', {}).get('main_balance', 0)
+    return 0
+
+def _fetch_bitlaunch(api_key: str, with_account: bool) -> tuple:
+    """Lấy ((balance, limit) hoặc None, danh sách server) của tài khoản BitLaunch"""
+    client = BitLaunchClient(api_key)
+    account = _bitlaunch_balance(client.get_account_info()) if with_account else None
+    return account, client.list_servers()
+
+def _fetch_zingproxy(access_token: str, with_account: bool) -> tuple:
+    """Lấy (balance hoặc None, danh sách proxy) của tài khoản ZingProxy"""
+    client = ZingProxyClient(access_token=access_token)
+    balance = client.get_account_details().get('balance', 0) if with_account else None
+    return balance, client.get_all_active_proxies()
+
+def _fetch_cloudfly(api_token: str, with_account: bool) -> tuple:
+    """Lấy (main_balance hoặc None, danh sách instance) của tài khoản CloudFly"""
+    client = CloudFlyClient(api_token)
+    main_balance = _cloudfly_main_balance(client.get_user_info()) if with_account else None
+    return main_balance, client.list_instances()
 
-    def _send_api_error_alert(user_id: int, provider: str, email: str, error_message: str) -> None:
-        """Gửi cảnh báo Rocket Chat khi API key/token lỗi hoặc hết hạn."""
+async def _fetch_bitlaunch_async(api_key: str, with_account: bool) -> tuple:
+    client = AsyncBitLaunchClient(api_key)
+    account = _bitlaunch_balance(await client.get_account_info()) if with_account else None
+    return account, await client.list_servers()
+
+async def _fetch_zingproxy_async(access_token: str, with_account: bool) -> tuple:
+    client = AsyncZingProxyClient(access_token)
+    balance = (await client.get_account_details()).get('balance', 0) if with_account else None
+    return balance, await client.get_all_active_proxies()
+
+async def _fetch_cloudfly_async(api_token: str, with_account: bool) -> tuple:
+    client = AsyncCloudFlyClient(api_token)
+    main_balance = _cloudfly_main_balance(await client.get_user_info()) if with_account else None
+    return main_balance, await client.list_instances()
+
+# ==================== USER NOTIFICATION SCHEDULE ====================
+# Mỗi user có Rocket Chat config được gán một cron job riêng đúng notify_hour:notify_minute,
+# nên giữa các lần gửi scheduler không phải chạm DB.
+
+# App và scheduler đang chạy, để có thể lên lịch lại từ request handler
+_app = None
+_active_scheduler = None
+
+# Cho phép job trễ tối đa 10 phút (vd. khi process bận) vẫn được chạy, chỉ một lần
+NOTIFICATION_MISFIRE_GRACE_SECONDS = 600
+
+def notification_job_id(user_id: int) -> str:
+    return f'expiry_warnings_user_{user_id}'
+
+def send_user_expiry_warnings(user_id: int) -> None:
+    """Gửi cảnh báo hết hạn qua RocketChat cho một user (chạy đúng giờ user đã chọn)"""
+    logger.info(f"[Scheduler] Running expiry warnings for user {user_id}")
+    with _app.app_context():
+        from core.models import RocketChatConfig
         try:
-            from core.models import RocketChatConfig
+            user = db.session.get(User, user_id)
             configs = RocketChatConfig.query.filter_by(user_id=user_id, is_active=True).all()
-            if not configs:
-                logger.warning(f"[Scheduler] No Rocket Chat config for user {user_id} to report API error")
+            if not user or not configs:
+                logger.info(f"[Scheduler] User {user_id} has no active RocketChat configuration")
                 return
+            
+            vps_list = manager.list_vps()
+            acc_list = manager.list_accounts()
+            for config in configs:
+                notifier.send_expiry_rocketchat(vps_list, item_type='VPS', user=user, config=config)
+                notifier.send_expiry_rocketchat(acc_list, item_type='Account', user=user, config=config)
+        except Exception as e:
+            logger.error(f"[Scheduler] Error sending expiry warnings for user {user_id}: {e}")
+
+# Chu kỳ (giây) đối chiếu job thông báo với giờ/phút của user trong DB, để thay đổi
+# nhận ở worker không phải leader vẫn được áp dụng
+NOTIFICATION_RECONCILE_SECONDS = int(os.getenv('NOTIFICATION_RECONCILE_SECONDS', '60'))
+NOTIFICATION_RECONCILE_JOB_ID = 'notification_reconcile'
+# (scheduler, trạng thái user/config) ở lần đối chiếu gần nhất; không đổi thì bỏ qua lần chạy
+_notification_state_seen = None
+
+def _notification_state() -> tuple:
+    """Số dòng và updated_at lớn nhất của users và rocket_chat_configs: đổi khi có thêm/sửa/xóa"""
+    from core.models import RocketChatConfig
+    return tuple(tuple(db.session.execute(db.select(db.func.count(model.id), db.func.max(model.updated_at))).one())
+                 for model in (User, RocketChatConfig))
+
+def _notify_time(user: User) -> tuple:
+    hour = user.notify_hour if user.notify_hour is not None else 8
+    minute = user.notify_minute if user.notify_minute is not None else 0
+    return hour, minute
+
+def _schedule_user_notification(scheduler, user: User) -> None:
+    hour, minute = _notify_time(user)
+    scheduler.add_job(
+        send_user_expiry_warnings, 'cron', hour=hour, minute=minute, args=[user.id],
+        id=notification_job_id(user.id), replace_existing=True,
+        coalesce=True, misfire_grace_time=NOTIFICATION_MISFIRE_GRACE_SECONDS
+    )
+
+def schedule_user_notifications(scheduler) -> int:
+    """Đồng bộ cron job gửi thông báo với DB, trả về số user có job.
+
+    User có Rocket Chat config đang bật được tạo job (hoặc lên lịch lại nếu giờ/phút
+    đã đổi); job của user không còn config bị xóa. Job không đổi được giữ nguyên
+    để không làm lệch next_run_time.
+    """
+    from core.models import RocketChatConfig
+    users = User.query.join(RocketChatConfig, RocketChatConfig.user_id == User.id) \
+        .filter(RocketChatConfig.is_active == True).distinct().all()
+    prefix = notification_job_id('')
+    stored = {job.id: job for job in scheduler.get_jobs() if job.id.startswith(prefix)}
+    changed = 0
+    for user in users:
+        job = stored.pop(notification_job_id(user.id), None)
+        hour, minute = _notify_time(user)
+        expected = scheduler._create_trigger('cron', {'hour': hour, 'minute': minute})
+        if job is None or str(job.trigger) != str(expected):
+            _schedule_user_notification(scheduler, user)
+            changed += 1
+    for job_id in stored:
+        scheduler.remove_job(job_id)
+    if changed or stored:
+        logger.info(f"[Scheduler] Notification jobs: {changed} scheduled/rescheduled, {len(stored)} removed "
+                    f"({len(users)} users with Rocket Chat)")
+    return len(users)
 
+def reconcile_user_notifications_job() -> Optional[int]:
+    """Job của leader: áp dụng thay đổi giờ thông báo/Rocket Chat config từ mọi worker.
+
+    Chỉ đọc lại user/config và job store khi users hoặc rocket_chat_configs đã đổi kể từ
+    lần đối chiếu trước; các lần khác chỉ tốn hai query aggregate.
+    """
+    global _notification_state_seen
+    scheduler = _active_scheduler
+    if scheduler is None:
+        return 0
+    with _app.app_context():
+        state = (scheduler, _notification_state())
+        if state == _notification_state_seen:
+            return None
+        count = schedule_user_notifications(scheduler)
+        _notification_state_seen = state
+        return count
+
+def reschedule_user_notification(user_id: int) -> None:
+    """Lên lịch lại job thông báo của user sau khi đổi giờ/phút hoặc Rocket Chat config.
+
+    Áp dụng ngay nếu scheduler chạy trong process này (leader). Ở worker khác thì
+    thay đổi đã nằm trong DB và job reconcile của leader áp dụng trong vòng
+    NOTIFICATION_RECONCILE_SECONDS giây.
+    """
+    scheduler = _active_scheduler
+    if scheduler is None or not scheduler.running:
+        return
+    from core.models import RocketChatConfig
+    try:
+        user = db.session.get(User, user_id)
+        has_config = RocketChatConfig.query.filter_by(user_id=user_id, is_active=True).first() is not None
+        if user and has_config:
+            _schedule_user_notification(scheduler, user)
+            logger.info(f"[Scheduler] Rescheduled expiry notifications for user {user_id} "
+                        f"at {scheduler.get_job(notification_job_id(user_id)).next_run_time}")
+        elif scheduler.get_job(notification_job_id(user_id)):
+            scheduler.remove_job(notification_job_id(user_id))
+    except Exception as e:
+        logger.error(f"[Scheduler] Error rescheduling notifications for user {user_id}: {e}")
+
+# ==================== JOBS ====================
+# Các job ở mức module để job store (SQLAlchemy) lưu được tham chiếu tới hàm
+
+def _notify_user_rooms(user_id: int, title: str, text: str, color: str) -> None:
+    from core.models import RocketChatConfig
+    configs = RocketChatConfig.query.filter_by(user_id=user_id, is_active=True).all()
+    if not configs:
+        logger.warning(f"[Scheduler] No Rocket Chat config for user {user_id} to report API status")
+        return
+    for cfg in configs:
+        try:
+            send_formatted_notification_simple(
+                room_id=cfg.room_id,
+                title=title,
+                text=text,
+                auth_token=cfg.auth_token,
+                user_id=cfg.user_id_rocket,
+                color=color
+            )
+        except Exception as e:
+            logger.error(f"[Scheduler] Failed to send API alert to Rocket Chat: {e}")
+
+def _send_api_error_alert(user_id: int, provider: str, email: str, error_message: str,
+                          error_class: str = None) -> None:
+    """Gửi cảnh báo Rocket Chat khi API key/token lỗi hoặc hết hạn.
+
+    Chỉ gửi khi trạng thái chuyển (mới lỗi, hoặc vẫn lỗi sau ALERT_DIGEST_HOURS);
+    các lần lỗi lặp lại trong khoảng đó chỉ được ghi nhận vào alert_states.
+    """
+    try:
+        transition, state = alerts.record_failure(user_id, provider, email, error_message, error_class)
+        if transition is None:
+            return
+
+        if transition == alerts.NEW:
             title = f"❗ Lỗi API key - {provider}"
+        else:
+            title = f"⏰ Vẫn lỗi API key - {provider}"
+        text = (
+            f"Tài khoản: {email}\n"
+            f"Dịch vụ: {provider}\n"
+            f"Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"Chi tiết lỗi: {error_message}\n"
+        )
+        if transition == alerts.STILL_FAILING:
+            text += (
+                f"Lỗi từ: {state.first_seen.strftime('%Y-%m-%d %H:%M:%S')} UTC "
+                f"({state.failure_count} lần thất bại)\n"
+            )
+        text += (
+            f"\nKhuyến nghị:\n"
+            f"- Kiểm tra lại API key/token.\n"
+            f"- Gia hạn hoặc nhập lại API key nếu hết hạn.\n"
+        )
+        _notify_user_rooms(user_id, title, text, "danger")
+    except Exception as e:
+        logger.error(f"[Scheduler] Unexpected error while preparing API error alert: {e}")
+
+def _send_api_recovered_alerts(provider: str, keys, error_class: str = None) -> None:
+    """Đánh dấu hồi phục các tài khoản cập nhật thành công và báo cho những key đã từng cảnh báo"""
+    try:
+        for state in alerts.record_successes(provider, keys, error_class):
             text = (
-                f"Tài khoản: {email}\n"
+                f"Tài khoản: {state.account}\n"
                 f"Dịch vụ: {provider}\n"
                 f"Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"Chi tiết lỗi: {error_message}\n\n"
-                f"Khuyến nghị:\n"
-                f"- Kiểm tra lại API key/token.\n"
-                f"- Gia hạn hoặc nhập lại API key nếu hết hạn.\n"
+                f"Đã lỗi từ: {state.first_seen.strftime('%Y-%m-%d %H:%M:%S')} UTC "
+                f"({state.failure_count} lần thất bại)\n"
             )
+            _notify_user_rooms(state.user_id, f"✅ API hoạt động lại - {provider}", text, "good")
+    except Exception as e:
+        logger.error(f"[Scheduler] Unexpected error while preparing API recovery alert: {e}")
 
-            for cfg in configs:
-                try:
-                    send_formatted_notification_simple(
-                        room_id=cfg.room_id,
-                        title=title,
-                        text=text,
-                        auth_token=cfg.auth_token,
-                        user_id=cfg.user_id_rocket,
-                        color="danger"
-                    )
-                except Exception as e:
-                    logger.error(f"[Scheduler] Failed to send API error alert to Rocket Chat: {e}")
+def send_daily_summary():
+    """Gửi báo cáo tổng hợp qua RocketChat cho users có cấu hình"""
+    logger.info("[Scheduler] Running send_daily_summary job")
+    with _app.app_context():
+        from core.models import RocketChatConfig
+        
+        configs = RocketChatConfig.query.filter_by(is_active=True).all()
+        logger.info(f"[Scheduler] Found {len(configs)} active RocketChat configurations")
+        
+        for config in configs:
+            user = User.query.get(config.user_id)
+            if not user:
+                continue
+            try:
+                logger.info(f"[Scheduler] Sending daily summary to user {user.username}")
+                notifier.send_daily_summary_rocketchat(user, config)
+            except Exception as e:
+                logger.error(f"[Scheduler] Error sending daily summary to {user.username}: {e}")
+
+def send_weekly_report():
+    """Gửi báo cáo tuần cho admin"""
+    logger.info("[Scheduler] Running send_weekly_report job")
+    with _app.app_context():
+        # TODO: Implement weekly report
+        pass
+
+def _commit_batch(job_name: str) -> bool:
+    """Commit một lần cho toàn bộ kết quả của job"""
+    try:
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Scheduler] Error committing {job_name} results: {e}")
+        return False
+
+# ==================== PROVIDER SYNC PIPELINES ====================
+# Một pipeline cho mỗi provider: một lần fetch mỗi tài khoản phục vụ cả bước
+# balance và bước VPS/proxy. SyncGuard bỏ qua trigger khi pipeline đang chạy
+# hoặc vừa chạy xong, nên trigger chồng nhau (hoặc chạy bù sau restart) không
+# gọi provider thêm lần nữa.
+
+_sync_guard = SyncGuard()
+# Ngân sách thời gian (giây) cho phần gọi API của một lần sync, để một provider treo
+# không giữ worker của scheduler quá lâu
+SYNC_JOB_DEADLINE = int(os.getenv('SYNC_JOB_DEADLINE', '300'))
+# auto: dùng client async khi đã cài httpx; true/false để ép bật/tắt
+ASYNC_SYNC = os.getenv('ASYNC_SYNC', 'auto').lower()
+
+def use_async_sync() -> bool:
+    if ASYNC_SYNC == 'auto':
+        return aio.is_available()
+    return ASYNC_SYNC in ('1', 'true', 'yes')
+
+def _sync_provider(provider: str, label: str, accounts: list, due_ids: set, fetchers: tuple, credential: str,
+                   apply) -> tuple:
+    """Chạy pipeline đồng bộ chung, trả về (số VPS/proxy đã đồng bộ, kết quả có đủ mới không).
+
+    `apply(account, balance, items)` ghi kết quả của một tài khoản (chưa commit) và
+    trả về số dòng thay đổi; balance là None nếu tài khoản chưa đến hạn cập nhật.
+    Mỗi `apply` chạy trong savepoint, lỗi thì tài khoản đó được tính vào failures.
+    `fetchers` là (hàm fetch đồng bộ, hàm fetch async).
+    """
+    engine = get_refresh_engine()
+    fetch, fetch_async = fetchers
+    if use_async_sync():
+        tasks = [RefreshTask(acc.id, provider, fetch_async, getattr(acc, credential), acc.id in due_ids)
+                 for acc in accounts]
+        results = engine.run_async(tasks, timeout=SYNC_JOB_DEADLINE)
+    else:
+        tasks = [RefreshTask(acc.id, provider, fetch, getattr(acc, credential), acc.id in due_ids) for acc in accounts]
+        results = engine.run(tasks, timeout=SYNC_JOB_DEADLINE)
+
+    accounts_by_id = {acc.id: acc for acc in accounts}
+    timed_out = 0
+    balances_updated = 0
+    items_synced = 0
+    rows_changed = 0
+    failures = []
+    succeeded = []
+    for result in results:
+        acc = accounts_by_id[result.key]
+        if not result.ok:
+            if isinstance(result.error, DeadlineExceededError):
+                timed_out += 1
+            logger.error(f"[Scheduler] {label} API error for account {acc.id}: {result.error}")
+            failures.append((acc.user_id, acc.email, str(result.error)))
+            continue
+        balance, items = result.value
+        try:
+            # Savepoint riêng cho mỗi tài khoản: dữ liệu lỗi chỉ làm hỏng tài khoản đó, không cả batch
+            with db.session.begin_nested():
+                rows_changed += apply(acc, balance, items)
         except Exception as e:
-            logger.error(f"[Scheduler] Unexpected error while preparing API error alert: {e}")
-    
-    def send_expiry_warnings():
-        """Gửi cảnh báo hết hạn qua RocketChat cho users có cấu hình"""
-        logger.info("[Scheduler] Running send_expiry_warnings job")
-        with app.app_context():
-            from core.models import RocketChatConfig
+            logger.error(f"[Scheduler] {label} apply error for account {acc.id}: {e}")
+            failures.append((acc.user_id, acc.email, str(e)))
+            continue
+        if balance is not None:
+            balances_updated += 1
+        items_synced += len(items or [])
+        succeeded.append((acc.user_id, acc.email))
+
+    committed = _commit_batch(f'sync_{provider}')
+    if committed:
+        _send_api_recovered_alerts(label, succeeded)
+    else:
+        balances_updated = items_synced = rows_changed = 0
+    for user_id, email, error in failures:
+        _send_api_error_alert(user_id, label, email, error)
+
+    logger.info(f"[Scheduler] {label} sync completed: {len(succeeded)}/{len(accounts)} accounts fetched, "
+                f"{balances_updated} balances updated, {items_synced} items synced, {rows_changed} rows changed")
+    if timed_out:
+        logger.warning(f"[Scheduler] {label} sync: {timed_out} accounts cancelled after the "
+                       f"{SYNC_JOB_DEADLINE}s deadline")
+    # Lỗi commit hoặc mọi tài khoản đều lỗi thì trigger kế tiếp không bị SyncGuard chặn
+    return items_synced, committed and (bool(succeeded) or not accounts)
+
+def _guarded_sync(provider: str, label: str, run, force: bool = False) -> Optional[int]:
+    """Chạy `run` trong app context nếu SyncGuard cho phép; `force` bỏ qua kiểm tra vừa chạy"""
+    skip = _sync_guard.begin(provider, force=force)
+    if skip:
+        logger.info(f"[Scheduler] Skipping {label} sync ({skip})")
+        return None
+    ok = False
+    try:
+        with _app.app_context():
+            synced, ok = run()
+        return synced
+    finally:
+        _sync_guard.finish(provider, ok=ok)
+
+def _apply_bitlaunch(api, account, servers) -> int:
+    changed = 0
+    if account is not None:
+        balance, limit = account
+        manager.update_bitlaunch_info(api.id, balance, limit, commit=False)
+        balance_history.record_sample('bitlaunch', api.id, api.user_id, balance)
+        logger.info(f"[Scheduler] Updated BitLaunch API {api.id}: balance=${balance:.3f}, limit=${limit:.3f}")
+    if servers:
+        counts = manager.update_bitlaunch_vps_list(api.id, servers, commit=False)
+        changed = counts['inserted'] + counts['updated'] + counts['deleted']
+        logger.info(f"[Scheduler] Synced {len(servers)} VPS instances for API {api.id}: "
+                    f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted")
+    return changed
+
+def _apply_zingproxy(acc, balance, proxies) -> int:
+    if balance is not None:
+        manager.update_zingproxy_account(acc.id, balance, commit=False)
+        balance_history.record_sample('zingproxy', acc.id, acc.user_id, balance)
+        logger.info(f"[Scheduler] Updated balance for account {acc.id}: ${balance}")
+    # Cập nhật danh sách proxy trong ZingProxy và import vào hệ thống quản lý proxy
+    counts = manager.sync_zingproxy_account(acc.id, acc.user_id, proxies, commit=False)
+    zing_counts = counts['zingproxies']
+    logger.info(f"[Scheduler] Synced {len(proxies)} proxies for account {acc.id}: "
+                f"{zing_counts['inserted']} inserted, {zing_counts['updated']} updated, {zing_counts['deleted']} deleted")
+    return sum(zing_counts.values()) + counts['proxies']['inserted'] + counts['proxies']['updated']
+
+def _apply_cloudfly(api, main_balance, instances) -> int:
+    changed = 0
+    if main_balance is not None:
+        # CloudFly API không có account_limit
+        manager.update_cloudfly_info(api.id, main_balance, 0, commit=False)
+        balance_history.record_sample('cloudfly', api.id, api.user_id, main_balance)
+        logger.info(f"[Scheduler] Updated balance for API {api.id}: ${main_balance}")
+    if instances:
+        counts = manager.update_cloudfly_vps_list(api.id, instances, commit=False)
+        changed = counts['inserted'] + counts['updated'] + counts['deleted']
+        logger.info(f"[Scheduler] Synced {len(instances)} VPS instances for API {api.id}: "
+                    f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted")
+    return changed
+
+def sync_bitlaunch(force: bool = False) -> Optional[int]:
+    """Đồng bộ BitLaunch: balance của API đến hạn và danh sách VPS của mọi API đang hoạt động"""
+    def run():
+        from core.models import BitLaunchAPI
+        apis = BitLaunchAPI.query.filter_by(is_active=True).all()
+        due_ids = {api.id for api in manager.get_bitlaunch_apis_needing_update()}
+        logger.info(f"[Scheduler] Syncing {len(apis)} BitLaunch APIs ({len(due_ids)} balances due)")
+        return _sync_provider('bitlaunch', 'BitLaunch', apis, due_ids, (_fetch_bitlaunch, _fetch_bitlaunch_async),
+                              'api_key', _apply_bitlaunch)
+    return _guarded_sync('bitlaunch', 'BitLaunch', run, force=force)
+
+def sync_zingproxy(force: bool = False) -> Optional[int]:
+    """Đồng bộ ZingProxy: balance của tài khoản đến hạn và proxy của mọi tài khoản"""
+    def run():
+        from core.models import ZingProxyAccount
+        accs = ZingProxyAccount.query.all()
+        due_ids = {acc.id for acc in manager.get_zingproxy_accounts_needing_update()}
+        logger.info(f"[Scheduler] Syncing {len(accs)} ZingProxy accounts ({len(due_ids)} balances due)")
+        return _sync_provider('zingproxy', 'ZingProxy', accs, due_ids, (_fetch_zingproxy, _fetch_zingproxy_async),
+                              'access_token', _apply_zingproxy)
+    return _guarded_sync('zingproxy', 'ZingProxy', run, force=force)
+
+def sync_cloudfly(force: bool = False) -> Optional[int]:
+    """Đồng bộ CloudFly: balance của API đến hạn và danh sách VPS của mọi API đang hoạt động"""
+    def run():
+        from core.models import CloudFlyAPI
+        apis = CloudFlyAPI.query.filter_by(is_active=True).all()
+        due_ids = {api.id for api in manager.get_cloudfly_apis_needing_update()}
+        logger.info(f"[Scheduler] Syncing {len(apis)} CloudFly APIs ({len(due_ids)} balances due)")
+        return _sync_provider('cloudfly', 'CloudFly', apis, due_ids, (_fetch_cloudfly, _fetch_cloudfly_async),
+                              'api_token', _apply_cloudfly)
+    return _guarded_sync('cloudfly', 'CloudFly', run, force=force)
+
+# Chu kỳ (phút) của job re-encrypt secret sau khi đổi key chính
+REENCRYPT_INTERVAL_MINUTES = int(os.getenv('REENCRYPT_INTERVAL_MINUTES', '10'))
+
+def reencrypt_secrets_job() -> int:
+    """Re-encrypt dần secret bằng key chính hiện tại, tiếp tục từ checkpoint lần trước"""
+    with _app.app_context():
+        if reencrypt.get_reencryption_status()['complete']:
+            return 0
+        rotated = reencrypt.reencrypt_secrets()
+        if rotated:
+            logger.info(f"[Scheduler] Re-encrypted {rotated} secrets with the primary key")
+        return rotated
+
+def check_proxies_job() -> int:
+    """Kiểm tra sống/chết một shard proxy (xoay vòng theo cursor trong DB), dọn lịch sử cũ ở shard 0"""
+    with _app.app_context():
+        shard = proxy_check.next_shard()
+        summary = proxy_check.check_shard(shard)
+        if shard == 0:
+            deleted = proxy_check.prune_check_history()
+            if deleted:
+                logger.info(f"[Scheduler] Pruned {deleted} old proxy check rows")
+        return summary['checked']
+
+def rollup_balance_history_job() -> int:
+    """Gộp sample số dư theo giờ/ngày và xóa dữ liệu quá hạn giữ (kể cả lịch sử job_runs)"""
+    with _app.app_context():
+        rolled = balance_history.rollup_balances()
+        deleted = balance_history.prune_balance_history()
+        if rolled['hour'] or rolled['day'] or deleted['samples'] or deleted['hour']:
+            logger.info(f"[Scheduler] Balance rollup: {rolled['hour']} hourly, {rolled['day']} daily buckets; "
+                        f"pruned {deleted['samples']} samples, {deleted['hour']} hourly buckets")
+        runs_deleted = prune_job_runs()
+        if runs_deleted:
+            logger.info(f"[Scheduler] Pruned {runs_deleted} job_runs rows older than {JOB_RUNS_RETENTION_DAYS} days")
+        return rolled['hour'] + rolled['day']
+
+def check_stale_api_updates():
+    """Cảnh báo nếu API không được cập nhật > 24h (có thể do hết hạn/nhập sai)."""
+    logger.info("[Scheduler] Running check_stale_api_updates job")
+    with _app.app_context():
+        from core.models import BitLaunchAPI, ZingProxyAccount, CloudFlyAPI
+        threshold = datetime.utcnow() - timedelta(hours=24)
+
+        # BitLaunch
+        try:
+            bl_stale = BitLaunchAPI.query.filter(
+                (BitLaunchAPI.last_updated == None) | (BitLaunchAPI.last_updated < threshold)
+            ).all()
+            for api in bl_stale:
+                _send_api_error_alert(api.user_id, "BitLaunch", api.email, "Không nhận cập nhật > 24h. Có thể API key hết hạn/không hợp lệ.", error_class="stale")
+        except Exception as e:
+            logger.error(f"[Scheduler] Error checking stale BitLaunch APIs: {e}")
+
+        # ZingProxy
+        try:
+            zp_stale = ZingProxyAccount.query.filter(
+                (ZingProxyAccount.last_updated == None) | (ZingProxyAccount.last_updated < threshold)
+            ).all()
+            for acc in zp_stale:
+                _send_api_error_alert(acc.user_id, "ZingProxy", acc.email, "Không nhận cập nhật > 24h. Có thể API token hết hạn/không hợp lệ.", error_class="stale")
+        except Exception as e:
+            logger.error(f"[Scheduler] Error checking stale ZingProxy accounts: {e}")
+
+        # CloudFly
+        try:
+            cf_stale = CloudFlyAPI.query.filter(
+                (CloudFlyAPI.last_updated == None) | (CloudFlyAPI.last_updated < threshold)
+            ).all()
+            for api in cf_stale:
+                _send_api_error_alert(api.user_id, "CloudFly", api.email, "Không nhận cập nhật > 24h. Có thể API token hết hạn/không hợp lệ.", error_class="stale")
+        except Exception as e:
+            logger.error(f"[Scheduler] Error checking stale CloudFly APIs: {e}")
+        
+        logger.info(f"[Scheduler] Stale API updates check completed")
+
+def check_account_alerts_5min():
+    """Kiểm tra và gửi cảnh báo tài khoản sắp hết hạn và balance thấp"""
+    with _app.app_context():
+        try:
+            from core.models import RocketChatConfig, User
+            from core.rocket_chat import send_account_expiry_notification
+            from core import manager
+            
+            logger.info("=" * 70)
+            logger.info("[Scheduler] 🔔 Checking account alerts (12-hour interval)")
+            logger.info("=" * 70)
             
-            # Kiểm tra users có cấu hình RocketChat
+            # Lấy tất cả cấu hình Rocket Chat
             configs = RocketChatConfig.query.filter_by(is_active=True).all()
+            
             if not configs:
-                logger.info("[Scheduler] No active RocketChat configurations found")
+                logger.info("[Scheduler] ⚠️ No Rocket Chat configurations found")
                 return
             
-            logger.info(f"[Scheduler] Found {len(configs)} active RocketChat configurations")
+            logger.info(f"[Scheduler] Found {len(configs)} Rocket Chat configurations")
             
-            # Lấy dữ liệu
-            try:
-                vps_list = manager.list_vps()
-                acc_list = manager.list_accounts()
-                logger.info(f"[Scheduler] Found {len(vps_list)} VPS and {len(acc_list)} accounts")
-                
-                # Gửi thông báo qua RocketChat cho từng user
-                for config in configs:
+            for config in configs:
+                try:
                     user = User.query.get(config.user_id)
                     if not user:
+                        logger.warning(f"[Scheduler] User {config.user_id} not found")
                         continue
+                
+                    logger.info(f"[Scheduler] 👤 Processing user: {user.username}")
+                
+                    # Lấy danh sách tài khoản từ TẤT CẢ nguồn
+                    all_accounts = inventory.list_accounts(config.user_id)
+                
+                    logger.info(f"[Scheduler] 📊 Found {len(all_accounts)} total accounts:")
+                    logger.info(f"[Scheduler]   - By source: {inventory.count_by_source(all_accounts)}")
+                    
+                    # Kiểm tra balance thấp
+                    low_balance_count = 0
+                    for acc in all_accounts:
+                        balance = acc.get('balance', 0)
+                        source = acc.get('source', '')
+                        if source == 'bitlaunch' and balance < 5:
+                            low_balance_count += 1
+                            logger.warning(f"[Scheduler] 💰 BitLaunch low balance: {acc.get('username')} (${balance:.2f} < $5)")
+                        elif source == 'zingproxy' and balance < 100000:
+                            low_balance_count += 1
+                            logger.warning(f"[Scheduler] 💰 ZingProxy low balance: {acc.get('username')} ({balance:,.0f} VND < 100,000 VND)")
+                        elif source == 'cloudfly' and balance < 100000:
+                            low_balance_count += 1
+                            logger.warning(f"[Scheduler] 💰 CloudFly low balance: {acc.get('username')} ({balance:,.0f} VND < 100,000 VND)")
+                    
+                    logger.info(f"[Scheduler] 🚨 Found {low_balance_count} accounts with low balance")
+                    
+                    # Lấy danh sách VPS
+                    vps_list = manager.list_vps()
+                    logger.info(f"[Scheduler] 🖥️  Found {len(vps_list)} total VPS")
+                
+                    # Gửi thông báo cảnh báo (bao gồm VPS, tài khoản sắp hết hạn và balance thấp)
+                    alert_success = send_account_expiry_notification(
+                        room_id=config.room_id,
+                        auth_token=config.auth_token,
+                        user_id=config.user_id_rocket,
+                        accounts=all_accounts,
+                        warning_days=user.notify_days or 7,
+                        vps_list=vps_list
+                    )
+                
+                    if alert_success:
+                        logger.info(f"[Scheduler] ✅ Alert sent successfully to user {user.username}")
+                    else:
+                        logger.error(f"[Scheduler] ❌ Failed to send alert to user {user.username}")
                     
-                    # Gửi thông báo VPS
-                    notifier.notify_expiry_rocketchat_per_user(vps_list, item_type='VPS', user=user, config=config)
-                    # Gửi thông báo Account
-                    notifier.notify_expiry_rocketchat_per_user(acc_list, item_type='Account', user=user, config=config)
-                    
-            except Exception as e:
-                logger.error(f"[Scheduler] Error in send_expiry_warnings: {e}")
-    
-    def send_daily_summary():
-        """Gửi báo cáo tổng hợp qua RocketChat cho users có cấu hình"""
-        logger.info("[Scheduler] Running send_daily_summary job")
-        with app.app_context():
-            from core.models import RocketChatConfig
-            
-            configs = RocketChatConfig.query.filter_by(is_active=True).all()
-            logger.info(f"[Scheduler] Found {len(configs)} active RocketChat configurations")
-            
-            for config in configs:
-                user = User.query.get(config.user_id)
-                if not user:
-                    continue
-                try:
-                    logger.info(f"[Scheduler] Sending daily summary to user {user.username}")
-                    notifier.send_daily_summary_rocketchat(user, config)
-                except Exception as e:
-                    logger.error(f"[Scheduler] Error sending daily summary to {user.username}: {e}")
-    
-    def send_weekly_report():
-        """Gửi báo cáo tuần cho admin"""
-        logger.info("[Scheduler] Running send_weekly_report job")
-        with app.app_context():
-            # TODO: Implement weekly report
-            pass
-    
-    def update_bitlaunch_apis():
-        """Tự động cập nhật thông tin tài khoản BitLaunch theo tần suất"""
-        logger.info("[Scheduler] Running update_bitlaunch_apis job")
-        with app.app_context():
-            from core.api_clients.bitlaunch import BitLaunchClient, BitLaunchAPIError
-            
-            apis = manager.get_bitlaunch_apis_needing_update()
-            logger.info(f"[Scheduler] Found {len(apis)} BitLaunch APIs needing update")
-            
-            updated_count = 0
-            for api in apis:
-                try:
-                    logger.info(f"[Scheduler] Updating BitLaunch API {api.id} ({api.email})")
-                    client = BitLaunchClient(api.api_key)
-                    account_info = client.get_account_info()
-                    
-                    # BitLaunch API trả về balance và limit theo đơn vị milli-dollars (1/1000)
-                    balance = account_info.get('balance', 0) / 1000
-                    limit = account_info.get('limit', 0) / 1000
-                    
-                    manager.update_bitlaunch_info(api.id, balance, limit)
-                    logger.info(f"[Scheduler] Updated BitLaunch API {api.id}: balance=${balance:.3f}, limit=${limit:.3f}")
-                    updated_count += 1
-                except BitLaunchAPIError as e:
-                    logger.error(f"[Scheduler] BitLaunch API error for API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "BitLaunch", api.email, str(e))
                 except Exception as e:
-                    logger.error(f"[Scheduler] Error updating BitLaunch API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "BitLaunch", api.email, str(e))
+                    logger.error(f"[Scheduler] ❌ Error processing user {config.id}: {e}")
+                    continue
             
-            logger.info(f"[Scheduler] Successfully updated {updated_count}/{len(apis)} BitLaunch APIs")
-    
-    def update_bitlaunch_vps():
-        """Tự động cập nhật danh sách VPS BitLaunch"""
-        logger.info("[Scheduler] Running update_bitlaunch_vps job")
-        with app.app_context():
-            from core.api_clients.bitlaunch import BitLaunchClient, BitLaunchAPIError
-            from core.models import BitLaunchAPI
+            logger.info("=" * 70)
+            logger.info("[Scheduler] 🏁 Account alerts check completed")
+            logger.info("=" * 70)
             
-            # Lấy tất cả BitLaunch APIs từ tất cả users
-            apis = BitLaunchAPI.query.filter_by(is_active=True).all()
-            logger.info(f"[Scheduler] Found {len(apis)} BitLaunch APIs for VPS update")
+        except Exception as e:
+            logger.error(f"[Scheduler] ❌ Error in check_account_alerts_5min: {e}")
+
+def send_daily_rocket_chat_notifications():
+    """Gửi thông báo hàng ngày đến Rocket Chat cho tất cả users có cấu hình"""
+    with _app.app_context():
+        try:
+            from core.models import RocketChatConfig, User
+            from core.rocket_chat import send_daily_account_summary, send_account_expiry_notification, send_detailed_account_info
+            from core import manager
             
-            total_updated = 0
-            failed_apis = 0
+            logger.info("[Scheduler] Starting daily Rocket Chat notifications")
             
-            for api in apis:
-                try:
-                    logger.info(f"[Scheduler] Updating VPS for BitLaunch API {api.id} ({api.email})")
-                    client = BitLaunchClient(api.api_key)
-                    servers = client.list_servers()
-                    
-                    if servers:
-                        manager.update_bitlaunch_vps_list(api.id, servers)
-                        total_updated += len(servers)
-                        logger.info(f"[Scheduler] Updated {len(servers)} VPS instances for API {api.id}")
-                    else:
-                        logger.info(f"[Scheduler] No VPS instances found for API {api.id}")
-                        
-                except BitLaunchAPIError as e:
-                    logger.error(f"[Scheduler] BitLaunch API error for API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "BitLaunch", api.email, str(e))
-                    failed_apis += 1
-                    continue
-                except Exception as e:
-                    logger.error(f"[Scheduler] Error updating BitLaunch VPS for API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "BitLaunch", api.email, str(e))
-                    failed_apis += 1
-                    continue
+            # Lấy tất cả cấu hình Rocket Chat
+            configs = RocketChatConfig.query.filter_by(is_active=True).all()
             
-            logger.info(f"[Scheduler] BitLaunch VPS update completed: {total_updated} instances updated, {failed_apis} APIs failed")
-    
-    def update_zingproxy_accounts():
-        """Tự động cập nhật thông tin tài khoản và proxy ZingProxy theo tần suất"""
-        logger.info("[Scheduler] Running update_zingproxy_accounts job")
-        with app.app_context():
-            from core.api_clients.zingproxy import ZingProxyClient, ZingProxyAPIError
-            accs = manager.get_zingproxy_accounts_needing_update()
-            logger.info(f"[Scheduler] Found {len(accs)} ZingProxy accounts needing update")
+            if not configs:
+                logger.info("[Scheduler] No Rocket Chat configurations found")
+                return
             
-            updated_count = 0
-            total_proxies_imported = 0
+            logger.info(f"[Scheduler] Found {len(configs)} Rocket Chat configurations")
             
-            for acc in accs:
+            for config in configs:
                 try:
-                    logger.info(f"[Scheduler] Updating ZingProxy account {acc.id} ({acc.email})")
-                    client = ZingProxyClient(access_token=acc.access_token)
-                    
-                    # Cập nhật thông tin tài khoản
-                    user_info = client.get_account_details()
-                    balance = user_info.get('balance', 0)
-                    manager.update_zingproxy_account(acc.id, balance)
-                    logger.info(f"[Scheduler] Updated balance for account {acc.id}: ${balance}")
-                    
-                    # Cập nhật danh sách proxy trong ZingProxy
-                    proxies = client.get_all_active_proxies()
-                    manager.update_zingproxy_list(acc.id, proxies)
-                    logger.info(f"[Scheduler] Updated {len(proxies)} proxies for account {acc.id}")
+                    user = User.query.get(config.user_id)
+                    if not user:
+                        logger.warning(f"[Scheduler] User {config.user_id} not found for config {config.id}")
+                        continue
+                
+                    logger.info(f"[Scheduler] Processing notifications for user {user.username}")
+                
+                    # Lấy danh sách tài khoản từ TẤT CẢ nguồn (giống như API endpoints)
+                    all_accounts = inventory.list_accounts(config.user_id)
                     
-                    # Tự động import proxy vào hệ thống quản lý proxy
-                    try:
-                        zingproxy_data = []
-                        for proxy in proxies:
-                            zingproxy_data.append({
-                                'proxy_id': proxy.get('proxy_id'),
-                                'ip': proxy.get('ip'),
-                                'port': proxy.get('port'),
-                                'port_socks5': proxy.get('port_socks5'),
-                                'username': proxy.get('username'),
-                                'password': proxy.get('password'),
-                                'status': proxy.get('status'),
-                                'expire_at': proxy.get('expire_at'),
-                                'location': proxy.get('location'),
-                                'type': proxy.get('type'),
-                                'note': proxy.get('note'),
-                                'auto_renew': proxy.get('auto_renew')
-                            })
-                        
-                        if zingproxy_data:
-                            imported_count = manager.import_proxies_from_zingproxy(acc.user_id, zingproxy_data)
-                            total_proxies_imported += imported_count
-                            logger.info(f"[Scheduler] Imported {imported_count} proxies to proxy management system for account {acc.id}")
-                    except Exception as e:
-                        logger.error(f"[Scheduler] Error importing proxies to management system for account {acc.id}: {e}")
+                    logger.info(f"[Scheduler] Found {len(all_accounts)} total accounts for user {user.username}:")
+                    logger.info(f"[Scheduler]   - By source: {inventory.count_by_source(all_accounts)}")
+                
+                    # Gửi báo cáo tổng hợp hàng ngày
+                    daily_success = send_daily_account_summary(
+                        room_id=config.room_id,
+                        auth_token=config.auth_token,  # Sử dụng trực tiếp
+                        user_id=config.user_id_rocket,
+                        accounts=all_accounts  # Sử dụng danh sách đầy đủ
+                    )
                     
-                    updated_count += 1
-                except ZingProxyAPIError as e:
-                    logger.error(f"[Scheduler] ZingProxy API error for account {acc.id}: {e}")
-                    _send_api_error_alert(acc.user_id, "ZingProxy", acc.email, str(e))
-                    continue
-                except Exception as e:
-                    logger.error(f"[Scheduler] Error updating ZingProxy account {acc.id}: {e}")
-                    _send_api_error_alert(acc.user_id, "ZingProxy", acc.email, str(e))
-                    continue
-            
-            logger.info(f"[Scheduler] Successfully updated {updated_count}/{len(accs)} ZingProxy accounts")
-            logger.info(f"[Scheduler] Total proxies imported to management system: {total_proxies_imported}")
-
-    def auto_sync_zingproxy_proxies():
-        """Tự động đồng bộ proxy từ ZingProxy"""
-        logger.info("[Scheduler] Running auto_sync_zingproxy_proxies job")
-        with app.app_context():
-            from core.api_clients.zingproxy import ZingProxyClient, ZingProxyAPIError
-            from core.models import ZingProxyAccount
-            
-            # Lấy tất cả tài khoản ZingProxy
-            accounts = ZingProxyAccount.query.all()
-            logger.info(f"[Scheduler] Found {len(accounts)} ZingProxy accounts for auto sync")
-            
-            total_synced = 0
-            failed_accounts = 0
-            
-            for acc in accounts:
-                try:
-                    logger.info(f"[Scheduler] Auto syncing proxies for account {acc.id} ({acc.email})")
-                    client = ZingProxyClient(access_token=acc.access_token)
-                    proxies = client.get_all_active_proxies()
+                    if daily_success:
+                        logger.info(f"[Scheduler] Daily summary sent successfully for user {user.username}")
+                    else:
+                        logger.error(f"[Scheduler] Failed to send daily summary for user {user.username}")
+                
+                    # Lấy danh sách VPS
+                    vps_list = manager.list_vps()
+                    
+                    # Gửi thông báo VPS/tài khoản sắp hết hạn
+                    expiry_success = send_account_expiry_notification(
+                        room_id=config.room_id,
+                        auth_token=config.auth_token,  # Sử dụng trực tiếp
+                        user_id=config.user_id_rocket,
+                        accounts=all_accounts,  # Sử dụng danh sách đầy đủ
+                        warning_days=user.notify_days or 7,
+                        vps_list=vps_list
+                    )
                     
-                    if proxies:
-                        # Import vào hệ thống quản lý proxy
-                        zingproxy_data = []
-                        for proxy in proxies:
-                            zingproxy_data.append({
-                                'proxy_id': proxy.get('proxy_id'),
-                                'ip': proxy.get('ip'),
-                                'port': proxy.get('port'),
-                                'port_socks5': proxy.get('port_socks5'),
-                                'username': proxy.get('username'),
-                                'password': proxy.get('password'),
-                                'status': proxy.get('status'),
-                                'expire_at': proxy.get('expire_at'),
-                                'location': proxy.get('location'),
-                                'type': proxy.get('type'),
-                                'note': proxy.get('note'),
-                                'auto_renew': proxy.get('auto_renew')
-                            })
-                        
-                        imported_count = manager.import_proxies_from_zingproxy(acc.user_id, zingproxy_data)
-                        total_synced += imported_count
-                        logger.info(f"[Scheduler] Auto synced {imported_count} proxies for account {acc.id}")
+                    if expiry_success:
+                        logger.info(f"[Scheduler] Expiry notification sent successfully for user {user.username}")
                     else:
-                        logger.info(f"[Scheduler] No proxies found for account {acc.id}")
+                        logger.error(f"[Scheduler] Failed to send expiry notification for user {user.username}")
                         
                 except Exception as e:
-                    logger.error(f"[Scheduler] Error auto syncing proxies for account {acc.id}: {e}")
-                    failed_accounts += 1
+                    logger.error(f"[Scheduler] Error processing notifications for config {config.id}: {e}")
                     continue
+        
+            logger.info("[Scheduler] Daily Rocket Chat notifications completed")
             
-            logger.info(f"[Scheduler] Auto sync completed: {total_synced} proxies synced, {failed_accounts} accounts failed")
+        except Exception as e:
+            logger.error(f"[Scheduler] Error in daily Rocket Chat notifications: {e}")
 
-    def update_cloudfly_apis():
-        """Tự động cập nhật thông tin tài khoản CloudFly theo tần suất"""
-        logger.info("[Scheduler] Running update_cloudfly_apis job")
-        with app.app_context():
-            from core.api_clients.cloudfly import CloudFlyClient, CloudFlyAPIError
-            apis = manager.get_cloudfly_apis_needing_update()
-            logger.info(f"[Scheduler] Found {len(apis)} CloudFly APIs needing update")
-            
-            updated_count = 0
-            for api in apis:
-                try:
-                    logger.info(f"[Scheduler] Updating CloudFly API {api.id} ({api.email})")
-                    client = CloudFlyClient(api.api_token)
-                    
-                    # Cập nhật thông tin tài khoản
-                    user_info = client.get_user_info()
-                    
-                    # CloudFly API có structure phức tạp: clients[0].wallet.main_balance
-                    main_balance = 0
-                    if 'clients' in user_info and len(user_info['clients']) > 0:
-                        wallet = user_info['clients'][0].get('wallet', {})
-                        main_balance = wallet.get('main_balance', 0)
-                    
-                    # CloudFly API không có account_limit
-                    manager.update_cloudfly_info(api.id, main_balance, 0)
-                    logger.info(f"[Scheduler] Updated balance for API {api.id}: ${main_balance}")
-                    
-                    updated_count += 1
-                except CloudFlyAPIError as e:
-                    logger.error(f"[Scheduler] CloudFly API error for API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "CloudFly", api.email, str(e))
-                    continue
-                except Exception as e:
-                    logger.error(f"[Scheduler] Error updating CloudFly API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "CloudFly", api.email, str(e))
-                    continue
-            
-            logger.info(f"[Scheduler] Successfully updated {updated_count}/{len(apis)} CloudFly APIs")
+# ==================== JOB STORE & RUN HISTORY ====================
+# Job được lưu trong bảng apscheduler_jobs của DB ứng dụng nên restart không mất lịch;
+# mỗi lần chạy (hoặc bị lỡ) được ghi vào job_runs.
 
-    def update_cloudfly_vps():
-        """Tự động cập nhật danh sách VPS CloudFly"""
-        logger.info("[Scheduler] Running update_cloudfly_vps job")
-        with app.app_context():
-            from core.api_clients.cloudfly import CloudFlyClient, CloudFlyAPIError
-            from core.models import CloudFlyAPI
-            
-            # Lấy tất cả tài khoản CloudFly
-            apis = CloudFlyAPI.query.filter_by(is_active=True).all()
-            logger.info(f"[Scheduler] Found {len(apis)} CloudFly APIs for VPS update")
-            
-            total_updated = 0
-            failed_apis = 0
-            
-            for api in apis:
-                try:
-                    logger.info(f"[Scheduler] Updating VPS for CloudFly API {api.id} ({api.email})")
-                    client = CloudFlyClient(api.api_token)
-                    instances = client.list_instances()
-                    
-                    if instances:
-                        manager.update_cloudfly_vps_list(api.id, instances)
-                        total_updated += len(instances)
-                        logger.info(f"[Scheduler] Updated {len(instances)} VPS instances for API {api.id}")
-                    else:
-                        logger.info(f"[Scheduler] No VPS instances found for API {api.id}")
-                        
-                except CloudFlyAPIError as e:
-                    logger.error(f"[Scheduler] CloudFly API error for API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "CloudFly", api.email, str(e))
-                    failed_apis += 1
-                    continue
-                except Exception as e:
-                    logger.error(f"[Scheduler] Error updating CloudFly VPS for API {api.id}: {e}")
-                    _send_api_error_alert(api.user_id, "CloudFly", api.email, str(e))
-                    failed_apis += 1
-                    continue
+JOBSTORE_TABLE = 'apscheduler_jobs'
+# Job trễ quá khoảng này (giây, vd. do process tắt) bị tính là misfire và bỏ qua
+JOB_MISFIRE_GRACE_SECONDS = int(os.getenv('JOB_MISFIRE_GRACE_SECONDS', '300'))
+# Số ngày lịch sử dùng để tính thống kê ở status endpoint
+JOB_STATS_DAYS = 7
+# Số ngày giữ lịch sử job_runs (không nhỏ hơn JOB_STATS_DAYS để thống kê luôn đủ dữ liệu)
+JOB_RUNS_RETENTION_DAYS = max(int(os.getenv('JOB_RUNS_RETENTION_DAYS', '30')), JOB_STATS_DAYS)
 
-    def check_stale_api_updates():
-        """Cảnh báo nếu API không được cập nhật > 24h (có thể do hết hạn/nhập sai)."""
-        logger.info("[Scheduler] Running check_stale_api_updates job")
-        with app.app_context():
-            from core.models import BitLaunchAPI, ZingProxyAccount, CloudFlyAPI
-            threshold = datetime.utcnow() - timedelta(hours=24)
+_registered_job_ids = set()
+# Job chạy dày và thường không làm gì, không ghi vào job_runs để bảng không phình ra
+_UNRECORDED_JOB_IDS = frozenset({NOTIFICATION_RECONCILE_JOB_ID})
+_job_started = {}
+_job_started_lock = threading.Lock()
 
-            # BitLaunch
-            try:
-                bl_stale = BitLaunchAPI.query.filter(
-                    (BitLaunchAPI.last_updated == None) | (BitLaunchAPI.last_updated < threshold)
-                ).all()
-                for api in bl_stale:
-                    _send_api_error_alert(api.user_id, "BitLaunch", api.email, "Không nhận cập nhật > 24h. Có thể API key hết hạn/không hợp lệ.")
-            except Exception as e:
-                logger.error(f"[Scheduler] Error checking stale BitLaunch APIs: {e}")
+def _ensure_job(scheduler, func, trigger: str, id: str, **trigger_args) -> None:
+    """Đăng ký job, giữ nguyên next_run_time đã lưu nếu job và trigger không đổi"""
+    _registered_job_ids.add(id)
+    new_trigger = scheduler._create_trigger(trigger, trigger_args)
+    existing = scheduler.get_job(id)
+    if existing is not None and existing.func_ref == obj_to_ref(func) and str(existing.trigger) == str(new_trigger):
+        return
+    scheduler.add_job(func, new_trigger, id=id, replace_existing=True)
 
-            # ZingProxy
-            try:
-                zp_stale = ZingProxyAccount.query.filter(
-                    (ZingProxyAccount.last_updated == None) | (ZingProxyAccount.last_updated < threshold)
-                ).all()
-                for acc in zp_stale:
-                    _send_api_error_alert(acc.user_id, "ZingProxy", acc.email, "Không nhận cập nhật > 24h. Có thể API token hết hạn/không hợp lệ.")
-            except Exception as e:
-                logger.error(f"[Scheduler] Error checking stale ZingProxy accounts: {e}")
+def _on_job_submitted(event) -> None:
+    if event.job_id in _UNRECORDED_JOB_IDS:
+        return
+    with _job_started_lock:
+        for run_time in event.scheduled_run_times:
+            _job_started[(event.job_id, run_time)] = (datetime.utcnow(), time.monotonic())
 
-            # CloudFly
-            try:
-                cf_stale = CloudFlyAPI.query.filter(
-                    (CloudFlyAPI.last_updated == None) | (CloudFlyAPI.last_updated < threshold)
-                ).all()
-                for api in cf_stale:
-                    _send_api_error_alert(api.user_id, "CloudFly", api.email, "Không nhận cập nhật > 24h. Có thể API token hết hạn/không hợp lệ.")
-            except Exception as e:
-                logger.error(f"[Scheduler] Error checking stale CloudFly APIs: {e}")
-            
-            logger.info(f"[Scheduler] Stale API updates check completed")
+def _on_job_finished(event) -> None:
+    """Ghi một dòng job_runs cho mỗi lần job chạy xong, lỗi hoặc bị lỡ (trừ _UNRECORDED_JOB_IDS)"""
+    if event.job_id in _UNRECORDED_JOB_IDS:
+        return
+    with _job_started_lock:
+        started = _job_started.pop((event.job_id, event.scheduled_run_time), None)
+    now = datetime.utcnow()
+    run = JobRun(
+        job_id=event.job_id,
+        scheduled_run_time=event.scheduled_run_time.astimezone(timezone.utc).replace(tzinfo=None),
+        started_at=started[0] if started else now,
+        finished_at=now,
+    )
+    if event.code == EVENT_JOB_MISSED:
+        run.status = 'missed'
+        run.finished_at = None
+    else:
+        run.duration_ms = int((time.monotonic() - started[1]) * 1000) if started else None
+        run.status = 'error' if event.exception else 'success'
+        if event.exception:
+            run.error = str(event.exception)[:512]
+        elif isinstance(event.retval, int) and not isinstance(event.retval, bool):
+            run.items_processed = event.retval
+    try:
+        with _app.app_context():
+            db.session.add(run)
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"[Scheduler] Error recording run of job {event.job_id}: {e}")
 
-    def check_account_alerts_5min():
-        """Kiểm tra và gửi cảnh báo tài khoản sắp hết hạn và balance thấp"""
-        with app.app_context():
-            try:
-                from core.models import RocketChatConfig, User
-                from core.rocket_chat import send_account_expiry_notification
-                from core import manager
-                
-                logger.info("=" * 70)
-                logger.info("[Scheduler] 🔔 Checking account alerts (12-hour interval)")
-                logger.info("=" * 70)
-                
-                # Lấy tất cả cấu hình Rocket Chat
-                configs = RocketChatConfig.query.filter_by(is_active=True).all()
-                
-                if not configs:
-                    logger.info("[Scheduler] ⚠️ No Rocket Chat configurations found")
-                    return
-                
-                logger.info(f"[Scheduler] Found {len(configs)} Rocket Chat configurations")
-                
-                for config in configs:
-                    try:
-                        user = User.query.get(config.user_id)
-                        if not user:
-                            logger.warning(f"[Scheduler] User {config.user_id} not found")
-                            continue
-                    
-                        logger.info(f"[Scheduler] 👤 Processing user: {user.username}")
-                    
-                        # Lấy danh sách tài khoản từ TẤT CẢ nguồn
-                        # 1. Tài khoản thủ công
-                        manual_acc_list = manager.list_accounts()
-                        for acc in manual_acc_list:
-                            if 'service' not in acc:
-                                acc['service'] = ''
-                            acc['source'] = 'manual'
-                    
-                        # 2. Tài khoản từ BitLaunch
-                        bitlaunch_apis = manager.list_bitlaunch_apis(config.user_id)
-                        bitlaunch_acc_list = []
-                        for api in bitlaunch_apis:
-                            acc = {
-                                'id': f"bitlaunch_{api['id']}",
-                                'username': api['email'],
-                                'service': 'BitLaunch',
-                                'expiry': None,
-                                'balance': api.get('balance', 0),
-                                'source': 'bitlaunch'
-                            }
-                            bitlaunch_acc_list.append(acc)
-                    
-                        # 3. Tài khoản từ ZingProxy
-                        zingproxy_acc_list = manager.list_zingproxy_accounts(config.user_id)
-                        for acc in zingproxy_acc_list:
-                            acc['source'] = 'zingproxy'
-                            acc['username'] = acc.get('email', 'N/A')
-                            acc['service'] = 'ZingProxy'
-                            acc['expiry'] = None
-                            acc['balance'] = acc.get('balance', 0)
-                    
-                        # 4. Tài khoản từ CloudFly
-                        cloudfly_apis = manager.list_cloudfly_apis(config.user_id)
-                        cloudfly_acc_list = []
-                        for api in cloudfly_apis:
-                            acc = {
-                                'id': f"cloudfly_{api['id']}",
-                                'username': api['email'],
-                                'service': 'CloudFly',
-                                'expiry': None,
-                                'balance': api.get('balance', 0),
-                                'source': 'cloudfly'
-                            }
-                            cloudfly_acc_list.append(acc)
-                    
-                        # Kết hợp tất cả tài khoản
-                        all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
-                    
-                        logger.info(f"[Scheduler] 📊 Found {len(all_accounts)} total accounts:")
-                        logger.info(f"[Scheduler]   - Manual: {len(manual_acc_list)}")
-                        logger.info(f"[Scheduler]   - BitLaunch: {len(bitlaunch_acc_list)}")
-                        logger.info(f"[Scheduler]   - ZingProxy: {len(zingproxy_acc_list)}")
-                        logger.info(f"[Scheduler]   - CloudFly: {len(cloudfly_acc_list)}")
-                        
-                        # Kiểm tra balance thấp
-                        low_balance_count = 0
-                        for acc in all_accounts:
-                            balance = acc.get('balance', 0)
-                            source = acc.get('source', '')
-                            if source == 'bitlaunch' and balance < 5:
-                                low_balance_count += 1
-                                logger.warning(f"[Scheduler] 💰 BitLaunch low balance: {acc.get('username')} (${balance:.2f} < $5)")
-                            elif source == 'zingproxy' and balance < 100000:
-                                low_balance_count += 1
-                                logger.warning(f"[Scheduler] 💰 ZingProxy low balance: {acc.get('username')} ({balance:,.0f} VND < 100,000 VND)")
-                            elif source == 'cloudfly' and balance < 100000:
-                                low_balance_count += 1
-                                logger.warning(f"[Scheduler] 💰 CloudFly low balance: {acc.get('username')} ({balance:,.0f} VND < 100,000 VND)")
-                        
-                        logger.info(f"[Scheduler] 🚨 Found {low_balance_count} accounts with low balance")
-                        
-                        # Lấy danh sách VPS
-                        vps_list = manager.list_vps()
-                        logger.info(f"[Scheduler] 🖥️  Found {len(vps_list)} total VPS")
-                    
-                        # Gửi thông báo cảnh báo (bao gồm VPS, tài khoản sắp hết hạn và balance thấp)
-                        alert_success = send_account_expiry_notification(
-                            room_id=config.room_id,
-                            auth_token=config.auth_token,
-                            user_id=config.user_id_rocket,
-                            accounts=all_accounts,
-                            warning_days=user.notify_days or 7,
-                            vps_list=vps_list
-                        )
-                    
-                        if alert_success:
-                            logger.info(f"[Scheduler] ✅ Alert sent successfully to user {user.username}")
-                        else:
-                            logger.error(f"[Scheduler] ❌ Failed to send alert to user {user.username}")
-                        
-                    except Exception as e:
-                        logger.error(f"[Scheduler] ❌ Error processing user {config.id}: {e}")
-                        continue
-                
-                logger.info("=" * 70)
-                logger.info("[Scheduler] 🏁 Account alerts check completed")
-                logger.info("=" * 70)
-                
-            except Exception as e:
-                logger.error(f"[Scheduler] ❌ Error in check_account_alerts_5min: {e}")
+def prune_job_runs(days: int = JOB_RUNS_RETENTION_DAYS) -> int:
+    """Xóa lịch sử job_runs cũ hơn `days` ngày"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = db.session.execute(db.delete(JobRun).where(JobRun.started_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
 
-    def send_daily_rocket_chat_notifications():
-        """Gửi thông báo hàng ngày đến Rocket Chat cho tất cả users có cấu hình"""
-        with app.app_context():
-            try:
-                from core.models import RocketChatConfig, User
-                from core.rocket_chat import send_daily_account_summary, send_account_expiry_notification, send_detailed_account_info
-                from core import manager
-                
-                logger.info("[Scheduler] Starting daily Rocket Chat notifications")
-                
-                # Lấy tất cả cấu hình Rocket Chat
-                configs = RocketChatConfig.query.filter_by(is_active=True).all()
-                
-                if not configs:
-                    logger.info("[Scheduler] No Rocket Chat configurations found")
-                    return
-                
-                logger.info(f"[Scheduler] Found {len(configs)} Rocket Chat configurations")
-                
-                for config in configs:
-                    try:
-                        user = User.query.get(config.user_id)
-                        if not user:
-                            logger.warning(f"[Scheduler] User {config.user_id} not found for config {config.id}")
-                            continue
-                    
-                        logger.info(f"[Scheduler] Processing notifications for user {user.username}")
-                    
-                        # Lấy danh sách tài khoản từ TẤT CẢ nguồn (giống như API endpoints)
-                        # 1. Tài khoản thủ công
-                        manual_acc_list = manager.list_accounts()
-                        for acc in manual_acc_list:
-                            if 'service' not in acc:
-                                acc['service'] = ''
-                            acc['source'] = 'manual'  # Đánh dấu nguồn
-                    
-                        # 2. Tài khoản từ BitLaunch
-                        bitlaunch_apis = manager.list_bitlaunch_apis(config.user_id)
-                        bitlaunch_acc_list = []
-                        for api in bitlaunch_apis:
-                            acc = {
-                                'id': f"bitlaunch_{api['id']}",
-                                'username': api['email'],
-                                'service': 'BitLaunch',
-                                'expiry': None,  # BitLaunch không có expiry
-                                'balance': api.get('balance', 0),
-                                'source': 'bitlaunch'
-                            }
-                            bitlaunch_acc_list.append(acc)
-                    
-                        # 3. Tài khoản từ ZingProxy
-                        zingproxy_acc_list = manager.list_zingproxy_accounts(config.user_id)
-                        for acc in zingproxy_acc_list:
-                            acc['source'] = 'zingproxy'  # Đánh dấu nguồn
-                            # Map fields để phù hợp với UI
-                            acc['username'] = acc.get('email', 'N/A')
-                            acc['service'] = 'ZingProxy'
-                            acc['expiry'] = None  # ZingProxy không có expiry
-                            acc['balance'] = acc.get('balance', 0)  # Thêm balance
-                    
-                        # 4. Tài khoản từ CloudFly
-                        cloudfly_apis = manager.list_cloudfly_apis(config.user_id)
-                        cloudfly_acc_list = []
-                        for api in cloudfly_apis:
-                            acc = {
-                                'id': f"cloudfly_{api['id']}",
-                                'username': api['email'],
-                                'service': 'CloudFly',
-                                'expiry': None,  # CloudFly không có expiry
-                                'balance': api.get('balance', 0),
-                                'source': 'cloudfly'
-                            }
-                            cloudfly_acc_list.append(acc)
-                    
-                        # Kết hợp tất cả tài khoản
-                        all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
-                        
-                        logger.info(f"[Scheduler] Found {len(all_accounts)} total accounts for user {user.username}:")
-                        logger.info(f"[Scheduler]   - Manual: {len(manual_acc_list)}")
-                        logger.info(f"[Scheduler]   - BitLaunch: {len(bitlaunch_acc_list)}")
-                        logger.info(f"[Scheduler]   - ZingProxy: {len(zingproxy_acc_list)}")
-                        logger.info(f"[Scheduler]   - CloudFly: {len(cloudfly_acc_list)}")
-                    
-                        # Gửi báo cáo tổng hợp hàng ngày
-                        daily_success = send_daily_account_summary(
-                            room_id=config.room_id,
-                            auth_token=config.auth_token,  # Sử dụng trực tiếp
-                            user_id=config.user_id_rocket,
-                            accounts=all_accounts  # Sử dụng danh sách đầy đủ
-                        )
-                        
-                        if daily_success:
-                            logger.info(f"[Scheduler] Daily summary sent successfully for user {user.username}")
-                        else:
-                            logger.error(f"[Scheduler] Failed to send daily summary for user {user.username}")
-                    
-                        # Lấy danh sách VPS
-                        vps_list = manager.list_vps()
-                        
-                        # Gửi thông báo VPS/tài khoản sắp hết hạn
-                        expiry_success = send_account_expiry_notification(
-                            room_id=config.room_id,
-                            auth_token=config.auth_token,  # Sử dụng trực tiếp
-                            user_id=config.user_id_rocket,
-                            accounts=all_accounts,  # Sử dụng danh sách đầy đủ
-                            warning_days=user.notify_days or 7,
-                            vps_list=vps_list
-                        )
-                        
-                        if expiry_success:
-                            logger.info(f"[Scheduler] Expiry notification sent successfully for user {user.username}")
-                        else:
-                            logger.error(f"[Scheduler] Failed to send expiry notification for user {user.username}")
-                            
-                    except Exception as e:
-                        logger.error(f"[Scheduler] Error processing notifications for config {config.id}: {e}")
-                        continue
-            
-                logger.info("[Scheduler] Daily Rocket Chat notifications completed")
-                
-            except Exception as e:
-                logger.error(f"[Scheduler] Error in daily Rocket Chat notifications: {e}")
+def _percentile(values: list, percent: float) -> Optional[int]:
+    """Percentile kiểu nearest-rank"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(values)) - 1)
+    return values[index]
+
+def get_job_run_stats(days: int = JOB_STATS_DAYS) -> dict:
+    """Thống kê theo job trong `days` ngày gần nhất: số lần chạy, lỗi, misfire, p50/p95, xu hướng item"""
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = db.session.execute(
+        db.select(JobRun.job_id, JobRun.status, JobRun.duration_ms, JobRun.items_processed, JobRun.started_at)
+        .where(JobRun.started_at >= since)
+        .order_by(JobRun.started_at)
+    ).all()
+    stats = {}
+    for row in rows:
+        job = stats.setdefault(row.job_id, {'runs': 0, 'errors': 0, 'misfires': 0, 'durations': [],
+                                            'items': [], 'last_run': None, 'last_status': None})
+        if row.status == 'missed':
+            job['misfires'] += 1
+            continue
+        job['runs'] += 1
+        if row.status == 'error':
+            job['errors'] += 1
+        if row.duration_ms is not None:
+            job['durations'].append(row.duration_ms)
+        if row.items_processed is not None:
+            job['items'].append(row.items_processed)
+        job['last_run'] = row.started_at.isoformat()
+        job['last_status'] = row.status
+
+    for job in stats.values():
+        durations = job.pop('durations')
+        items = job.pop('items')
+        job['p50_ms'] = _percentile(durations, 50)
+        job['p95_ms'] = _percentile(durations, 95)
+        # 10 lần gần nhất, cũ -> mới, để thấy xu hướng số item mỗi lần chạy
+        job['items_trend'] = items[-10:]
+    return stats
 
-    # Lên lịch gửi cảnh báo hết hạn mỗi 5 phút để kiểm tra notify_hour của từng user
-    scheduler.add_job(send_expiry_warnings, 'interval', minutes=5, id='expiry_warnings')
+def get_scheduler_status() -> dict:
+    """Trạng thái scheduler cho /api/scheduler/status: leader, job, lịch chạy và thống kê"""
+    running = scheduler is not None and scheduler.running
+    run_stats = get_job_run_stats()
+    jobs = []
+    if running:
+        for job in scheduler.get_jobs():
+            jobs.append({
+                'id': job.id,
+                'trigger': str(job.trigger),
+                'next_run_time': job.next_run_time.isoformat() if job.next_run_time else None,
+                'stats': run_stats.get(job.id),
+            })
+    return {
+        'status': 'success',
+        'running': running,
+        'leader': get_leader_status(),
+        'jobs_count': len(jobs),
+        'jobs': jobs,
+        'job_stats': run_stats,
+        'sync_pipelines': _sync_guard.status(),
+    }
+
+def start_scheduler():
+    global _app, _active_scheduler
+    from ui.app import create_app
+    app = create_app()
+    _app = app
+    
+    # Bảng của các job được tạo bởi core.schema.upgrade_schema lúc server khởi động
+    with app.app_context():
+        jobstore = SQLAlchemyJobStore(engine=db.engine, tablename=JOBSTORE_TABLE)
+    scheduler = BackgroundScheduler(
+        jobstores={'default': jobstore},
+        job_defaults={'coalesce': True, 'misfire_grace_time': JOB_MISFIRE_GRACE_SECONDS}
+    )
+    scheduler.add_listener(_on_job_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(_on_job_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    
+    # Start ở chế độ tạm dừng để đọc được job đã lưu, đồng bộ lịch rồi mới cho chạy
+    scheduler.start(paused=True)
+    
+    # Mỗi user một cron job gửi cảnh báo hết hạn đúng notify_hour:notify_minute
+    with app.app_context():
+        try:
+            schedule_user_notifications(scheduler)
+        except Exception as e:
+            logger.error(f"[Scheduler] Error scheduling user notifications: {e}")
+    
+    # Đối chiếu job thông báo với DB (giờ/phút đổi ở worker không phải leader)
+    _ensure_job(scheduler, reconcile_user_notifications_job, 'interval', seconds=NOTIFICATION_RECONCILE_SECONDS,
+                id=NOTIFICATION_RECONCILE_JOB_ID)
     
     # Lên lịch gửi báo cáo tổng hợp mỗi 5 phút để kiểm tra notify_hour của từng user
     # DISABLED: Gây duplicate notifications với account_alerts_12h
-    # scheduler.add_job(send_daily_summary, 'interval', minutes=5, id='daily_summary')
+    # _ensure_job(scheduler, send_daily_summary, 'interval', minutes=5, id='daily_summary')
     
     # Lên lịch kiểm tra và gửi cảnh báo tài khoản mỗi 12 giờ
     # Job này sẽ gửi thông báo ngay lập tức, không cần chờ đến notify_hour
-    scheduler.add_job(check_account_alerts_5min, 'interval', hours=12, id='account_alerts_12h')
+    _ensure_job(scheduler, check_account_alerts_5min, 'interval', hours=12, id='account_alerts_12h')
     
     # Lên lịch gửi báo cáo tuần vào chủ nhật lúc 10h sáng
-    scheduler.add_job(send_weekly_report, 'cron', day_of_week='sun', hour=10, minute=0, id='weekly_report')
+    _ensure_job(scheduler, send_weekly_report, 'cron', day_of_week='sun', hour=10, minute=0, id='weekly_report')
     
     # Lên lịch gửi thông báo hàng ngày đến Rocket Chat mỗi ngày lúc 9h sáng
-    scheduler.add_job(send_daily_rocket_chat_notifications, 'cron', hour=9, minute=0, id='rocketchat_daily_notifications')
+    _ensure_job(scheduler, send_daily_rocket_chat_notifications, 'cron', hour=9, minute=0, id='rocketchat_daily_notifications')
     
     # ========================================================================
-    # BITLAUNCH API UPDATES
+    # PROVIDER SYNC PIPELINES
     # ========================================================================
-    # Cập nhật hàng ngày lúc 6h sáng
-    scheduler.add_job(update_bitlaunch_apis, 'cron', hour=6, minute=0, id='bitlaunch_update')
-    scheduler.add_job(update_bitlaunch_vps, 'cron', hour=6, minute=30, id='bitlaunch_vps_update')
+    # Mỗi provider một job; trước đây cron hằng ngày và interval 6h chạy song song
+    # cùng việc nên tài khoản bị gọi API hai lần trong cùng khoảng thời gian.
+    # BitLaunch mỗi 6 giờ (0h, 6h, 12h, 18h)
+    _ensure_job(scheduler, sync_bitlaunch, 'cron', hour='0,6,12,18', minute=0, id='bitlaunch_sync')
     
-    # Cập nhật mỗi 6 giờ để đảm bảo dữ liệu luôn mới (NEW!)
-    scheduler.add_job(update_bitlaunch_apis, 'interval', hours=6, id='bitlaunch_update_interval')
-    scheduler.add_job(update_bitlaunch_vps, 'interval', hours=6, id='bitlaunch_vps_update_interval')
+    # ZingProxy mỗi 2 giờ vì proxy thay đổi nhiều; balance chỉ được lấy khi tài khoản đến hạn
+    _ensure_job(scheduler, sync_zingproxy, 'cron', hour='*/2', minute=0, id='zingproxy_sync')
     
-    # ========================================================================
-    # ZINGPROXY API UPDATES
-    # ========================================================================
-    # Cập nhật balance hàng ngày lúc 7h sáng
-    scheduler.add_job(update_zingproxy_accounts, 'cron', hour=7, minute=0, id='zingproxy_update')
+    # CloudFly mỗi 6 giờ (2h, 8h, 14h, 20h), lệch giờ với BitLaunch
+    _ensure_job(scheduler, sync_cloudfly, 'cron', hour='2,8,14,20', minute=0, id='cloudfly_sync')
     
-    # Cập nhật balance mỗi 6 giờ để đảm bảo dữ liệu luôn mới
-    scheduler.add_job(update_zingproxy_accounts, 'interval', hours=6, id='zingproxy_update_interval')
-    
-    # Đồng bộ proxy mỗi 2 giờ (thường xuyên hơn vì proxy thay đổi nhiều)
-    scheduler.add_job(auto_sync_zingproxy_proxies, 'interval', hours=2, id='zingproxy_proxy_sync')
+    # Kiểm tra API không cập nhật quá 24h (mỗi 6 giờ)
+    _ensure_job(scheduler, check_stale_api_updates, 'interval', hours=6, id='stale_api_updates_check')
     
-    # Đồng bộ proxy tổng quát vào 2h sáng (khi ít traffic)
-    scheduler.add_job(auto_sync_zingproxy_proxies, 'cron', hour=2, minute=0, id='zingproxy_proxy_sync_nightly')
+    # Re-encrypt secret theo lô sau khi đổi ENCRYPTION_KEY (không làm gì khi đã xong)
+    _ensure_job(scheduler, reencrypt_secrets_job, 'interval', minutes=REENCRYPT_INTERVAL_MINUTES, id='reencrypt_secrets')
     
-    # ========================================================================
-    # CLOUDFLY API UPDATES
-    # ========================================================================
-    # Cập nhật hàng ngày lúc 8h sáng
-    scheduler.add_job(update_cloudfly_apis, 'cron', hour=8, minute=0, id='cloudfly_update')
-    scheduler.add_job(update_cloudfly_vps, 'cron', hour=8, minute=30, id='cloudfly_vps_update')
+    # Kiểm tra proxy sống/chết theo shard: mỗi proxy một lần mỗi PROXY_CHECK_SHARDS * interval phút
+    _ensure_job(scheduler, check_proxies_job, 'interval', minutes=proxy_check.PROXY_CHECK_INTERVAL_MINUTES,
+                id='proxy_health_check')
     
-    # Cập nhật mỗi 6 giờ để đảm bảo dữ liệu luôn mới
-    scheduler.add_job(update_cloudfly_apis, 'interval', hours=6, id='cloudfly_update_interval')
-    scheduler.add_job(update_cloudfly_vps, 'interval', hours=6, id='cloudfly_vps_update_interval')
+    # Gộp lịch sử số dư theo giờ/ngày (phút 5 mỗi giờ, sau khi giờ trước đã kết thúc)
+    _ensure_job(scheduler, rollup_balance_history_job, 'cron', minute=5, id='balance_rollup')
     
-    # Kiểm tra API không cập nhật quá 24h (mỗi 6 giờ)
-    scheduler.add_job(check_stale_api_updates, 'interval', hours=6, id='stale_api_updates_check')
+    # Xóa job cũ còn trong job store nhưng không còn được đăng ký (vd. đã đổi id)
+    for job in scheduler.get_jobs():
+        if job.id not in _registered_job_ids and not job.id.startswith(notification_job_id('')):
+            logger.info(f"[Scheduler] Removing obsolete stored job {job.id}")
+            scheduler.remove_job(job.id)
     
     logger.info(f"[Scheduler] Starting scheduler with {len(scheduler.get_jobs())} jobs")
-    scheduler.start()
+    scheduler.resume()
+    _active_scheduler = scheduler
     return scheduler
 
 # Global scheduler instance
@@ -743,4 +947,55 @@ def get_scheduler():
     global scheduler
     if scheduler is None:
         scheduler = start_scheduler()
-    return scheduler 
\ No newline at end of file
+    return scheduler
+
+def stop_scheduler() -> None:
+    """Dừng scheduler của process này và chờ job đang chạy xong.
+
+    Khi mất leader, scheduler được pause trước để không chạy thêm job nào, rồi chờ job
+    đang chạy kết thúc; LeaderElector.stop chỉ trả lease sau khi hàm này trả về.
+    Vì vậy SCHEDULER_LEASE_TTL phải lớn hơn thời gian chạy của job dài nhất, nếu không
+    leader mới có thể chạy trùng job trong lúc leader cũ còn đang chờ.
+    """
+    global scheduler
+    if scheduler is not None and scheduler.running:
+        scheduler.pause()
+        scheduler.shutdown(wait=True)
+    scheduler = None
+
+# ==================== LEADER ELECTION ====================
+# Mọi gunicorn worker/replica đều tham gia bầu, chỉ process giữ lease chạy scheduler.
+# Leader chết thì lease hết hạn sau SCHEDULER_LEASE_TTL giây và process khác tiếp quản.
+
+SCHEDULER_LEASE_NAME = 'scheduler'
+_elector = None
+
+def start_leader_election(app) -> LeaderElector:
+    """Tham gia bầu leader; scheduler chỉ được khởi động khi process này giành được lease"""
+    global _elector
+    if _elector is None:
+        with app.app_context():
+            SchedulerLease.__table__.create(db.engine, checkfirst=True)
+        _elector = LeaderElector(app, SCHEDULER_LEASE_NAME, on_elected=get_scheduler, on_demoted=stop_scheduler)
+        _elector.start()
+        atexit.register(_elector.stop)
+    return _elector
+
+def is_scheduler_leader() -> bool:
+    """Process này có được phép chạy scheduler không (luôn True nếu không bật bầu leader)"""
+    return _elector is None or _elector.is_leader
+
+def get_leader_status() -> dict:
+    return {
+        'election_enabled': _elector is not None,
+        'is_leader': is_scheduler_leader(),
+        'owner': _elector.owner if _elector else None,
+        'lease': get_lease(SCHEDULER_LEASE_NAME),
+    }
+
+def restart_scheduler():
+    """Khởi động lại scheduler của leader, trả về None nếu process này không phải leader"""
+    if not is_scheduler_leader():
+        return None
+    stop_scheduler()
+    return get_scheduler()
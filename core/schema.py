@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional
+import time
+import logging
+from sqlalchemy import inspect, text
+from core.models import db, VPS, Account, ZingProxy, Proxy, SchedulerLease, parse_expiry_date
+from core.leader import make_owner_id, try_acquire, release
+
+logger = logging.getLogger(__name__)
+
+# (model, cột chuỗi gốc, cột DATE đã parse)
+EXPIRY_COLUMNS = (
+    (VPS, 'expiry', 'expiry_date'),
+    (Account, 'expiry', 'expiry_date'),
+    (ZingProxy, 'expire_at', 'expire_date'),
+    (Proxy, 'expire_at', 'expire_date'),
+)
+
+BACKFILL_BATCH_SIZE = 500
+
+# Lease để chỉ một process nâng cấp schema tại một thời điểm khi nhiều worker/replica cùng khởi động
+SCHEMA_LEASE_NAME = 'schema_upgrade'
+# Lease không được gia hạn nên phải dài hơn thời gian nâng cấp lâu nhất (backfill database lớn)
+SCHEMA_LEASE_TTL = 900
+# Thời gian tối đa (giây) một process chờ process khác nâng cấp xong
+SCHEMA_UPGRADE_WAIT = 300
+
+def create_missing_tables() -> List[str]:
+    """Tạo các bảng có trong model nhưng chưa có trong database"""
+    existing = set(inspect(db.engine).get_table_names())
+    missing = [table for table in db.metadata.sorted_tables if table.name not in existing]
+    if missing:
+        db.metadata.create_all(db.engine, tables=missing)
+    for table in missing:
+        logger.info(f"[Schema] Created table {table.name}")
+    return [table.name for table in missing]
+
+def add_missing_columns() -> List[str]:
+    """Thêm các cột/index có trong model nhưng chưa có trong database (database tạo từ bản cũ).
+
+    Không có migration alembic nên chỉ hỗ trợ thêm cột nullable, không sửa/xóa cột.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                added.append(f'{table.name}.{column.name}')
+            indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+    for name in added:
+        logger.info(f"[Schema] Added column {name}")
+    return added
+
+def backfill_expiry_dates(batch_size: int = BACKFILL_BATCH_SIZE) -> Dict[str, int]:
+    """Điền cột DATE hết hạn cho các dòng cũ chưa có, theo lô"""
+    counts = {}
+    for model, source_column, date_column in EXPIRY_COLUMNS:
+        source = getattr(model, source_column)
+        target = getattr(model, date_column)
+        filled = 0
+        last_id = None
+        while True:
+            query = db.select(model.id, source).where(source.isnot(None), source != '', target.is_(None))
+            if last_id is not None:
+                query = query.where(model.id > last_id)
+            rows = db.session.execute(query.order_by(model.id).limit(batch_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = [{'id': row.id, date_column: parse_expiry_date(row[1])} for row in rows]
+            updates = [u for u in updates if u[date_column] is not None]
+            if updates:
+                db.session.execute(db.update(model), updates)
+            db.session.commit()
+            filled += len(updates)
+        counts[model.__tablename__] = filled
+        if filled:
+            logger.info(f"[Schema] Backfilled {filled} {date_column} values in {model.__tablename__}")
+    return counts
+
+def upgrade_schema() -> Dict[str, int]:
+    """Đưa database cũ lên schema hiện tại: tạo bảng, thêm cột/index còn thiếu rồi backfill dữ liệu"""
+    create_missing_tables()
+    add_missing_columns()
+    return backfill_expiry_dates()
+
+def upgrade_schema_locked(wait: float = SCHEMA_UPGRADE_WAIT, owner: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """Chạy upgrade_schema lúc khởi động dưới lease 'schema_upgrade'.
+
+    Các process khởi động cùng lúc lần lượt giành lease nên không có hai process cùng
+    ALTER/backfill; process đến sau chạy lại upgrade_schema nhưng không còn gì để làm.
+    Trả về None nếu chờ quá `wait` giây mà không giành được lease.
+    """
+    SchedulerLease.__table__.create(db.engine, checkfirst=True)
+    owner = owner or make_owner_id()
+    deadline = time.monotonic() + wait
+    while not try_acquire(SCHEMA_LEASE_NAME, owner, SCHEMA_LEASE_TTL):
+        if time.monotonic() >= deadline:
+            logger.warning(f"[Schema] Timed out after {wait}s waiting for another process to upgrade the schema")
+            return None
+        time.sleep(1)
+    try:
+        return upgrade_schema()
+    finally:
+        release(SCHEMA_LEASE_NAME, owner)
@@ -0,0 +1,12 @@
+"""
+Cấu hình gunicorn: mỗi worker tham gia bầu leader cho scheduler sau khi load app.
+Import ui.app không khởi động scheduler, việc này chỉ xảy ra ở hook dưới đây.
+"""
+
+def on_starting(server):
+    from core.cache import warn_if_process_local
+    warn_if_process_local(server.cfg.workers)
+
+def post_worker_init(worker):
+    from ui.app import init_app
+    init_app()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Proxy giả (HTTP CONNECT và SOCKS5 trên cùng một port) để test và benchmark việc kiểm tra
+proxy mà không cần mạng: chỉ trả lời handshake, không mở kết nối tới đích.
+
+    python scripts/fake_proxy_server.py --port 3128 --username u --password p
+    python scripts/fake_proxy_server.py --benchmark 10000 --latency 0.05
+"""
+
+import os
+import sys
+import time
+import base64
+import asyncio
+import argparse
+from typing import Optional
+
+# Thêm thư mục gốc vào Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class FakeProxyServer:
+    """Server proxy giả chạy trên event loop hiện tại.
+
+    Byte đầu tiên 0x05 được xử lý như SOCKS5, còn lại là HTTP CONNECT. `latency`
+    (giây) được chờ trước khi trả lời, `fail_every`=N làm mỗi kết nối thứ N bị từ chối.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, username: Optional[str] = None,
+                 password: Optional[str] = None, latency: float = 0.0, fail_every: int = 0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.fail_every = fail_every
+        self.connections = 0
+        self.established = 0
+        self.active = 0
+        self.peak = 0  # Số kết nối đồng thời lớn nhất
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _should_fail(self) -> bool:
+        self.connections += 1
+        return bool(self.fail_every) and self.connections % self.fail_every == 0
+
+    async def _handle(self, reader, writer) -> None:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            fail = self._should_fail()
+            first = await reader.readexactly(1)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if first == b'\x05':
+                ok = await self._socks5(reader, writer, fail)
+            else:
+                ok = await self._http(first, reader, writer, fail)
+            await writer.drain()
+            if ok:
+                self.established += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def _http(self, first: bytes, reader, writer, fail: bool) -> bool:
+        head = first + await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        if not lines[0].startswith('CONNECT '):
+            writer.write(b'HTTP/1.1 405 Method Not Allowed\r\n\r\n')
+            return False
+        if self.username is not None:
+            expected = base64.b64encode(f'{self.username}:{self.password or ""}'.encode()).decode()
+            if f'proxy-authorization: basic {expected}'.lower() not in (l.lower() for l in lines):
+                writer.write(b'HTTP/1.1 407 Proxy Authentication Required\r\n\r\n')
+                return False
+        if fail:
+            writer.write(b'HTTP/1.1 502 Bad Gateway\r\n\r\n')
+            return False
+        writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+        return True
+
+    async def _socks5(self, reader, writer, fail: bool) -> bool:
+        methods = await reader.readexactly((await reader.readexactly(1))[0])
+        wanted = 0x02 if self.username is not None else 0x00
+        if wanted not in methods:
+            writer.write(b'\x05\xff')
+            return False
+        writer.write(bytes([5, wanted]))
+        if wanted == 0x02:
+            await reader.readexactly(1)
+            user = await reader.readexactly((await reader.readexactly(1))[0])
+            pwd = await reader.readexactly((await reader.readexactly(1))[0])
+            if user.decode() != self.username or pwd.decode() != (self.password or ''):
+                writer.write(b'\x01\x01')
+                return False
+            writer.write(b'\x01\x00')
+        _, _, _, atyp = await reader.readexactly(4)
+        if atyp == 0x03:
+            await reader.readexactly((await reader.readexactly(1))[0])
+        else:
+            await reader.readexactly(4 if atyp == 0x01 else 16)
+        await reader.readexactly(2)
+        # Mã 0x05: connection refused
+        writer.write(bytes([5, 5 if fail else 0, 0, 1]) + b'\x00' * 6)
+        return not fail
+
+async def benchmark(count: int, concurrency: int, latency: float, fail_every: int) -> dict:
+    """Kiểm tra `count` proxy giả (nửa HTTP, nửa SOCKS5) và đo tốc độ"""
+    # Benchmark không đọc/ghi secret nào nên không cần ENCRYPTION_KEY thật
+    os.environ.setdefault('ALLOW_EPHEMERAL_ENCRYPTION_KEY', 'true')
+    # Proxy giả chạy trên 127.0.0.1 nên phải cho phép kiểm tra địa chỉ nội bộ
+    os.environ.setdefault('PROXY_CHECK_ALLOW_PRIVATE', 'true')
+    from core.proxy_check import ProxyTarget, check_proxies
+    server = FakeProxyServer(username='bench', password='secret', latency=latency, fail_every=fail_every)
+    port = await server.start()
+    targets = [ProxyTarget(i, '127.0.0.1', str(port), type='SOCKS5' if i % 2 else 'HTTP',
+                           username='bench', password='secret') for i in range(count)]
+    started = time.perf_counter()
+    results = await check_proxies(targets, concurrency=concurrency, timeout=10, target=('example.com', 443))
+    elapsed = time.perf_counter() - started
+    await server.stop()
+    latencies = sorted(r['latency_ms'] for r in results if r['success'])
+    return {
+        'checked': len(results),
+        'alive': len(latencies),
+        'seconds': round(elapsed, 2),
+        'per_minute': int(len(results) / elapsed * 60) if elapsed else None,
+        'p50_ms': latencies[len(latencies) // 2] if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else None,
+    }
+
+async def serve(args) -> None:
+    server = FakeProxyServer(args.host, args.port, args.username, args.password, args.latency, args.fail_every)
+    port = await server.start()
+    print(f"🧪 Fake proxy (HTTP CONNECT + SOCKS5) đang chạy tại {args.host}:{port}")
+    while True:
+        await asyncio.sleep(3600)
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake HTTP CONNECT / SOCKS5 proxy for checker tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3128)
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--latency', type=float, default=0.0, help='Độ trễ giả lập mỗi kết nối (giây)')
+    parser.add_argument('--fail-every', type=int, default=0, help='Từ chối mỗi kết nối thứ N')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Kiểm tra N proxy giả rồi in tốc độ')
+    parser.add_argument('--concurrency', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = asyncio.run(benchmark(args.benchmark, args.concurrency, args.latency, args.fail_every))
+        print(f"✅ {result['checked']} checks ({result['alive']} alive) trong {result['seconds']}s "
+              f"= {result['per_minute']}/phút, p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms")
+        return 0
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,6 +27,11 @@ def init_database():
             print("📋 Tạo các bảng database...")
             db.create_all()
             print("✅ Đã tạo tất cả bảng thành công!")
+
+            # Nâng cấp database tạo từ bản cũ (cột/index mới, backfill ngày hết hạn)
+            from core.schema import upgrade_schema
+            backfilled = upgrade_schema()
+            print(f"✅ Đã cập nhật schema, backfill ngày hết hạn: {backfilled}")
             
             # Kiểm tra xem đã có admin user chưa
             admin_user = User.query.filter_by(username='admin').first()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Script chuyển các secret đã mã hóa (API key, token, password) sang định dạng ciphertext v2,
+hoặc (--rotate) re-encrypt toàn bộ bằng key chính sau khi đổi ENCRYPTION_KEY.
+Chạy theo lô, có thể dừng và chạy lại bất cứ lúc nào khi ứng dụng vẫn đang chạy.
+"""
+
+import os
+import sys
+import argparse
+
+# Thêm thư mục gốc vào Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ui.app import create_app
+from core.models import db, ReencryptionCheckpoint
+from core.reencrypt import (ENCRYPTED_COLUMNS, MIGRATION_BATCH_SIZE, get_reencryption_status,
+                            migrate_ciphertexts, reencrypt_secrets)
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate encrypted secrets to the v2 ciphertext format')
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument('--table', action='append', choices=[m.__tablename__ for m, _ in ENCRYPTED_COLUMNS],
+                        help='Chỉ migrate bảng này (có thể lặp lại)')
+    parser.add_argument('--rotate', action='store_true',
+                        help='Re-encrypt mọi secret bằng key chính (tiếp tục từ checkpoint nếu đã chạy dở)')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.rotate:
+        return rotate(app, args.batch_size)
+
+    print("🔐 Migrate ciphertext sang định dạng v2...")
+    with app.app_context():
+        results = migrate_ciphertexts(args.batch_size, args.table)
+
+    failed = 0
+    for table, counts in results.items():
+        print(f"  {table}: {counts['migrated']} migrated, {counts['failed']} không giải mã được")
+        failed += counts['failed']
+    if failed:
+        print("⚠️  Một số giá trị không giải mã được bằng ENCRYPTION_KEY hiện tại và được giữ nguyên")
+        return 1
+    print("✅ Hoàn tất!")
+    return 0
+
+def rotate(app, batch_size):
+    with app.app_context():
+        ReencryptionCheckpoint.__table__.create(db.engine, checkfirst=True)
+        print(f"🔐 Re-encrypt secret bằng key chính {get_reencryption_status()['key_fingerprint']}...")
+        rotated = reencrypt_secrets(batch_size, max_batches=None)
+        status = get_reencryption_status()
+
+    failed = 0
+    for table, progress in status['tables'].items():
+        print(f"  {table}: {progress['rotated']} rotated, {progress['failed']} không giải mã được")
+        failed += progress['failed']
+    print(f"✅ Đã ghi lại {rotated} secret trong lần chạy này")
+    if failed:
+        print("⚠️  Một số giá trị không giải mã được bằng keyring hiện tại, chưa thể bỏ key cũ")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
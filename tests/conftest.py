@@ -1,6 +1,7 @@
 import pytest
 import os
 import sys
+import uuid
 from pathlib import Path
 
 # Add project root to Python path
@@ -10,6 +11,8 @@ sys.path.insert(0, str(project_root))
 # Set test environment
 os.environ['FLASK_ENV'] = 'testing'
 os.environ['TESTING'] = 'True'
+# Test tự khởi động scheduler khi cần, không tham gia bầu leader lúc import ui.app
+os.environ.setdefault('ENABLE_SCHEDULER', 'false')
 
 @pytest.fixture(scope='session')
 def app():
@@ -33,7 +36,78 @@ def app_context(app):
     with app.app_context():
         yield
 
+@pytest.fixture(autouse=True)
+def inventory_cache():
+    """Clear the inventory cache so snapshots don't leak between tests."""
+    from core.cache import get_inventory_cache
+    cache = get_inventory_cache()
+    cache.invalidate()
+    yield cache
+
 @pytest.fixture(autouse=True)
 def client(app):
     """Create a test client for the app."""
-    return app.test_client() 
\ No newline at end of file
+    return app.test_client()
+
+@pytest.fixture
+def make_user(app):
+    """Factory tạo user với username duy nhất: make_user('import', notify_hour=7).
+
+    Các file test khác có thể drop_all trên cùng database nên bảng được tạo lại mỗi lần
+    gọi; id user có thể được dùng lại nên proxy/VPS còn sót của id đó bị xóa trước.
+    """
+    from core.models import db, User, Proxy, BitLaunchAPI, BitLaunchVPS
+
+    def _make_user(prefix='user', **fields):
+        db.create_all()
+        user = User(username=f'{prefix}_{uuid.uuid4().hex[:8]}', role='user', **fields)
+        user.set_password('testpass123')
+        db.session.add(user)
+        db.session.commit()
+        api_ids = [a.id for a in BitLaunchAPI.query.filter_by(user_id=user.id)]
+        BitLaunchVPS.query.filter(BitLaunchVPS.api_id.in_(api_ids)).delete()
+        BitLaunchAPI.query.filter_by(user_id=user.id).delete()
+        Proxy.query.filter_by(user_id=user.id).delete()
+        db.session.commit()
+        return user
+
+    return _make_user
+
+class QueryCounter:
+    """Ghi lại các câu SQL được gửi tới database"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture
+def assert_max_queries(app):
+    """Context manager kiểm tra số câu SQL trong một khối code, dùng để bắt lỗi N+1.
+
+        with assert_max_queries(3):
+            client.get('/api/bitlaunch-vps')
+    """
+    from contextlib import contextmanager
+    from sqlalchemy import event
+    from core.models import db
+
+    @contextmanager
+    def _assert_max_queries(limit):
+        counter = QueryCounter()
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', counter)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, 'before_cursor_execute', counter)
+        assert counter.count <= limit, (
+            f"Expected at most {limit} SQL statements, got {counter.count}:\n" + "\n".join(counter.statements)
+        )
+
+    return _assert_max_queries
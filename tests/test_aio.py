@@ -0,0 +1,136 @@
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+pytest.importorskip('httpx')
+
+from core.api_clients import aio, resilience
+from core.api_clients.zingproxy import AsyncZingProxyClient
+from core.rocket_chat import AsyncRocketChatClient, RocketChatError
+from core.refresh import RefreshEngine, RefreshTask
+
+class _SlowJSONHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.2
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        time.sleep(self.delay)
+        with cls.lock:
+            cls.active -= 1
+        if self.path.startswith('/api/v1/channels.list'):
+            payload = {'channels': [{'_id': 'c1', 'name': 'alerts'}], 'token': self.headers.get('X-Auth-Token')}
+        elif self.path.startswith('/proxy/get-all-active-proxies'):
+            payload = {'datacenterIPv4Proxies': [{'uId': 'p1', 'ip': '1.2.3.4', 'portHttp': 8080}],
+                       'vietnamResidentialProxies': [{'resourceId': 'p2', 'hostIp': '5.6.7.8'}]}
+        else:
+            payload = {'status': 'success', 'user': {'balance': 42}}
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # Trả lại payload nhận được (Rocket Chat chat.postMessage)
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        body = json.dumps({'success': True, 'message': request}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+@pytest.fixture
+def server():
+    _SlowJSONHandler.active = _SlowJSONHandler.peak = 0
+    httpd = _Server(('127.0.0.1', 0), _SlowJSONHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    resilience.reset_all()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    aio.close_all()
+    resilience.reset_all()
+    httpd.shutdown()
+
+def test_async_client_parses_like_sync_client(server, monkeypatch):
+    monkeypatch.setattr(AsyncZingProxyClient, 'BASE_URL', server)
+    client = AsyncZingProxyClient('token')
+    details = aio.run(client.get_account_details())
+    proxies = aio.run(client.get_all_active_proxies())
+    assert details == {'balance': 42}
+    assert [(p['proxy_id'], p['ip'], p['type']) for p in proxies] == [
+        ('p1', '1.2.3.4', 'datacenter_ipv4'), ('p2', '5.6.7.8', 'vietnam_residential')]
+
+def test_async_rocket_chat_client(server):
+    client = AsyncRocketChatClient('token', 'rocket-user', base_url=server)
+    assert aio.run(client.get_channels()) == [{'_id': 'c1', 'name': 'alerts'}]
+    sent = aio.run(client.send_message('room-1', 'hello', alias='bot'))
+    assert sent['message'] == {'roomId': 'room-1', 'text': 'hello', 'alias': 'bot'}
+    sent = aio.run(client.post_attachments('room-1', [{'title': 'T', 'text': 'x'}]))
+    assert sent['message']['attachments'] == [{'title': 'T', 'text': 'x'}]
+
+    with pytest.raises(RocketChatError):
+        aio.run(AsyncRocketChatClient('token', 'rocket-user', base_url='http://127.0.0.1:1').get_groups())
+
+def test_run_async_keeps_hundreds_of_requests_in_flight(server):
+    async def fetch(i):
+        response = await aio.request('GET', f'{server}/account/details?i={i}')
+        return response.json()['user']['balance']
+
+    engine = RefreshEngine(max_workers=2)
+    started = time.monotonic()
+    results = engine.run_async([RefreshTask(i, 'local', fetch, i) for i in range(300)], timeout=30)
+    elapsed = time.monotonic() - started
+    engine.shutdown()
+
+    assert all(r.ok and r.value == 42 for r in results)
+    # Chạy tuần tự sẽ mất 60s; với một event loop, phần lớn request chờ I/O cùng lúc
+    assert _SlowJSONHandler.peak >= 100
+    assert elapsed < 10
+
+def test_run_async_deadline_cancels_slow_calls(server, monkeypatch):
+    monkeypatch.setenv('ASYNC_LIMIT_LOCAL', '1')
+    _SlowJSONHandler.delay = 0.3
+
+    async def fetch():
+        return (await aio.request('GET', f'{server}/account/details')).status_code
+
+    engine = RefreshEngine(max_workers=2)
+    results = engine.run_async([RefreshTask(i, 'local', fetch) for i in range(4)], timeout=0.5)
+    engine.shutdown()
+    _SlowJSONHandler.delay = 0.2
+    assert results[0].ok
+    assert all(isinstance(r.error, resilience.DeadlineExceededError) for r in results[2:])
+
+def test_offload_runs_off_loop_and_keeps_deadline():
+    loop_thread = {}
+
+    def blocking():
+        loop_thread['name'] = threading.current_thread().name
+        return resilience.remaining_time()
+
+    async def main():
+        with resilience.deadline(time.monotonic() + 5):
+            return await aio.offload(blocking)
+
+    remaining = aio.run(main())
+    aio.close_all()
+    assert loop_thread['name'].startswith('aio-offload')
+    assert 0 < remaining <= 5
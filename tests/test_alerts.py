@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+import pytest
+from core import alerts
+from core.models import AlertState
+
+@pytest.fixture
+def user(make_user):
+    return make_user('alerts')
+
+def test_classify_error():
+    assert alerts.classify_error('401 Client Error: Unauthorized') == 'auth'
+    assert alerts.classify_error('429 Too Many Requests') == 'rate_limit'
+    assert alerts.classify_error('Read timed out. (read timeout=30)') == 'timeout'
+    assert alerts.classify_error('Max retries exceeded with url') == 'network'
+    assert alerts.classify_error('Something odd') == 'error'
+    assert alerts.classify_error('Token expired, please login again') == 'auth'
+    # Chữ "token" trong message không đủ để coi là lỗi xác thực
+    assert alerts.classify_error('Unexpected token < in JSON at position 0') == 'error'
+
+def test_only_transitions_are_reported(user):
+    start = datetime(2026, 1, 1, 8, 0)
+    transition, state = alerts.record_failure(user.id, 'BitLaunch', 'a@b.io', '401 Unauthorized', now=start)
+    assert transition == alerts.NEW
+
+    # Lỗi lặp lại trong khoảng digest bị chặn
+    for hours in (6, 12, 18):
+        transition, _ = alerts.record_failure(user.id, 'BitLaunch', 'a@b.io', '401 Unauthorized',
+                                              now=start + timedelta(hours=hours))
+        assert transition is None
+
+    transition, state = alerts.record_failure(user.id, 'BitLaunch', 'a@b.io', '401 Unauthorized',
+                                              now=start + timedelta(hours=alerts.ALERT_DIGEST_HOURS))
+    assert transition == alerts.STILL_FAILING
+    assert state.failure_count == 5 and state.first_seen == start
+    assert AlertState.query.filter_by(user_id=user.id).count() == 1
+
+    # Lỗi khác loại là một key riêng
+    transition, _ = alerts.record_failure(user.id, 'BitLaunch', 'a@b.io', 'stale', error_class='stale', now=start)
+    assert transition == alerts.NEW
+
+def test_recovery_reported_once_then_new_failure(user):
+    start = datetime(2026, 1, 1, 8, 0)
+    alerts.record_failure(user.id, 'CloudFly', 'c@d.vn', 'Connection refused', now=start)
+
+    recovered = alerts.record_successes('CloudFly', [(user.id, 'c@d.vn'), (user.id, 'other@d.vn')])
+    assert [s.account for s in recovered] == ['c@d.vn']
+    assert alerts.record_successes('CloudFly', [(user.id, 'c@d.vn')]) == []
+
+    transition, state = alerts.record_failure(user.id, 'CloudFly', 'c@d.vn', 'Connection refused',
+                                              now=start + timedelta(hours=1))
+    assert transition == alerts.NEW
+    assert state.failure_count == 1
@@ -0,0 +1,101 @@
+from datetime import datetime
+import pytest
+from core import balance_history
+from core.models import db, BitLaunchAPI, BalanceSample, BalanceRollup
+
+@pytest.fixture
+def user(make_user):
+    user = make_user('balance')
+    # Watermark rollup là toàn cục nên mỗi test bắt đầu với bảng rỗng
+    BalanceRollup.query.delete()
+    BalanceSample.query.delete()
+    db.session.commit()
+    return user
+
+def _sample(user, at, balance, provider='bitlaunch', account_id=1):
+    balance_history.record_sample(provider, account_id, user.id, balance, sampled_at=datetime.fromisoformat(at))
+
+def _rollups(resolution):
+    rows = BalanceRollup.query.filter_by(resolution=resolution).order_by(BalanceRollup.provider,
+                                                                         BalanceRollup.bucket_start)
+    return [(r.provider, r.bucket_start.isoformat(), r.samples, r.balance_open, r.balance_close,
+             r.balance_min, r.balance_max) for r in rows]
+
+def test_rollup_hourly_then_daily_only_finished_buckets(user):
+    _sample(user, '2025-01-01T00:10:00', 100)
+    _sample(user, '2025-01-01T00:40:00', 90)
+    _sample(user, '2025-01-01T00:50:00', 95)
+    _sample(user, '2025-01-01T01:20:00', 80)
+    _sample(user, '2025-01-02T05:00:00', 60)
+    _sample(user, '2025-01-01T03:00:00', 7, provider='cloudfly', account_id=1)
+    _sample(user, '2025-01-02T06:40:00', 55)  # Giờ chưa kết thúc
+    db.session.commit()
+
+    assert balance_history.rollup_balances(now=datetime(2025, 1, 2, 6, 45)) == {'hour': 4, 'day': 2}
+    assert _rollups('hour') == [
+        ('bitlaunch', '2025-01-01T00:00:00', 3, 100, 95, 90, 100),
+        ('bitlaunch', '2025-01-01T01:00:00', 1, 80, 80, 80, 80),
+        ('bitlaunch', '2025-01-02T05:00:00', 1, 60, 60, 60, 60),
+        ('cloudfly', '2025-01-01T03:00:00', 1, 7, 7, 7, 7),
+    ]
+    assert _rollups('day') == [('bitlaunch', '2025-01-01T00:00:00', 4, 100, 80, 80, 100),
+                               ('cloudfly', '2025-01-01T00:00:00', 1, 7, 7, 7, 7)]
+    # Chạy lại không gộp trùng; lần sau chỉ đọc phần mới sau watermark
+    assert balance_history.rollup_balances(now=datetime(2025, 1, 2, 6, 50)) == {'hour': 0, 'day': 0}
+    assert balance_history.rollup_balances(now=datetime(2025, 1, 3, 0, 5)) == {'hour': 1, 'day': 1}
+    assert _rollups('day')[1] == ('bitlaunch', '2025-01-02T00:00:00', 2, 60, 55, 55, 60)
+
+def test_prune_keeps_samples_not_yet_rolled_up(user, monkeypatch):
+    _sample(user, '2025-01-01T00:10:00', 100)
+    _sample(user, '2025-01-02T05:00:00', 90)
+    db.session.commit()
+    # Chưa gộp gì thì không xóa gì
+    assert balance_history.prune_balance_history(now=datetime(2026, 1, 1)) == {'samples': 0, 'hour': 0}
+
+    balance_history.rollup_balances(now=datetime(2025, 1, 2, 0, 30))
+    _sample(user, '2025-01-02T06:00:00', 85)
+    db.session.commit()
+    deleted = balance_history.prune_balance_history(now=datetime(2026, 1, 1))
+    # Chỉ sample đã vào bucket giờ bị xóa; bucket giờ của ngày đã gộp bị xóa sau 90 ngày
+    assert deleted == {'samples': 1, 'hour': 1}
+    assert [s.balance for s in BalanceSample.query.order_by(BalanceSample.sampled_at)] == [90, 85]
+    assert len(_rollups('day')) == 1
+
+def test_series_from_rollups_with_burn_rate(user, client, make_user):
+    other = make_user('balance')
+    for day in range(1, 6):
+        _sample(user, f'2025-01-0{day}T08:00:00', 100 - 5 * day, provider='zingproxy', account_id=3)
+    _sample(other, '2025-01-01T08:00:00', 1, provider='zingproxy', account_id=4)
+    db.session.commit()
+    balance_history.rollup_balances(now=datetime(2025, 1, 6, 0, 5))
+
+    data = balance_history.get_balance_series(user.id, days=30, now=datetime(2025, 1, 6))
+    assert data['resolution'] == 'day'
+    [series] = data['series']
+    assert [p['close'] for p in series['points']] == [95, 90, 85, 80, 75]
+    assert series['burn_rate_per_day'] == 5.0 and series['days_until_empty'] == 15.0
+
+    hourly = balance_history.get_balance_series(user.id, 'zingproxy', 3, days=2, now=datetime(2025, 1, 6))
+    assert hourly['resolution'] == 'hour' and len(hourly['series'][0]['points']) == 2
+    with pytest.raises(ValueError):
+        balance_history.get_balance_series(user.id, provider='aws')
+
+    assert client.get('/api/balance-history').status_code == 401
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+    # Mặc định 30 ngày gần nhất tính từ hiện tại
+    assert client.get('/api/balance-history').get_json()['series'] == []
+    assert client.get('/api/balance-history?resolution=minute').status_code == 400
+    assert client.get('/api/balance-history?days=0').status_code == 400
+
+def test_sync_apply_records_balance_sample(user):
+    from core import scheduler
+    api = BitLaunchAPI(user_id=user.id, email='history@bitlaunch.io', api_key='key')
+    db.session.add(api)
+    db.session.commit()
+    scheduler._apply_bitlaunch(api, (12.5, 50.0), [])
+    scheduler._apply_bitlaunch(api, None, [])
+    balance_history.record_sample('zingproxy', 1, user.id, 'n/a')
+    db.session.commit()
+    assert [(s.provider, s.account_id, s.balance) for s in BalanceSample.query.filter_by(user_id=user.id)] == \
+        [('bitlaunch', api.id, 12.5)]
@@ -0,0 +1,135 @@
+import time
+import pytest
+from core import cache as cache_module, inventory, manager
+from core.cache import MemoryCache, RedisCache, get_inventory_cache, mark_inventory_dirty
+from core.models import db
+
+def test_memory_cache_hit_miss_and_lru_eviction():
+    cache = MemoryCache(ttl=60, max_entries=2)
+    assert cache.get(1, 'a') is None
+    cache.set(1, 'a', {'v': 1})
+    cache.set(2, 'a', {'v': 2})
+    assert cache.get(1, 'a') == {'v': 1}  # user 1 vừa dùng, user 2 là LRU
+    cache.set(3, 'a', {'v': 3})
+
+    assert cache.get(2, 'a') is None
+    assert cache.get(1, 'a') == {'v': 1}
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['size'] == 2
+
+def test_memory_cache_ttl_and_copy():
+    cache = MemoryCache(ttl=0.05, max_entries=10)
+    cache.set(1, 'a', {'items': [1]})
+    cache.get(1, 'a')['items'].append(2)
+    assert cache.get(1, 'a') == {'items': [1]}
+    time.sleep(0.06)
+    assert cache.get(1, 'a') is None
+
+def test_memory_cache_invalidate_per_user():
+    cache = MemoryCache(ttl=60, max_entries=10)
+    cache.set(1, 'a', 1)
+    cache.set(1, 'b', 2)
+    cache.set(2, 'a', 3)
+    cache.invalidate(1)
+    assert cache.get(1, 'a') is None and cache.get(1, 'b') is None
+    assert cache.get(2, 'a') == 3
+    cache.invalidate()
+    assert cache.get(2, 'a') is None
+
+class FakeRedis:
+    """Stub các lệnh Redis mà RedisCache dùng, lưu trong dict"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1).encode()
+        return int(self.data[key])
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value.encode()
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    monkeypatch.setattr(cache_module, 'redis', type('redis', (), {'Redis': FakeRedis}))
+
+def test_redis_cache_invalidates_by_generation(fake_redis):
+    cache = RedisCache('redis://stub', ttl=60)
+    cache.set(1, 'a', {'v': 1})
+    cache.set(2, 'a', {'v': 2})
+    assert cache.get(1, 'a') == {'v': 1}
+    assert cache.client.ttls == {'vpsm:inventory:0:1': 60, 'vpsm:inventory:0:2': 60}
+
+    cache.invalidate(1)
+    assert cache.get(1, 'a') is None and cache.get(2, 'a') == {'v': 2}
+
+    # Xóa toàn bộ chỉ tăng generation, key cũ để Redis tự hết hạn
+    cache.invalidate()
+    assert cache.get(2, 'a') is None
+    assert 'vpsm:inventory:0:2' in cache.client.data
+    cache.set(2, 'a', {'v': 3})
+    assert cache.get(2, 'a') == {'v': 3} and 'vpsm:inventory:1:2' in cache.client.ttls
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 2
+
+def test_inventory_cache_url_selects_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(cache_module, '_cache', None)
+    monkeypatch.setenv('INVENTORY_CACHE_URL', 'redis://stub')
+    assert get_inventory_cache().backend == 'redis'
+
+def test_warns_when_memory_cache_has_several_workers(fake_redis, monkeypatch):
+    monkeypatch.delenv('INVENTORY_CACHE_URL', raising=False)
+    assert cache_module.warn_if_process_local(1) is False
+    assert cache_module.warn_if_process_local(4) is True
+    monkeypatch.setenv('INVENTORY_CACHE_URL', 'redis://stub')
+    assert cache_module.warn_if_process_local(4) is False
+
+@pytest.fixture
+def user(make_user):
+    user = make_user('cache')
+    get_inventory_cache().invalidate()
+    return user
+
+def test_snapshot_invalidated_after_manager_write(user):
+    cache = get_inventory_cache()
+    hits = cache.hits
+
+    assert inventory.get_snapshot(user.id)['counts']['accounts']['cloudfly'] == 0
+    assert inventory.get_snapshot(user.id)['counts']['accounts']['cloudfly'] == 0
+    assert cache.hits == hits + 1
+
+    manager.add_cloudfly_api(user.id, 'cache@cloudfly.vn', 'token')
+    assert inventory.get_snapshot(user.id)['counts']['accounts']['cloudfly'] == 1
+
+def test_snapshot_kept_after_rollback(user):
+    inventory.get_snapshot(user.id)
+    mark_inventory_dirty(user.id)
+    db.session.rollback()
+    hits = get_inventory_cache().hits
+    inventory.get_snapshot(user.id)
+    assert get_inventory_cache().hits == hits + 1
@@ -4,7 +4,7 @@ from core.api_clients.cloudfly import CloudFlyClient, CloudFlyAPIError
 
 @pytest.fixture
 def mock_cloudfly_client():
-    with patch('requests.get') as mock_get, patch('requests.post') as mock_post, patch('requests.delete') as mock_delete:
+    with patch('requests.Session.get') as mock_get, patch('requests.Session.post') as mock_post, patch('requests.Session.delete') as mock_delete:
         client = CloudFlyClient('test_token')
         yield client
 
@@ -54,7 +54,7 @@ def test_get_user_info_success(mock_cloudfly_client, sample_user_info):
     mock_response.status_code = 200
     mock_response.json.return_value = sample_user_info
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.get_user_info()
         assert result == sample_user_info
 
@@ -63,7 +63,7 @@ def test_get_user_info_error(mock_cloudfly_client):
     mock_response.status_code = 401
     mock_response.raise_for_status.side_effect = Exception('Unauthorized')
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         with pytest.raises(CloudFlyAPIError, match='Unauthorized'):
             mock_cloudfly_client.get_user_info()
 
@@ -72,7 +72,7 @@ def test_list_instances_success(mock_cloudfly_client, sample_instances):
     mock_response.status_code = 200
     mock_response.json.return_value = sample_instances
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.list_instances()
         assert len(result) == 2
         assert result[0]['display_name'] == 'Test VPS 1'
@@ -83,7 +83,7 @@ def test_list_instances_empty(mock_cloudfly_client):
     mock_response.status_code = 200
     mock_response.json.return_value = {'results': []}
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.list_instances()
         assert result == []
 
@@ -101,7 +101,7 @@ def test_create_instance_success(mock_cloudfly_client):
         'disk': 20
     }
     
-    with patch('requests.post', return_value=mock_response):
+    with patch('requests.Session.post', return_value=mock_response):
         result = mock_cloudfly_client.create_instance(instance_data)
         assert result['id'] == 3
         assert result['status'] == 'BUILDING'
@@ -110,7 +110,7 @@ def test_delete_instance_success(mock_cloudfly_client):
     mock_response = Mock()
     mock_response.status_code = 204
     
-    with patch('requests.delete', return_value=mock_response):
+    with patch('requests.Session.delete', return_value=mock_response):
         result = mock_cloudfly_client.delete_instance(1)
         assert result is True
 
@@ -119,7 +119,7 @@ def test_delete_instance_error(mock_cloudfly_client):
     mock_response.status_code = 404
     mock_response.raise_for_status.side_effect = Exception('Not Found')
     
-    with patch('requests.delete', return_value=mock_response):
+    with patch('requests.Session.delete', return_value=mock_response):
         with pytest.raises(CloudFlyAPIError, match='Not Found'):
             mock_cloudfly_client.delete_instance(999)
 
@@ -128,7 +128,7 @@ def test_start_instance_success(mock_cloudfly_client):
     mock_response.status_code = 200
     mock_response.json.return_value = {'status': 'STARTING'}
     
-    with patch('requests.post', return_value=mock_response):
+    with patch('requests.Session.post', return_value=mock_response):
         result = mock_cloudfly_client.start_instance(1)
         assert result['status'] == 'STARTING'
 
@@ -137,7 +137,7 @@ def test_stop_instance_success(mock_cloudfly_client):
     mock_response.status_code = 200
     mock_response.json.return_value = {'status': 'STOPPING'}
     
-    with patch('requests.post', return_value=mock_response):
+    with patch('requests.Session.post', return_value=mock_response):
         result = mock_cloudfly_client.stop_instance(1)
         assert result['status'] == 'STOPPING'
 
@@ -146,7 +146,7 @@ def test_restart_instance_success(mock_cloudfly_client):
     mock_response.status_code = 200
     mock_response.json.return_value = {'status': 'REBOOTING'}
     
-    with patch('requests.post', return_value=mock_response):
+    with patch('requests.Session.post', return_value=mock_response):
         result = mock_cloudfly_client.restart_instance(1)
         assert result['status'] == 'REBOOTING'
 
@@ -158,7 +158,7 @@ def test_list_regions_success(mock_cloudfly_client):
         {'id': 'SG-Cloud01', 'description': 'Singapore Cloud 01'}
     ]
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.list_regions()
         assert len(result) == 2
         assert result[0]['description'] == 'Hanoi Cloud 01'
@@ -171,7 +171,7 @@ def test_list_images_success(mock_cloudfly_client):
         {'id': 'ubuntu-20.04', 'name': 'Ubuntu-20.04'}
     ]
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.list_images()
         assert len(result) == 2
         assert result[0]['name'] == 'CentOS-7.9'
@@ -184,7 +184,7 @@ def test_list_flavors_success(mock_cloudfly_client):
         {'id': 'premium', 'description': 'Premium'}
     ]
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.list_flavors()
         assert len(result) == 2
         assert result[0]['description'] == 'Standard'
@@ -197,7 +197,7 @@ def test_get_billing_info_success(mock_cloudfly_client):
         'current_balance': 100000
     }
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.get_billing_info()
         assert result['total_usage'] == 50.0
         assert result['current_balance'] == 100000
@@ -211,7 +211,7 @@ def test_get_usage_stats_success(mock_cloudfly_client):
         'disk_usage': 40.0
     }
     
-    with patch('requests.get', return_value=mock_response):
+    with patch('requests.Session.get', return_value=mock_response):
         result = mock_cloudfly_client.get_usage_stats(1)
         assert result['cpu_usage'] == 25.5
         assert result['memory_usage'] == 60.0 
\ No newline at end of file
@@ -0,0 +1,163 @@
+import base64
+import time
+import pytest
+from cryptography.fernet import Fernet
+from core import manager
+from core.reencrypt import get_reencryption_status, migrate_ciphertexts, reencrypt_secrets
+from core.encryption import EncryptionKeyError, EncryptionManager, SecretCache, encryption_manager
+from core.models import db, CloudFlyAPI
+
+def test_secret_cache_ttl_lru_and_stats():
+    cache = SecretCache(ttl=60, max_entries=2)
+    assert cache.get('c1') is None
+    cache.set('c1', 'p1')
+    cache.set('c2', 'p2')
+    assert cache.get('c1') == 'p1'  # c2 thành LRU
+    cache.set('c3', 'p3')
+    assert cache.get('c2') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (1, 2, 1, 2)
+
+    short = SecretCache(ttl=0.05, max_entries=10)
+    short.set('c', 'p')
+    time.sleep(0.06)
+    assert short.get('c') is None
+
+def test_decrypt_uses_cache_and_skips_failures(monkeypatch):
+    manager_ = EncryptionManager()
+    token = manager_.encrypt('secret')
+    calls = []
+    real_decrypt = manager_.cipher_suite.decrypt
+    monkeypatch.setattr(manager_.cipher_suite, 'decrypt', lambda data: calls.append(1) or real_decrypt(data))
+
+    assert [manager_.decrypt(token) for _ in range(3)] == ['secret'] * 3
+    assert len(calls) == 1
+    assert manager_.cache.stats()['hits'] == 2
+
+    # Giá trị không giải mã được trả nguyên văn và không bị cache
+    assert manager_.decrypt('not-a-token') == 'not-a-token'
+    assert manager_.cache.get('not-a-token') is None
+
+def test_rotate_key_keeps_old_key_and_wipes_cache():
+    manager_ = EncryptionManager()
+    token = manager_.encrypt('secret')
+    assert manager_.decrypt(token) == 'secret'
+    old_fingerprint = manager_.primary_fingerprint
+    manager_.rotate_key(Fernet.generate_key())
+    assert manager_.cache.stats()['size'] == 0
+    assert manager_.fingerprints()[1] == old_fingerprint
+    # Key cũ vẫn trong keyring nên ciphertext cũ vẫn đọc được, nhưng cần re-encrypt
+    assert manager_.decrypt(token) == 'secret'
+    rotated = manager_.reencrypt(token)
+    assert rotated != token and manager_.reencrypt(rotated) is None
+
+def test_keyring_from_env_and_no_silent_key_generation(monkeypatch):
+    old, new = Fernet.generate_key(), Fernet.generate_key()
+    monkeypatch.setenv('ENCRYPTION_KEY', old.decode())
+    monkeypatch.delenv('ENCRYPTION_OLD_KEYS', raising=False)
+    token = EncryptionManager().encrypt('secret')
+
+    monkeypatch.setenv('ENCRYPTION_KEY', new.decode().rstrip('='))
+    monkeypatch.setenv('ENCRYPTION_OLD_KEYS', old.decode())
+    assert EncryptionManager().decrypt(token) == 'secret'
+
+    monkeypatch.setenv('ENCRYPTION_KEY', 'too-short')
+    with pytest.raises(EncryptionKeyError):
+        EncryptionManager()
+    monkeypatch.delenv('ENCRYPTION_KEY')
+    monkeypatch.setenv('ALLOW_EPHEMERAL_ENCRYPTION_KEY', 'false')
+    with pytest.raises(EncryptionKeyError):
+        EncryptionManager()
+
+def _legacy(manager_, value):
+    """Ciphertext định dạng cũ: base64 của token Fernet"""
+    return base64.urlsafe_b64encode(manager_.cipher_suite.encrypt(value.encode())).decode()
+
+def test_v2_format_is_shorter_and_reads_legacy():
+    manager_ = EncryptionManager()
+    token = manager_.encrypt('x' * 64)
+    legacy = _legacy(manager_, 'x' * 64)
+    assert token.startswith('v2:') and manager_.is_current_format(token)
+    assert len(token) < len(legacy) * 0.8
+    assert manager_.decrypt(token) == manager_.decrypt(legacy) == 'x' * 64
+    assert manager_.upgrade(legacy).startswith('v2:')
+    assert manager_.upgrade('garbage') is None
+
+def test_encrypt_many_and_decrypt_many_round_trip():
+    manager_ = EncryptionManager()
+    values = ['a', None, '', 'b', 'a']
+    encrypted = manager_.encrypt_many(values)
+    assert encrypted[1] is None and encrypted[2] == ''
+    assert manager_.decrypt_many(encrypted) == values
+
+@pytest.fixture
+def user(make_user):
+    return make_user('enc')
+
+def test_list_proxies_without_secrets_skips_decryption(user, monkeypatch):
+    manager.add_proxy(user.id, {'name': 'p', 'ip': '1.2.3.4', 'port': 8080, 'password': 'pw'})
+    calls = []
+    monkeypatch.setattr(encryption_manager, 'decrypt', lambda data: calls.append(data) or 'pw')
+
+    listed = manager.list_proxies(user.id, include_secrets=False)
+    assert listed[0]['password'] is None and listed[0]['has_password'] is True
+    assert calls == []
+    assert manager.list_proxies(user.id)[0]['password'] == 'pw'
+    assert len(calls) == 1
+
+def test_migrate_ciphertexts_rewrites_legacy_rows_in_batches(user):
+    apis = []
+    for i in range(5):
+        api = CloudFlyAPI(user_id=user.id, email=f'm{i}@cloudfly.vn')
+        api.api_token = f'token-{i}'
+        apis.append(api)
+    db.session.add_all(apis)
+    db.session.commit()
+    for api in apis[:4]:
+        api.api_token_encrypted = _legacy(encryption_manager, api.api_token)
+    apis[4].api_token_encrypted = 'unreadable'
+    db.session.commit()
+
+    results = migrate_ciphertexts(batch_size=2, tables=['cloudfly_apis'])
+    assert results == {'cloudfly_apis': {'migrated': 4, 'failed': 1}}
+    db.session.expire_all()
+    assert all(a.api_token_encrypted.startswith('v2:') for a in apis[:4])
+    assert [a.api_token for a in apis[:4]] == [f'token-{i}' for i in range(4)]
+    assert apis[4].api_token_encrypted == 'unreadable'
+    # Chạy lại không làm gì thêm
+    assert migrate_ciphertexts(tables=['cloudfly_apis'])['cloudfly_apis']['migrated'] == 0
+
+@pytest.fixture
+def restore_keys():
+    keys = list(encryption_manager.keys)
+    yield
+    encryption_manager._set_keys(keys)
+
+def test_reencrypt_secrets_resumes_from_checkpoint(user, restore_keys):
+    apis = []
+    for i in range(5):
+        api = CloudFlyAPI(user_id=user.id, email=f'r{i}@cloudfly.vn')
+        api.api_token = f'token-{i}'
+        apis.append(api)
+    db.session.add_all(apis)
+    db.session.commit()
+    encryption_manager.rotate_key(Fernet.generate_key())
+    old_ciphertexts = [a.api_token_encrypted for a in apis]
+
+    # Mỗi lần chạy chỉ một lô 2 dòng; checkpoint giúp lần sau chạy tiếp đúng chỗ
+    steps = 0
+    checkpoints = []
+    while not get_reencryption_status()['complete']:
+        reencrypt_secrets(batch_size=2, max_batches=1)
+        checkpoints.append(get_reencryption_status()['tables']['cloudfly_apis']['last_id'])
+        steps += 1
+        assert steps < 1000
+    assert checkpoints == sorted(checkpoints)
+    # 5 dòng cloudfly cần ít nhất 3 lô, cộng một lô rỗng kết thúc cho mỗi bảng
+    assert steps >= 3 + 5
+    db.session.expire_all()
+    assert all(a.api_token_encrypted != old for a, old in zip(apis, old_ciphertexts))
+    assert all(encryption_manager.reencrypt(a.api_token_encrypted) is None for a in apis)
+    # Bỏ key cũ khỏi keyring: dữ liệu vẫn đọc được
+    encryption_manager._set_keys(encryption_manager.keys[:1])
+    assert [a.api_token for a in apis] == [f'token-{i}' for i in range(5)]
@@ -0,0 +1,65 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from core import export
+from core.models import db, Proxy
+
+@pytest.fixture
+def user(make_user):
+    user = make_user('export')
+    for i in range(12):
+        proxy = Proxy(user_id=user.id, name=f'e{i}', ip=f'10.1.0.{i}', port=str(8000 + i),
+                      status='active' if i < 10 else 'inactive', note='có, "dấu"' if i == 0 else None)
+        if i % 3:
+            proxy.username = f'u{i}'
+            proxy.password = f'p{i}'
+        db.session.add(proxy)
+    db.session.commit()
+    return user
+
+def test_chunks_follow_yield_per_and_decrypt_once_per_chunk(user, monkeypatch):
+    calls = []
+    real = export.encryption_manager.decrypt_many
+    monkeypatch.setattr(export.encryption_manager, 'decrypt_many', lambda values: calls.append(len(values)) or real(values))
+
+    chunks = list(export.iter_proxy_chunks(user.id, chunk_size=5))
+    assert [len(c) for c in chunks] == [5, 5, 2]
+    assert calls == [5, 5, 2]
+    assert chunks[0][1]['password'] == 'p1' and chunks[0][0]['password'] is None
+
+    assert all(item['password'] is None for chunk in export.iter_proxy_chunks(user.id, include_secrets=False)
+               for item in chunk)
+
+def test_csv_ndjson_and_txt_formats(user):
+    text = b''.join(export.stream_proxies(user.id, 'csv', chunk_size=4)).decode()
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert len(rows) == 12
+    assert rows[0]['note'] == 'có, "dấu"' and rows[1]['password'] == 'p1'
+
+    lines = b''.join(export.stream_proxies(user.id, 'ndjson', {'status': 'inactive'})).decode().splitlines()
+    assert [json.loads(line)['name'] for line in lines] == ['e10', 'e11']
+
+    lines = b''.join(export.stream_proxies(user.id, 'txt')).decode().splitlines()
+    assert lines[0] == '10.1.0.0:8000'
+    assert lines[1] == '10.1.0.1:8001:u1:p1'
+
+def test_export_endpoint_streams_and_gzips(client, user):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+
+    response = client.get('/api/proxies/export?format=txt&gzip=1')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/gzip'
+    assert '.txt.gz' in response.headers['Content-Disposition']
+    assert len(gzip.decompress(response.get_data()).decode().splitlines()) == 12
+
+    response = client.get('/api/proxies/export?format=csv&include_secrets=0')
+    assert response.mimetype == 'text/csv'
+    assert 'p1' not in response.get_data(as_text=True)
+
+    assert client.get('/api/proxies/export?format=xml').status_code == 400
+    # Không truyền format: JSON như trước
+    assert len(client.get('/api/proxies/export').get_json()['proxies']) == 12
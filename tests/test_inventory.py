@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+import pytest
+from core import inventory
+from core.models import db, BitLaunchAPI, BitLaunchVPS, ZingProxyAccount, ZingProxy, VPS
+
+@pytest.fixture
+def user(make_user):
+    user = make_user('inventory')
+
+    soon = (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+    later = (datetime.now() + timedelta(days=60)).strftime('%Y-%m-%d')
+    api = BitLaunchAPI(user_id=user.id, email='inv@bitlaunch.io', api_key='key', balance=12.5)
+    acc = ZingProxyAccount(user_id=user.id, email='inv@zingproxy.com', access_token='token', balance=50000)
+    db.session.add_all([api, acc, VPS(id='inv-vps', service='Vultr', name='inv', ip='1.1.1.1', expiry=soon)])
+    db.session.flush()
+    db.session.add(BitLaunchVPS(api_id=api.id, server_id=1, name='bl-1', ip_address='2.2.2.2'))
+    db.session.add(ZingProxy(account_id=acc.id, proxy_id='inv-zp-1', ip='3.3.3.3', type='datacenter_ipv4', expire_at=soon))
+    db.session.add(ZingProxy(account_id=acc.id, proxy_id='inv-zp-2', ip='4.4.4.4', type='datacenter_ipv4', expire_at=later))
+    db.session.commit()
+    yield user
+    VPS.query.filter_by(id='inv-vps').delete()
+    db.session.commit()
+
+def test_list_accounts_merges_sources(user):
+    accounts = inventory.list_accounts(user.id)
+    by_source = {a['source']: a for a in accounts if a['source'] != 'manual'}
+    assert by_source['bitlaunch']['id'] == f"bitlaunch_{BitLaunchAPI.query.filter_by(user_id=user.id).one().id}"
+    assert by_source['zingproxy']['username'] == 'inv@zingproxy.com'
+    assert by_source['zingproxy']['service'] == 'ZingProxy'
+
+def test_build_inventory(user):
+    data = inventory.build_inventory(user.id)
+    assert data['counts']['vps']['bitlaunch'] == 1
+    assert any(v['id'] == 'inv-vps' and v['source'] == 'manual' for v in data['vps'])
+    assert data['balances'] == {'bitlaunch': 12.5, 'zingproxy': 50000}
+
+    names = [w['name'] for w in data['warnings']]
+    assert 'inv' in names
+    assert 'inv-zp-1 (datacenter_ipv4)' in names
+    assert 'inv-zp-2 (datacenter_ipv4)' not in names
+    assert data['counts']['warnings'] == len(data['warnings'])
+
+def test_inventory_endpoint(client, user, assert_max_queries):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+
+    with assert_max_queries(12):
+        response = client.get('/api/inventory')
+    data = response.get_json()
+    assert data['status'] == 'success'
+    assert data['counts']['accounts']['zingproxy'] == 1
+
+    # Dashboard chỉ cần số lượng và cảnh báo
+    data = client.get('/api/inventory?lists=0').get_json()
+    assert 'vps' not in data and 'accounts' not in data
+    assert data['counts']['vps']['bitlaunch'] == 1 and data['warnings']
+
+def test_filter_items_search_and_expiry(user):
+    vps = inventory.build_inventory(user.id)['vps']
+    ids = lambda filters: {v['id'] for v in inventory.filter_items(vps, filters, inventory.VPS_FILTERS)}
+    assert 'inv-vps' in ids({'q': 'VULTR'}) and 'inv-vps' in ids({'q': '1.1.1'})
+    assert not any(i.startswith('bitlaunch') for i in ids({'q': 'vultr'}))
+    assert 'inv-vps' in ids({'expiring_within': 3})
+    # VPS không có ngày hết hạn không khớp filter hết hạn
+    assert 'inv-vps' not in ids({'expires_after': 3}) | ids({'expired': True})
+
+def test_inventory_requires_login(client):
+    assert client.get('/api/inventory').status_code == 401
+
+def test_expiry_date_filled_on_write(user):
+    acc = ZingProxyAccount.query.filter_by(user_id=user.id).one()
+    proxy = ZingProxy.query.filter_by(account_id=acc.id, proxy_id='inv-zp-1').one()
+    assert proxy.expire_date == (datetime.now() + timedelta(days=2)).date()
+    proxy.expire_at = None
+    assert proxy.expire_date is None
+    db.session.rollback()
+
+def test_backfill_expiry_dates(user):
+    from core.schema import backfill_expiry_dates
+    db.session.execute(db.update(VPS).where(VPS.id == 'inv-vps').values(expiry_date=None))
+    db.session.commit()
+    assert not [w for w in inventory.collect_expiry_warnings(user.id) if w['name'] == 'inv']
+
+    counts = backfill_expiry_dates(batch_size=1)
+    assert counts['vps'] >= 1
+    assert [w for w in inventory.collect_expiry_warnings(user.id) if w['name'] == 'inv'][0]['days_left'] == 2
+
+def test_add_missing_columns_is_idempotent(user):
+    from core.schema import add_missing_columns
+    assert add_missing_columns() == []
+
+def test_upgrade_schema_runs_under_lease(user):
+    from core import leader, schema
+    db.create_all()
+    # Process khác đang nâng cấp: chờ hết thời gian thì bỏ qua
+    assert leader.try_acquire(schema.SCHEMA_LEASE_NAME, 'other-worker', ttl=60)
+    assert schema.upgrade_schema_locked(wait=0) is None
+    leader.release(schema.SCHEMA_LEASE_NAME, 'other-worker')
+
+    assert schema.upgrade_schema_locked(wait=0, owner='this-worker') is not None
+    # Lease được trả ngay sau khi nâng cấp xong
+    assert leader.try_acquire(schema.SCHEMA_LEASE_NAME, 'other-worker', ttl=60)
+    leader.release(schema.SCHEMA_LEASE_NAME, 'other-worker')
+
+def test_upgrade_schema_creates_missing_tables(user):
+    from core.models import BalanceRollup
+    from core.schema import create_missing_tables
+    BalanceRollup.__table__.drop(db.engine)
+    assert create_missing_tables() == ['balance_rollups']
+    assert create_missing_tables() == []
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import subprocess
+from datetime import datetime, timedelta
+import pytest
+from core import leader
+from core.models import db, SchedulerLease
+
+@pytest.fixture(autouse=True)
+def lease_table():
+    db.create_all()
+    SchedulerLease.query.delete()
+    db.session.commit()
+
+def test_only_one_owner_holds_the_lease():
+    now = datetime.utcnow()
+    assert leader.try_acquire('jobs', 'a', ttl=60, now=now)
+    assert not leader.try_acquire('jobs', 'b', ttl=60, now=now)
+    # Leader gia hạn được, acquired_at giữ nguyên
+    assert leader.try_acquire('jobs', 'a', ttl=60, now=now + timedelta(seconds=20))
+    lease = leader.get_lease('jobs')
+    assert lease['owner'] == 'a' and lease['acquired_at'] == now.isoformat()
+
+    # Leader chết: sau khi lease hết hạn thì process khác tiếp quản
+    assert not leader.try_acquire('jobs', 'b', ttl=60, now=now + timedelta(seconds=60))
+    assert leader.try_acquire('jobs', 'b', ttl=60, now=now + timedelta(seconds=81))
+    assert not leader.try_acquire('jobs', 'a', ttl=60, now=now + timedelta(seconds=82))
+
+def test_release_allows_immediate_takeover():
+    assert leader.try_acquire('jobs', 'a')
+    leader.release('jobs', 'a')
+    assert leader.try_acquire('jobs', 'b')
+
+def test_elector_demotes_when_lease_is_taken(app):
+    events = []
+    a = leader.LeaderElector(app, 'jobs', lambda: events.append('a+'), lambda: events.append('a-'), ttl=1, owner='a')
+    b = leader.LeaderElector(app, 'jobs', lambda: events.append('b+'), lambda: events.append('b-'), ttl=1, owner='b')
+
+    assert a.tick() and not b.tick()
+    time.sleep(1.1)  # a không gia hạn kịp
+    assert b.tick()
+    assert not a.tick()
+    assert events == ['a+', 'b+', 'a-']
+
+def test_importing_app_does_not_join_election(tmp_path):
+    """Script/migration import ui.app không được trở thành leader và chạy scheduler"""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path / "import.db"}', ENABLE_SCHEDULER='true',
+               ALLOW_EPHEMERAL_ENCRYPTION_KEY='true')
+    code = ('import threading, ui.app\n'
+            'from core import scheduler\n'
+            'assert scheduler._elector is None and scheduler._active_scheduler is None\n'
+            'assert [t.name for t in threading.enumerate()] == ["MainThread"]\n')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+def test_init_app_respects_enable_scheduler(monkeypatch):
+    from ui import app as app_module
+    from core import scheduler, outbox
+    started = []
+    monkeypatch.setenv('ENABLE_SCHEDULER', 'false')
+    monkeypatch.setattr(scheduler, 'start_leader_election', lambda app: pytest.fail('election started'))
+    monkeypatch.setattr(outbox, 'start_dispatcher', started.append)
+    app_module.init_app()
+    # Outbox vẫn được gửi khi process không chạy scheduler
+    assert started == [app_module.app]
+
+def test_demotion_waits_for_running_job(monkeypatch):
+    """Leader bị hạ dừng nhận job mới nhưng chờ job đang chạy xong rồi mới trả lease"""
+    import threading
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from core import scheduler as scheduler_module
+    started, runs = threading.Event(), []
+
+    def slow_job():
+        started.set()
+        time.sleep(0.3)
+        runs.append('done')
+
+    sched = BackgroundScheduler()
+    sched.add_job(slow_job, 'interval', seconds=0.05, id='slow', max_instances=1)
+    sched.start()
+    monkeypatch.setattr(scheduler_module, 'scheduler', sched)
+    assert started.wait(2)
+    scheduler_module.stop_scheduler()
+    assert runs == ['done'] and not sched.running and scheduler_module.scheduler is None
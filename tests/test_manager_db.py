@@ -67,4 +67,71 @@ def test_crud_account(client):
     assert res.status_code == 200
     res = client.get('/api/accounts')
     data = res.get_json()
-    assert not any(x['id'] == 'acc1' for x in data) 
\ No newline at end of file
+    assert not any(x['id'] == 'acc1' for x in data)
+
+def _servers(n, status='running'):
+    return [{'id': str(1000 + i), 'name': f'srv{i}', 'status': status, 'ipv4': f'10.0.0.{i}',
+             'region': 'ams', 'sizeDescription': '1GB'} for i in range(n)]
+
+def test_update_bitlaunch_vps_list_diff(client):
+    from core import manager
+    from core.models import BitLaunchVPS
+    with client.application.app_context():
+        counts = manager.update_bitlaunch_vps_list(1, _servers(3))
+        assert counts == {'inserted': 3, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        ids = {v.server_id: v.id for v in BitLaunchVPS.query.filter_by(api_id=1)}
+
+        # Không có gì thay đổi
+        counts = manager.update_bitlaunch_vps_list(1, _servers(3))
+        assert counts == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 3}
+
+        servers = _servers(2)
+        servers[0]['status'] = 'stopped'
+        counts = manager.update_bitlaunch_vps_list(1, servers)
+        assert counts == {'inserted': 0, 'updated': 1, 'deleted': 1, 'unchanged': 1}
+        rows = {v.server_id: v for v in BitLaunchVPS.query.filter_by(api_id=1)}
+        assert len(rows) == 2
+        assert rows[1000].status == 'stopped'
+        # Dòng được giữ nguyên id, không bị xóa và tạo lại
+        assert rows[1000].id == ids[1000]
+
+def test_update_cloudfly_vps_list_diff(client):
+    from core import manager
+    from core.models import CloudFlyVPS
+    instances = [{'id': 'abc', 'display_name': 'vm1', 'status': 'ACTIVE', 'accessIPv4': '1.1.1.1',
+                  'region': {'description': 'HN'}, 'flavor': {'description': 'small'}, 'image': {'name': 'ubuntu'}}]
+    with client.application.app_context():
+        assert manager.update_cloudfly_vps_list(7, instances)['inserted'] == 1
+        assert manager.update_cloudfly_vps_list(7, instances)['unchanged'] == 1
+        vps = CloudFlyVPS.query.filter_by(api_id=7).one()
+        assert vps.status == 'running'
+        assert vps.region == 'HN'
+        assert manager.update_cloudfly_vps_list(7, [])['deleted'] == 1
+
+def _zing_proxies(n, password='secret'):
+    return [{'proxy_id': f'z{i}', 'ip': f'103.1.1.{i}', 'port': 8000 + i, 'port_socks5': 9000 + i,
+             'status': 'running', 'location': 'vn', 'type': 'vietnam_residential',
+             'username': 'user', 'password': password} for i in range(n)]
+
+def test_sync_zingproxy_account_bulk(client):
+    from core import manager
+    from core.models import ZingProxy, Proxy
+    with client.application.app_context():
+        counts = manager.sync_zingproxy_account(3, 1, _zing_proxies(50))
+        assert counts['zingproxies']['inserted'] == 50
+        assert counts['proxies']['inserted'] == 50
+        assert Proxy.query.filter_by(user_id=1, source='zingproxy').count() == 50
+
+        # Lần đồng bộ lại không ghi gì (port số từ API so với cột String)
+        counts = manager.sync_zingproxy_account(3, 1, _zing_proxies(50))
+        assert counts['zingproxies'] == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 50}
+        assert counts['proxies'] == {'inserted': 0, 'updated': 0, 'unchanged': 50}
+
+        counts = manager.sync_zingproxy_account(3, 1, _zing_proxies(40, password='rotated'))
+        assert counts['zingproxies']['deleted'] == 10
+        assert counts['proxies']['updated'] == 40
+        assert ZingProxy.query.filter_by(account_id=3).count() == 40
+        proxy = Proxy.query.filter_by(user_id=1, source_id='z0').one()
+        assert proxy.password == 'rotated'
+        assert proxy.name == 'ZingProxy_vietnam_residential_z0'
+        assert manager.import_proxies_from_zingproxy(1, _zing_proxies(40, password='rotated')) == 40
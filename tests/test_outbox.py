@@ -0,0 +1,116 @@
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from core import outbox
+from core.models import db, User, RocketChatConfig, RocketChatOutbox
+from core.rocket_chat import send_formatted_notification_simple
+
+@pytest.fixture(autouse=True)
+def empty_outbox():
+    db.create_all()
+    RocketChatOutbox.query.delete()
+    db.session.commit()
+
+@pytest.fixture
+def config(make_user):
+    user = make_user('outbox')
+    config = RocketChatConfig(user_id=user.id, auth_token=f'token-{uuid.uuid4().hex}', user_id_rocket='rocket-user',
+                              room_id='room-1234567890')
+    db.session.add(config)
+    db.session.commit()
+    return config
+
+def _later():
+    return datetime.utcnow() + timedelta(seconds=outbox.OUTBOX_MERGE_WINDOW + 1)
+
+@patch('core.rocket_chat.post_attachments')
+def test_send_simple_only_enqueues(mock_post, config):
+    room_id, token, rocket_user = config.room_id, config.auth_token, config.user_id_rocket
+    # Thay đổi chưa commit của caller không bị commit theo thông báo
+    db.session.add(User(username=f'pending_{uuid.uuid4().hex[:8]}', role='user', password_hash='x'))
+    assert send_formatted_notification_simple(room_id, 'Title', 'Body', token, rocket_user, 'danger') is True
+    db.session.rollback()
+    mock_post.assert_not_called()
+    assert User.query.filter(User.username.like('pending_%')).count() == 0
+    [message] = RocketChatOutbox.query.all()
+    assert message.config_id == config.id and message.status == 'pending'
+
+@patch('core.rocket_chat.post_attachments', return_value=(True, None))
+def test_manual_and_unknown_credentials_sent_immediately(mock_post, config):
+    assert send_formatted_notification_simple(config.room_id, 'Test', 'Body', config.auth_token,
+                                              config.user_id_rocket, immediate=True) is True
+    assert send_formatted_notification_simple('room-other-12345', 'Title', 'Body', 'other-token', 'rocket-user')
+    assert mock_post.call_count == 2 and outbox.get_queue_stats()['pending'] == 0
+
+def test_enqueue_joins_caller_transaction(config):
+    outbox.enqueue(config.room_id, 'Alert', 'Body', config.id)
+    db.session.rollback()
+    assert outbox.get_queue_stats()['pending'] == 0
+    outbox.enqueue(config.room_id, 'Alert', 'Body', config.id)
+    db.session.commit()
+    assert outbox.get_queue_stats()['pending'] == 1
+
+@patch('core.rocket_chat.post_attachments', return_value=(True, None))
+def test_alerts_for_same_room_are_merged(mock_post, config):
+    for i in range(3):
+        outbox.enqueue(config.room_id, f'Alert {i}', 'Body', config.id, commit=True)
+    outbox.enqueue('room-2', 'Other', 'Body', config.id, commit=True)
+
+    # Trong cửa sổ gộp: chưa gửi
+    assert outbox.dispatch_once()['messages'] == 0
+
+    counts = outbox.dispatch_once(_later())
+    assert counts == {'sent': 4, 'retry': 0, 'failed': 0, 'messages': 2}
+    attachments = {call.args[0]: call.args[3] for call in mock_post.call_args_list}
+    assert [a['title'] for a in attachments[config.room_id]] == ['Alert 0', 'Alert 1', 'Alert 2']
+    # Token được đọc từ config lúc gửi
+    assert {call.args[1] for call in mock_post.call_args_list} == {config.auth_token}
+    assert outbox.get_queue_stats()['pending'] == 0
+
+@patch('core.rocket_chat.post_attachments', return_value=(False, 'HTTP 502'))
+def test_failed_send_backs_off(mock_post, config):
+    message = outbox.enqueue(config.room_id, 'Alert', 'Body', config.id, commit=True)
+    later = _later()
+    assert outbox.dispatch_once(later)['retry'] == 1
+
+    db.session.refresh(message)
+    assert message.attempts == 1 and message.last_error == 'HTTP 502'
+    assert message.next_attempt_at > datetime.utcnow() + timedelta(seconds=outbox.BACKOFF_BASE_SECONDS * 0.7)
+    # Chưa đến hạn retry thì không gửi lại
+    assert outbox.dispatch_once(later)['messages'] == 0
+    assert outbox.backoff_delay(20) <= outbox.BACKOFF_MAX_SECONDS * 1.2
+
+@patch('core.rocket_chat.post_attachments', return_value=(True, None))
+def test_claimed_or_orphaned_messages(mock_post, config):
+    outbox.enqueue(config.room_id, 'Alert', 'Body', config.id, commit=True)
+    later = _later()
+    groups = outbox._due_groups(later)
+    # Dispatcher ở process khác đã nhận nhóm này thì không gửi trùng
+    assert len(outbox._claim(groups, later)) == 1
+    assert outbox._claim(groups, later) == []
+    assert outbox.dispatch_once(later)['messages'] == 0
+
+    config.is_active = False
+    db.session.commit()
+    outbox.enqueue(config.room_id, 'Alert', 'Body', config.id, commit=True)
+    assert outbox.dispatch_once(_later())['failed'] == 1
+    mock_post.assert_not_called()
+
+def test_prune_keeps_pending_messages(config):
+    old = datetime.utcnow() - timedelta(days=outbox.OUTBOX_RETENTION_DAYS + 1)
+    for status in ('sent', 'failed', 'pending'):
+        db.session.add(RocketChatOutbox(room_id=config.room_id, config_id=config.id, text='x', status=status,
+                                        created_at=old, next_attempt_at=old))
+    outbox.enqueue(config.room_id, 'Alert', 'Body', config.id)
+    db.session.commit()
+    assert outbox.prune_outbox() == 2
+    assert outbox.get_queue_stats()['pending'] == 2
+
+def test_outbox_depth_endpoint(client, config):
+    outbox.enqueue(config.room_id, 'Alert', 'Body', config.id, commit=True)
+    assert client.get('/api/rocket-chat/outbox').status_code == 401
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    data = client.get('/api/rocket-chat/outbox').get_json()
+    assert data['queue']['pending'] == 1
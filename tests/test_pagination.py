@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+import pytest
+from core import manager
+from core.models import db, Proxy, BitLaunchAPI, BitLaunchVPS
+from core.pagination import PaginationError, decode_cursor, encode_cursor, page_items
+
+@pytest.fixture
+def user(make_user):
+    user = make_user('page')
+
+    soon = (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
+    later = (datetime.now() + timedelta(days=90)).strftime('%Y-%m-%d')
+    base = datetime(2025, 1, 1)
+    for i in range(25):
+        db.session.add(Proxy(user_id=user.id, name=f'p{i:02d}', ip=f'10.0.0.{i}', port='8080',
+                             status='active' if i % 2 else 'inactive', location='VN' if i < 10 else 'US',
+                             source='zingproxy' if i % 5 == 0 else 'manual',
+                             expire_at=soon if i < 5 else (later if i < 20 else None),
+                             # Trùng created_at để kiểm tra tie-break theo id
+                             created_at=base + timedelta(hours=i // 3)))
+    api = BitLaunchAPI(user_id=user.id, email='page@bitlaunch.io', api_key='key')
+    db.session.add(api)
+    db.session.flush()
+    for i in range(7):
+        db.session.add(BitLaunchVPS(api_id=api.id, server_id=i, name=f'bl-{i}',
+                                    status='running' if i < 4 else 'stopped', location='ams'))
+    db.session.commit()
+    return user
+
+def _walk(fetch, **kwargs):
+    items, cursor, pages = [], None, 0
+    while True:
+        page = fetch(cursor=cursor, **kwargs)
+        items.extend(page['items'])
+        pages += 1
+        cursor = page['next_cursor']
+        if not cursor:
+            return items, pages
+
+def test_cursor_round_trip_and_invalid_cursor():
+    assert decode_cursor(encode_cursor(['2025-01-01', 5])) == ['2025-01-01', 5]
+    with pytest.raises(PaginationError):
+        decode_cursor('not-a-cursor')
+
+def test_page_proxies_walks_every_row_once(user):
+    items, pages = _walk(lambda **kw: manager.page_proxies(user.id, **kw), limit=4)
+    assert pages == 7
+    assert len(items) == len({p['id'] for p in items}) == 25
+    # Mặc định mới nhất trước, cùng created_at thì id lớn trước
+    keys = [(p['created_at'], p['id']) for p in items]
+    assert keys == sorted(keys, reverse=True)
+
+def test_page_proxies_filters_and_nullable_sort(user):
+    items, _ = _walk(lambda **kw: manager.page_proxies(user.id, **kw), limit=3,
+                     sort='-expire_date', filters={'status': 'active', 'location': 'US'})
+    assert all(p['status'] == 'active' and p['location'] == 'US' for p in items)
+    assert len(items) == 7
+    # NULL xếp cuối kể cả khi giảm dần
+    assert [p['expire_at'] is None for p in items] == [False] * 5 + [True] * 2
+
+    expiring = manager.page_proxies(user.id, filters={'expiring_within': 7}, limit=100)
+    assert sorted(p['name'] for p in expiring['items']) == [f'p{i:02d}' for i in range(5)]
+    assert expiring['next_cursor'] is None
+
+    with pytest.raises(PaginationError):
+        manager.page_proxies(user.id, sort='password')
+
+def test_page_proxies_search_and_expired(user):
+    found = manager.page_proxies(user.id, filters={'q': 'P0'}, limit=100)['items']
+    assert sorted(p['name'] for p in found) == [f'p{i:02d}' for i in range(10)]
+    assert len(manager.page_proxies(user.id, filters={'q': '10.0.0.1'}, limit=100)['items']) == 11
+    # Ký tự wildcard của LIKE được escape
+    assert manager.page_proxies(user.id, filters={'q': '%'}, limit=100)['items'] == []
+
+    assert manager.page_proxies(user.id, filters={'expired': True}, limit=100)['items'] == []
+    manager.add_proxy(user.id, {'name': 'old', 'ip': '10.9.9.9', 'port': '80',
+                                'expire_at': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')})
+    assert [p['name'] for p in manager.page_proxies(user.id, filters={'expired': True})['items']] == ['old']
+
+def test_page_bitlaunch_vps(user):
+    page = manager.page_bitlaunch_vps(user.id, limit=2, sort='-name', filters={'status': 'running'})
+    assert [v['name'] for v in page['items']] == ['bl-3', 'bl-2']
+    rest = manager.page_bitlaunch_vps(user.id, cursor=page['next_cursor'], limit=2, sort='-name',
+                                      filters={'status': 'running'})
+    assert [v['name'] for v in rest['items']] == ['bl-1', 'bl-0']
+    assert rest['has_more'] is False
+
+def test_page_items_mixed_sources_keeps_order_across_pages():
+    items = [{'id': 'a', 'source': 'manual', 'name': 'x'}, {'id': 3, 'source': 'bitlaunch', 'name': 'x'},
+             {'id': 1, 'source': 'cloudfly', 'name': None}, {'id': 2, 'source': 'cloudfly', 'name': 'b'}]
+    for descending in (False, True):
+        full, _ = page_items(items, 'name', descending, limit=10)
+        walked, cursor = [], None
+        while True:
+            page, cursor = page_items(items, 'name', descending, cursor, limit=1)
+            walked.extend(page)
+            if not cursor:
+                break
+        assert walked == full
+        assert full[-1]['name'] is None
+
+def test_list_endpoints_paginate_when_limit_given(client, user):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+
+    data = client.get('/api/proxies?limit=10&include_secrets=0&source=zingproxy').get_json()
+    assert data['status'] == 'success' and data['has_more'] is False
+    assert len(data['proxies']) == 5
+
+    # Không có limit/cursor: giữ response cũ (toàn bộ list)
+    assert len(client.get('/api/proxies').get_json()['proxies']) == 25
+
+    data = client.get('/api/bitlaunch-vps?limit=5&status=stopped').get_json()
+    assert [v['name'] for v in data['vps']] == ['bl-4', 'bl-5', 'bl-6']
+
+    vps = client.get('/api/vps?limit=2&source=bitlaunch').get_json()
+    assert len(vps['vps']) == 2 and vps['has_more'] is True
+    assert client.get('/api/accounts?limit=5&source=bitlaunch').get_json()['accounts'][0]['username'] == 'page@bitlaunch.io'
+
+    assert client.get('/api/proxies?cursor=bogus').status_code == 400
+    assert client.get('/api/proxies?limit=5&sort=nope').status_code == 400
+    assert client.get('/api/proxies?expiring_within=x').status_code == 400
+
+    # Filter phía server mà các trang list dùng
+    assert [p['name'] for p in client.get('/api/proxies?limit=50&q=p2').get_json()['proxies']] == \
+        ['p24', 'p23', 'p22', 'p21', 'p20']
+    assert client.get('/api/accounts?limit=5&service=bitlaunch').get_json()['accounts'][0]['source'] == 'bitlaunch'
+    assert client.get('/api/vps?limit=5&source=bitlaunch&expired=1').get_json()['vps'] == []
+    assert client.get('/api/vps?limit=5&expires_after=-1').status_code == 400
+
+@pytest.mark.parametrize('sort', manager.PROXY_SORT_KEYS)
+def test_page_proxies_reads_in_index_order(user, sort):
+    """Mọi key sort đều đi theo index (user_id, key, id): không có bước sort tạm"""
+    from sqlalchemy import event
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    first = manager.page_proxies(user.id, limit=3, sort=f'-{sort}')
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        manager.page_proxies(user.id, cursor=first['next_cursor'], limit=3, sort=f'-{sort}')
+        manager.page_proxies(user.id, limit=3, sort=sort, filters={'status': 'active'})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert statements
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = ' '.join(row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters))
+            assert 'TEMP B-TREE' not in plan, (statement, plan)
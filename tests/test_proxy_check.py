@@ -0,0 +1,169 @@
+import time
+import socket
+import asyncio
+import pytest
+from core import proxy_check
+from core.api_clients import aio
+from core.models import db, Proxy, ProxyCheck
+from core.proxy_check import ProxyTarget, check_proxies
+from scripts.fake_proxy_server import FakeProxyServer
+
+@pytest.fixture(autouse=True)
+def allow_private(monkeypatch):
+    # Proxy giả chạy trên 127.0.0.1
+    monkeypatch.setattr(proxy_check, 'PROXY_CHECK_ALLOW_PRIVATE', True)
+
+def _closed_port() -> int:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+async def _with_server(coro_factory, **server_args):
+    server = FakeProxyServer(**server_args)
+    port = await server.start()
+    try:
+        return await coro_factory(port), server
+    finally:
+        await server.stop()
+
+def test_http_connect_and_socks5_handshakes():
+    closed = _closed_port()
+
+    async def run(port):
+        targets = [ProxyTarget(1, '127.0.0.1', str(port), username='u', password='p'),
+                   ProxyTarget(2, '127.0.0.1', str(port), type='SOCKS5', username='u', password='p'),
+                   ProxyTarget(3, '127.0.0.1', str(port), username='u', password='wrong'),
+                   ProxyTarget(4, '127.0.0.1', str(port), type='socks5', username='u', password='wrong'),
+                   ProxyTarget(5, '127.0.0.1', str(closed), port_socks5=str(port), username='u', password='p')]
+        return await check_proxies(targets, timeout=2)
+
+    results, server = asyncio.run(_with_server(run, username='u', password='p'))
+    by_key = {(r['proxy_id'], r['protocol']): r for r in results}
+    assert by_key[(1, 'http')]['success'] and by_key[(1, 'http')]['latency_ms'] is not None
+    assert by_key[(2, 'socks5')]['success']
+    assert by_key[(3, 'http')]['error'] == 'HTTP 407'
+    assert by_key[(4, 'socks5')]['error'] == 'SOCKS5 sai username/password'
+    # Port HTTP chết nhưng port SOCKS5 vẫn sống: mỗi giao thức một kết quả
+    assert by_key[(5, 'http')]['error'] == 'Kết nối bị từ chối'
+    assert by_key[(5, 'socks5')]['success']
+    assert server.established == 3
+
+def test_timeout_and_global_concurrency_cap(monkeypatch):
+    monkeypatch.setattr(proxy_check, 'PROXY_CHECK_CONCURRENCY', 4)
+
+    async def run(port):
+        slow = [ProxyTarget(i, '127.0.0.1', str(port)) for i in range(20)]
+        # Hai lượt kiểm tra chạy song song vẫn dùng chung giới hạn 4 kết nối
+        return await asyncio.gather(check_proxies(slow[:10], concurrency=10, timeout=2),
+                                    check_proxies(slow[10:], concurrency=10, timeout=2))
+
+    (first, second), server = asyncio.run(_with_server(run, latency=0.05))
+    assert len(first) == len(second) == 10 and all(r['success'] for r in first + second)
+    assert server.peak <= 4
+
+    async def timeout(port):
+        return await check_proxies([ProxyTarget(1, '127.0.0.1', str(port))], timeout=0.05)
+
+    results, _ = asyncio.run(_with_server(timeout, latency=0.5))
+    assert results[0]['error'] == 'Timeout'
+
+def test_internal_addresses_rejected_by_default(monkeypatch):
+    monkeypatch.setattr(proxy_check, 'PROXY_CHECK_ALLOW_PRIVATE', False)
+
+    async def run(port):
+        targets = [ProxyTarget(1, '127.0.0.1', str(port)), ProxyTarget(2, 'localhost', str(port), type='SOCKS5'),
+                   ProxyTarget(3, '10.0.0.1', '3128'), ProxyTarget(4, '169.254.169.254', '80'),
+                   ProxyTarget(5, '::ffff:192.168.1.1', '8080')]
+        return await check_proxies(targets, timeout=2)
+
+    results, server = asyncio.run(_with_server(run))
+    assert [r['error'] for r in results] == ['Địa chỉ nội bộ, không được kiểm tra'] * 5
+    assert server.connections == 0
+    assert not proxy_check._is_internal('8.8.8.8')
+
+def test_fake_server_benchmark_exceeds_10k_per_minute():
+    async def run(port):
+        targets = [ProxyTarget(i, '127.0.0.1', str(port), type='SOCKS5' if i % 2 else 'HTTP') for i in range(2000)]
+        started = time.perf_counter()
+        results = await check_proxies(targets, concurrency=200, timeout=5)
+        return results, time.perf_counter() - started
+
+    (results, elapsed), _ = asyncio.run(_with_server(run, latency=0.02))
+    assert sum(r['success'] for r in results) == 2000
+    assert len(results) / elapsed * 60 > 10000
+
+@pytest.fixture
+def fake_proxy():
+    server = FakeProxyServer(username='u', password='p')
+    port = aio.run(server.start())
+    yield port
+    aio.run(server.stop())
+
+@pytest.fixture
+def user(fake_proxy, make_user):
+    user = make_user('check')
+    dead = str(_closed_port())
+    for i in range(6):
+        proxy = Proxy(user_id=user.id, name=f'c{i}', ip='127.0.0.1', port=str(fake_proxy) if i < 4 else dead,
+                      type='SOCKS5' if i == 1 else 'HTTP', status='expired' if i == 3 else 'active')
+        proxy.username, proxy.password = 'u', 'p'
+        db.session.add(proxy)
+    db.session.commit()
+    return user
+
+def test_check_user_proxies_records_history_and_health(user, monkeypatch):
+    monkeypatch.setattr(proxy_check, 'PROXY_CHECK_TIMEOUT', 2)
+    for run in range(proxy_check.PROXY_CHECK_FAIL_THRESHOLD):
+        summary = proxy_check.check_user_proxies(user.id, batch_size=2)
+        # Proxy expired không được kiểm tra
+        assert summary['checked'] == 5 and summary['alive'] == 3 and summary['dead'] == 2
+    assert summary['health_changed'] == 2
+
+    proxies = {p.name: p for p in Proxy.query.filter_by(user_id=user.id)}
+    assert proxies['c0'].health == 'alive' and proxies['c0'].last_latency_ms is not None
+    assert proxies['c4'].health == 'dead' and proxies['c4'].check_failures == 3
+    # Checker không sửa status do user/provider đặt
+    assert proxies['c4'].status == 'active'
+    assert proxies['c3'].status == 'expired' and proxies['c3'].health is None and proxies['c3'].last_checked_at is None
+
+    history = proxy_check.get_check_history(proxies['c1'].id)
+    assert len(history['checks']) == 3 and history['success_rate'] == 1.0
+    assert history['checks'][0]['protocol'] == 'socks5'
+
+def test_check_shard_covers_only_its_ids(user, monkeypatch):
+    monkeypatch.setattr(proxy_check, 'PROXY_CHECK_TIMEOUT', 2)
+    # Chỉ kiểm tra proxy của user này (DB test có proxy giả của các file test khác)
+    checkable = proxy_check._checkable_query
+    monkeypatch.setattr(proxy_check, '_checkable_query', lambda: checkable().where(Proxy.user_id == user.id))
+    ids = [p.id for p in Proxy.query.filter_by(user_id=user.id) if p.status != 'expired']
+    ProxyCheck.query.filter(ProxyCheck.proxy_id.in_(ids)).delete()
+    proxy_check.check_shard(0, shards=2)
+    checked = {c.proxy_id for c in ProxyCheck.query.filter(ProxyCheck.proxy_id.in_(ids))}
+    assert checked == {i for i in ids if i % 2 == 0}
+
+def test_next_shard_cursor_visits_every_shard_in_order():
+    from core.models import SchedulerCursor
+    db.session.query(SchedulerCursor).delete()
+    assert [proxy_check.next_shard(shards=3) for _ in range(4)] == [0, 1, 2, 0]
+    # Giảm số shard: cursor cũ vẫn rơi vào một shard hợp lệ
+    assert proxy_check.next_shard(shards=1) == 0
+
+def test_check_endpoints(client, user, monkeypatch):
+    monkeypatch.setattr(proxy_check, 'PROXY_CHECK_TIMEOUT', 2)
+    assert client.post('/api/proxies/check').status_code == 401
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+
+    proxy = Proxy.query.filter_by(user_id=user.id, name='c0').one()
+    data = client.post('/api/proxies/check', json={'ids': [proxy.id]}).get_json()
+    assert data['status'] == 'success' and data['checked'] == 1 and data['alive'] == 1
+    assert client.post('/api/proxies/check', json={'ids': 'all'}).status_code == 400
+
+    data = client.get(f'/api/proxies/{proxy.id}/checks').get_json()
+    assert data['checks'][0]['success'] is True and data['avg_latency_ms'] is not None
+    assert client.get('/api/proxies/999999/checks').status_code == 404
+
+    monkeypatch.setattr(proxy_check, 'MANUAL_CHECK_LIMIT', 2)
+    assert client.post('/api/proxies/check').status_code == 400
@@ -0,0 +1,99 @@
+import io
+import time
+import pytest
+from core import proxy_import
+from core.models import db, Proxy
+
+@pytest.fixture
+def user(make_user):
+    user = make_user('import')
+    db.session.add(Proxy(user_id=user.id, name='old', ip='10.2.0.1', port='8080'))
+    db.session.commit()
+    return user
+
+def _import(user, text, **kwargs):
+    return proxy_import.import_proxies(user.id, io.BytesIO(text.encode('utf-8')), **kwargs)
+
+def test_txt_import_dedups_and_reports_lines(user):
+    text = ('10.2.0.1:8080\n'            # trùng proxy đã có
+            '10.2.0.2:8080:u2:p2\n'
+            '\n'
+            '# comment\n'
+            '10.2.0.2:8080\n'            # trùng trong file
+            '300.1.1.1:80\n'
+            '10.2.0.3:70000\n'
+            '10.2.0.4\n'
+            '10.2.0.5:3128:u5:p:5\n')
+    result = _import(user, text, default_type='SOCKS5')
+    assert result['imported'] == 2 and result['duplicates'] == 2 and result['invalid'] == 3
+    assert [e['line'] for e in result['errors']] == [8, 6, 7]  # lỗi parse báo ngay, lỗi validate theo lô
+
+    proxy = Proxy.query.filter_by(user_id=user.id, ip='10.2.0.5').one()
+    # Password có thể chứa dấu ':'
+    assert proxy.username == 'u5' and proxy.password == 'p:5'
+    assert proxy.type == 'SOCKS5' and proxy.name == '10.2.0.5:3128' and proxy.source == 'manual'
+
+def test_csv_import_round_trips_export_columns(user):
+    text = ('﻿id,name,ip,port,username,password,type,expire_at,source,auto_renew,extra\n'
+            '9,"VN, 1",10.2.1.1,8000,u,p,HTTPS,2030-01-31,zingproxy,true,x\n'
+            ',,10.2.1.2,abc,,,,,,,\n')
+    result = _import(user, text)
+    assert result['imported'] == 1
+    assert result['errors'] == [{'line': 3, 'error': 'Port không hợp lệ: abc'}]
+    proxy = Proxy.query.filter_by(user_id=user.id, ip='10.2.1.1').one()
+    assert proxy.name == 'VN, 1' and proxy.password == 'p' and proxy.type == 'HTTPS'
+    assert proxy.source == 'manual' and proxy.auto_renew is True
+    assert proxy.expire_date.isoformat() == '2030-01-31'
+
+    assert _import(user, 'name,host\nx,1.1.1.1\n')['errors'][0]['line'] == 1
+    with pytest.raises(ValueError):
+        _import(user, '1.1.1.1:80', fmt='xml')
+
+def test_invalid_type_and_long_fields_reported_per_line(user):
+    text = ('name,ip,port,type,note\n'
+            'ok,10.2.3.1,80, socks4 ,\n'
+            'bad-type,10.2.3.2,80,FTP,\n'
+            f'{"n" * 129},10.2.3.3,80,,\n'
+            f'long-note,10.2.3.4,80,HTTP,{"x" * 513}\n')
+    result = _import(user, text)
+    assert result['imported'] == 1
+    assert result['errors'] == [{'line': 3, 'error': 'Loại proxy không hợp lệ: FTP'},
+                                {'line': 4, 'error': 'Cột name dài quá 128 ký tự'},
+                                {'line': 5, 'error': 'Cột note dài quá 512 ký tự'}]
+    assert Proxy.query.filter_by(user_id=user.id, ip='10.2.3.1').one().type == 'SOCKS4'
+
+def test_inserts_in_batches_and_truncates_errors(user, monkeypatch):
+    calls = []
+    real = proxy_import._insert_batch
+    monkeypatch.setattr(proxy_import, '_insert_batch', lambda uid, batch: calls.append(len(batch)) or real(uid, batch))
+    monkeypatch.setattr(proxy_import, 'MAX_REPORTED_ERRORS', 3)
+    text = ''.join(f'10.3.{i // 250}.{i % 250}:80\n' for i in range(25)) + 'bad\n' * 5
+    result = _import(user, text, batch_size=10)
+    assert calls == [10, 10, 5]
+    assert result['imported'] == 25 and result['invalid'] == 5
+    assert len(result['errors']) == 3 and result['errors_truncated'] is True
+
+def test_large_import_is_fast(user):
+    text = ''.join(f'10.{i // 62500}.{i // 250 % 250}.{i % 250}:{8000 + i % 1000}:user:pass\n' for i in range(20000))
+    started = time.perf_counter()
+    result = _import(user, text)
+    assert result['imported'] == 20000
+    assert time.perf_counter() - started < 10
+    assert Proxy.query.filter_by(user_id=user.id).count() == 20001
+
+def test_import_endpoint(client, user):
+    assert client.post('/api/proxies/import').status_code == 401
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+
+    response = client.post('/api/proxies/import', data={
+        'file': (io.BytesIO(b'10.2.2.1:80\n10.2.2.2:80:a:b\nnope\n'), 'proxies.txt'), 'type': 'socks5'})
+    data = response.get_json()
+    assert data['status'] == 'success' and data['imported'] == 2 and data['errors'][0]['line'] == 3
+    assert Proxy.query.filter_by(user_id=user.id, ip='10.2.2.1').one().type == 'SOCKS5'
+
+    response = client.post('/api/proxies/import?format=csv', data=b'ip,port\n10.2.2.3,81\n',
+                           content_type='text/csv')
+    assert response.get_json()['imported'] == 1
+    assert client.post('/api/proxies/import').status_code == 400
+    assert client.post('/api/proxies/import?format=xml', data=b'x').status_code == 400
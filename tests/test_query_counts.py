@@ -0,0 +1,54 @@
+import pytest
+from core.models import db, BitLaunchAPI, BitLaunchVPS, CloudFlyAPI, CloudFlyVPS, ZingProxyAccount, ZingProxy
+
+def _seed(user, accounts, items_per_account=3):
+    for i in range(accounts):
+        api = BitLaunchAPI(user_id=user.id, email=f'bl{i}@{user.username}.io', api_key='key')
+        cf = CloudFlyAPI(user_id=user.id, email=f'cf{i}@{user.username}.io', api_token='token')
+        acc = ZingProxyAccount(user_id=user.id, email=f'zp{i}@{user.username}.io', access_token='token', balance=1)
+        db.session.add_all([api, cf, acc])
+        db.session.flush()
+        for j in range(items_per_account):
+            db.session.add(BitLaunchVPS(api_id=api.id, server_id=j, name=f'bl-{i}-{j}'))
+            db.session.add(CloudFlyVPS(api_id=cf.id, instance_id=f'cf-{i}-{j}', name=f'cf-{i}-{j}'))
+            db.session.add(ZingProxy(account_id=acc.id, proxy_id=f'zp-{user.id}-{i}-{j}', ip=f'10.0.{i}.{j}',
+                                     port='8080', expire_at='2099-01-01'))
+    db.session.commit()
+
+@pytest.fixture
+def login(client):
+    def _login(user):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['role'] = user.role
+    return _login
+
+@pytest.mark.parametrize('url', [
+    '/api/bitlaunch-vps',
+    '/api/cloudfly/vps',
+    '/api/zingproxy-statistics',
+])
+def test_listing_query_count_does_not_grow_with_accounts(client, login, assert_max_queries, make_user, url):
+    small = make_user('qc_small')
+    large = make_user('qc_large')
+    _seed(small, accounts=1)
+    _seed(large, accounts=6)
+
+    login(small)
+    with assert_max_queries(5) as small_counter:
+        assert client.get(url).status_code == 200
+
+    login(large)
+    with assert_max_queries(small_counter.count) as large_counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert large_counter.count == small_counter.count
+
+def test_import_zingproxy_query_count(client, login, assert_max_queries, make_user):
+    user = make_user('qc_import')
+    _seed(user, accounts=6)
+    login(user)
+
+    with assert_max_queries(6):
+        response = client.post('/api/proxies/import-zingproxy')
+    assert response.get_json()['imported_count'] == 18
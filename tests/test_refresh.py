@@ -0,0 +1,91 @@
+import time
+import threading
+import pytest
+from core.refresh import RefreshEngine, RefreshTask
+
+@pytest.fixture
+def engine():
+    engine = RefreshEngine(max_workers=8, provider_limits={'slow': 2})
+    yield engine
+    engine.shutdown()
+
+def test_run_returns_results_in_input_order(engine):
+    tasks = [RefreshTask(i, 'bitlaunch', lambda x: x * 2, i) for i in range(10)]
+    results = engine.run(tasks)
+    assert [r.key for r in results] == list(range(10))
+    assert [r.value for r in results] == [i * 2 for i in range(10)]
+
+def test_run_captures_errors(engine):
+    def boom():
+        raise ValueError('API key invalid')
+
+    results = engine.run([RefreshTask('ok', 'cloudfly', lambda: 1), RefreshTask('bad', 'cloudfly', boom)])
+    assert results[0].ok and results[0].value == 1
+    assert not results[1].ok
+    assert isinstance(results[1].error, ValueError)
+
+def test_wall_time_close_to_slowest_call(engine):
+    tasks = [RefreshTask(i, 'bitlaunch', time.sleep, 0.2) for i in range(8)]
+    started = time.monotonic()
+    engine.run(tasks)
+    # Chạy tuần tự sẽ mất 1.6s
+    assert time.monotonic() - started < 0.6
+
+def test_provider_limit_is_respected(engine):
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+
+    def call():
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+
+    engine.run([RefreshTask(i, 'slow', call) for i in range(6)])
+    assert state['peak'] == 2
+
+def test_empty_task_list(engine):
+    assert engine.run([]) == []
+
+def test_sync_guard_skips_in_flight_and_recent_runs():
+    from core.refresh import SyncGuard
+    guard = SyncGuard(min_interval=60)
+    assert guard.begin('bitlaunch') is None
+    assert guard.begin('bitlaunch') == SyncGuard.IN_FLIGHT
+    assert guard.begin('cloudfly') is None
+    guard.finish('bitlaunch')
+    guard.finish('cloudfly', ok=False)
+    assert guard.begin('bitlaunch') == SyncGuard.RECENT
+    assert guard.begin('bitlaunch', force=True) is None
+    # Lần chạy thất bại không chặn trigger kế tiếp
+    assert guard.begin('cloudfly') is None
+
+def test_deadline_cancels_calls_not_started(engine):
+    from core.api_clients.resilience import DeadlineExceededError, remaining_time
+    seen = []
+
+    def call():
+        seen.append(remaining_time())
+        time.sleep(0.2)
+
+    results = engine.run([RefreshTask(i, 'slow', call) for i in range(6)], timeout=0.3)
+    # Giới hạn 2 call song song: 2 lượt đầu chạy, phần còn lại bị hủy khi hết giờ
+    assert sum(r.ok for r in results) == 4
+    assert all(isinstance(r.error, DeadlineExceededError) for r in results if not r.ok)
+    assert all(0 < remaining <= 0.3 for remaining in seen)
+
+def test_run_async_stays_within_rate_limit_wait(engine, monkeypatch):
+    from core.api_clients import resilience
+    # 20 token/giây, max_wait 0.5s: chỉ ~15 lời gọi xếp hàng được, 100 task cần ~5s
+    guard = resilience.ProviderGuard('limited', rate=20, burst=5, max_wait=0.5)
+    monkeypatch.setitem(resilience._guards, 'limited', guard)
+
+    async def call(i):
+        await guard.acquire_async()
+        return i
+
+    results = engine.run_async([RefreshTask(i, 'limited', call, i) for i in range(100)], timeout=30)
+    assert [r.error for r in results if not r.ok] == []
+    assert guard.stats()['rejected'] == 0
@@ -0,0 +1,151 @@
+import time
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pytest
+import requests
+from core.api_clients import transport, resilience
+from core.api_clients.resilience import (CircuitBreaker, DeadlineExceededError, ProviderGuard,
+                                        ProviderUnavailableError, RequestPolicy, TokenBucket)
+
+class _FailingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    hits = 0
+    delay = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        time.sleep(self.delay)
+        body = b'{"error": "down"}'
+        self.send_response(503)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def failing_server():
+    _FailingHandler.hits = 0
+    _FailingHandler.delay = 0
+    httpd = HTTPServer(('127.0.0.1', 0), _FailingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    transport.close_all()
+    resilience.reset_all()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    transport.close_all()
+    resilience.reset_all()
+    httpd.shutdown()
+
+def test_token_bucket_spreads_requests_beyond_burst():
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02)
+    assert waits[3] == pytest.approx(0.2, abs=0.02)
+
+def test_guard_throttles_shared_callers():
+    guard = ProviderGuard('test', rate=20, burst=1)
+    started = time.monotonic()
+    threads = [threading.Thread(target=guard.acquire) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 5 request, burst 1, 20/giây -> lần cuối phải chờ ~0.2s
+    assert time.monotonic() - started >= 0.18
+
+def test_guard_rejects_when_wait_exceeds_budget():
+    guard = ProviderGuard('test', rate=1, burst=1, max_wait=0.5)
+    guard.acquire()
+    with pytest.raises(ProviderUnavailableError):
+        guard.acquire()
+    assert guard.stats()['rejected'] == 1
+
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.record_failure() is True
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.12)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    # Chỉ một lời gọi thử ở half-open
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.12)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_open_circuit_fails_fast_without_calling_provider(failing_server, monkeypatch):
+    monkeypatch.setattr(resilience, 'CIRCUIT_FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(resilience, 'DEFAULT_POLICY', (5, 20, 0))
+    for _ in range(3):
+        assert transport.request('GET', f'{failing_server}/ping').status_code == 503
+    assert _FailingHandler.hits == 3
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.request('GET', f'{failing_server}/ping')
+    assert _FailingHandler.hits == 3
+
+    stats = resilience.get_stats()[failing_server]
+    assert stats['state'] == CircuitBreaker.OPEN
+    assert stats['rejected'] == 1
+
+def test_provider_hosts_map_to_provider_names():
+    assert resilience.provider_name('https://api.cloudfly.vn') == 'cloudfly'
+    assert resilience.provider_name('https://app.bitlaunch.io') == 'bitlaunch'
+    assert resilience.provider_name('http://127.0.0.1:5000') == 'http://127.0.0.1:5000'
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(resilience, 'DEFAULT_POLICY', (1, 1, 2))
+    # backoff_base, backoff_max nhỏ để test chạy nhanh
+    monkeypatch.setattr(RequestPolicy.__init__, '__defaults__', (0.01, 0.05))
+
+def test_idempotent_requests_are_retried(failing_server, fast_retries):
+    assert transport.request('GET', f'{failing_server}/ping').status_code == 503
+    assert _FailingHandler.hits == 3
+    assert resilience.get_stats()[failing_server]['retries'] == 2
+
+def test_post_is_not_retried(failing_server, fast_retries):
+    assert transport.request('POST', f'{failing_server}/ping', json={}).status_code == 503
+    assert _FailingHandler.hits == 1
+
+def test_policy_read_timeout_applies_when_client_passes_none(failing_server, monkeypatch):
+    monkeypatch.setattr(resilience, 'DEFAULT_POLICY', (1, 0.2, 0))
+    _FailingHandler.delay = 0.5
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        transport.request('GET', f'{failing_server}/slow')
+    assert time.monotonic() - started < 0.45
+
+def test_deadline_caps_timeout_and_stops_retries(failing_server, monkeypatch):
+    monkeypatch.setattr(resilience, 'DEFAULT_POLICY', (5, 20, 5))
+    _FailingHandler.delay = 0.5
+    started = time.monotonic()
+    with resilience.deadline(time.monotonic() + 0.2):
+        with pytest.raises(requests.exceptions.Timeout):
+            transport.request('GET', f'{failing_server}/slow')
+        assert time.monotonic() - started < 0.45
+        with pytest.raises(DeadlineExceededError):
+            transport.request('GET', f'{failing_server}/slow')
+    assert resilience.remaining_time() is None
+
+def test_backoff_has_jitter_and_cap():
+    policy = RequestPolicy(1, 1, 5, backoff_base=1, backoff_max=4)
+    delays = [policy.backoff(10) for _ in range(50)]
+    assert all(0 <= d <= 4 for d in delays)
+    assert len(set(delays)) > 1
+    assert policy.retries_for('get') == 5
+    assert policy.retries_for('POST') == 0
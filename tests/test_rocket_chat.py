@@ -38,7 +38,7 @@ def sample_accounts():
 
 @pytest.fixture
 def mock_rocket_chat_client():
-    with patch('requests.post') as mock_post:
+    with patch('requests.Session.post') as mock_post:
         client = RocketChatClient('test_token', 'test_user_id')
         yield client
 
@@ -48,7 +48,7 @@ def test_rocket_chat_client_init():
     assert client.user_id == 'test_user_id'
     assert client.base_url == 'https://rocket.int.team/api/v1'
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_send_message_success(mock_post):
     mock_response = Mock()
     mock_response.status_code = 200
@@ -59,7 +59,7 @@ def test_send_message_success(mock_post):
     result = client.send_message('test_room', 'Test message')
     assert result is True
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_send_message_error(mock_post):
     mock_response = Mock()
     mock_response.status_code = 401
@@ -70,7 +70,7 @@ def test_send_message_error(mock_post):
     result = client.send_message('test_room', 'Test message')
     assert result is False
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_send_formatted_message_success(mock_post):
     mock_response = Mock()
     mock_response.status_code = 200
@@ -86,7 +86,7 @@ def test_send_formatted_message_success(mock_post):
     )
     assert result is True
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_get_channels_success(mock_get):
     mock_response = Mock()
     mock_response.status_code = 200
@@ -103,7 +103,7 @@ def test_get_channels_success(mock_get):
     assert len(result) == 2
     assert result[0]['name'] == 'general'
 
-@patch('requests.get')
+@patch('requests.Session.get')
 def test_get_groups_success(mock_get):
     mock_response = Mock()
     mock_response.status_code = 200
@@ -38,9 +38,9 @@ def test_scheduler_jobs_registration():
         'expiry_warnings',
         'daily_summary',
         'rocketchat_daily_notifications',
-        'bitlaunch_update',
-        'zingproxy_update',
-        'cloudfly_update'
+        'bitlaunch_sync',
+        'zingproxy_sync',
+        'cloudfly_sync'
     ]
     
     for job_id in expected_jobs:
@@ -116,13 +116,10 @@ def test_bitlaunch_update_jobs(mock_update_info, mock_update_vps):
     """Test các jobs cập nhật BitLaunch"""
     scheduler = start_scheduler()
     
-    # Test job cập nhật API info
-    api_job = scheduler.get_job('bitlaunch_update')
-    assert api_job is not None
-    
-    # Test job cập nhật VPS list
-    vps_job = scheduler.get_job('bitlaunch_vps_update')
-    assert vps_job is not None
+    # Một pipeline cập nhật cả API info và VPS list
+    assert scheduler.get_job('bitlaunch_sync') is not None
+    assert scheduler.get_job('bitlaunch_update') is None
+    assert scheduler.get_job('bitlaunch_vps_update') is None
     
     scheduler.shutdown()
 
@@ -132,13 +129,9 @@ def test_zingproxy_update_jobs(mock_update_list, mock_update_account):
     """Test các jobs cập nhật ZingProxy"""
     scheduler = start_scheduler()
     
-    # Test job cập nhật account
-    account_job = scheduler.get_job('zingproxy_update')
-    assert account_job is not None
-    
-    # Test job cập nhật proxy list
-    proxy_job = scheduler.get_job('zingproxy_update_interval')
-    assert proxy_job is not None
+    # Một pipeline cập nhật cả account và proxy list
+    assert scheduler.get_job('zingproxy_sync') is not None
+    assert scheduler.get_job('zingproxy_proxy_sync') is None
     
     scheduler.shutdown()
 
@@ -148,13 +141,9 @@ def test_cloudfly_update_jobs(mock_update_vps, mock_update_info):
     """Test các jobs cập nhật CloudFly"""
     scheduler = start_scheduler()
     
-    # Test job cập nhật API info
-    api_job = scheduler.get_job('cloudfly_update')
-    assert api_job is not None
-    
-    # Test job cập nhật VPS
-    vps_job = scheduler.get_job('cloudfly_vps_update')
-    assert vps_job is not None
+    # Một pipeline cập nhật cả API info và VPS
+    assert scheduler.get_job('cloudfly_sync') is not None
+    assert scheduler.get_job('cloudfly_vps_update') is None
     
     scheduler.shutdown()
 
@@ -178,10 +167,7 @@ def test_scheduler_interval_jobs():
     interval_jobs = [
         'expiry_warnings',  # 5 phút
         'daily_summary',    # 5 phút
-        'zingproxy_proxy_sync',  # 2 giờ
-        'zingproxy_update_interval',  # 6 giờ
-        'cloudfly_update_interval',   # 6 giờ
-        'cloudfly_vps_update_interval'  # 6 giờ
+        'stale_api_updates_check'  # 6 giờ
     ]
     
     for job_id in interval_jobs:
@@ -197,13 +183,9 @@ def test_scheduler_cron_jobs():
     
     # Kiểm tra cron jobs
     cron_jobs = [
-        'auto_sync_zingproxy_proxies',  # 2:00 sáng
-        'bitlaunch_update',             # 6:00 sáng
-        'bitlaunch_vps_update',         # 6:30 sáng
-        'zingproxy_update',             # 7:00 sáng
-        'cloudfly_update',              # 8:00 sáng
-        'zingproxy_proxy_sync_daily',   # 8:00 sáng
-        'cloudfly_vps_update',          # 8:30 sáng
+        'bitlaunch_sync',               # mỗi 6 giờ
+        'zingproxy_sync',               # mỗi 2 giờ
+        'cloudfly_sync',                # mỗi 6 giờ
         'rocketchat_daily_notifications',  # 9:00 sáng
         'weekly_report'                 # 10:00 sáng chủ nhật
     ]
@@ -264,4 +246,220 @@ def test_scheduler_restart():
     assert scheduler2.running
     assert len(scheduler2.get_jobs()) > 0
     
-    scheduler2.shutdown() 
\ No newline at end of file
+    scheduler2.shutdown()
+
+@pytest.fixture
+def notify_user(make_user):
+    user = make_user('notify', notify_hour=7, notify_minute=15)
+    manager.add_rocket_chat_config(user.id, 'token', 'rocket-user', 'room-1234567890')
+    return user
+
+@pytest.fixture
+def paused_scheduler(monkeypatch, app):
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from core import scheduler as scheduler_module
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    monkeypatch.setattr(scheduler_module, '_active_scheduler', scheduler)
+    monkeypatch.setattr(scheduler_module, '_app', app)
+    yield scheduler
+    scheduler.shutdown()
+
+def test_user_notification_job_follows_notify_time(client, notify_user, paused_scheduler):
+    """Mỗi user một cron job, đổi giờ/phút qua API thì job được lên lịch lại"""
+    from core.scheduler import schedule_user_notifications, notification_job_id
+    schedule_user_notifications(paused_scheduler)
+    job = paused_scheduler.get_job(notification_job_id(notify_user.id))
+    assert (job.next_run_time.hour, job.next_run_time.minute) == (7, 15)
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = notify_user.id
+    assert client.post('/api/notify-hour', json={'notify_hour': 21}).status_code == 200
+    assert client.post('/api/notify-minute', json={'notify_minute': 45}).status_code == 200
+
+    job = paused_scheduler.get_job(notification_job_id(notify_user.id))
+    assert (job.next_run_time.hour, job.next_run_time.minute) == (21, 45)
+
+def test_notification_reconcile_applies_changes_from_other_workers(client, notify_user, paused_scheduler,
+                                                                   monkeypatch):
+    """Đổi giờ ở worker không phải leader: job reconcile của leader áp dụng thay đổi từ DB"""
+    from core import scheduler as scheduler_module
+    from core.scheduler import schedule_user_notifications, notification_job_id, reconcile_user_notifications_job
+    schedule_user_notifications(paused_scheduler)
+    job_id = notification_job_id(notify_user.id)
+    paused_scheduler.add_job(print, 'cron', hour=1, id=notification_job_id(999999))
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = notify_user.id
+    monkeypatch.setattr(scheduler_module, '_active_scheduler', None)
+    assert client.post('/api/notify-hour', json={'notify_hour': 22}).status_code == 200
+    assert paused_scheduler.get_job(job_id).next_run_time.hour == 7
+
+    monkeypatch.setattr(scheduler_module, '_active_scheduler', paused_scheduler)
+    reconcile_user_notifications_job()
+    job = paused_scheduler.get_job(job_id)
+    assert (job.next_run_time.hour, job.next_run_time.minute) == (22, 15)
+    # User không còn Rocket Chat config thì job bị xóa
+    assert paused_scheduler.get_job(notification_job_id(999999)) is None
+    # Không đổi gì thì job giữ nguyên
+    next_run = job.next_run_time
+    reconcile_user_notifications_job()
+    assert paused_scheduler.get_job(job_id).next_run_time == next_run
+
+def test_notification_reconcile_skips_when_nothing_changed(client, notify_user, paused_scheduler, monkeypatch):
+    """users/rocket_chat_configs không đổi thì không đọc lại user và job store"""
+    from core import scheduler as scheduler_module
+    from core.scheduler import reconcile_user_notifications_job
+    calls = []
+    real = scheduler_module.schedule_user_notifications
+    monkeypatch.setattr(scheduler_module, 'schedule_user_notifications',
+                        lambda scheduler: calls.append(1) or real(scheduler))
+
+    assert reconcile_user_notifications_job() >= 1
+    assert reconcile_user_notifications_job() is None
+    assert len(calls) == 1
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = notify_user.id
+    monkeypatch.setattr(scheduler_module, '_active_scheduler', None)
+    assert client.post('/api/notify-hour', json={'notify_hour': 23}).status_code == 200
+    monkeypatch.setattr(scheduler_module, '_active_scheduler', paused_scheduler)
+    reconcile_user_notifications_job()
+    assert len(calls) == 2
+
+@patch('core.notifier.send_expiry_rocketchat')
+def test_user_notification_job_sends_without_time_check(mock_send, notify_user, paused_scheduler):
+    from core.scheduler import send_user_expiry_warnings
+    send_user_expiry_warnings(notify_user.id)
+    assert [c.kwargs['item_type'] for c in mock_send.call_args_list] == ['VPS', 'Account']
+
+def test_job_runs_recorded_with_duration_and_items(paused_scheduler):
+    """Mỗi lần job chạy xong/lỗi/bị lỡ được ghi vào job_runs"""
+    from datetime import datetime, timezone
+    from apscheduler.events import JobSubmissionEvent, JobExecutionEvent, EVENT_JOB_SUBMITTED, \
+        EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+    from core.models import db, JobRun
+    from core.scheduler import _on_job_submitted, _on_job_finished
+    db.create_all()
+    JobRun.query.filter(JobRun.job_id.like('test_job%')).delete(synchronize_session=False)
+    db.session.commit()
+
+    run_time = datetime(2030, 1, 1, 6, 0, tzinfo=timezone.utc)
+    _on_job_submitted(JobSubmissionEvent(EVENT_JOB_SUBMITTED, 'test_job', 'default', [run_time]))
+    _on_job_finished(JobExecutionEvent(EVENT_JOB_EXECUTED, 'test_job', 'default', run_time, retval=12))
+    _on_job_finished(JobExecutionEvent(EVENT_JOB_ERROR, 'test_job', 'default', run_time,
+                                       exception=RuntimeError('boom')))
+    _on_job_finished(JobExecutionEvent(EVENT_JOB_MISSED, 'test_job', 'default', run_time))
+
+    # Job đối chiếu thông báo chạy mỗi phút nên không được ghi lại
+    _on_job_submitted(JobSubmissionEvent(EVENT_JOB_SUBMITTED, 'notification_reconcile', 'default', [run_time]))
+    _on_job_finished(JobExecutionEvent(EVENT_JOB_EXECUTED, 'notification_reconcile', 'default', run_time))
+    assert JobRun.query.filter_by(job_id='notification_reconcile', scheduled_run_time=run_time.replace(tzinfo=None)) \
+        .count() == 0
+
+    runs = {r.status: r for r in JobRun.query.filter_by(job_id='test_job').all()}
+    assert runs['success'].items_processed == 12
+    assert runs['success'].duration_ms is not None
+    assert runs['success'].scheduled_run_time == datetime(2030, 1, 1, 6, 0)
+    assert runs['error'].error == 'boom'
+    assert runs['missed'].finished_at is None
+
+def test_job_run_stats_percentiles_and_trend(app):
+    from datetime import datetime, timedelta
+    from core.models import db, JobRun
+    from core.scheduler import get_job_run_stats
+    db.create_all()
+    JobRun.query.filter(JobRun.job_id.like('test_job%')).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    for i in range(20):
+        db.session.add(JobRun(job_id='test_job_stats', status='success', started_at=now - timedelta(minutes=20 - i),
+                              duration_ms=(i + 1) * 100, items_processed=i))
+    db.session.add(JobRun(job_id='test_job_stats', status='error', started_at=now, duration_ms=50))
+    db.session.add(JobRun(job_id='test_job_stats', status='missed', started_at=now))
+    # Ngoài cửa sổ thống kê
+    db.session.add(JobRun(job_id='test_job_stats', status='success', started_at=now - timedelta(days=30),
+                          duration_ms=999999))
+    db.session.commit()
+
+    stats = get_job_run_stats()['test_job_stats']
+    assert (stats['runs'], stats['errors'], stats['misfires']) == (21, 1, 1)
+    assert stats['p50_ms'] == 1000
+    assert stats['p95_ms'] == 1900
+    assert stats['items_trend'] == list(range(10, 20))
+    assert stats['last_status'] == 'error'
+
+def test_prune_job_runs_keeps_recent_history(app):
+    from datetime import datetime, timedelta
+    from core.models import db, JobRun
+    from core.scheduler import prune_job_runs, JOB_RUNS_RETENTION_DAYS
+    db.create_all()
+    JobRun.query.filter(JobRun.job_id.like('test_job%')).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    for days in (0, JOB_RUNS_RETENTION_DAYS - 1, JOB_RUNS_RETENTION_DAYS + 1, 400):
+        db.session.add(JobRun(job_id='test_job_prune', status='success', started_at=now - timedelta(days=days)))
+    db.session.commit()
+    assert prune_job_runs() >= 2
+    assert JobRun.query.filter_by(job_id='test_job_prune').count() == 2
+
+def test_scheduler_status_endpoint(client, notify_user):
+    with client.session_transaction() as sess:
+        sess['user_id'] = notify_user.id
+    data = client.get('/api/scheduler/status').get_json()
+    assert data['status'] == 'success'
+    assert 'job_stats' in data and 'leader' in data
+
+@pytest.fixture
+def zingproxy_accounts(notify_user):
+    from core.models import db, ZingProxyAccount
+    ZingProxyAccount.query.delete()
+    accs = [ZingProxyAccount(user_id=notify_user.id, email=f'zp{i}@example.com', access_token=f'token-{i}')
+            for i in range(2)]
+    db.session.add_all(accs)
+    db.session.commit()
+    return accs
+
+def test_zingproxy_sync_fetches_each_account_once(zingproxy_accounts, paused_scheduler, monkeypatch):
+    """Balance và proxy dùng chung một lần fetch; trigger chồng nhau bị bỏ qua"""
+    from core import scheduler as scheduler_module
+    from core.refresh import SyncGuard
+    monkeypatch.setattr(scheduler_module, 'ASYNC_SYNC', 'false')
+    proxies = [{'proxy_id': 'p1', 'ip': '10.0.0.1', 'port': 8080, 'username': 'u', 'password': 'p',
+                'status': 'active', 'expire_at': '2099-01-01'}]
+    with patch.object(scheduler_module, '_sync_guard', SyncGuard(min_interval=3600)), \
+         patch('core.scheduler.ZingProxyClient') as client_cls:
+        client = client_cls.return_value
+        client.get_account_details.return_value = {'balance': 5}
+        client.get_all_active_proxies.return_value = proxies
+        assert scheduler_module.sync_zingproxy() == 2
+        assert client.get_all_active_proxies.call_count == 2
+        # Tài khoản vừa cập nhật balance nên lần ép chạy tiếp theo chỉ lấy proxy
+        assert scheduler_module.sync_zingproxy() is None
+        assert scheduler_module.sync_zingproxy(force=True) == 2
+    assert client.get_account_details.call_count == 2
+    assert client.get_all_active_proxies.call_count == 4
+
+def test_sync_apply_error_only_fails_that_account(zingproxy_accounts, paused_scheduler, monkeypatch):
+    """Một tài khoản ghi lỗi bị rollback về savepoint, các tài khoản khác vẫn được commit"""
+    from core import scheduler as scheduler_module
+    from core.models import ZingProxyAccount
+    from core.refresh import SyncGuard
+    monkeypatch.setattr(scheduler_module, 'ASYNC_SYNC', 'false')
+    apply = scheduler_module._apply_zingproxy
+    broken = zingproxy_accounts[0].id
+
+    def flaky_apply(acc, balance, items):
+        changed = apply(acc, balance, items)
+        if acc.id == broken:
+            raise ValueError('bad payload')
+        return changed
+
+    monkeypatch.setattr(scheduler_module, '_apply_zingproxy', flaky_apply)
+    with patch.object(scheduler_module, '_sync_guard', SyncGuard(min_interval=0)), \
+         patch.object(scheduler_module, '_send_api_error_alert') as error_alert, \
+         patch('core.scheduler.ZingProxyClient') as client_cls:
+        client_cls.return_value.get_account_details.return_value = {'balance': 5}
+        client_cls.return_value.get_all_active_proxies.return_value = []
+        scheduler_module.sync_zingproxy()
+    balances = {acc.id: acc.balance for acc in ZingProxyAccount.query}
+    assert balances[broken] != 5 and balances[zingproxy_accounts[1].id] == 5
+    assert [c.args[3] for c in error_alert.call_args_list] == ['bad payload']
@@ -0,0 +1,45 @@
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pytest
+from core.api_clients import transport
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), _OkHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    transport.close_all()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    transport.close_all()
+    httpd.shutdown()
+
+def test_same_origin_shares_session():
+    a = transport.get_session('https://api.cloudfly.vn/user/info')
+    b = transport.get_session('https://API.cloudfly.vn')
+    c = transport.get_session('https://api.zingproxy.com')
+    assert a is b
+    assert a is not c
+
+def test_connections_are_reused(server):
+    for _ in range(5):
+        assert transport.request('GET', f'{server}/ping').json() == {'ok': True}
+
+    stats = transport.get_stats()
+    host = stats['hosts'][server]
+    assert host['requests'] == 5
+    assert host['handshakes'] == 1
+    assert host['reuse_ratio'] == 0.8
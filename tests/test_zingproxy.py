@@ -8,12 +8,12 @@ TOKEN = 'testtoken'
 
 @pytest.fixture
 def mock_post():
-    with patch('requests.post') as mock:
+    with patch('requests.Session.post') as mock:
         yield mock
 
 @pytest.fixture
 def mock_get():
-    with patch('requests.get') as mock:
+    with patch('requests.Session.get') as mock:
         yield mock
 
 def test_login_success(mock_post):
@@ -8,11 +8,14 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, jsonify, render_template, request, session, redirect, url_for
+from flask import Flask, Response, jsonify, render_template, request, session, redirect, url_for, stream_with_context
 from core import manager
+from core import inventory
+from core import pagination
 from datetime import datetime, timedelta
 from core import notifier
 from core.scheduler import start_scheduler
+from core import scheduler as scheduler_module
 from core.models import db, User, VPS, Account, CloudFlyAPI
 from werkzeug.security import check_password_hash
 from core.api_clients.bitlaunch import BitLaunchClient, BitLaunchAPIError
@@ -149,43 +152,38 @@ def create_app():
         if auth_check: return auth_check
         return render_template('expiry.html')
 
+    def _page_args() -> dict:
+        """cursor/limit/sort từ query string cho các hàm page_* (limit bị chặn bởi MAX_PAGE_SIZE)"""
+        return {'cursor': request.args.get('cursor') or None,
+                'limit': pagination.parse_limit(request.args.get('limit')),
+                'sort': request.args.get('sort') or None}
+
+    def _page_response(key: str, page: dict) -> dict:
+        return {'status': 'success', key: page['items'], 'next_cursor': page['next_cursor'],
+                'has_more': page['has_more']}
+
     @app.route('/api/vps')
     def list_vps():
-        """Lấy danh sách VPS từ tất cả nguồn: manual, BitLaunch, CloudFly"""
+        """Lấy danh sách VPS từ tất cả nguồn: manual, BitLaunch, CloudFly.
+
+        Có limit/cursor thì trả về một trang ({vps, next_cursor, has_more}); không có
+        thì trả về toàn bộ list như trước. Filter: source, status, location, q, expiring_within,
+        expired, expires_after.
+        """
         if 'user_id' not in session:
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         
         try:
-            # Lấy VPS thủ công
-            manual_vps_list = manager.list_vps()
-            for vps in manual_vps_list:
-                if 'service' not in vps:
-                    vps['service'] = ''
-                vps['source'] = 'manual'  # Đánh dấu nguồn
-            
-            # Lấy VPS từ BitLaunch
-            bitlaunch_vps_list = manager.list_bitlaunch_vps(session['user_id'])
-            for vps in bitlaunch_vps_list:
-                vps['source'] = 'bitlaunch'  # Đánh dấu nguồn
-                # Map fields để phù hợp với UI
-                vps['service'] = 'BitLaunch'
-                vps['ip'] = vps.get('ip_address', 'N/A')
-                vps['expiry'] = None  # BitLaunch không có expiry
-            
-            # Lấy VPS từ CloudFly
-            cloudfly_vps_list = manager.list_cloudfly_vps(session['user_id'])
-            for vps in cloudfly_vps_list:
-                vps['source'] = 'cloudfly'  # Đánh dấu nguồn
-                # Map fields để phù hợp với UI
-                vps['service'] = 'CloudFly'
-                vps['ip'] = vps.get('ip_address', 'N/A')
-                vps['expiry'] = None  # CloudFly không có expiry
-            
-            # Kết hợp tất cả VPS
-            all_vps = manual_vps_list + bitlaunch_vps_list + cloudfly_vps_list
-            
+            filters = pagination.parse_filters(request.args, inventory.VPS_FILTERS)
+            if pagination.wants_page(request.args):
+                return _page_response('vps', inventory.page_vps(session['user_id'], filters=filters, **_page_args()))
+            all_vps = inventory.get_snapshot(session['user_id'])['vps']
+            if filters:
+                all_vps = inventory.filter_items(all_vps, filters, inventory.VPS_FILTERS)
             return jsonify(all_vps)
             
+        except pagination.PaginationError as e:
+            return {'status': 'error', 'error': str(e)}, 400
         except Exception as e:
             logger.error(f"Error listing VPS: {e}")
             return {'status': 'error', 'error': str(e)}, 500
@@ -251,184 +249,52 @@ def create_app():
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         
         try:
-            # Lấy tài khoản thủ công
-            manual_acc_list = manager.list_accounts()
-            for acc in manual_acc_list:
-                if 'service' not in acc:
-                    acc['service'] = ''
-                acc['source'] = 'manual'  # Đánh dấu nguồn
-            
-            # Lấy tài khoản từ BitLaunch
-            bitlaunch_apis = manager.list_bitlaunch_apis(session['user_id'])
-            bitlaunch_acc_list = []
-            for api in bitlaunch_apis:
-                acc = {
-                    'id': f"bitlaunch_{api['id']}",
-                    'username': api['email'],
-                    'service': 'BitLaunch',
-                    'expiry': None,  # BitLaunch không có expiry
-                    'balance': api.get('balance', 0),
-                    'source': 'bitlaunch'
-                }
-                bitlaunch_acc_list.append(acc)
-            
-            # Lấy tài khoản từ ZingProxy
-            zingproxy_acc_list = manager.list_zingproxy_accounts(session['user_id'])
-            for acc in zingproxy_acc_list:
-                acc['source'] = 'zingproxy'  # Đánh dấu nguồn
-                # Map fields để phù hợp với UI
-                acc['username'] = acc.get('email', 'N/A')
-                acc['service'] = 'ZingProxy'
-                acc['expiry'] = None  # ZingProxy không có expiry
-                acc['balance'] = acc.get('balance', 0)  # Thêm balance
-            
-            # Lấy tài khoản từ CloudFly
-            cloudfly_apis = manager.list_cloudfly_apis(session['user_id'])
-            cloudfly_acc_list = []
-            for api in cloudfly_apis:
-                acc = {
-                    'id': f"cloudfly_{api['id']}",
-                    'username': api['email'],
-                    'service': 'CloudFly',
-                    'expiry': None,  # CloudFly không có expiry
-                    'balance': api.get('balance', 0),
-                    'source': 'cloudfly'
-                }
-                cloudfly_acc_list.append(acc)
-            
-            # Kết hợp tất cả tài khoản
-            all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
-            
+            filters = pagination.parse_filters(request.args, inventory.ACCOUNT_FILTERS)
+            if pagination.wants_page(request.args):
+                return _page_response('accounts', inventory.page_accounts(session['user_id'], filters=filters,
+                                                                          **_page_args()))
+            all_accounts = inventory.get_snapshot(session['user_id'])['accounts']
+            if filters:
+                all_accounts = inventory.filter_items(all_accounts, filters, inventory.ACCOUNT_FILTERS)
             return jsonify(all_accounts)
             
+        except pagination.PaginationError as e:
+            return {'status': 'error', 'error': str(e)}, 400
         except Exception as e:
             logger.error(f"Error listing accounts: {e}")
             return {'status': 'error', 'error': str(e)}, 500
 
-    def parse_expiry_date(date_str):
-        """Helper function để parse ngày hết hạn từ nhiều định dạng khác nhau"""
-        try:
-            if not date_str:
-                return None
-                
-            # Xử lý ISO 8601 format: 2025-10-11T03:25:07.000Z
-            if 'T' in date_str:
-                return datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
-            # Xử lý YYYY-MM-DD format
-            else:
-                return datetime.strptime(date_str, '%Y-%m-%d').date()
-        except Exception as e:
-            logger.warning(f"Error parsing expiry date {date_str}: {e}")
-            return None
-
     @app.route('/api/expiry-warnings')
     def expiry_warnings():
         """API trả về danh sách cảnh báo hết hạn có cấu trúc"""
         try:
-            from sqlalchemy import text
-            from datetime import datetime
-            
-            today = datetime.now().date()
-            warning_days = 7
-            warnings = []
-            
-            # Lấy tất cả VPS
-            cursor = db.session.execute(text('SELECT id, name, service, ip, expiry FROM vps WHERE expiry IS NOT NULL'))
-            vps_list = cursor.fetchall()
-            
-            for vps in vps_list:
-                if vps.expiry:
-                    expiry_date = parse_expiry_date(vps.expiry)
-                    if expiry_date:
-                        days_left = (expiry_date - today).days
-                        if days_left <= warning_days:  # Bao gồm cả items đã hết hạn
-                            warnings.append({
-                                'item_type': 'VPS',
-                                'name': vps.name or f"VPS-{vps.id}",
-                                'service': vps.service or 'N/A',
-                                'ip': vps.ip or 'N/A',
-                                'expiry': expiry_date.strftime('%Y-%m-%d'),
-                                'days_left': days_left
-                            })
-            
-            # Lấy tất cả Accounts
-            cursor = db.session.execute(text('SELECT id, username, service, expiry FROM accounts WHERE expiry IS NOT NULL'))
-            acc_list = cursor.fetchall()
-            
-            for acc in acc_list:
-                if acc.expiry:
-                    expiry_date = parse_expiry_date(acc.expiry)
-                    if expiry_date:
-                        days_left = (expiry_date - today).days
-                        if days_left <= warning_days:  # Bao gồm cả items đã hết hạn
-                            warnings.append({
-                                'item_type': 'Account',
-                                'name': acc.username or f"Account-{acc.id}",
-                                'service': acc.service or 'N/A',
-                                'ip': 'N/A',
-                                'expiry': expiry_date.strftime('%Y-%m-%d'),
-                                'days_left': days_left
-                            })
-            
-            # Lấy tất cả Proxies (nếu user đã đăng nhập)
-            if 'user_id' in session:
-                # Proxy từ ZingProxy
-                cursor = db.session.execute(text('''
-                    SELECT zp.proxy_id, zp.ip, zp.type, zp.expire_at, zpa.email 
-                    FROM zingproxies zp 
-                    JOIN zingproxy_accounts zpa ON zp.account_id = zpa.id 
-                    WHERE zpa.user_id = :user_id AND zp.expire_at IS NOT NULL
-                '''), {'user_id': session['user_id']})
-                proxy_list = cursor.fetchall()
-                
-                for proxy in proxy_list:
-                    if proxy.expire_at:
-                        expiry_date = parse_expiry_date(proxy.expire_at)
-                        if expiry_date:
-                            days_left = (expiry_date - today).days
-                            if days_left <= warning_days:  # Bao gồm cả items đã hết hạn
-                                warnings.append({
-                                    'item_type': 'Proxy',
-                                    'name': f"{proxy.proxy_id} ({proxy.type})",
-                                    'service': 'ZingProxy',
-                                    'ip': proxy.ip,
-                                    'expiry': expiry_date.strftime('%Y-%m-%d'),
-                                    'days_left': days_left
-                                })
-                
-                # Proxy từ hệ thống quản lý proxy
-                cursor = db.session.execute(text('''
-                    SELECT name, ip, port, expire_at, source 
-                    FROM proxies 
-                    WHERE user_id = :user_id AND expire_at IS NOT NULL
-                '''), {'user_id': session['user_id']})
-                managed_proxy_list = cursor.fetchall()
-                
-                for proxy in managed_proxy_list:
-                    if proxy.expire_at:
-                        expiry_date = parse_expiry_date(proxy.expire_at)
-                        if expiry_date:
-                            days_left = (expiry_date - today).days
-                            if days_left <= warning_days:  # Bao gồm cả items đã hết hạn
-                                source_text = f"[{proxy.source}]" if proxy.source != 'manual' else ""
-                                warnings.append({
-                                    'item_type': 'Proxy',
-                                    'name': f"{proxy.name} {source_text}",
-                                    'service': 'Proxy Management',
-                                    'ip': f"{proxy.ip}:{proxy.port}",
-                                    'expiry': expiry_date.strftime('%Y-%m-%d'),
-                                    'days_left': days_left
-                                })
-            
-            # Sắp xếp theo số ngày còn lại (gần hết hạn trước)
-            warnings.sort(key=lambda x: x['days_left'])
-            
+            warnings = inventory.collect_expiry_warnings(session.get('user_id'))
             return {'status': 'success', 'warnings': warnings}
             
         except Exception as e:
             logger.error(f"Error getting expiry warnings: {e}")
             return {'status': 'error', 'error': 'Lỗi khi lấy cảnh báo hết hạn'}, 500
 
+    @app.route('/api/inventory')
+    def api_inventory():
+        """Toàn bộ inventory của user (VPS, tài khoản, số dư, cảnh báo) trong một request.
+
+        ?lists=0 bỏ list VPS/tài khoản, chỉ trả về số lượng, số dư và cảnh báo (dashboard);
+        các trang list dùng /api/vps và /api/accounts có phân trang.
+        """
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+        
+        try:
+            warning_days = request.args.get('warning_days', inventory.DEFAULT_WARNING_DAYS, type=int)
+            data = inventory.get_snapshot(session['user_id'], warning_days)
+            if request.args.get('lists', 'true').strip().lower() in ('0', 'false', 'no'):
+                data = {key: value for key, value in data.items() if key not in ('vps', 'accounts')}
+            return {'status': 'success', **data}
+        except Exception as e:
+            logger.error(f"Error building inventory: {e}")
+            return {'status': 'error', 'error': str(e)}, 500
+
     @app.route('/api/notify-telegram', methods=['POST'])
     def notify_telegram():
         vps_list = manager.list_vps()
@@ -668,7 +534,8 @@ def create_app():
                 text=f"Đây là thông báo test từ VPS Manager cho user {user.username}",
                 auth_token=config.auth_token,
                 user_id=config.user_id_rocket,
-                color="good"
+                color="good",
+                immediate=True
             )
             
             if success:
@@ -698,51 +565,7 @@ def create_app():
                 return {'status': 'error', 'error': 'Chưa cấu hình RocketChat'}, 400
             
             # Lấy danh sách tài khoản từ tất cả nguồn
-            manual_acc_list = manager.list_accounts()
-            for acc in manual_acc_list:
-                if 'service' not in acc:
-                    acc['service'] = ''
-                acc['source'] = 'manual'
-            
-            # Tài khoản từ BitLaunch
-            bitlaunch_apis = manager.list_bitlaunch_apis(user.id)
-            bitlaunch_acc_list = []
-            for api in bitlaunch_apis:
-                acc = {
-                    'id': f"bitlaunch_{api['id']}",
-                    'username': api['email'],
-                    'service': 'BitLaunch',
-                    'expiry': None,
-                    'balance': api.get('balance', 0),
-                    'source': 'bitlaunch'
-                }
-                bitlaunch_acc_list.append(acc)
-            
-            # Tài khoản từ ZingProxy
-            zingproxy_acc_list = manager.list_zingproxy_accounts(user.id)
-            for acc in zingproxy_acc_list:
-                acc['source'] = 'zingproxy'
-                acc['username'] = acc.get('email', 'N/A')
-                acc['service'] = 'ZingProxy'
-                acc['expiry'] = None
-                acc['balance'] = acc.get('balance', 0)
-            
-            # Tài khoản từ CloudFly
-            cloudfly_apis = manager.list_cloudfly_apis(user.id)
-            cloudfly_acc_list = []
-            for api in cloudfly_apis:
-                acc = {
-                    'id': f"cloudfly_{api['id']}",
-                    'username': api['email'],
-                    'service': 'CloudFly',
-                    'expiry': None,
-                    'balance': api.get('balance', 0),
-                    'source': 'cloudfly'
-                }
-                cloudfly_acc_list.append(acc)
-            
-            # Kết hợp tất cả tài khoản
-            all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
+            all_accounts = inventory.list_accounts(user.id)
             
             # Gửi thông tin chi tiết tài khoản
             success = send_detailed_account_info(
@@ -779,51 +602,7 @@ def create_app():
                 return {'status': 'error', 'error': 'Chưa cấu hình RocketChat'}, 400
             
             # Lấy danh sách tài khoản từ tất cả nguồn
-            manual_acc_list = manager.list_accounts()
-            for acc in manual_acc_list:
-                if 'service' not in acc:
-                    acc['service'] = ''
-                acc['source'] = 'manual'
-            
-            # Tài khoản từ BitLaunch
-            bitlaunch_apis = manager.list_bitlaunch_apis(user.id)
-            bitlaunch_acc_list = []
-            for api in bitlaunch_apis:
-                acc = {
-                    'id': f"bitlaunch_{api['id']}",
-                    'username': api['email'],
-                    'service': 'BitLaunch',
-                    'expiry': None,
-                    'balance': api.get('balance', 0),
-                    'source': 'bitlaunch'
-                }
-                bitlaunch_acc_list.append(acc)
-            
-            # Tài khoản từ ZingProxy
-            zingproxy_acc_list = manager.list_zingproxy_accounts(user.id)
-            for acc in zingproxy_acc_list:
-                acc['source'] = 'zingproxy'
-                acc['username'] = acc.get('email', 'N/A')
-                acc['service'] = 'ZingProxy'
-                acc['expiry'] = None
-                acc['balance'] = acc.get('balance', 0)
-            
-            # Tài khoản từ CloudFly
-            cloudfly_apis = manager.list_cloudfly_apis(user.id)
-            cloudfly_acc_list = []
-            for api in cloudfly_apis:
-                acc = {
-                    'id': f"cloudfly_{api['id']}",
-                    'username': api['email'],
-                    'service': 'CloudFly',
-                    'expiry': None,
-                    'balance': api.get('balance', 0),
-                    'source': 'cloudfly'
-                }
-                cloudfly_acc_list.append(acc)
-            
-            # Kết hợp tất cả tài khoản
-            all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
+            all_accounts = inventory.list_accounts(user.id)
             
             # Lấy danh sách VPS
             vps_list = manager.list_vps()
@@ -1098,7 +877,14 @@ def create_app():
         if 'user_id' not in session:
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         
-        vps_list = manager.list_bitlaunch_vps(session['user_id'])
+        try:
+            filters = pagination.parse_filters(request.args, manager.BITLAUNCH_VPS_FILTERS)
+            if pagination.wants_page(request.args):
+                return _page_response('vps', manager.page_bitlaunch_vps(session['user_id'], filters=filters,
+                                                                        **_page_args()))
+        except pagination.PaginationError as e:
+            return {'status': 'error', 'error': str(e)}, 400
+        vps_list = manager.list_bitlaunch_vps(session['user_id'], filters)
         return {'status': 'success', 'vps': vps_list}
 
     @app.route('/api/bitlaunch-update-vps/<int:api_id>', methods=['POST'])
@@ -1241,37 +1027,15 @@ def create_app():
                 update_frequency=update_frequency
             )
             
-            # Tự động cập nhật proxy sau khi thêm tài khoản
+            # Tự động cập nhật proxy và import vào hệ thống quản lý proxy sau khi thêm tài khoản
             try:
                 proxies = client.get_all_active_proxies()
-                manager.update_zingproxy_list(acc.id, proxies)
-                
-                # Tự động import proxy vào hệ thống quản lý proxy
-                try:
-                    zingproxy_data = []
-                    for proxy in proxies:
-                        zingproxy_data.append({
-                            'proxy_id': proxy.get('proxy_id'),
-                            'ip': proxy.get('ip'),
-                            'port': proxy.get('port'),
-                            'port_socks5': proxy.get('port_socks5'),
-                            'username': proxy.get('username'),
-                            'password': proxy.get('password'),
-                            'status': proxy.get('status'),
-                            'expire_at': proxy.get('expire_at'),
-                            'location': proxy.get('location'),
-                            'type': proxy.get('type'),
-                            'note': proxy.get('note'),
-                            'auto_renew': proxy.get('auto_renew')
-                        })
-                    
-                    if zingproxy_data:
-                        imported_count = manager.import_proxies_from_zingproxy(session['user_id'], zingproxy_data)
-                        logger.info(f"Đã tự động import {imported_count} proxy từ ZingProxy vào hệ thống quản lý proxy")
-                except Exception as e:
-                    logger.warning(f"Không thể import proxy vào hệ thống quản lý: {e}")
-                    
+                counts = manager.sync_zingproxy_account(acc.id, session['user_id'], proxies)
+                imported_count = counts['proxies']['inserted'] + counts['proxies']['updated'] + counts['proxies']['unchanged']
+                if imported_count:
+                    logger.info(f"Đã tự động import {imported_count} proxy từ ZingProxy vào hệ thống quản lý proxy")
             except Exception as e:
+                db.session.rollback()
                 logger.warning(f"Không thể cập nhật proxy cho tài khoản mới: {e}")
             
             return {'status': 'success', 'account': manager.zingproxy_account_to_dict(acc)}
@@ -1386,50 +1150,32 @@ def create_app():
         if 'user_id' not in session:
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         try:
-            accounts = ZingProxyAccount.query.filter_by(user_id=session['user_id']).all()
-            total_accounts = len(accounts)
-            total_balance = sum(acc.balance or 0 for acc in accounts)
-            
-            # Đếm tổng số proxy
-            total_proxies = 0
-            expiring_proxies = 0
-            from datetime import datetime, timedelta
-            
-            for acc in accounts:
-                proxies = ZingProxy.query.filter_by(account_id=acc.id).all()
-                total_proxies += len(proxies)
-                
-                # Đếm proxy sắp hết hạn (trong vòng 7 ngày)
-                for proxy in proxies:
-                    if proxy.expire_at:
-                        try:
-                            expiry_date = datetime.strptime(proxy.expire_at, '%Y-%m-%d')
-                            days_until_expiry = (expiry_date - datetime.now()).days
-                            if 0 <= days_until_expiry <= 7:
-                                expiring_proxies += 1
-                        except:
-                            pass
-            
-            return {
-                'status': 'success',
-                'total_accounts': total_accounts,
-                'total_balance': round(total_balance, 2),
-                'total_proxies': total_proxies,
-                'expiring_proxies': expiring_proxies
-            }
+            stats = manager.get_zingproxy_statistics(session['user_id'])
+            return {'status': 'success', **stats}
         except Exception as e:
             return {'status': 'error', 'error': str(e)}, 500
 
     # ==================== PROXY MANAGEMENT API ====================
 
+    def _include_secrets() -> bool:
+        """?include_secrets=0 để list không giải mã password (mặc định vẫn trả về)"""
+        return request.args.get('include_secrets', 'true').strip().lower() not in ('0', 'false', 'no')
+
     @app.route('/api/proxies', methods=['GET'])
     def api_proxies_list():
         """Lấy danh sách proxy của user"""
         if 'user_id' not in session:
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         try:
-            proxies = manager.list_proxies(session['user_id'])
+            filters = pagination.parse_filters(request.args, manager.PROXY_FILTERS)
+            if pagination.wants_page(request.args):
+                return _page_response('proxies', manager.page_proxies(session['user_id'], filters=filters,
+                                                                      include_secrets=_include_secrets(),
+                                                                      **_page_args()))
+            proxies = manager.list_proxies(session['user_id'], include_secrets=_include_secrets(), filters=filters)
             return {'status': 'success', 'proxies': proxies}
+        except pagination.PaginationError as e:
+            return {'status': 'error', 'error': str(e)}, 400
         except Exception as e:
             return {'status': 'error', 'error': str(e)}, 500
 
@@ -1485,6 +1231,38 @@ def create_app():
         except Exception as e:
             return {'status': 'error', 'error': str(e)}, 500
 
+    @app.route('/api/proxies/check', methods=['POST'])
+    def api_proxies_check():
+        """Kiểm tra ngay proxy sống/chết (body {"ids": [...]}, bỏ trống để kiểm tra tất cả)"""
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+        from core import proxy_check
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+            return {'status': 'error', 'error': 'ids phải là danh sách id proxy'}, 400
+        try:
+            summary = proxy_check.check_user_proxies(session['user_id'], ids)
+            return {'status': 'success', **summary}
+        except ValueError as e:
+            return {'status': 'error', 'error': str(e)}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'status': 'error', 'error': str(e)}, 500
+
+    @app.route('/api/proxies/<int:proxy_id>/checks')
+    def api_proxies_checks(proxy_id):
+        """Lịch sử kiểm tra sống/chết và latency của proxy"""
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+        from core import proxy_check
+        try:
+            if not manager.get_proxy_by_id(proxy_id, session['user_id']):
+                return {'status': 'error', 'error': 'Không tìm thấy proxy'}, 404
+            limit = max(min(request.args.get('limit', 50, type=int), 500), 1)
+            return {'status': 'success', **proxy_check.get_check_history(proxy_id, limit)}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}, 500
+
     @app.route('/api/proxies/statistics')
     def api_proxies_statistics():
         """Lấy thống kê proxy"""
@@ -1533,25 +1311,21 @@ def create_app():
         try:
             # Lấy tất cả proxy từ ZingProxy
             zingproxy_data = []
-            accounts = ZingProxyAccount.query.filter_by(user_id=session['user_id']).all()
-            
-            for acc in accounts:
-                proxies = ZingProxy.query.filter_by(account_id=acc.id).all()
-                for proxy in proxies:
-                    zingproxy_data.append({
-                        'proxy_id': proxy.proxy_id,
-                        'ip': proxy.ip,
-                        'port': proxy.port,
-                        'port_socks5': proxy.port_socks5,
-                        'username': proxy.username,
-                        'password': proxy.password,
-                        'status': proxy.status,
-                        'expire_at': proxy.expire_at,
-                        'location': proxy.location,
-                        'type': proxy.type,
-                        'note': proxy.note,
-                        'auto_renew': proxy.auto_renew
-                    })
+            for proxy in manager.list_user_zingproxies(session['user_id']):
+                zingproxy_data.append({
+                    'proxy_id': proxy.proxy_id,
+                    'ip': proxy.ip,
+                    'port': proxy.port,
+                    'port_socks5': proxy.port_socks5,
+                    'username': proxy.username,
+                    'password': proxy.password,
+                    'status': proxy.status,
+                    'expire_at': proxy.expire_at,
+                    'location': proxy.location,
+                    'type': proxy.type,
+                    'note': proxy.note,
+                    'auto_renew': proxy.auto_renew
+                })
             
             if not zingproxy_data:
                 return {'status': 'error', 'error': 'Không có proxy nào từ ZingProxy để import'}, 400
@@ -1561,15 +1335,71 @@ def create_app():
         except Exception as e:
             return {'status': 'error', 'error': str(e)}, 500
 
+    def _stream_proxy_export(fmt: str, filters: dict):
+        from core import export
+        if fmt not in export.EXPORT_FORMATS:
+            return {'status': 'error', 'error': f"Định dạng export không hỗ trợ: {fmt}"}, 400
+        mimetype, extension = export.EXPORT_FORMATS[fmt]
+        body = export.stream_proxies(session['user_id'], fmt, filters, include_secrets=_include_secrets())
+        filename = f"proxies_{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+        if request.args.get('gzip', '').strip().lower() in ('1', 'true', 'yes'):
+            body = export.gzip_stream(body)
+            mimetype, filename = 'application/gzip', filename + '.gz'
+        return Response(stream_with_context(body), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no',  # Không để nginx gom cả response trước khi gửi
+        })
+
     @app.route('/api/proxies/export')
     def api_proxies_export():
-        """Export danh sách proxy"""
+        """Export danh sách proxy.
+
+        format=csv|ndjson|txt trả về file stream theo lô (chunked, bộ nhớ không tăng theo
+        số proxy), thêm gzip=1 để nén; không có format thì trả về JSON như trước.
+        """
         if 'user_id' not in session:
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         try:
-            proxies = manager.list_proxies(session['user_id'])
+            filters = pagination.parse_filters(request.args, manager.PROXY_FILTERS)
+            fmt = request.args.get('format', 'json').strip().lower()
+            if fmt != 'json':
+                return _stream_proxy_export(fmt, filters)
+            if pagination.wants_page(request.args):
+                return _page_response('proxies', manager.page_proxies(session['user_id'], filters=filters,
+                                                                      include_secrets=_include_secrets(),
+                                                                      **_page_args()))
+            proxies = manager.list_proxies(session['user_id'], include_secrets=_include_secrets(), filters=filters)
             return {'status': 'success', 'proxies': proxies}
+        except pagination.PaginationError as e:
+            return {'status': 'error', 'error': str(e)}, 400
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}, 500
+
+    @app.route('/api/proxies/import', methods=['POST'])
+    def api_proxies_import():
+        """Import proxy hàng loạt từ file.
+
+        Nhận multipart `file` hoặc body thô; format=auto|csv|txt (CSV có header như file
+        export, txt là ip:port:user:pass), type là loại proxy mặc định. Trả về số proxy đã
+        import, số dòng trùng/lỗi và danh sách lỗi theo số dòng.
+        """
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+        from core import proxy_import
+        fmt = (request.values.get('format') or 'auto').strip().lower()
+        if fmt not in proxy_import.IMPORT_FORMATS:
+            return {'status': 'error', 'error': f"Định dạng import không hỗ trợ: {fmt}"}, 400
+        upload = request.files.get('file')
+        # Đọc dạng stream từ file upload / body request, không nạp cả file vào bộ nhớ
+        stream = upload.stream if upload else request.stream
+        if not upload and not request.content_length:
+            return {'status': 'error', 'error': 'Không có file để import'}, 400
+        default_type = (request.values.get('type') or 'HTTP').strip().upper()
+        try:
+            result = proxy_import.import_proxies(session['user_id'], stream, fmt, default_type)
+            return {'status': 'success', **result}
         except Exception as e:
+            db.session.rollback()
             return {'status': 'error', 'error': str(e)}, 500
 
     @app.route('/api/proxies/sync-zingproxy', methods=['POST'])
@@ -1733,6 +1563,7 @@ def create_app():
             try:
                 user.notify_hour = notify_hour
                 db.session.commit()
+                scheduler_module.reschedule_user_notification(user.id)
                 return {'status': 'success', 'message': 'Đã cập nhật giờ gửi thông báo'}
             except Exception as e:
                 return {'status': 'error', 'error': str(e)}, 500
@@ -1759,6 +1590,7 @@ def create_app():
             try:
                 user.notify_minute = notify_minute
                 db.session.commit()
+                scheduler_module.reschedule_user_notification(user.id)
                 return {'status': 'success', 'message': 'Đã cập nhật phút gửi thông báo'}
             except Exception as e:
                 return {'status': 'error', 'error': str(e)}, 500
@@ -1957,8 +1789,14 @@ def create_app():
             return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
         
         try:
-            vps_list = manager.list_cloudfly_vps(session['user_id'])
+            filters = pagination.parse_filters(request.args, manager.CLOUDFLY_VPS_FILTERS)
+            if pagination.wants_page(request.args):
+                return _page_response('vps', manager.page_cloudfly_vps(session['user_id'], filters=filters,
+                                                                       **_page_args()))
+            vps_list = manager.list_cloudfly_vps(session['user_id'], filters)
             return vps_list  # Trả về trực tiếp array thay vì wrap trong object
+        except pagination.PaginationError as e:
+            return {'status': 'error', 'error': str(e)}, 400
         except Exception as e:
             logger.error(f"Error listing CloudFly VPS: {e}")
             return {'status': 'error', 'error': str(e)}, 500
@@ -2078,6 +1916,7 @@ def create_app():
                         room_id=room_id,
                         room_name=room_name
                     )
+                    scheduler_module.reschedule_user_notification(session['user_id'])
                     return {'status': 'success', 'message': 'Cập nhật cấu hình Rocket Chat thành công'}
                 else:
                     # Tạo config mới
@@ -2088,6 +1927,7 @@ def create_app():
                         room_id,
                         room_name
                     )
+                    scheduler_module.reschedule_user_notification(session['user_id'])
                     return {'status': 'success', 'message': 'Thêm cấu hình Rocket Chat thành công'}
                     
             except ValueError as e:
@@ -2157,7 +1997,8 @@ def create_app():
                     text,
                     config.auth_token,
                     config.user_id_rocket,
-                    color
+                    color,
+                    immediate=True
                 )
             else:
                 success = send_formatted_notification_simple(
@@ -2166,7 +2007,8 @@ def create_app():
                     message,
                     config.auth_token,
                     config.user_id_rocket,
-                    "info"
+                    "info",
+                    immediate=True
                 )
             
             if success:
@@ -2214,6 +2056,17 @@ def create_app():
             logger.error(f"Error testing Rocket Chat connection: {e}")
             return {'status': 'error', 'error': str(e)}, 500
 
+    @app.route('/api/rocket-chat/outbox')
+    def api_rocket_chat_outbox():
+        """Độ sâu hàng đợi thông báo Rocket Chat"""
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+
+        from core import outbox
+        dispatcher = outbox.get_dispatcher()
+        return {'status': 'success', 'queue': outbox.get_queue_stats(),
+                'dispatcher_running': bool(dispatcher and dispatcher.running)}
+
     @app.route('/rocket-chat')
     def rocket_chat_page():
         """Trang cấu hình Rocket Chat"""
@@ -2245,59 +2098,10 @@ def create_app():
             logger.info(f"[API] Auth token present: {bool(config.auth_token)}")
             
             # Lấy danh sách tài khoản từ TẤT CẢ nguồn (giống như accounts page)
-            # 1. Tài khoản thủ công
-            manual_acc_list = manager.list_accounts()
-            for acc in manual_acc_list:
-                if 'service' not in acc:
-                    acc['service'] = ''
-                acc['source'] = 'manual'  # Đánh dấu nguồn
-            
-            # 2. Tài khoản từ BitLaunch
-            bitlaunch_apis = manager.list_bitlaunch_apis(session['user_id'])
-            bitlaunch_acc_list = []
-            for api in bitlaunch_apis:
-                acc = {
-                    'id': f"bitlaunch_{api['id']}",
-                    'username': api['email'],
-                    'service': 'BitLaunch',
-                    'expiry': None,  # BitLaunch không có expiry
-                    'balance': api.get('balance', 0),
-                    'source': 'bitlaunch'
-                }
-                bitlaunch_acc_list.append(acc)
-            
-            # 3. Tài khoản từ ZingProxy
-            zingproxy_acc_list = manager.list_zingproxy_accounts(session['user_id'])
-            for acc in zingproxy_acc_list:
-                acc['source'] = 'zingproxy'  # Đánh dấu nguồn
-                # Map fields để phù hợp với UI
-                acc['username'] = acc.get('email', 'N/A')
-                acc['service'] = 'ZingProxy'
-                acc['expiry'] = None  # ZingProxy không có expiry
-                acc['balance'] = acc.get('balance', 0)  # Thêm balance
-            
-            # 4. Tài khoản từ CloudFly
-            cloudfly_apis = manager.list_cloudfly_apis(session['user_id'])
-            cloudfly_acc_list = []
-            for api in cloudfly_apis:
-                acc = {
-                    'id': f"cloudfly_{api['id']}",
-                    'username': api['email'],
-                    'service': 'CloudFly',
-                    'expiry': None,  # CloudFly không có expiry
-                    'balance': api.get('balance', 0),
-                    'source': 'cloudfly'
-                }
-                cloudfly_acc_list.append(acc)
-            
-            # Kết hợp tất cả tài khoản
-            all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
+            all_accounts = inventory.list_accounts(session['user_id'])
             
             logger.info(f"[API] Found {len(all_accounts)} total accounts:")
-            logger.info(f"[API]   - Manual: {len(manual_acc_list)}")
-            logger.info(f"[API]   - BitLaunch: {len(bitlaunch_acc_list)}")
-            logger.info(f"[API]   - ZingProxy: {len(zingproxy_acc_list)}")
-            logger.info(f"[API]   - CloudFly: {len(cloudfly_acc_list)}")
+            logger.info(f"[API]   - By source: {inventory.count_by_source(all_accounts)}")
             
             if all_accounts:
                 for i, acc in enumerate(all_accounts[:3]):
@@ -2343,39 +2147,9 @@ def create_app():
                 return {'status': 'error', 'error': 'Chưa cấu hình Rocket Chat'}, 400
             
             # Lấy danh sách tài khoản từ TẤT CẢ nguồn (giống như accounts page)
-            manual_acc_list = manager.list_accounts()
-            for acc in manual_acc_list:
-                if 'service' not in acc: acc['service'] = ''
-                acc['source'] = 'manual'
-            bitlaunch_apis = manager.list_bitlaunch_apis(session['user_id'])
-            bitlaunch_acc_list = []
-            for api in bitlaunch_apis:
-                acc = {
-                    'id': f"bitlaunch_{api['id']}", 'username': api['email'], 'service': 'BitLaunch',
-                    'expiry': None, 'balance': api.get('balance', 0), 'source': 'bitlaunch'
-                }
-                bitlaunch_acc_list.append(acc)
-            zingproxy_acc_list = manager.list_zingproxy_accounts(session['user_id'])
-            for acc in zingproxy_acc_list:
-                acc['source'] = 'zingproxy'
-                acc['username'] = acc.get('email', 'N/A')
-                acc['service'] = 'ZingProxy'
-                acc['expiry'] = None
-                acc['balance'] = acc.get('balance', 0) # Added this line
-            cloudfly_apis = manager.list_cloudfly_apis(session['user_id'])
-            cloudfly_acc_list = []
-            for api in cloudfly_apis:
-                acc = {
-                    'id': f"cloudfly_{api['id']}", 'username': api['email'], 'service': 'CloudFly',
-                    'expiry': None, 'balance': api.get('balance', 0), 'source': 'cloudfly'
-                }
-                cloudfly_acc_list.append(acc)
-            all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
+            all_accounts = inventory.list_accounts(session['user_id'])
             logger.info(f"[API] Found {len(all_accounts)} total accounts:")
-            logger.info(f"[API]   - Manual: {len(manual_acc_list)}")
-            logger.info(f"[API]   - BitLaunch: {len(bitlaunch_acc_list)}")
-            logger.info(f"[API]   - ZingProxy: {len(zingproxy_acc_list)}")
-            logger.info(f"[API]   - CloudFly: {len(cloudfly_acc_list)}")
+            logger.info(f"[API]   - By source: {inventory.count_by_source(all_accounts)}")
             
             # Gửi báo cáo tổng hợp
             success = send_daily_account_summary(
@@ -2413,39 +2187,9 @@ def create_app():
             logger.info(f"[API] send-detailed-info: Found config {config.id} for user {session['user_id']}")
             
             # Lấy danh sách tài khoản từ TẤT CẢ nguồn (giống như accounts page)
-            manual_acc_list = manager.list_accounts()
-            for acc in manual_acc_list:
-                if 'service' not in acc: acc['service'] = ''
-                acc['source'] = 'manual'
-            bitlaunch_apis = manager.list_bitlaunch_apis(session['user_id'])
-            bitlaunch_acc_list = []
-            for api in bitlaunch_apis:
-                acc = {
-                    'id': f"bitlaunch_{api['id']}", 'username': api['email'], 'service': 'BitLaunch',
-                    'expiry': None, 'balance': api.get('balance', 0), 'source': 'bitlaunch'
-                }
-                bitlaunch_acc_list.append(acc)
-            zingproxy_acc_list = manager.list_zingproxy_accounts(session['user_id'])
-            for acc in zingproxy_acc_list:
-                acc['source'] = 'zingproxy'
-                acc['username'] = acc.get('email', 'N/A')
-                acc['service'] = 'ZingProxy'
-                acc['expiry'] = None
-                acc['balance'] = acc.get('balance', 0)
-            cloudfly_apis = manager.list_cloudfly_apis(session['user_id'])
-            cloudfly_acc_list = []
-            for api in cloudfly_apis:
-                acc = {
-                    'id': f"cloudfly_{api['id']}", 'username': api['email'], 'service': 'CloudFly',
-                    'expiry': None, 'balance': api.get('balance', 0), 'source': 'cloudfly'
-                }
-                cloudfly_acc_list.append(acc)
-            all_accounts = manual_acc_list + bitlaunch_acc_list + zingproxy_acc_list + cloudfly_acc_list
+            all_accounts = inventory.list_accounts(session['user_id'])
             logger.info(f"[API] send-detailed-info: Found {len(all_accounts)} total accounts for user {session['user_id']}:")
-            logger.info(f"[API]   - Manual: {len(manual_acc_list)}")
-            logger.info(f"[API]   - BitLaunch: {len(bitlaunch_acc_list)}")
-            logger.info(f"[API]   - ZingProxy: {len(zingproxy_acc_list)}")
-            logger.info(f"[API]   - CloudFly: {len(cloudfly_acc_list)}")
+            logger.info(f"[API]   - By source: {inventory.count_by_source(all_accounts)}")
             
             # Gửi thông tin chi tiết
             logger.info(f"[API] send-detailed-info: Calling send_detailed_account_info...")
@@ -2469,6 +2213,26 @@ def create_app():
             logger.error(f"[API] send-detailed-info: Traceback: {traceback.format_exc()}")
             return {'status': 'error', 'error': f'Lỗi hệ thống: {str(e)}'}
 
+    @app.route('/api/balance-history')
+    def api_balance_history():
+        """Series số dư theo giờ/ngày của các tài khoản provider (cho biểu đồ và dự báo hết tiền).
+
+        Query: provider, account_id, days (mặc định 30), resolution=auto|hour|day.
+        """
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+        from core import balance_history
+        try:
+            days = request.args.get('days', 30, type=int)
+            account_id = request.args.get('account_id', type=int)
+            data = balance_history.get_balance_series(session['user_id'], request.args.get('provider') or None,
+                                                      account_id, days, request.args.get('resolution', 'auto'))
+            return {'status': 'success', **data}
+        except ValueError as e:
+            return {'status': 'error', 'error': str(e)}, 400
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}, 500
+
     @app.route('/api/scheduler/status')
     def api_scheduler_status():
         """Kiểm tra trạng thái scheduler"""
@@ -2483,6 +2247,47 @@ def create_app():
             logger.error(f"Error getting scheduler status: {e}")
             return {'status': 'error', 'error': str(e)}, 500
 
+    @app.route('/api/transport/stats')
+    def api_transport_stats():
+        """Thống kê connection pool HTTP, rate limiter và circuit breaker của các provider"""
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+
+        from core.api_clients.transport import get_stats
+        from core.api_clients import resilience
+        return {'status': 'success', 'stats': get_stats(), 'providers': resilience.get_stats()}
+
+    @app.route('/api/inventory/cache-stats')
+    def api_inventory_cache_stats():
+        """Thống kê cache inventory: hit, miss, eviction"""
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+
+        from core.cache import get_inventory_cache
+        return {'status': 'success', 'stats': get_inventory_cache().stats()}
+
+    @app.route('/api/encryption/cache-stats')
+    def api_encryption_cache_stats():
+        """Thống kê cache giá trị đã giải mã: hit, miss, eviction"""
+        if 'user_id' not in session:
+            return {'status': 'error', 'error': 'Chưa đăng nhập'}, 401
+
+        from core.encryption import get_secret_cache_stats
+        return {'status': 'success', 'stats': get_secret_cache_stats()}
+
+    @app.route('/api/encryption/keyring')
+    def api_encryption_keyring():
+        """Fingerprint các key đang nạp và tiến độ re-encrypt theo key chính (chỉ admin)"""
+        if not is_admin():
+            return {'status': 'error', 'error': 'Chỉ admin được phép xem keyring'}, 403
+
+        from core.encryption import get_keyring_info
+        from core.reencrypt import get_reencryption_status
+        try:
+            return {'status': 'success', 'keys': get_keyring_info(), 'reencryption': get_reencryption_status()}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}, 500
+
     @app.route('/api/scheduler/restart', methods=['POST'])
     def api_scheduler_restart():
         """Khởi động lại scheduler (chỉ admin)"""
@@ -2490,16 +2295,11 @@ def create_app():
             return {'status': 'error', 'error': 'Chỉ admin được phép khởi động lại scheduler'}, 403
         
         try:
-            from core.scheduler import get_scheduler
-            scheduler = get_scheduler()
-            
-            if scheduler.running:
-                scheduler.shutdown()
-                logger.info("[API] Scheduler shutdown")
-            
-            # Khởi động lại
-            from core.scheduler import start_scheduler
-            new_scheduler = start_scheduler()
+            new_scheduler = scheduler_module.restart_scheduler()
+            if new_scheduler is None:
+                return {'status': 'error', 'error': 'Scheduler đang chạy ở process khác (leader)',
+                        'leader': scheduler_module.get_leader_status()}, 409
+            logger.info("[API] Scheduler restarted")
             
             return {
                 'status': 'success',
@@ -2518,13 +2318,6 @@ def create_app():
 
 app = create_app()
 
-# Bật scheduler tự động trong container nếu ENABLE_SCHEDULER=true (mặc định: true)
-try:
-    if os.getenv('ENABLE_SCHEDULER', 'true').strip().lower() == 'true':
-        init_app()
-except Exception as _e:
-    pass
-
 # Tạm thời comment để tránh lỗi database
 # with app.app_context():
 #     db.create_all()  # Đảm bảo luôn tạo schema mới trước khi truy vấn User
@@ -2537,25 +2330,31 @@ except Exception as _e:
 
 # Khởi động scheduler khi app được tạo
 def init_app():
-    """Khởi tạo app với scheduler"""
+    """Khởi động dispatcher outbox Rocket Chat và cho process hiện tại tham gia bầu leader
+    để chạy scheduler (nếu ENABLE_SCHEDULER=true).
+
+    Chỉ được gọi từ entrypoint của server (run_app.py, hook post_worker_init của
+    gunicorn.conf.py); import ui.app không có side effect nên script/migration có thể
+    import app mà không trở thành leader. Mọi worker/replica gọi hàm này đều tham
+    gia bầu leader qua lease trong database, chỉ process giữ lease mới chạy các job.
+    Dispatcher outbox chạy ở mọi process, không phụ thuộc scheduler. Trước đó schema
+    được nâng cấp (dưới lease trong database nên các worker không nâng cấp cùng lúc).
+    """
+    from core import outbox
+    from core.schema import upgrade_schema_locked
     try:
-        from core.scheduler import get_scheduler
-        print("🔄 Đang khởi động scheduler...")
-        
-        # Khởi động scheduler
-        scheduler = get_scheduler()
-        
-        # Kiểm tra trạng thái scheduler
-        if scheduler.running:
-            print(f"✅ Scheduler đã khởi động thành công với {len(scheduler.get_jobs())} jobs")
-            
-            # In danh sách jobs
-            print("📋 Danh sách jobs đang chạy:")
-            for job in scheduler.get_jobs():
-                print(f"   • {job.id}: {job.trigger}")
-        else:
-            print("❌ Scheduler không thể khởi động")
-            
+        with app.app_context():
+            upgrade_schema_locked()
+    except Exception as e:
+        print(f"❌ Lỗi nâng cấp schema: {e}")
+    outbox.start_dispatcher(app)
+    if os.getenv('ENABLE_SCHEDULER', 'true').strip().lower() != 'true':
+        print("⏸️  ENABLE_SCHEDULER=false, không chạy scheduler trong process này")
+        return app
+    try:
+        print("🔄 Đang tham gia bầu leader cho scheduler...")
+        elector = scheduler_module.start_leader_election(app)
+        print(f"✅ Process {elector.owner} đã tham gia bầu leader")
         return app
         
     except Exception as e:
@@ -5,4 +5,67 @@ window.fetch = function(url, opts={}) {
 };
 // Ẩn/hiện nút thao tác theo quyền (nếu còn dùng)
 function showAdminActions() {}
-document.addEventListener('DOMContentLoaded', showAdminActions); 
\ No newline at end of file
+document.addEventListener('DOMContentLoaded', showAdminActions);
+
+// Phân trang theo cursor cho các API list (?limit=&cursor= cùng filter/sort phía server).
+// render(items, pager, error) vẽ trang hiện tại; pager.next()/prev() chuyển trang,
+// pager.reload(params) tải lại từ trang đầu với filter mới, pager.refresh() tải lại trang đang xem.
+function createCursorPager(url, key, render, options={}) {
+  const pager = {page: 1, hasMore: false, limit: options.limit || 50, params: {...(options.params || {})}};
+  let cursors = [null];
+  async function load() {
+    const query = new URLSearchParams({limit: pager.limit});
+    Object.entries(pager.params).forEach(([name, value]) => {
+      if (value !== '' && value !== null && value !== undefined) query.set(name, value);
+    });
+    if (cursors[pager.page - 1]) query.set('cursor', cursors[pager.page - 1]);
+    try {
+      const json = await (await fetch(`${url}?${query}`)).json();
+      if (json.status !== 'success') {
+        render(null, pager, json.error || 'Lỗi khi tải dữ liệu');
+        return;
+      }
+      cursors[pager.page] = json.next_cursor;
+      pager.hasMore = json.has_more;
+      render(json[key], pager, null);
+    } catch (error) {
+      render(null, pager, 'Lỗi kết nối!');
+    }
+  }
+  pager.reload = function(params) {
+    if (params) pager.params = {...params};
+    cursors = [null];
+    pager.page = 1;
+    return load();
+  };
+  pager.refresh = load;
+  pager.next = function() {
+    if (!pager.hasMore) return;
+    pager.page += 1;
+    return load();
+  };
+  pager.prev = function() {
+    if (pager.page === 1) return;
+    pager.page -= 1;
+    return load();
+  };
+  return pager;
+}
+
+// Nút Trước/Sau của một pager, vẽ vào <ul class="pagination">
+function renderPagerControls(ul, pager) {
+  ul.innerHTML = '';
+  if (pager.page === 1 && !pager.hasMore) return;
+  const items = [
+    ['« Trước', pager.page > 1, () => pager.prev()],
+    [`Trang ${pager.page}`, false, null],
+    ['Sau »', pager.hasMore, () => pager.next()],
+  ];
+  items.forEach(([label, enabled, action]) => {
+    const li = document.createElement('li');
+    li.className = 'page-item' + (action && !enabled ? ' disabled' : '') + (action ? '' : ' active');
+    li.innerHTML = `<a class="page-link" href="#">${label}</a>`;
+    li.onclick = function(e) { e.preventDefault(); if (action && enabled) action(); };
+    ul.appendChild(li);
+  });
+}